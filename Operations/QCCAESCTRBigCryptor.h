@@ -0,0 +1,101 @@
+/*
+     File: QCCAESCTRBigCryptor.h
+ Abstract: Implements AES encryption and decryption in CTR mode in a way that's suitable for large data sets.
+  Version: 1.0
+ 
+ Disclaimer: IMPORTANT:  This Apple software is supplied to you by Apple
+ Inc. ("Apple") in consideration of your agreement to the following
+ terms, and your use, installation, modification or redistribution of
+ this Apple software constitutes acceptance of these terms.  If you do
+ not agree with these terms, please do not use, install, modify or
+ redistribute this Apple software.
+ 
+ In consideration of your agreement to abide by the following terms, and
+ subject to these terms, Apple grants you a personal, non-exclusive
+ license, under Apple's copyrights in this original Apple software (the
+ "Apple Software"), to use, reproduce, modify and redistribute the Apple
+ Software, with or without modifications, in source and/or binary forms;
+ provided that if you redistribute the Apple Software in its entirety and
+ without modifications, you must retain this notice and the following
+ text and disclaimers in all such redistributions of the Apple Software.
+ Neither the name, trademarks, service marks or logos of Apple Inc. may
+ be used to endorse or promote products derived from the Apple Software
+ without specific prior written permission from Apple.  Except as
+ expressly stated in this notice, no other rights or licenses, express or
+ implied, are granted by Apple herein, including but not limited to any
+ patent rights that may be infringed by your derivative works or by other
+ works in which the Apple Software may be incorporated.
+ 
+ The Apple Software is provided by Apple on an "AS IS" basis.  APPLE
+ MAKES NO WARRANTIES, EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION
+ THE IMPLIED WARRANTIES OF NON-INFRINGEMENT, MERCHANTABILITY AND FITNESS
+ FOR A PARTICULAR PURPOSE, REGARDING THE APPLE SOFTWARE OR ITS USE AND
+ OPERATION ALONE OR IN COMBINATION WITH YOUR PRODUCTS.
+ 
+ IN NO EVENT SHALL APPLE BE LIABLE FOR ANY SPECIAL, INDIRECT, INCIDENTAL
+ OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+ SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+ INTERRUPTION) ARISING IN ANY WAY OUT OF THE USE, REPRODUCTION,
+ MODIFICATION AND/OR DISTRIBUTION OF THE APPLE SOFTWARE, HOWEVER CAUSED
+ AND WHETHER UNDER THEORY OF CONTRACT, TORT (INCLUDING NEGLIGENCE),
+ STRICT LIABILITY OR OTHERWISE, EVEN IF APPLE HAS BEEN ADVISED OF THE
+ POSSIBILITY OF SUCH DAMAGE.
+ 
+ Copyright (C) 2013 Apple Inc. All Rights Reserved.
+ 
+ */
+
+#import <Foundation/Foundation.h>
+
+// Notes:
+//
+// o The streams are opened if they're in state NSStreamStatusNotOpen when the operation is run.
+// 
+// o If the operation opens the streams, it closes them at the end.
+//
+// o The operation reads and writes the streams synchronously, making it only suitable for use 
+//   with file streams.  An operation that supported network streams would be significantly 
+//   more complex.
+//
+// o CTR mode turns AES into a stream cypher, so there's no padding and the output is the 
+//   same length as the input.  Encryption and decryption are the same operation; the 
+//   two init methods exist for symmetry with QCCAESPadBigCryptor.
+//
+// o CTR mode provides no integrity.  If you need that, follow this with an HMAC of the 
+//   cyphertext.
+//
+// o If parallel is set, the operation reads the input in 1 MiB segments and crypts a batch 
+//   of segments (one per active processor) concurrently before writing them out in order.  
+//   This works, in both directions, because the counter for each segment can be computed 
+//   from its offset.  Memory use is bounded by the batch, that is, two segments (input and 
+//   output) per active processor.
+//
+// o Otherwise the operation reads the input stream chunkSize bytes at a time, holding one 
+//   chunk of input and one of output.
+
+@interface QCCAESCTRBigCryptor : NSOperation
+
+- (id)initToEncryptInputStream:(NSInputStream *)inputStream toOutputStream:(NSOutputStream *)outputStream keyData:(NSData *)keyData;
+- (id)initToDecryptInputStream:(NSInputStream *)inputStream toOutputStream:(NSOutputStream *)outputStream keyData:(NSData *)keyData;
+
+// properties set by the init method
+
+@property (atomic, strong, readonly ) NSInputStream *   inputStream;    // can be any length
+@property (atomic, strong, readonly ) NSOutputStream *  outputStream;   // will be the same length as the input
+@property (atomic, copy,   readonly ) NSData *          keyData;        // must be either kCCKeySizeAES128, kCCKeySizeAES192 or kCCKeySizeAES256
+
+// properties that may be set before running
+
+@property (atomic, copy,   readwrite) NSData *          ivData;         // the initial counter block, treated as a 128-bit big endian integer, 
+                                                                        // length must be kCCBlockSizeAES128 bytes, defaults to all zeros
+@property (atomic, assign, readwrite) BOOL              parallel;       // crypt segments of the input concurrently, defaults to NO
+@property (atomic, assign, readwrite) NSUInteger        chunkSize;      // bytes to read at a time, defaults to 64 KiB, must not be zero, 
+                                                                        // ignored if parallel is set
+
+// properties set on finish
+
+@property (atomic, copy,   readonly ) NSError *         error;
+
+@end
+
+extern NSString * kQCCAESCTRBigCryptorErrorDomain;                      // codes are kCCParamError and its friends
@@ -0,0 +1,469 @@
+/*
+     File: QCCAESCTRBigCryptor.m
+ Abstract: Implements AES encryption and decryption in CTR mode in a way that's suitable for large data sets.
+  Version: 1.0
+ 
+ Disclaimer: IMPORTANT:  This Apple software is supplied to you by Apple
+ Inc. ("Apple") in consideration of your agreement to the following
+ terms, and your use, installation, modification or redistribution of
+ this Apple software constitutes acceptance of these terms.  If you do
+ not agree with these terms, please do not use, install, modify or
+ redistribute this Apple software.
+ 
+ In consideration of your agreement to abide by the following terms, and
+ subject to these terms, Apple grants you a personal, non-exclusive
+ license, under Apple's copyrights in this original Apple software (the
+ "Apple Software"), to use, reproduce, modify and redistribute the Apple
+ Software, with or without modifications, in source and/or binary forms;
+ provided that if you redistribute the Apple Software in its entirety and
+ without modifications, you must retain this notice and the following
+ text and disclaimers in all such redistributions of the Apple Software.
+ Neither the name, trademarks, service marks or logos of Apple Inc. may
+ be used to endorse or promote products derived from the Apple Software
+ without specific prior written permission from Apple.  Except as
+ expressly stated in this notice, no other rights or licenses, express or
+ implied, are granted by Apple herein, including but not limited to any
+ patent rights that may be infringed by your derivative works or by other
+ works in which the Apple Software may be incorporated.
+ 
+ The Apple Software is provided by Apple on an "AS IS" basis.  APPLE
+ MAKES NO WARRANTIES, EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION
+ THE IMPLIED WARRANTIES OF NON-INFRINGEMENT, MERCHANTABILITY AND FITNESS
+ FOR A PARTICULAR PURPOSE, REGARDING THE APPLE SOFTWARE OR ITS USE AND
+ OPERATION ALONE OR IN COMBINATION WITH YOUR PRODUCTS.
+ 
+ IN NO EVENT SHALL APPLE BE LIABLE FOR ANY SPECIAL, INDIRECT, INCIDENTAL
+ OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+ SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+ INTERRUPTION) ARISING IN ANY WAY OUT OF THE USE, REPRODUCTION,
+ MODIFICATION AND/OR DISTRIBUTION OF THE APPLE SOFTWARE, HOWEVER CAUSED
+ AND WHETHER UNDER THEORY OF CONTRACT, TORT (INCLUDING NEGLIGENCE),
+ STRICT LIABILITY OR OTHERWISE, EVEN IF APPLE HAS BEEN ADVISED OF THE
+ POSSIBILITY OF SUCH DAMAGE.
+ 
+ Copyright (C) 2013 Apple Inc. All Rights Reserved.
+ 
+ */
+
+#import "QCCAESCTRBigCryptor.h"
+
+#include <CommonCrypto/CommonCrypto.h>
+
+// The segment length for parallel crypting.  This must be a multiple of kCCBlockSizeAES128.
+
+enum {
+    kParallelSegmentLength = 1024 * 1024
+};
+
+@interface QCCAESCTRBigCryptor ()
+
+@property (atomic, assign, readonly ) CCOperation       op;
+@property (atomic, assign, readwrite) BOOL              didOpenInputStream;
+@property (atomic, assign, readwrite) BOOL              didOpenOutputStream;
+
+// read/write versions of public properties
+
+@property (atomic, copy,   readwrite) NSError *         error;
+
+@end
+
+@implementation QCCAESCTRBigCryptor
+
+- (id)initWithOp:(CCOperation)op inputStream:(NSInputStream *)inputStream outputStream:(NSOutputStream *)outputStream keyData:(NSData *)keyData
+{
+    NSParameterAssert(inputStream != nil);
+    NSParameterAssert(outputStream != nil);
+    NSParameterAssert(keyData != nil);
+    self = [super init];
+    if (self != nil) {
+        self->_op = op;
+        self->_inputStream = inputStream;
+        self->_outputStream = outputStream;
+        self->_keyData = [keyData copy];
+        self->_ivData = [[NSMutableData alloc] initWithLength:kCCBlockSizeAES128];
+        self->_chunkSize = 64 * 1024;
+    }
+    return self;
+}
+
+- (id)initToEncryptInputStream:(NSInputStream *)inputStream toOutputStream:(NSOutputStream *)outputStream keyData:(NSData *)keyData
+{
+    return [self initWithOp:kCCEncrypt inputStream:inputStream outputStream:outputStream keyData:keyData];
+}
+
+- (id)initToDecryptInputStream:(NSInputStream *)inputStream toOutputStream:(NSOutputStream *)outputStream keyData:(NSData *)keyData
+{
+    return [self initWithOp:kCCDecrypt inputStream:inputStream outputStream:outputStream keyData:keyData];
+}
+
+static CCCryptorStatus CreateCTRCryptor(CCOperation op, NSData * keyData, NSData * counterData, CCCryptorRef * cryptorPtr)
+    // Creates a CTR mode cryptor whose first counter block is counterData.
+{
+    return CCCryptorCreateWithMode(
+        op, 
+        kCCModeCTR, 
+        kCCAlgorithmAES128, 
+        ccNoPadding, 
+        [counterData bytes], 
+        [keyData bytes], [keyData length], 
+        NULL, 0, 
+        0, 
+        kCCModeOptionCTR_BE, 
+        cryptorPtr
+    );
+}
+
+static NSData * CounterDataByAdding(NSData * counterData, uint64_t blockCount)
+    // Returns a copy of counterData, a 128-bit big endian integer, with blockCount added to 
+    // it, wrapping around at 2^128 like the counter itself does.
+{
+    NSMutableData *     result;
+    uint8_t *           bytes;
+    NSUInteger          byteIndex;
+    uint64_t            carry;
+    
+    result = [counterData mutableCopy];
+    bytes = (uint8_t *) [result mutableBytes];
+    carry = blockCount;
+    byteIndex = kCCBlockSizeAES128;
+    while ( (carry != 0) && (byteIndex != 0) ) {
+        byteIndex -= 1;
+        carry += bytes[byteIndex];
+        bytes[byteIndex] = (uint8_t) (carry & 0xff);
+        carry >>= 8;
+    }
+    return result;
+}
+
+- (void)readToInputBuffer:(NSMutableData *)inputBuffer
+    // Read bytes from the input stream into the input buffer, setting self.error if something 
+    // goes wrong.
+    // 
+    // Note that -read:maxLength: might not return the full number of bytes we request, either 
+    // because it's hit the end of file or because it's having a bad day.  That's OK, CTR 
+    // mode doesn't care about block boundaries between chunks.
+    //
+    // Also note that this does fail if we hit the end of the input stream; rather it returns 
+    // an empty input buffer.
+    //
+    // This, -writeFromOutputBuffer: and -readSegment are copies of the methods of the same 
+    // name in QCCAESPadBigCryptor, so that each operation stands on its own.  If you fix a 
+    // bug in one, fix it in the other.
+{
+    NSInteger       bytesRead;
+
+    if (self.error == nil) {
+        bytesRead = [self.inputStream read:[inputBuffer mutableBytes] maxLength:[inputBuffer length]];
+        if (bytesRead >= 0) {
+            [inputBuffer setLength: (NSUInteger) bytesRead];
+        } else {
+            self.error = [self.inputStream streamError];
+            assert(self.error != nil);  // error on input stream
+        }
+    }
+}
+
+- (void)writeFromOutputBuffer:(NSData *)outputBuffer
+    // Write bytes from the output buffer to the output stream, setting self.error if something 
+    // goes wrong.
+    //
+    // Note that this does nothing if a) self.error is set, implying that we got an error 
+    // somewhere 'upstream', or b) the output buffer length is zero.
+    //
+    // IMPORTANT: -write:maxLength: might not write all the bytes we give it, so we have to loop 
+    // until we've written everything.
+    //
+    // This is a copy of -[QCCAESPadBigCryptor writeFromOutputBuffer:]; see the comment in 
+    // -readToInputBuffer:.
+{
+    NSUInteger      bytesTotal;
+    NSUInteger      bytesSoFar;
+    const uint8_t * buffer;
+    NSInteger       bytesWritten;
+    
+    bytesSoFar = 0;
+    bytesTotal = [outputBuffer length];
+    buffer = (const uint8_t *) [outputBuffer bytes];
+    while ( (self.error == nil) && (bytesSoFar != bytesTotal) ) {
+        bytesWritten = [self.outputStream write:&buffer[bytesSoFar] maxLength:bytesTotal - bytesSoFar];
+        if (bytesWritten < 0) {
+            self.error = [self.outputStream streamError];
+        } else if (bytesWritten == 0) {
+            self.error = [NSError errorWithDomain:NSPOSIXErrorDomain code:EPIPE userInfo:nil];
+        } else {
+            bytesSoFar += (NSUInteger) bytesWritten;
+        }
+    }
+}
+
+- (void)processStreams
+    // Crypts the input stream to the output stream, one chunk at a time.  Set self.error 
+    // if there's a problem.
+{
+    CCCryptorStatus     err;
+    CCCryptorStatus     junk;
+    CCCryptorRef        cryptor;
+    NSMutableData *     inputBuffer;
+    NSMutableData *     outputBuffer;
+    BOOL                done;
+    size_t              bytesToWrite;
+    
+    cryptor = NULL;
+    
+    err = CreateCTRCryptor(self.op, self.keyData, self.ivData, &cryptor);
+    if (err != kCCSuccess) {
+        self.error = [NSError errorWithDomain:kQCCAESCTRBigCryptorErrorDomain code:err userInfo:nil];
+    }
+    
+    // There's no padding, so the output buffer is the same size as the input buffer.
+    
+    inputBuffer  = [[NSMutableData alloc] init];
+    outputBuffer = [[NSMutableData alloc] init];
+    done = NO;
+    while ( (self.error == nil) && ! done ) {
+        if (self.isCancelled) {
+            self.error = [NSError errorWithDomain:NSCocoaErrorDomain code:NSUserCancelledError userInfo:nil];
+        }
+        
+        // Note that -readToInputBuffer: and -writeFromOutputBuffer: do nothing if self.error is set.
+        
+        [inputBuffer setLength:self.chunkSize];
+        [self readToInputBuffer:inputBuffer];
+        
+        if (self.error == nil) {
+            done = ([inputBuffer length] == 0);
+            if ( ! done ) {
+                [outputBuffer setLength:[inputBuffer length]];
+                err = CCCryptorUpdate(
+                    cryptor, 
+                    [inputBuffer bytes], [inputBuffer length], 
+                    [outputBuffer mutableBytes], [outputBuffer length], 
+                    &bytesToWrite
+                );
+                if (err == kCCSuccess) {
+                    [outputBuffer setLength:bytesToWrite];
+                } else {
+                    self.error = [NSError errorWithDomain:kQCCAESCTRBigCryptorErrorDomain code:err userInfo:nil];
+                }
+            }
+        }
+        
+        if ( ! done ) {
+            [self writeFromOutputBuffer:outputBuffer];
+        }
+    }
+    
+    if (cryptor != NULL) {
+        junk = CCCryptorRelease(cryptor);
+        assert(junk == kCCSuccess);
+    }
+}
+
+static CCCryptorStatus CryptSegment(CCOperation op, NSData * keyData, NSData * counterData, NSData * inputSegment, NSMutableData * outputSegment)
+    // Crypts a segment of the input into the output segment, starting with counterData 
+    // as the counter block.  This is called concurrently, so it must not touch the 
+    // operation itself.
+{
+    CCCryptorStatus     err;
+    CCCryptorStatus     junk;
+    CCCryptorRef        cryptor;
+    size_t              bytesCrypted;
+    
+    [outputSegment setLength:[inputSegment length]];
+    bytesCrypted = 0;
+    
+    err = CreateCTRCryptor(op, keyData, counterData, &cryptor);
+    if (err == kCCSuccess) {
+        err = CCCryptorUpdate(
+            cryptor, 
+            [inputSegment bytes], [inputSegment length], 
+            [outputSegment mutableBytes], [outputSegment length], 
+            &bytesCrypted
+        );
+        junk = CCCryptorRelease(cryptor);
+        assert(junk == kCCSuccess);
+    }
+    if (err == kCCSuccess) {
+        [outputSegment setLength:bytesCrypted];
+    }
+    return err;
+}
+
+- (NSMutableData *)readSegment
+    // Reads the next segment from the input stream, setting self.error if something goes wrong.
+    //
+    // Unlike -readToInputBuffer:, this loops until the segment is full or we hit the end 
+    // of the input stream, so that every segment except the last is a whole number of blocks, 
+    // and hence starts on a block boundary.  At the end of the input stream it returns an 
+    // empty segment.
+    //
+    // This is a copy of -[QCCAESPadBigCryptor readSegment]; see the comment in 
+    // -readToInputBuffer:.
+{
+    NSMutableData *     segment;
+    NSUInteger          bytesSoFar;
+    NSInteger           bytesRead;
+    BOOL                atEnd;
+    
+    segment = [[NSMutableData alloc] initWithLength:kParallelSegmentLength];
+    bytesSoFar = 0;
+    atEnd = NO;
+    while ( (self.error == nil) && ! atEnd && (bytesSoFar != [segment length]) ) {
+        bytesRead = [self.inputStream read:((uint8_t *) [segment mutableBytes]) + bytesSoFar maxLength:[segment length] - bytesSoFar];
+        if (bytesRead < 0) {
+            self.error = [self.inputStream streamError];
+            assert(self.error != nil);  // error on input stream
+        } else if (bytesRead == 0) {
+            atEnd = YES;
+        } else {
+            bytesSoFar += (NSUInteger) bytesRead;
+        }
+    }
+    [segment setLength:bytesSoFar];
+    return segment;
+}
+
+- (void)processStreamsInParallel
+    // Crypts the input stream to the output stream, a batch of segments at a time.  Each 
+    // batch is read serially, crypted concurrently, and then written serially, in order.  
+    // Each segment's counter is the initial counter plus the number of blocks before it.  
+    // Set self.error if there's a problem.
+{
+    NSUInteger          batchLimit;
+    CCOperation         op;
+    NSData *            keyData;
+    NSData *            ivData;
+    uint64_t            blocksSoFar;
+    NSMutableArray *    inputSegments;
+    BOOL                done;
+
+    batchLimit = [[NSProcessInfo processInfo] activeProcessorCount];
+    op = self.op;
+    keyData = self.keyData;
+    ivData = self.ivData;
+    blocksSoFar = 0;
+    inputSegments = [[NSMutableArray alloc] init];
+    done = NO;
+    while ( (self.error == nil) && ! done ) {
+        NSMutableData *     segment;
+        NSUInteger          segmentCount;
+        NSUInteger          segmentIndex;
+        NSMutableArray *    outputSegments;
+        NSMutableData *     errsData;
+        CCCryptorStatus *   errs;
+        uint64_t            batchBlocks;
+        
+        if (self.isCancelled) {
+            self.error = [NSError errorWithDomain:NSCocoaErrorDomain code:NSUserCancelledError userInfo:nil];
+        }
+        
+        // Read the batch.  A short segment means we've hit the end of the input stream.
+        
+        if (self.error == nil) {
+            [inputSegments removeAllObjects];
+            do {
+                segment = [self readSegment];
+                if ([segment length] != 0) {
+                    [inputSegments addObject:segment];
+                }
+                done = ([segment length] != kParallelSegmentLength);
+            } while ( (self.error == nil) && ! done && ([inputSegments count] < batchLimit) );
+        }
+        
+        // Crypt it.
+        
+        if (self.error == nil) {
+            segmentCount = [inputSegments count];
+            outputSegments = [[NSMutableArray alloc] init];
+            for (segmentIndex = 0; segmentIndex < segmentCount; segmentIndex++) {
+                [outputSegments addObject:[[NSMutableData alloc] init]];
+            }
+            errsData = [[NSMutableData alloc] initWithLength:segmentCount * sizeof(CCCryptorStatus)];
+            errs = (CCCryptorStatus *) [errsData mutableBytes];
+            batchBlocks = blocksSoFar;
+            
+            dispatch_apply(segmentCount, dispatch_get_global_queue(DISPATCH_QUEUE_PRIORITY_DEFAULT, 0), ^(size_t i) {
+                NSData *    counterData;
+                
+                counterData = CounterDataByAdding(ivData, batchBlocks + (i * (kParallelSegmentLength / kCCBlockSizeAES128)));
+                errs[i] = CryptSegment(op, keyData, counterData, inputSegments[i], outputSegments[i]);
+            });
+            
+            // Write it out in order, stopping at the first error.
+            //
+            // Note that -writeFromOutputBuffer: does nothing if self.error is set.
+            
+            for (segmentIndex = 0; segmentIndex < segmentCount; segmentIndex++) {
+                if ( (self.error == nil) && (errs[segmentIndex] != kCCSuccess) ) {
+                    self.error = [NSError errorWithDomain:kQCCAESCTRBigCryptorErrorDomain code:errs[segmentIndex] userInfo:nil];
+                }
+                [self writeFromOutputBuffer:outputSegments[segmentIndex]];
+            }
+            
+            blocksSoFar += segmentCount * (kParallelSegmentLength / kCCBlockSizeAES128);
+        }
+    }
+}
+
+- (void)mainAfterParameterChecks
+{
+    // Open the streams if necessary.
+
+    if ([self.inputStream streamStatus] == NSStreamStatusNotOpen) {
+        [self.inputStream open];
+        self.didOpenInputStream = YES;
+    }
+    if ([self.outputStream streamStatus] == NSStreamStatusNotOpen) {
+        [self.outputStream open];
+        self.didOpenOutputStream = YES;
+    }
+    
+    // Run the cryptor.
+    
+    if (self.parallel) {
+        [self processStreamsInParallel];
+    } else {
+        [self processStreams];
+    }
+    
+    // Close any streams we opened.
+    
+    if (self.didOpenInputStream) {
+        [self.inputStream close];
+    }
+    if (self.didOpenOutputStream) {
+        [self.outputStream close];
+    }
+}
+
+- (void)main
+{
+    CCCryptorStatus     err;
+    NSUInteger          keyDataLength;
+
+    // We check for common input problems to make it easier for someone tracing through 
+    // the code to find problems (rather than just getting a mysterious kCCParamError back 
+    // from CCCryptorCreateWithMode).  Unlike QCCAESPadBigCryptor, there's no ECB fallback, 
+    // so ivData must be set.
+
+    err = kCCSuccess;
+    keyDataLength = [self.keyData length];
+    if ( (keyDataLength != kCCKeySizeAES128) && (keyDataLength != kCCKeySizeAES192) && (keyDataLength != kCCKeySizeAES256) ) {
+        err = kCCParamError;
+    }
+    if ( (self.ivData == nil) || ([self.ivData length] != kCCBlockSizeAES128) ) {
+        err = kCCParamError;
+    }
+    if (self.chunkSize == 0) {
+        err = kCCParamError;
+    }
+    if (err != kCCSuccess) {
+        self.error = [NSError errorWithDomain:kQCCAESCTRBigCryptorErrorDomain code:err userInfo:nil];
+    } else {
+        [self mainAfterParameterChecks];
+    }
+}
+
+@end
+
+NSString * kQCCAESCTRBigCryptorErrorDomain = @"kQCCAESCTRBigCryptorErrorDomain";
@@ -56,6 +56,24 @@
 // o The operation reads and writes the streams synchronously, making it only suitable for use 
 //   with file streams.  An operation that supported network streams would be significantly 
 //   more complex.
+//
+// o If parallel is set on decrypt, the operation reads the input in 1 MiB segments and 
+//   decrypts a batch of segments (one per active processor) concurrently before writing 
+//   them out in order.  This works because CBC decryption of a block only depends on the 
+//   previous cyphertext block.  Memory use is bounded by the batch, that is, two segments 
+//   (input and output) per active processor.  Encryption is always serial.
+//
+// o Otherwise the operation reads the input stream chunkSize bytes at a time.  If maxChunkSize 
+//   is set, it adapts the chunk size: after every few chunks it measures the throughput and, 
+//   if that improved on the previous chunk size, doubles the chunk size, up to maxChunkSize.  
+//   Once throughput stops improving it settles on the best chunk size it saw.  The operation 
+//   holds one chunk of input and one of output, so maxChunkSize caps its memory use.
+//
+// o If hmacKeyData is set, the operation also calculates an HMAC-SHA1 of the cyphertext 
+//   (the output on encrypt, the input on decrypt) as it goes, in the same pass.  This lets 
+//   you do encrypt-then-MAC without reading the data twice.  Decryption still writes out 
+//   all the plaintext; it's up to you to compare outputHMAC against the expected value 
+//   and discard the plaintext if they don't match.
 
 @interface QCCAESPadBigCryptor : NSOperation
 
@@ -72,10 +90,17 @@
 
 @property (atomic, copy,   readwrite) NSData *          ivData;         // length must be kCCBlockSizeAES128 bytes, defaults to all zeros, 
                                                                         // set to nil for ECB mode (generally a bad idea)
+@property (atomic, assign, readwrite) BOOL              parallel;       // on decrypt, decrypt segments of the input concurrently, 
+                                                                        // defaults to NO, ignored on encrypt
+@property (atomic, assign, readwrite) NSUInteger        chunkSize;      // bytes to read at a time, defaults to 64 KiB, must not be zero
+@property (atomic, assign, readwrite) NSUInteger        maxChunkSize;   // if greater than chunkSize, adapt the chunk size up to this limit, 
+                                                                        // defaults to 0 (don't adapt)
+@property (atomic, copy,   readwrite) NSData *          hmacKeyData;    // if set, calculate an HMAC-SHA1 of the cyphertext, defaults to nil
 
 // properties set on finish
 
 @property (atomic, copy,   readonly ) NSError *         error;
+@property (atomic, copy,   readonly ) NSData *          outputHMAC;     // always 20 bytes, nil if hmacKeyData is nil or on error
 
 @end
 
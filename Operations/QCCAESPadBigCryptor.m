@@ -49,6 +49,21 @@
 
 #include <CommonCrypto/CommonCrypto.h>
 
+// The segment length for parallel decryption.  This must be a multiple of kCCBlockSizeAES128.
+
+enum {
+    kParallelSegmentLength = 1024 * 1024
+};
+
+// When adapting the chunk size, we measure the throughput over this many chunks, and 
+// only grow the chunk size if that throughput beats the previous best by this factor.
+
+enum {
+    kAdaptiveChunkCount = 8
+};
+
+static const double kAdaptiveImprovementFactor = 1.05;
+
 @interface QCCAESPadBigCryptor ()
 
 @property (atomic, assign, readonly ) CCOperation       op;
@@ -58,6 +73,7 @@
 // read/write versions of public properties
 
 @property (atomic, copy,   readwrite) NSError *         error;
+@property (atomic, copy,   readwrite) NSData *          outputHMAC;
 @property (atomic, strong, readwrite) NSOutputStream *  outputStream;
 
 @end
@@ -76,6 +92,7 @@
         self->_outputStream = outputStream;
         self->_keyData = [keyData copy];
         self->_ivData = [[NSMutableData alloc] initWithLength:kCCBlockSizeAES128];
+        self->_chunkSize = 64 * 1024;
     }
     return self;
 }
@@ -100,6 +117,9 @@
     //
     // Also note that this does fail if we hit the end of the input stream; rather it returns 
     // an empty input buffer.
+    //
+    // QCCAESCTRBigCryptor has copies of this, -writeFromOutputBuffer: and -readSegment, so 
+    // that each operation stands on its own.  If you fix a bug in one, fix it in the other.
 {
     NSInteger       bytesRead;
 
@@ -123,6 +143,8 @@
     //
     // IMPORTANT: -write:maxLength: might not write all the bytes we give it, so we have to loop 
     // until we've written everything.
+    //
+    // QCCAESCTRBigCryptor has a copy of this; see the comment in -readToInputBuffer:.
 {
     NSUInteger      bytesTotal;
     NSUInteger      bytesSoFar;
@@ -144,11 +166,13 @@
     }
 }
 
-- (BOOL)processChunkWithCryptor:(CCCryptorRef)cryptor inputBuffer:(NSMutableData *)inputBuffer outputBuffer:(NSMutableData *)outputBuffer
+- (BOOL)processChunkWithCryptor:(CCCryptorRef)cryptor hmacContext:(CCHmacContext *)hmacContext inputBuffer:(NSMutableData *)inputBuffer outputBuffer:(NSMutableData *)outputBuffer
     // Read a chunk of data from the input stream into the input buffer, run it through 
     // the cryptor into the output buffer, and then write it to the output stream.  
-    // If something goes wrong, set self.error.  Return YES if we're all done (either 
-    // because we read the last chunk from the input stream or because we got an error).
+    // If hmacContext is not NULL, also run the cyphertext through it, that is, the input 
+    // buffer on decrypt and the output buffer on encrypt.  If something goes wrong, set 
+    // self.error.  Return YES if we're all done (either because we read the last chunk 
+    // from the input stream or because we got an error).
 {
     CCCryptorStatus     err;
     size_t              bytesToWrite;
@@ -163,6 +187,10 @@
     
     [self readToInputBuffer:inputBuffer];
     
+    if ( (self.error == nil) && (hmacContext != NULL) && (self.op == kCCDecrypt) ) {
+        CCHmacUpdate(hmacContext, [inputBuffer bytes], [inputBuffer length]);
+    }
+    
     // Crypt it.
     // 
     // Note that if we hit the end of the input stream than the input buffer will 
@@ -191,6 +219,10 @@
         }
     }
     
+    if ( (self.error == nil) && (hmacContext != NULL) && (self.op == kCCEncrypt) ) {
+        CCHmacUpdate(hmacContext, [outputBuffer bytes], [outputBuffer length]);
+    }
+    
     // Write it out to the output stream.
     //
     // Note that this does nothing if self.error is set.
@@ -200,9 +232,10 @@
     return (self.error != nil) || ([inputBuffer length] == 0);
 }
 
-- (void)processStreamsInputBuffer:(NSMutableData *)inputBuffer outputBuffer:(NSMutableData *)outputBuffer
+- (void)processStreamsInputBuffer:(NSMutableData *)inputBuffer outputBuffer:(NSMutableData *)outputBuffer hmacContext:(CCHmacContext *)hmacContext
     // Processes the input stream and write the results to the input stream, using the input and output 
-    // buffers as scratch space.  Set self.error if there's a problem.
+    // buffers as scratch space, and running the cyphertext through hmacContext if it's not NULL.  
+    // Set self.error if there's a problem.
 {
     CCCryptorStatus     err;
     CCCryptorStatus     junk;
@@ -228,17 +261,58 @@
     
     if (self.error == nil) {
         BOOL                done;
-        NSUInteger          initialInputBufferLength;
-        NSUInteger          initialOutputBufferLength;
+        NSUInteger          chunkLength;
+        NSUInteger          padLength;
+        BOOL                adapting;
+        NSUInteger          periodChunks;
+        NSUInteger          periodBytes;
+        CFAbsoluteTime      periodStart;
+        double              bestRate;
+        NSUInteger          bestChunkLength;
 
-        initialInputBufferLength  = [inputBuffer  length];
-        initialOutputBufferLength = [outputBuffer length];
+        chunkLength = [inputBuffer  length];
+        padLength   = [outputBuffer length] - chunkLength;
+        
+        adapting = (self.maxChunkSize > chunkLength);
+        periodChunks = 0;
+        periodBytes = 0;
+        periodStart = CFAbsoluteTimeGetCurrent();
+        bestRate = 0.0;
+        bestChunkLength = chunkLength;
 
         do {
-            [inputBuffer  setLength:initialInputBufferLength ];
-            [outputBuffer setLength:initialOutputBufferLength];
+            [inputBuffer  setLength:chunkLength];
+            [outputBuffer setLength:chunkLength + padLength];
 
-            done = [self processChunkWithCryptor:cryptor inputBuffer:inputBuffer outputBuffer:outputBuffer];
+            done = [self processChunkWithCryptor:cryptor hmacContext:hmacContext inputBuffer:inputBuffer outputBuffer:outputBuffer];
+            
+            // If we're adapting, see whether it's time to measure the throughput and, if so, 
+            // either move on to the next chunk size or settle on the best one so far.
+            
+            if (adapting && ! done) {
+                periodChunks += 1;
+                periodBytes += [inputBuffer length];
+                if (periodChunks == kAdaptiveChunkCount) {
+                    CFAbsoluteTime  now;
+                    double          rate;
+                    
+                    now = CFAbsoluteTimeGetCurrent();
+                    rate = (now > periodStart) ? (periodBytes / (now - periodStart)) : HUGE_VAL;
+                    if ( (rate > (bestRate * kAdaptiveImprovementFactor)) && (chunkLength < self.maxChunkSize) ) {
+                        bestRate = rate;
+                        bestChunkLength = chunkLength;
+                        chunkLength = MIN(chunkLength * 2, self.maxChunkSize);
+                    } else {
+                        if (rate < bestRate) {
+                            chunkLength = bestChunkLength;
+                        }
+                        adapting = NO;
+                    }
+                    periodChunks = 0;
+                    periodBytes = 0;
+                    periodStart = now;
+                }
+            }
         } while ( ! done );
     }
     
@@ -250,11 +324,197 @@
     }
 }
 
+static CCCryptorStatus DecryptSegment(NSData * keyData, NSData * ivData, BOOL isLast, NSData * inputSegment, NSMutableData * outputSegment)
+    // Decrypts a segment of the input into the output segment, using ivData as the IV, or 
+    // ECB if it's nil.  Only the last segment is padded.  This is called concurrently, so 
+    // it must not touch the operation itself.
+{
+    CCCryptorStatus     err;
+    CCCryptorStatus     junk;
+    CCCryptorRef        cryptor;
+    size_t              updateBytes;
+    size_t              finalBytes;
+    
+    [outputSegment setLength:[inputSegment length]];
+    updateBytes = 0;
+    finalBytes = 0;
+    
+    err = CCCryptorCreate(
+        kCCDecrypt, 
+        kCCAlgorithmAES128, 
+        ((ivData == nil) ? kCCOptionECBMode : 0) | (isLast ? kCCOptionPKCS7Padding : 0), 
+        [keyData bytes], [keyData length], 
+        [ivData bytes],                                     // will be NULL if ivData is nil
+        &cryptor
+    );
+    if (err == kCCSuccess) {
+        err = CCCryptorUpdate(
+            cryptor, 
+            [inputSegment bytes], [inputSegment length], 
+            [outputSegment mutableBytes], [outputSegment length], 
+            &updateBytes
+        );
+        if (err == kCCSuccess) {
+            err = CCCryptorFinal(
+                cryptor, 
+                ((uint8_t *) [outputSegment mutableBytes]) + updateBytes, [outputSegment length] - updateBytes, 
+                &finalBytes
+            );
+        }
+        junk = CCCryptorRelease(cryptor);
+        assert(junk == kCCSuccess);
+    }
+    if (err == kCCSuccess) {
+        [outputSegment setLength:updateBytes + finalBytes];
+    }
+    return err;
+}
+
+- (NSMutableData *)readSegment
+    // Reads the next segment from the input stream, setting self.error if something goes wrong.
+    //
+    // Unlike -readToInputBuffer:, this loops until the segment is full or we hit the end 
+    // of the input stream, so that every segment except the last is a whole number of blocks.  
+    // At the end of the input stream it returns an empty segment.
+    //
+    // QCCAESCTRBigCryptor has a copy of this; see the comment in -readToInputBuffer:.
+{
+    NSMutableData *     segment;
+    NSUInteger          bytesSoFar;
+    NSInteger           bytesRead;
+    BOOL                atEnd;
+    
+    segment = [[NSMutableData alloc] initWithLength:kParallelSegmentLength];
+    bytesSoFar = 0;
+    atEnd = NO;
+    while ( (self.error == nil) && ! atEnd && (bytesSoFar != [segment length]) ) {
+        bytesRead = [self.inputStream read:((uint8_t *) [segment mutableBytes]) + bytesSoFar maxLength:[segment length] - bytesSoFar];
+        if (bytesRead < 0) {
+            self.error = [self.inputStream streamError];
+            assert(self.error != nil);  // error on input stream
+        } else if (bytesRead == 0) {
+            atEnd = YES;
+        } else {
+            bytesSoFar += (NSUInteger) bytesRead;
+        }
+    }
+    [segment setLength:bytesSoFar];
+    return segment;
+}
+
+- (void)processStreamsInParallelWithHMACContext:(CCHmacContext *)hmacContext
+    // Decrypts the input stream to the output stream, a batch of segments at a time.  Each 
+    // batch is read serially, decrypted concurrently, and then written serially, in order.  
+    // Each segment's IV is the last cyphertext block of the segment before it.  We read one 
+    // segment ahead so that we know which segment is the last, and hence padded.  If 
+    // hmacContext is not NULL, we run each segment through it as we read it, which keeps 
+    // the segments in order.  Set self.error if there's a problem.
+{
+    NSUInteger          batchLimit;
+    NSData *            keyData;
+    NSData *            chainData;
+    NSMutableArray *    inputSegments;
+    NSMutableData *     nextSegment;
+    BOOL                isLastBatch;
+
+    batchLimit = [[NSProcessInfo processInfo] activeProcessorCount];
+    keyData = self.keyData;
+    chainData = self.ivData;
+    inputSegments = [[NSMutableArray alloc] init];
+    nextSegment = [self readSegment];
+    if ( (self.error == nil) && (hmacContext != NULL) ) {
+        CCHmacUpdate(hmacContext, [nextSegment bytes], [nextSegment length]);
+    }
+    isLastBatch = NO;
+    while ( (self.error == nil) && ! isLastBatch ) {
+        NSUInteger          segmentCount;
+        NSUInteger          segmentIndex;
+        NSMutableArray *    outputSegments;
+        NSMutableData *     errsData;
+        CCCryptorStatus *   errs;
+        NSData *            batchChainData;
+        
+        if (self.isCancelled) {
+            self.error = [NSError errorWithDomain:NSCocoaErrorDomain code:NSUserCancelledError userInfo:nil];
+        }
+        
+        // Read the batch.  Note that, if the input is empty, the batch consists of a single 
+        // empty segment, which gets the same treatment as an empty input in the serial case.
+        
+        if (self.error == nil) {
+            [inputSegments removeAllObjects];
+            do {
+                [inputSegments addObject:nextSegment];
+                nextSegment = [self readSegment];
+                if ( (self.error == nil) && (hmacContext != NULL) ) {
+                    CCHmacUpdate(hmacContext, [nextSegment bytes], [nextSegment length]);
+                }
+            } while ( (self.error == nil) && ([nextSegment length] != 0) && ([inputSegments count] < batchLimit) );
+            isLastBatch = ([nextSegment length] == 0);
+        }
+        
+        // Decrypt it.
+        
+        if (self.error == nil) {
+            segmentCount = [inputSegments count];
+            outputSegments = [[NSMutableArray alloc] init];
+            for (segmentIndex = 0; segmentIndex < segmentCount; segmentIndex++) {
+                [outputSegments addObject:[[NSMutableData alloc] init]];
+            }
+            errsData = [[NSMutableData alloc] initWithLength:segmentCount * sizeof(CCCryptorStatus)];
+            errs = (CCCryptorStatus *) [errsData mutableBytes];
+            batchChainData = chainData;
+            
+            dispatch_apply(segmentCount, dispatch_get_global_queue(DISPATCH_QUEUE_PRIORITY_DEFAULT, 0), ^(size_t i) {
+                NSData *    segmentIVData;
+                NSData *    previousSegment;
+                
+                if ( (batchChainData == nil) || (i == 0) ) {
+                    segmentIVData = batchChainData;
+                } else {
+                    previousSegment = inputSegments[i - 1];
+                    segmentIVData = [previousSegment subdataWithRange:NSMakeRange([previousSegment length] - kCCBlockSizeAES128, kCCBlockSizeAES128)];
+                }
+                errs[i] = DecryptSegment(keyData, segmentIVData, isLastBatch && (i == (segmentCount - 1)), inputSegments[i], outputSegments[i]);
+            });
+            
+            // Write it out in order, stopping at the first error.
+            //
+            // Note that -writeFromOutputBuffer: does nothing if self.error is set.
+            
+            for (segmentIndex = 0; segmentIndex < segmentCount; segmentIndex++) {
+                if ( (self.error == nil) && (errs[segmentIndex] != kCCSuccess) ) {
+                    self.error = [NSError errorWithDomain:kQCCAESPadBigCryptorErrorDomain code:errs[segmentIndex] userInfo:nil];
+                }
+                [self writeFromOutputBuffer:outputSegments[segmentIndex]];
+            }
+            
+            if ( (chainData != nil) && ! isLastBatch ) {
+                NSData *    lastSegment;
+                
+                lastSegment = [inputSegments lastObject];
+                chainData = [lastSegment subdataWithRange:NSMakeRange([lastSegment length] - kCCBlockSizeAES128, kCCBlockSizeAES128)];
+            }
+        }
+    }
+}
+
 - (void)mainAfterParameterChecks
 {
     NSUInteger          padLength;
     NSMutableData *     inputBuffer;
     NSMutableData *     outputBuffer;
+    CCHmacContext       hmacContextStorage;
+    CCHmacContext *     hmacContext;
+    uint8_t             hmac[CC_SHA1_DIGEST_LENGTH];
+    
+    // Set up the HMAC, if any.  The cyphertext is fed through it as we go.
+    
+    hmacContext = NULL;
+    if (self.hmacKeyData != nil) {
+        hmacContext = &hmacContextStorage;
+        CCHmacInit(hmacContext, kCCHmacAlgSHA1, [self.hmacKeyData bytes], [self.hmacKeyData length]);
+    }
     
     // Open the streams if necessary.
 
@@ -267,25 +527,41 @@
         self.didOpenOutputStream = YES;
     }
     
-    // Allocate the input and output buffers.  We use a 64K buffer, which is generally a good 
-    // size when reading from a file.
-    //
-    // Padding can expand the data, so we have to allocate space for that.  The rule for block 
-    // cyphers, like AES, is that the padding only adds space on encryption (on decryption it 
-    // can reduce space, obviously, but we don't need to account for that) and it will only add 
-    // at most one block size worth of space.
+    if ( (self.op == kCCDecrypt) && self.parallel ) {
+    
+        // Run the segments through a cryptor each, in parallel.
+        
+        [self processStreamsInParallelWithHMACContext:hmacContext];
+    } else {
+
+        // Allocate the input and output buffers.  By default we use a 64K buffer, which is 
+        // generally a good size when reading from a file.  If we're adapting the chunk size, 
+        // the buffers grow as we go.
+        //
+        // Padding can expand the data, so we have to allocate space for that.  The rule for block 
+        // cyphers, like AES, is that the padding only adds space on encryption (on decryption it 
+        // can reduce space, obviously, but we don't need to account for that) and it will only add 
+        // at most one block size worth of space.
+        //
+        // On decryption the cryptor holds back the last block it's seen, and any partial block, 
+        // so a chunk can produce up to one block more output than its input.  That matters when 
+        // the chunk size is small, so we allow one block of space in both cases.
 
-    if (self.op == kCCEncrypt) {
         padLength = kCCBlockSizeAES128;
-    } else {
-        padLength = 0;
-    }
-    inputBuffer  = [[NSMutableData alloc] initWithLength:64 * 1024];
-    outputBuffer = [[NSMutableData alloc] initWithLength:[inputBuffer length] + padLength];
+        inputBuffer  = [[NSMutableData alloc] initWithLength:self.chunkSize];
+        outputBuffer = [[NSMutableData alloc] initWithLength:[inputBuffer length] + padLength];
 
-    // Run the cryptor.
+        // Run the cryptor.
+        
+        [self processStreamsInputBuffer:inputBuffer outputBuffer:outputBuffer hmacContext:hmacContext];
+    }
     
-    [self processStreamsInputBuffer:inputBuffer outputBuffer:outputBuffer];
+    // As with CCHmac, the output length is determined by the hash algorithm.
+    
+    if ( (self.error == nil) && (hmacContext != NULL) ) {
+        CCHmacFinal(hmacContext, hmac);
+        self.outputHMAC = [[NSData alloc] initWithBytes:hmac length:sizeof(hmac)];
+    }
     
     // Close any streams we opened.
     
@@ -314,6 +590,9 @@
     if ( (self.ivData != nil) && ([self.ivData length] != kCCBlockSizeAES128) ) {
         err = kCCParamError;
     }
+    if (self.chunkSize == 0) {
+        err = kCCParamError;
+    }
     if (err != kCCSuccess) {
         self.error = [NSError errorWithDomain:kQCCAESPadBigCryptorErrorDomain code:err userInfo:nil];
     } else {
@@ -0,0 +1,301 @@
+/*
+     File: QCCBase64BigDecode.m
+ Abstract: Implements Base64 decoding in a way that's suitable for large data sets.
+  Version: 1.0
+ 
+ Disclaimer: IMPORTANT:  This Apple software is supplied to you by Apple
+ Inc. ("Apple") in consideration of your agreement to the following
+ terms, and your use, installation, modification or redistribution of
+ this Apple software constitutes acceptance of these terms.  If you do
+ not agree with these terms, please do not use, install, modify or
+ redistribute this Apple software.
+ 
+ In consideration of your agreement to abide by the following terms, and
+ subject to these terms, Apple grants you a personal, non-exclusive
+ license, under Apple's copyrights in this original Apple software (the
+ "Apple Software"), to use, reproduce, modify and redistribute the Apple
+ Software, with or without modifications, in source and/or binary forms;
+ provided that if you redistribute the Apple Software in its entirety and
+ without modifications, you must retain this notice and the following
+ text and disclaimers in all such redistributions of the Apple Software.
+ Neither the name, trademarks, service marks or logos of Apple Inc. may
+ be used to endorse or promote products derived from the Apple Software
+ without specific prior written permission from Apple.  Except as
+ expressly stated in this notice, no other rights or licenses, express or
+ implied, are granted by Apple herein, including but not limited to any
+ patent rights that may be infringed by your derivative works or by other
+ works in which the Apple Software may be incorporated.
+ 
+ The Apple Software is provided by Apple on an "AS IS" basis.  APPLE
+ MAKES NO WARRANTIES, EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION
+ THE IMPLIED WARRANTIES OF NON-INFRINGEMENT, MERCHANTABILITY AND FITNESS
+ FOR A PARTICULAR PURPOSE, REGARDING THE APPLE SOFTWARE OR ITS USE AND
+ OPERATION ALONE OR IN COMBINATION WITH YOUR PRODUCTS.
+ 
+ IN NO EVENT SHALL APPLE BE LIABLE FOR ANY SPECIAL, INDIRECT, INCIDENTAL
+ OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+ SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+ INTERRUPTION) ARISING IN ANY WAY OUT OF THE USE, REPRODUCTION,
+ MODIFICATION AND/OR DISTRIBUTION OF THE APPLE SOFTWARE, HOWEVER CAUSED
+ AND WHETHER UNDER THEORY OF CONTRACT, TORT (INCLUDING NEGLIGENCE),
+ STRICT LIABILITY OR OTHERWISE, EVEN IF APPLE HAS BEEN ADVISED OF THE
+ POSSIBILITY OF SUCH DAMAGE.
+ 
+ Copyright (C) 2013 Apple Inc. All Rights Reserved.
+ 
+ */
+
+#import "QCCBase64BigDecode.h"
+
+// b64_pton, which QCCBase64Decode uses, has to see the whole input at once, so we do the 
+// decoding ourselves.  kBase64Values maps a character to its 6-bit value plus one, so that 
+// the zero entries, which is all the ones we don't list, mark the characters that aren't 
+// in the Base64 alphabet.  The padding character is handled separately.
+
+static const uint8_t kBase64Values[256] = {
+    ['A'] =  1, ['B'] =  2, ['C'] =  3, ['D'] =  4, ['E'] =  5, ['F'] =  6, ['G'] =  7, ['H'] =  8, 
+    ['I'] =  9, ['J'] = 10, ['K'] = 11, ['L'] = 12, ['M'] = 13, ['N'] = 14, ['O'] = 15, ['P'] = 16, 
+    ['Q'] = 17, ['R'] = 18, ['S'] = 19, ['T'] = 20, ['U'] = 21, ['V'] = 22, ['W'] = 23, ['X'] = 24, 
+    ['Y'] = 25, ['Z'] = 26, ['a'] = 27, ['b'] = 28, ['c'] = 29, ['d'] = 30, ['e'] = 31, ['f'] = 32, 
+    ['g'] = 33, ['h'] = 34, ['i'] = 35, ['j'] = 36, ['k'] = 37, ['l'] = 38, ['m'] = 39, ['n'] = 40, 
+    ['o'] = 41, ['p'] = 42, ['q'] = 43, ['r'] = 44, ['s'] = 45, ['t'] = 46, ['u'] = 47, ['v'] = 48, 
+    ['w'] = 49, ['x'] = 50, ['y'] = 51, ['z'] = 52, ['0'] = 53, ['1'] = 54, ['2'] = 55, ['3'] = 56, 
+    ['4'] = 57, ['5'] = 58, ['6'] = 59, ['7'] = 60, ['8'] = 61, ['9'] = 62, ['+'] = 63, ['/'] = 64
+};
+
+// We read the input this many bytes at a time.  Every 4 characters of input produce at 
+// most 3 bytes of output, and a chunk can complete a quantum started in the previous one, 
+// so the output buffer needs room for a few extra bytes.
+
+enum {
+    kInputChunkSize = 64 * 1024, 
+    kOutputBufferSize = ((kInputChunkSize / 4) * 3) + 3
+};
+
+// The decoder state carried from one chunk to the next.  bits holds the bits of the 
+// current quantum, charCount is the number of characters in the quantum so far, and 
+// padCount is the number of padding characters we've seen (after which only whitespace, 
+// or a second padding character, is allowed).
+
+typedef struct {
+    uint32_t    bits;
+    NSUInteger  charCount;
+    NSUInteger  padCount;
+} DecodeState;
+
+static BOOL IsBase64Whitespace(uint8_t ch)
+    // The same characters as isspace in the C locale, which is what b64_pton skips.
+{
+    return (ch == ' ') || (ch == '\t') || (ch == '\n') || (ch == '\v') || (ch == '\f') || (ch == '\r');
+}
+
+static BOOL DecodeChunk(DecodeState * state, const uint8_t * input, NSUInteger inputLength, uint8_t * output, NSUInteger * outputLengthPtr)
+    // Decodes the input, updating state and placing the output in the output buffer, which 
+    // must be big enough (see kOutputBufferSize).  Returns NO if the input isn't valid.
+{
+    NSUInteger  outputLength;
+    uint8_t     value;
+    
+    outputLength = 0;
+    for (NSUInteger i = 0; i < inputLength; i++) {
+        if (IsBase64Whitespace(input[i])) {
+            continue;
+        }
+        if (input[i] == '=') {
+            // A quantum of two characters needs two padding characters (and encodes one byte); 
+            // a quantum of three characters needs one (and encodes two bytes).  Either way, the 
+            // bits that don't make up a whole byte must be zero.
+            
+            if (state->padCount != 0) {
+                if ( (state->charCount != 2) || (state->padCount != 1) ) {
+                    return NO;
+                }
+                state->padCount = 2;
+            } else if (state->charCount == 2) {
+                if ((state->bits & 0x0f) != 0) {
+                    return NO;
+                }
+                output[outputLength++] = (uint8_t) (state->bits >> 4);
+                state->padCount = 1;
+            } else if (state->charCount == 3) {
+                if ((state->bits & 0x03) != 0) {
+                    return NO;
+                }
+                output[outputLength++] = (uint8_t) (state->bits >> 10);
+                output[outputLength++] = (uint8_t) (state->bits >> 2);
+                state->padCount = 1;
+            } else {
+                return NO;
+            }
+        } else {
+            value = kBase64Values[input[i]];
+            if ( (value == 0) || (state->padCount != 0) ) {
+                return NO;
+            }
+            state->bits = (state->bits << 6) | (uint32_t) (value - 1);
+            state->charCount += 1;
+            if (state->charCount == 4) {
+                output[outputLength++] = (uint8_t) (state->bits >> 16);
+                output[outputLength++] = (uint8_t) (state->bits >> 8);
+                output[outputLength++] = (uint8_t)  state->bits;
+                state->bits = 0;
+                state->charCount = 0;
+            }
+        }
+    }
+    *outputLengthPtr = outputLength;
+    return YES;
+}
+
+static BOOL DecodeStateIsComplete(const DecodeState * state)
+    // Returns YES if the input so far ends at a valid point, that is, at the end of a 
+    // quantum or after the right amount of padding.
+{
+    BOOL    result;
+    
+    switch (state->charCount) {
+        case 0:  { result = YES;                        } break;
+        case 2:  { result = (state->padCount == 2);     } break;
+        case 3:  { result = (state->padCount == 1);     } break;
+        default: { result = NO;                         } break;
+    }
+    return result;
+}
+
+@interface QCCBase64BigDecode ()
+
+@property (atomic, assign, readwrite) BOOL              didOpenInputStream;
+@property (atomic, assign, readwrite) BOOL              didOpenOutputStream;
+
+// read/write versions of public properties
+
+@property (atomic, copy,   readwrite) NSError *         error;
+
+@end
+
+@implementation QCCBase64BigDecode
+
+- (id)initWithInputStream:(NSInputStream *)inputStream outputStream:(NSOutputStream *)outputStream
+{
+    NSParameterAssert(inputStream != nil);
+    NSParameterAssert(outputStream != nil);
+    self = [super init];
+    if (self != nil) {
+        self->_inputStream = inputStream;
+        self->_outputStream = outputStream;
+    }
+    return self;
+}
+
+- (void)fillInputBuffer:(NSMutableData *)inputBuffer
+    // Reads bytes from the input stream until the input buffer is full or we hit the end of 
+    // the stream, setting self.error if something goes wrong.  On return the length of the 
+    // input buffer is the number of bytes read, so a short buffer means we're at the end 
+    // of the stream.
+    //
+    // -read:maxLength: might not return the full number of bytes we request, even when we're 
+    // not at the end of the stream, which is why we loop.
+{
+    NSUInteger      bytesTotal;
+    NSUInteger      bytesSoFar;
+    NSInteger       bytesRead;
+    
+    bytesTotal = [inputBuffer length];
+    bytesSoFar = 0;
+    do {
+        bytesRead = [self.inputStream read:((uint8_t *) [inputBuffer mutableBytes]) + bytesSoFar maxLength:bytesTotal - bytesSoFar];
+        if (bytesRead < 0) {
+            self.error = [self.inputStream streamError];
+            assert(self.error != nil);  // error on input stream
+        } else {
+            bytesSoFar += (NSUInteger) bytesRead;
+        }
+    } while ( (self.error == nil) && (bytesRead > 0) && (bytesSoFar != bytesTotal) );
+    [inputBuffer setLength:bytesSoFar];
+}
+
+- (void)writeFromOutputBuffer:(NSData *)outputBuffer
+    // Writes bytes from the output buffer to the output stream, setting self.error if something 
+    // goes wrong.  As with QCCAESPadBigCryptor, we have to loop because -write:maxLength: might 
+    // not write all the bytes we give it.
+{
+    NSUInteger      bytesTotal;
+    NSUInteger      bytesSoFar;
+    const uint8_t * buffer;
+    NSInteger       bytesWritten;
+    
+    bytesSoFar = 0;
+    bytesTotal = [outputBuffer length];
+    buffer = (const uint8_t *) [outputBuffer bytes];
+    while ( (self.error == nil) && (bytesSoFar != bytesTotal) ) {
+        bytesWritten = [self.outputStream write:&buffer[bytesSoFar] maxLength:bytesTotal - bytesSoFar];
+        if (bytesWritten < 0) {
+            self.error = [self.outputStream streamError];
+        } else if (bytesWritten == 0) {
+            self.error = [NSError errorWithDomain:NSPOSIXErrorDomain code:EPIPE userInfo:nil];
+        } else {
+            bytesSoFar += (NSUInteger) bytesWritten;
+        }
+    }
+}
+
+- (void)main
+{
+    NSMutableData *     inputBuffer;
+    NSMutableData *     outputBuffer;
+    DecodeState         state;
+    NSUInteger          outputLength;
+    BOOL                done;
+    
+    // Open the streams if necessary.
+
+    if ([self.inputStream streamStatus] == NSStreamStatusNotOpen) {
+        [self.inputStream open];
+        self.didOpenInputStream = YES;
+    }
+    if ([self.outputStream streamStatus] == NSStreamStatusNotOpen) {
+        [self.outputStream open];
+        self.didOpenOutputStream = YES;
+    }
+
+    // Process the input, one chunk at a time.  A short chunk means we've hit the end of 
+    // the input, at which point we check that the input didn't stop part way through 
+    // a quantum.
+    
+    inputBuffer  = [[NSMutableData alloc] initWithLength:kInputChunkSize];
+    outputBuffer = [[NSMutableData alloc] initWithLength:kOutputBufferSize];
+    memset(&state, 0, sizeof(state));
+    done = NO;
+    while ( (self.error == nil) && ! done ) {
+        if (self.isCancelled) {
+            self.error = [NSError errorWithDomain:NSCocoaErrorDomain code:NSUserCancelledError userInfo:nil];
+        } else {
+            [inputBuffer setLength:kInputChunkSize];
+            [self fillInputBuffer:inputBuffer];
+            if (self.error == nil) {
+                done = ([inputBuffer length] != kInputChunkSize);
+                [outputBuffer setLength:kOutputBufferSize];
+                if ( ! DecodeChunk(&state, [inputBuffer bytes], [inputBuffer length], [outputBuffer mutableBytes], &outputLength) ) {
+                    self.error = [NSError errorWithDomain:NSCocoaErrorDomain code:NSFileReadCorruptFileError userInfo:nil];
+                } else {
+                    [outputBuffer setLength:outputLength];
+                    [self writeFromOutputBuffer:outputBuffer];
+                }
+                if ( (self.error == nil) && done && ! DecodeStateIsComplete(&state) ) {
+                    self.error = [NSError errorWithDomain:NSCocoaErrorDomain code:NSFileReadCorruptFileError userInfo:nil];
+                }
+            }
+        }
+    }
+    
+    // Close any streams we opened.
+    
+    if (self.didOpenInputStream) {
+        [self.inputStream close];
+    }
+    if (self.didOpenOutputStream) {
+        [self.outputStream close];
+    }
+}
+
+@end
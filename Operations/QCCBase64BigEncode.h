@@ -0,0 +1,87 @@
+/*
+     File: QCCBase64BigEncode.h
+ Abstract: Implements Base64 encoding in a way that's suitable for large data sets.
+  Version: 1.0
+ 
+ Disclaimer: IMPORTANT:  This Apple software is supplied to you by Apple
+ Inc. ("Apple") in consideration of your agreement to the following
+ terms, and your use, installation, modification or redistribution of
+ this Apple software constitutes acceptance of these terms.  If you do
+ not agree with these terms, please do not use, install, modify or
+ redistribute this Apple software.
+ 
+ In consideration of your agreement to abide by the following terms, and
+ subject to these terms, Apple grants you a personal, non-exclusive
+ license, under Apple's copyrights in this original Apple software (the
+ "Apple Software"), to use, reproduce, modify and redistribute the Apple
+ Software, with or without modifications, in source and/or binary forms;
+ provided that if you redistribute the Apple Software in its entirety and
+ without modifications, you must retain this notice and the following
+ text and disclaimers in all such redistributions of the Apple Software.
+ Neither the name, trademarks, service marks or logos of Apple Inc. may
+ be used to endorse or promote products derived from the Apple Software
+ without specific prior written permission from Apple.  Except as
+ expressly stated in this notice, no other rights or licenses, express or
+ implied, are granted by Apple herein, including but not limited to any
+ patent rights that may be infringed by your derivative works or by other
+ works in which the Apple Software may be incorporated.
+ 
+ The Apple Software is provided by Apple on an "AS IS" basis.  APPLE
+ MAKES NO WARRANTIES, EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION
+ THE IMPLIED WARRANTIES OF NON-INFRINGEMENT, MERCHANTABILITY AND FITNESS
+ FOR A PARTICULAR PURPOSE, REGARDING THE APPLE SOFTWARE OR ITS USE AND
+ OPERATION ALONE OR IN COMBINATION WITH YOUR PRODUCTS.
+ 
+ IN NO EVENT SHALL APPLE BE LIABLE FOR ANY SPECIAL, INDIRECT, INCIDENTAL
+ OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+ SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+ INTERRUPTION) ARISING IN ANY WAY OUT OF THE USE, REPRODUCTION,
+ MODIFICATION AND/OR DISTRIBUTION OF THE APPLE SOFTWARE, HOWEVER CAUSED
+ AND WHETHER UNDER THEORY OF CONTRACT, TORT (INCLUDING NEGLIGENCE),
+ STRICT LIABILITY OR OTHERWISE, EVEN IF APPLE HAS BEEN ADVISED OF THE
+ POSSIBILITY OF SUCH DAMAGE.
+ 
+ Copyright (C) 2013 Apple Inc. All Rights Reserved.
+ 
+ */
+
+#import <Foundation/Foundation.h>
+
+// Encodes a stream as Base64, a chunk at a time, writing the result to another stream.  
+// Like QCCBase64Encode, it doesn't do anything especially clever.
+//
+// Notes:
+//
+// o The streams are opened if they're in state NSStreamStatusNotOpen when the operation is run.
+// 
+// o If the operation opens the streams, it closes them at the end.
+//
+// o The operation reads and writes the streams synchronously, making it only suitable for use 
+//   with file streams.
+//
+// o The operation holds one chunk of input and one of output, so it runs in constant memory 
+//   regardless of the size of the input.  If addLineBreaks is set, it writes each line, 
+//   and its line break, straight into the output chunk, so there's no second pass to add 
+//   the line breaks.
+// 
+// IMPORTANT: To use this class you must link with "libresolv.dylib".
+
+@interface QCCBase64BigEncode : NSOperation
+
+- (id)initWithInputStream:(NSInputStream *)inputStream outputStream:(NSOutputStream *)outputStream;
+
+// properties set by the init method
+
+@property (atomic, strong, readonly ) NSInputStream *   inputStream;
+@property (atomic, strong, readonly ) NSOutputStream *  outputStream;
+
+// properties that may be set before running
+
+@property (atomic, assign, readwrite) BOOL              addLineBreaks;  // if set, adds a line break after every 64 characters and at the end, 
+                                                                        // just like QCCBase64Encode
+
+// properties set on finish
+
+@property (atomic, copy,   readonly ) NSError *         error;
+
+@end
@@ -0,0 +1,227 @@
+/*
+     File: QCCBase64BigEncode.m
+ Abstract: Implements Base64 encoding in a way that's suitable for large data sets.
+  Version: 1.0
+ 
+ Disclaimer: IMPORTANT:  This Apple software is supplied to you by Apple
+ Inc. ("Apple") in consideration of your agreement to the following
+ terms, and your use, installation, modification or redistribution of
+ this Apple software constitutes acceptance of these terms.  If you do
+ not agree with these terms, please do not use, install, modify or
+ redistribute this Apple software.
+ 
+ In consideration of your agreement to abide by the following terms, and
+ subject to these terms, Apple grants you a personal, non-exclusive
+ license, under Apple's copyrights in this original Apple software (the
+ "Apple Software"), to use, reproduce, modify and redistribute the Apple
+ Software, with or without modifications, in source and/or binary forms;
+ provided that if you redistribute the Apple Software in its entirety and
+ without modifications, you must retain this notice and the following
+ text and disclaimers in all such redistributions of the Apple Software.
+ Neither the name, trademarks, service marks or logos of Apple Inc. may
+ be used to endorse or promote products derived from the Apple Software
+ without specific prior written permission from Apple.  Except as
+ expressly stated in this notice, no other rights or licenses, express or
+ implied, are granted by Apple herein, including but not limited to any
+ patent rights that may be infringed by your derivative works or by other
+ works in which the Apple Software may be incorporated.
+ 
+ The Apple Software is provided by Apple on an "AS IS" basis.  APPLE
+ MAKES NO WARRANTIES, EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION
+ THE IMPLIED WARRANTIES OF NON-INFRINGEMENT, MERCHANTABILITY AND FITNESS
+ FOR A PARTICULAR PURPOSE, REGARDING THE APPLE SOFTWARE OR ITS USE AND
+ OPERATION ALONE OR IN COMBINATION WITH YOUR PRODUCTS.
+ 
+ IN NO EVENT SHALL APPLE BE LIABLE FOR ANY SPECIAL, INDIRECT, INCIDENTAL
+ OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+ SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+ INTERRUPTION) ARISING IN ANY WAY OUT OF THE USE, REPRODUCTION,
+ MODIFICATION AND/OR DISTRIBUTION OF THE APPLE SOFTWARE, HOWEVER CAUSED
+ AND WHETHER UNDER THEORY OF CONTRACT, TORT (INCLUDING NEGLIGENCE),
+ STRICT LIABILITY OR OTHERWISE, EVEN IF APPLE HAS BEEN ADVISED OF THE
+ POSSIBILITY OF SUCH DAMAGE.
+ 
+ Copyright (C) 2013 Apple Inc. All Rights Reserved.
+ 
+ */
+
+#import "QCCBase64BigEncode.h"
+
+#include <resolv.h>
+
+// Each 64 character line of Base64 encodes 48 bytes of input.  We read the input in chunks 
+// of a whole number of lines, so every chunk but the last encodes to whole lines (and whole 
+// Base64 quanta), and thus nothing carries over from one chunk to the next.  The output 
+// buffer has room for a chunk's worth of lines, their line breaks, and the trailing null 
+// that b64_ntop always writes.
+
+enum {
+    kBytesPerLine = 48, 
+    kCharsPerLine = 64, 
+    kLinesPerChunk = 1024, 
+    kInputChunkSize = kBytesPerLine * kLinesPerChunk, 
+    kOutputBufferSize = ((kCharsPerLine + 1) * kLinesPerChunk) + 1
+};
+
+@interface QCCBase64BigEncode ()
+
+@property (atomic, assign, readwrite) BOOL              didOpenInputStream;
+@property (atomic, assign, readwrite) BOOL              didOpenOutputStream;
+
+// read/write versions of public properties
+
+@property (atomic, copy,   readwrite) NSError *         error;
+
+@end
+
+@implementation QCCBase64BigEncode
+
+- (id)initWithInputStream:(NSInputStream *)inputStream outputStream:(NSOutputStream *)outputStream
+{
+    NSParameterAssert(inputStream != nil);
+    NSParameterAssert(outputStream != nil);
+    self = [super init];
+    if (self != nil) {
+        self->_inputStream = inputStream;
+        self->_outputStream = outputStream;
+    }
+    return self;
+}
+
+- (void)fillInputBuffer:(NSMutableData *)inputBuffer
+    // Reads bytes from the input stream until the input buffer is full or we hit the end of 
+    // the stream, setting self.error if something goes wrong.  On return the length of the 
+    // input buffer is the number of bytes read, so a short buffer means we're at the end 
+    // of the stream.
+    //
+    // -read:maxLength: might not return the full number of bytes we request, even when we're 
+    // not at the end of the stream, which is why we loop.
+{
+    NSUInteger      bytesTotal;
+    NSUInteger      bytesSoFar;
+    NSInteger       bytesRead;
+    
+    bytesTotal = [inputBuffer length];
+    bytesSoFar = 0;
+    do {
+        bytesRead = [self.inputStream read:((uint8_t *) [inputBuffer mutableBytes]) + bytesSoFar maxLength:bytesTotal - bytesSoFar];
+        if (bytesRead < 0) {
+            self.error = [self.inputStream streamError];
+            assert(self.error != nil);  // error on input stream
+        } else {
+            bytesSoFar += (NSUInteger) bytesRead;
+        }
+    } while ( (self.error == nil) && (bytesRead > 0) && (bytesSoFar != bytesTotal) );
+    [inputBuffer setLength:bytesSoFar];
+}
+
+- (void)writeFromOutputBuffer:(NSData *)outputBuffer
+    // Writes bytes from the output buffer to the output stream, setting self.error if something 
+    // goes wrong.  As with QCCAESPadBigCryptor, we have to loop because -write:maxLength: might 
+    // not write all the bytes we give it.
+{
+    NSUInteger      bytesTotal;
+    NSUInteger      bytesSoFar;
+    const uint8_t * buffer;
+    NSInteger       bytesWritten;
+    
+    bytesSoFar = 0;
+    bytesTotal = [outputBuffer length];
+    buffer = (const uint8_t *) [outputBuffer bytes];
+    while ( (self.error == nil) && (bytesSoFar != bytesTotal) ) {
+        bytesWritten = [self.outputStream write:&buffer[bytesSoFar] maxLength:bytesTotal - bytesSoFar];
+        if (bytesWritten < 0) {
+            self.error = [self.outputStream streamError];
+        } else if (bytesWritten == 0) {
+            self.error = [NSError errorWithDomain:NSPOSIXErrorDomain code:EPIPE userInfo:nil];
+        } else {
+            bytesSoFar += (NSUInteger) bytesWritten;
+        }
+    }
+}
+
+- (void)encodeInputBuffer:(NSData *)inputBuffer toOutputBuffer:(NSMutableData *)outputBuffer
+    // Encodes the input buffer into the output buffer.  If we're adding line breaks we encode 
+    // a line at a time, writing each line break over the null that b64_ntop puts at the end 
+    // of the line, which builds the wrapped output in a single pass.
+    //
+    // See QCCBase64Encode for a description of b64_ntop.
+{
+    const uint8_t * input;
+    NSUInteger      inputLength;
+    NSUInteger      inputCursor;
+    char *          output;
+    NSUInteger      outputCursor;
+    int             charsEncoded;
+    
+    [outputBuffer setLength:kOutputBufferSize];
+    input = (const uint8_t *) [inputBuffer bytes];
+    inputLength = [inputBuffer length];
+    output = (char *) [outputBuffer mutableBytes];
+    outputCursor = 0;
+    
+    if (self.addLineBreaks) {
+        for (inputCursor = 0; inputCursor < inputLength; inputCursor += kBytesPerLine) {
+            charsEncoded = b64_ntop(&input[inputCursor], MIN(kBytesPerLine, inputLength - inputCursor), &output[outputCursor], kOutputBufferSize - outputCursor);
+            assert(charsEncoded > 0);
+            outputCursor += (NSUInteger) charsEncoded;
+            output[outputCursor] = '\n';
+            outputCursor += 1;
+        }
+    } else if (inputLength != 0) {
+        charsEncoded = b64_ntop(input, inputLength, output, kOutputBufferSize);
+        assert(charsEncoded > 0);
+        outputCursor = (NSUInteger) charsEncoded;
+    }
+    
+    [outputBuffer setLength:outputCursor];
+}
+
+- (void)main
+{
+    NSMutableData *     inputBuffer;
+    NSMutableData *     outputBuffer;
+    BOOL                done;
+    
+    // Open the streams if necessary.
+
+    if ([self.inputStream streamStatus] == NSStreamStatusNotOpen) {
+        [self.inputStream open];
+        self.didOpenInputStream = YES;
+    }
+    if ([self.outputStream streamStatus] == NSStreamStatusNotOpen) {
+        [self.outputStream open];
+        self.didOpenOutputStream = YES;
+    }
+
+    // Process the input, one chunk at a time.  A short chunk means we've hit the end of 
+    // the input.
+    
+    inputBuffer  = [[NSMutableData alloc] initWithLength:kInputChunkSize];
+    outputBuffer = [[NSMutableData alloc] initWithLength:kOutputBufferSize];
+    done = NO;
+    while ( (self.error == nil) && ! done ) {
+        if (self.isCancelled) {
+            self.error = [NSError errorWithDomain:NSCocoaErrorDomain code:NSUserCancelledError userInfo:nil];
+        } else {
+            [inputBuffer setLength:kInputChunkSize];
+            [self fillInputBuffer:inputBuffer];
+            if (self.error == nil) {
+                done = ([inputBuffer length] != kInputChunkSize);
+                [self encodeInputBuffer:inputBuffer toOutputBuffer:outputBuffer];
+                [self writeFromOutputBuffer:outputBuffer];
+            }
+        }
+    }
+    
+    // Close any streams we opened.
+    
+    if (self.didOpenInputStream) {
+        [self.inputStream close];
+    }
+    if (self.didOpenOutputStream) {
+        [self.outputStream close];
+    }
+}
+
+@end
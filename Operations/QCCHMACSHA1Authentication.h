@@ -47,17 +47,30 @@
 
 #import <Foundation/Foundation.h>
 
+// Notes:
+//
+// o If initialised with a stream, the operation reads the stream a chunk at a time and 
+//   feeds it through the HMAC incrementally, so the input never has to be in memory 
+//   all at once.  It opens the stream if it's in state NSStreamStatusNotOpen and, if so, 
+//   closes it at the end.
+//
+// o The operation reads the stream synchronously, making it only suitable for use with 
+//   file streams (or streams of in-memory data).
+
 @interface QCCHMACSHA1Authentication : NSOperation
 
 - (id)initWithInputData:(NSData *)inputData keyData:(NSData *)keyData;
+- (id)initWithInputStream:(NSInputStream *)inputStream keyData:(NSData *)keyData;
 
 // properties set by the init method
 
-@property (atomic, copy,   readonly ) NSData *      inputData;
-@property (atomic, copy,   readonly ) NSData *      keyData;
+@property (atomic, copy,   readonly ) NSData *          inputData;      // nil if initialised with a stream
+@property (atomic, strong, readonly ) NSInputStream *   inputStream;    // nil if initialised with data
+@property (atomic, copy,   readonly ) NSData *          keyData;
 
 // properties set on finish
 
-@property (atomic, copy,   readonly ) NSData *      outputHMAC;         // always 20 bytes
+@property (atomic, copy,   readonly ) NSData *          outputHMAC;     // always 20 bytes, nil on error
+@property (atomic, copy,   readonly ) NSError *         error;          // nil on success, always nil if initialised with data
 
 @end
@@ -49,11 +49,18 @@
 
 #include <CommonCrypto/CommonCrypto.h>
 
+// The number of bytes to read from the input stream at a time.
+
+enum {
+    kStreamChunkSize = 64 * 1024
+};
+
 @interface QCCHMACSHA1Authentication ()
 
 // read/write versions of public properties
 
 @property (atomic, copy,   readwrite) NSData *      outputHMAC;
+@property (atomic, copy,   readwrite) NSError *     error;
 
 @end
 
@@ -71,7 +78,68 @@
     return self;
 }
 
-- (void)main
+- (id)initWithInputStream:(NSInputStream *)inputStream keyData:(NSData *)keyData
+{
+    NSParameterAssert(inputStream != nil);
+    NSParameterAssert(keyData != nil);
+    self = [super init];
+    if (self != nil) {
+        self->_inputStream = inputStream;
+        self->_keyData = [keyData copy];
+    }
+    return self;
+}
+
+- (void)mainWithInputStream
+    // Runs the input stream through the HMAC, one chunk at a time, setting self.error 
+    // if something goes wrong.
+{
+    CCHmacContext   context;
+    uint8_t         hmac[CC_SHA1_DIGEST_LENGTH];
+    NSMutableData * buffer;
+    NSInteger       bytesRead;
+    BOOL            didOpenInputStream;
+    BOOL            done;
+    
+    didOpenInputStream = NO;
+    if ([self.inputStream streamStatus] == NSStreamStatusNotOpen) {
+        [self.inputStream open];
+        didOpenInputStream = YES;
+    }
+    
+    CCHmacInit(&context, kCCHmacAlgSHA1, [self.keyData bytes], [self.keyData length]);
+    
+    buffer = [[NSMutableData alloc] initWithLength:kStreamChunkSize];
+    done = NO;
+    while ( (self.error == nil) && ! done ) {
+        if (self.isCancelled) {
+            self.error = [NSError errorWithDomain:NSCocoaErrorDomain code:NSUserCancelledError userInfo:nil];
+        } else {
+            bytesRead = [self.inputStream read:[buffer mutableBytes] maxLength:[buffer length]];
+            if (bytesRead < 0) {
+                self.error = [self.inputStream streamError];
+                assert(self.error != nil);  // error on input stream
+            } else if (bytesRead == 0) {
+                done = YES;
+            } else {
+                CCHmacUpdate(&context, [buffer bytes], (size_t) bytesRead);
+            }
+        }
+    }
+    
+    // As with CCHmac, the output length is determined by the hash algorithm.
+    
+    if (self.error == nil) {
+        CCHmacFinal(&context, hmac);
+        self.outputHMAC = [[NSData alloc] initWithBytes:hmac length:sizeof(hmac)];
+    }
+    
+    if (didOpenInputStream) {
+        [self.inputStream close];
+    }
+}
+
+- (void)mainWithInputData
 {
     uint8_t     hmac[CC_SHA1_DIGEST_LENGTH];
     
@@ -82,4 +150,13 @@
     self.outputHMAC = [[NSData alloc] initWithBytes:hmac length:sizeof(hmac)];
 }
 
+- (void)main
+{
+    if (self.inputStream != nil) {
+        [self mainWithInputStream];
+    } else {
+        [self mainWithInputData];
+    }
+}
+
 @end
@@ -47,10 +47,31 @@
 
 #import <Foundation/Foundation.h>
 
+@class QCCPBKDF2SHA1KeyDerivationCache;
+
+// Notes:
+//
+// o Each 20 byte (CC_SHA1_DIGEST_LENGTH) block of the derived key is computed independently 
+//   of the others.  If parallel is set and the derived key is longer than one block, the 
+//   operation computes the blocks concurrently, one per CPU.  This doesn't make a one block 
+//   key any faster, and it doesn't change the result.
+//
+// o If cache is set, the operation looks up the derived key in the cache before doing 
+//   the derivation, and adds it to the cache afterwards.  The cache holds derived keys 
+//   in memory, so only use it where that's acceptable.
+
 @interface QCCPBKDF2SHA1KeyDerivation : NSOperation
 
 - (id)initWithPasswordString:(NSString *)passwordString saltData:(NSData *)saltData;
 
+// Returns the number of rounds that takes about derivationTime seconds on this machine for 
+// inputs of the specified sizes, or 0 on error.  This is what the operation uses when rounds 
+// is 0.  It's a wrapper around CCCalibratePBKDF, which times the derivation on a single 
+// thread, so the result divided by derivationTime is the rounds per second of a single core.  
+// The same limits on derivationTime apply as described below.
+
++ (NSUInteger)calibratedRoundsForPasswordLength:(NSUInteger)passwordLength saltLength:(NSUInteger)saltLength derivedKeyLength:(NSUInteger)derivedKeyLength derivationTime:(NSTimeInterval)derivationTime;
+
 // properties set by the init method
 
 @property (atomic, copy,   readonly ) NSString *        passwordString;
@@ -61,6 +82,8 @@
 @property (atomic, assign, readwrite) NSUInteger        rounds;             // default is 0, which calculates rounds based on derivationTime
 @property (atomic, assign, readwrite) NSTimeInterval    derivationTime;     // default is 0.1 seconds
 @property (atomic, assign, readwrite) NSUInteger        derivedKeyLength;   // default is 16
+@property (atomic, assign, readwrite) BOOL              parallel;           // default is NO
+@property (atomic, strong, readwrite) QCCPBKDF2SHA1KeyDerivationCache * cache;  // default is nil, that is, no caching
 
 // Note: With regards derivationTime, the underlying API takes a uint32_t 
 // of milliseconds, meaning that values less than 1 ms or values greater 
@@ -75,3 +98,20 @@
 @end
 
 extern NSString * kQCCPBKDF2KeyDerivationErrorDomain;                       // codes are kCCParamError and its friends
+
+// A size-bounded cache of derived keys, keyed by password, salt, rounds and derived key length.  
+// When the cache is full, adding a key evicts the least recently used one.  The cache is 
+// thread safe, so a single cache can be shared by many concurrent operations.
+
+@interface QCCPBKDF2SHA1KeyDerivationCache : NSObject
+
+- (id)initWithCountLimit:(NSUInteger)countLimit;
+
+@property (atomic, assign, readwrite) NSUInteger        countLimit;         // must not be zero; reducing it evicts keys as necessary
+@property (atomic, assign, readonly ) NSUInteger        count;
+
+- (NSData *)derivedKeyDataForPasswordString:(NSString *)passwordString saltData:(NSData *)saltData rounds:(NSUInteger)rounds derivedKeyLength:(NSUInteger)derivedKeyLength;
+- (void)setDerivedKeyData:(NSData *)derivedKeyData forPasswordString:(NSString *)passwordString saltData:(NSData *)saltData rounds:(NSUInteger)rounds;
+- (void)removeAllDerivedKeys;
+
+@end
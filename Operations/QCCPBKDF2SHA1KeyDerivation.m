@@ -76,12 +76,12 @@
     return self;
 }
 
-- (void)calculateActualRoundsForPasswordLength:(size_t)passwordLength saltLength:(size_t)saltLength
++ (NSUInteger)calibratedRoundsForPasswordLength:(NSUInteger)passwordLength saltLength:(NSUInteger)saltLength derivedKeyLength:(NSUInteger)derivedKeyLength derivationTime:(NSTimeInterval)derivationTime
 {
     unsigned int        result;
     double              derivationTimeMilliseconds;
     
-    derivationTimeMilliseconds = self.derivationTime * 1000.0;
+    derivationTimeMilliseconds = derivationTime * 1000.0;
     
     // CCCalibratePBKDF has undocumented limits on the salt length <rdar://problem/13641064>.
     
@@ -99,28 +99,99 @@
         derivationTimeMilliseconds = (double) UINT32_MAX;
     }
     
-    // Do the key derivation.
+    // Do the calibration.
     
     result = CCCalibratePBKDF(
         kCCPBKDF2, 
         passwordLength, 
         saltLength, 
         kCCPRFHmacAlgSHA1, 
-        self.derivedKeyLength, 
+        derivedKeyLength, 
         (uint32_t) derivationTimeMilliseconds
     );
     
     // CCCalibratePBKDF returns undocumented error codes <rdar://problem/13641039>.
     
     if ( (result == (unsigned int) -1) || (result == (unsigned int) -2) ) {
-        // Setting actualRounds to 0 triggers an error path in our caller.
         result = 0;
     }
     
-    // Save the result.  This can't truncate because NSUInteger always has either the same 
-    // or more range than (unsigned int).
+    // This can't truncate because NSUInteger always has either the same or more range 
+    // than (unsigned int).
+    
+    return result;
+}
+
+- (void)calculateActualRoundsForPasswordLength:(size_t)passwordLength saltLength:(size_t)saltLength
+{
+    // Setting actualRounds to 0, which is what the calibration returns on error, triggers 
+    // an error path in our caller.
+    
+    self.actualRounds = [[self class] calibratedRoundsForPasswordLength:passwordLength saltLength:saltLength derivedKeyLength:self.derivedKeyLength derivationTime:self.derivationTime];
+}
+
+static void DeriveBlock(const CCHmacContext * passwordContext, const uint8_t * saltPtr, size_t saltLength, unsigned int rounds, uint32_t blockNumber, uint8_t * block)
+    // Computes block number blockNumber (counting from 1) of the PBKDF2 derived key into block, 
+    // which must be CC_SHA1_DIGEST_LENGTH bytes.  passwordContext is an HMAC-SHA1 context 
+    // that's been initialised with the password and nothing else.  Every HMAC in PBKDF2 
+    // uses the same key, so we start each one from a copy of that context rather than 
+    // process the key again.  This is called concurrently, so it must not touch the operation.
+{
+    CCHmacContext   context;
+    uint8_t         blockNumberBytes[4];
+    uint8_t         u[CC_SHA1_DIGEST_LENGTH];
+    unsigned int    round;
+    size_t          byteIndex;
+    
+    blockNumberBytes[0] = (uint8_t) (blockNumber >> 24);
+    blockNumberBytes[1] = (uint8_t) (blockNumber >> 16);
+    blockNumberBytes[2] = (uint8_t) (blockNumber >>  8);
+    blockNumberBytes[3] = (uint8_t) (blockNumber >>  0);
+    
+    // U1 = HMAC(password, salt || blockNumber)
+    
+    context = *passwordContext;
+    CCHmacUpdate(&context, saltPtr, saltLength);
+    CCHmacUpdate(&context, blockNumberBytes, sizeof(blockNumberBytes));
+    CCHmacFinal(&context, u);
+    memcpy(block, u, sizeof(u));
     
-    self.actualRounds = result;
+    // Un = HMAC(password, Un-1), and the block is U1 ^ U2 ^ ... ^ Urounds.
+    
+    for (round = 1; round < rounds; round++) {
+        context = *passwordContext;
+        CCHmacUpdate(&context, u, sizeof(u));
+        CCHmacFinal(&context, u);
+        for (byteIndex = 0; byteIndex < sizeof(u); byteIndex++) {
+            block[byteIndex] ^= u[byteIndex];
+        }
+    }
+}
+
+- (void)deriveBlocksInParallelPasswordUTF8:(const char *)passwordUTF8 passwordLength:(size_t)passwordUTFLength saltPtr:(const uint8_t *)saltPtr saltLength:(size_t)saltLength result:(NSMutableData *)result
+    // Computes the derived key one block per CPU.  Each block goes into its own slot in 
+    // a scratch buffer, which we then truncate to the derived key length.
+{
+    CCHmacContext       passwordContext;
+    CCHmacContext *     passwordContextPtr;
+    size_t              blockCount;
+    NSMutableData *     blocks;
+    uint8_t *           blocksPtr;
+    unsigned int        rounds;
+    
+    CCHmacInit(&passwordContext, kCCHmacAlgSHA1, passwordUTF8, passwordUTFLength);
+    passwordContextPtr = &passwordContext;
+    
+    blockCount = ([result length] + CC_SHA1_DIGEST_LENGTH - 1) / CC_SHA1_DIGEST_LENGTH;
+    blocks = [[NSMutableData alloc] initWithLength:blockCount * CC_SHA1_DIGEST_LENGTH];
+    blocksPtr = [blocks mutableBytes];
+    rounds = (unsigned int) self.actualRounds;
+    
+    dispatch_apply(blockCount, dispatch_get_global_queue(DISPATCH_QUEUE_PRIORITY_DEFAULT, 0), ^(size_t i) {
+        DeriveBlock(passwordContextPtr, saltPtr, saltLength, rounds, (uint32_t) (i + 1), &blocksPtr[i * CC_SHA1_DIGEST_LENGTH]);
+    });
+    
+    memcpy([result mutableBytes], blocksPtr, [result length]);
 }
 
 - (void)main
@@ -132,6 +203,7 @@
     static const uint8_t    saltDummy = 0;
     size_t                  saltLength;
     NSMutableData *         result;
+    NSData *                cachedKeyData;
 
     result = [[NSMutableData alloc] initWithLength:self.derivedKeyLength];
 
@@ -168,9 +240,20 @@
         err = kCCParamError;
     }
     
-    // Do the key derivation and save the results.
+    // Do the key derivation and save the results.  We check the cache first, now that 
+    // we know the actual number of rounds.  We only derive the blocks in parallel if 
+    // there's more than one of them and fewer than PBKDF2's limit of 2^32 - 1; beyond 
+    // that limit we leave it to CCKeyDerivationPBKDF to return the appropriate error.
     
-    if (err == kCCSuccess) {
+    cachedKeyData = nil;
+    if ( (err == kCCSuccess) && (self.cache != nil) ) {
+        cachedKeyData = [self.cache derivedKeyDataForPasswordString:self.passwordString saltData:self.saltData rounds:self.actualRounds derivedKeyLength:self.derivedKeyLength];
+    }
+    if ( (err == kCCSuccess) && (cachedKeyData != nil) ) {
+        [result setData:cachedKeyData];
+    } else if ( (err == kCCSuccess) && self.parallel && (self.derivedKeyLength > CC_SHA1_DIGEST_LENGTH) && ((self.derivedKeyLength / CC_SHA1_DIGEST_LENGTH) < UINT32_MAX) ) {
+        [self deriveBlocksInParallelPasswordUTF8:passwordUTF8 passwordLength:passwordUTFLength saltPtr:saltPtr saltLength:saltLength result:result];
+    } else if (err == kCCSuccess) {
         err = CCKeyDerivationPBKDF(
             kCCPBKDF2, 
             passwordUTF8, passwordUTFLength, 
@@ -188,6 +271,9 @@
         }
     }
     if (err == kCCSuccess) {
+        if ( (self.cache != nil) && (cachedKeyData == nil) ) {
+            [self.cache setDerivedKeyData:result forPasswordString:self.passwordString saltData:self.saltData rounds:self.actualRounds];
+        }
         self.derivedKeyData = result;
     } else {
         self.error = [NSError errorWithDomain:kQCCPBKDF2KeyDerivationErrorDomain code:err userInfo:nil];
@@ -197,3 +283,123 @@
 @end
 
 NSString * kQCCPBKDF2KeyDerivationErrorDomain = @"kQCCPBKDF2KeyDerivationErrorDomain";
+
+@interface QCCPBKDF2SHA1KeyDerivationCache ()
+
+// keys is ordered from least to most recently used.  Both it and derivedKeyDataByKey 
+// are protected by @synchronized (self).
+
+@property (atomic, strong, readonly ) NSMutableOrderedSet *     keys;
+@property (atomic, strong, readonly ) NSMutableDictionary *     derivedKeyDataByKey;
+
+@end
+
+@implementation QCCPBKDF2SHA1KeyDerivationCache
+
+@synthesize countLimit = _countLimit;
+
+- (id)initWithCountLimit:(NSUInteger)countLimit
+{
+    NSParameterAssert(countLimit != 0);
+    self = [super init];
+    if (self != nil) {
+        self->_countLimit = countLimit;
+        self->_keys = [[NSMutableOrderedSet alloc] init];
+        self->_derivedKeyDataByKey = [[NSMutableDictionary alloc] init];
+    }
+    return self;
+}
+
+static NSData * CacheKey(NSString * passwordString, NSData * saltData, NSUInteger rounds, NSUInteger derivedKeyLength)
+    // Returns an unambiguous key for the derivation parameters: the fixed-size numbers 
+    // first, including the password length, then the password and the salt.  We use 
+    // data, rather than an array of the parameters, because NSArray's hash is only 
+    // its count.
+{
+    NSMutableData *     result;
+    NSData *            passwordData;
+    uint64_t            numbers[3];
+    
+    passwordData = [passwordString dataUsingEncoding:NSUTF8StringEncoding];
+    numbers[0] = rounds;
+    numbers[1] = derivedKeyLength;
+    numbers[2] = [passwordData length];
+    result = [[NSMutableData alloc] initWithBytes:numbers length:sizeof(numbers)];
+    [result appendData:passwordData];
+    [result appendData:saltData];
+    return result;
+}
+
+- (void)evictToCountLimit
+    // Removes the least recently used keys until we're within the count limit.  
+    // Must be called with @synchronized (self).
+{
+    while ([self.keys count] > self->_countLimit) {
+        [self.derivedKeyDataByKey removeObjectForKey:self.keys[0]];
+        [self.keys removeObjectAtIndex:0];
+    }
+}
+
+- (NSUInteger)countLimit
+{
+    @synchronized (self) {
+        return self->_countLimit;
+    }
+}
+
+- (void)setCountLimit:(NSUInteger)countLimit
+{
+    NSParameterAssert(countLimit != 0);
+    @synchronized (self) {
+        self->_countLimit = countLimit;
+        [self evictToCountLimit];
+    }
+}
+
+- (NSUInteger)count
+{
+    @synchronized (self) {
+        return [self.keys count];
+    }
+}
+
+- (NSData *)derivedKeyDataForPasswordString:(NSString *)passwordString saltData:(NSData *)saltData rounds:(NSUInteger)rounds derivedKeyLength:(NSUInteger)derivedKeyLength
+{
+    NSData *    key;
+    NSData *    result;
+    
+    key = CacheKey(passwordString, saltData, rounds, derivedKeyLength);
+    @synchronized (self) {
+        result = self.derivedKeyDataByKey[key];
+        if (result != nil) {
+            // Move the key to the most recently used end.
+            [self.keys removeObject:key];
+            [self.keys addObject:key];
+        }
+    }
+    return result;
+}
+
+- (void)setDerivedKeyData:(NSData *)derivedKeyData forPasswordString:(NSString *)passwordString saltData:(NSData *)saltData rounds:(NSUInteger)rounds
+{
+    NSData *    key;
+    
+    NSParameterAssert(derivedKeyData != nil);
+    key = CacheKey(passwordString, saltData, rounds, [derivedKeyData length]);
+    @synchronized (self) {
+        [self.keys removeObject:key];
+        [self.keys addObject:key];
+        self.derivedKeyDataByKey[key] = [derivedKeyData copy];
+        [self evictToCountLimit];
+    }
+}
+
+- (void)removeAllDerivedKeys
+{
+    @synchronized (self) {
+        [self.keys removeAllObjects];
+        [self.derivedKeyDataByKey removeAllObjects];
+    }
+}
+
+@end
@@ -47,16 +47,29 @@
 
 #import <Foundation/Foundation.h>
 
+// Notes:
+//
+// o If initialised with a stream, the operation reads the stream a chunk at a time and 
+//   feeds it through the digest incrementally, so the input never has to be in memory 
+//   all at once.  It opens the stream if it's in state NSStreamStatusNotOpen and, if so, 
+//   closes it at the end.
+//
+// o The operation reads the stream synchronously, making it only suitable for use with 
+//   file streams (or streams of in-memory data).
+
 @interface QCCSHA1Digest : NSOperation
 
 - (id)initWithInputData:(NSData *)inputData;
+- (id)initWithInputStream:(NSInputStream *)inputStream;
 
 // properties set by the init method
 
-@property (atomic, copy,   readonly ) NSData *      inputData;
+@property (atomic, copy,   readonly ) NSData *          inputData;      // nil if initialised with a stream
+@property (atomic, strong, readonly ) NSInputStream *   inputStream;    // nil if initialised with data
 
 // properties set on finish
 
-@property (atomic, copy,   readonly ) NSData *      outputDigest;       // always 20 bytes (CC_SHA1_DIGEST_LENGTH)
+@property (atomic, copy,   readonly ) NSData *          outputDigest;   // always 20 bytes (CC_SHA1_DIGEST_LENGTH), nil on error
+@property (atomic, copy,   readonly ) NSError *         error;          // nil on success, always nil if initialised with data
 
 @end
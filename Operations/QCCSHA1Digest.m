@@ -49,11 +49,18 @@
 
 #include <CommonCrypto/CommonCrypto.h>
 
+// The number of bytes to read from the input stream at a time.
+
+enum {
+    kStreamChunkSize = 64 * 1024
+};
+
 @interface QCCSHA1Digest ()
 
 // read/write versions of public properties
 
 @property (atomic, copy,   readwrite) NSData *      outputDigest;
+@property (atomic, copy,   readwrite) NSError *     error;
 
 @end
 
@@ -69,7 +76,66 @@
     return self;
 }
 
-- (void)main
+- (id)initWithInputStream:(NSInputStream *)inputStream
+{
+    NSParameterAssert(inputStream != nil);
+    self = [super init];
+    if (self != nil) {
+        self->_inputStream = inputStream;
+    }
+    return self;
+}
+
+- (void)mainWithInputStream
+    // Runs the input stream through the digest, one chunk at a time, setting self.error 
+    // if something goes wrong.
+{
+    CC_SHA1_CTX     context;
+    uint8_t         digest[CC_SHA1_DIGEST_LENGTH];
+    NSMutableData * buffer;
+    NSInteger       bytesRead;
+    BOOL            didOpenInputStream;
+    BOOL            done;
+    
+    didOpenInputStream = NO;
+    if ([self.inputStream streamStatus] == NSStreamStatusNotOpen) {
+        [self.inputStream open];
+        didOpenInputStream = YES;
+    }
+    
+    // You can ignore the results of the CC_SHA1_Xxx routines because they never fail.
+    
+    (void) CC_SHA1_Init(&context);
+    
+    buffer = [[NSMutableData alloc] initWithLength:kStreamChunkSize];
+    done = NO;
+    while ( (self.error == nil) && ! done ) {
+        if (self.isCancelled) {
+            self.error = [NSError errorWithDomain:NSCocoaErrorDomain code:NSUserCancelledError userInfo:nil];
+        } else {
+            bytesRead = [self.inputStream read:[buffer mutableBytes] maxLength:[buffer length]];
+            if (bytesRead < 0) {
+                self.error = [self.inputStream streamError];
+                assert(self.error != nil);  // error on input stream
+            } else if (bytesRead == 0) {
+                done = YES;
+            } else {
+                (void) CC_SHA1_Update(&context, [buffer bytes], (CC_LONG) bytesRead);
+            }
+        }
+    }
+    
+    if (self.error == nil) {
+        (void) CC_SHA1_Final(digest, &context);
+        self.outputDigest = [[NSData alloc] initWithBytes:digest length:sizeof(digest)];
+    }
+    
+    if (didOpenInputStream) {
+        [self.inputStream close];
+    }
+}
+
+- (void)mainWithInputData
 {
     uint8_t     digest[CC_SHA1_DIGEST_LENGTH];
     
@@ -79,4 +145,13 @@
     self.outputDigest = [[NSData alloc] initWithBytes:digest length:sizeof(digest)];
 }
 
+- (void)main
+{
+    if (self.inputStream != nil) {
+        [self mainWithInputStream];
+    } else {
+        [self mainWithInputData];
+    }
+}
+
 @end
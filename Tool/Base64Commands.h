@@ -54,3 +54,11 @@
 @interface Base64DecodeCommand : QToolCommand
 
 @end
+
+@interface Base64BigEncodeCommand : QToolCommand
+
+@end
+
+@interface Base64BigDecodeCommand : QToolCommand
+
+@end
@@ -49,6 +49,8 @@
 
 #import "QCCBase64Encode.h"
 #import "QCCBase64Decode.h"
+#import "QCCBase64BigEncode.h"
+#import "QCCBase64BigDecode.h"
 
 #import "ToolCommon.h"
 
@@ -96,7 +98,7 @@
     BOOL        success;
     NSData *    fileData;
     
-    fileData = [NSData dataWithContentsOfURL:[NSURL fileURLWithPath:self.arguments[0]] options:0 error:errorPtr];
+    fileData = [[ToolCommon sharedInstance] dataWithContentsOfFile:self.arguments[0] error:errorPtr];
     success = (fileData != nil);
     
     if (success) {
@@ -105,7 +107,7 @@
         op = [[QCCBase64Encode alloc] initWithInputData:fileData];
         op.addLineBreaks = self.addLineBreaks;
         [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
-        fprintf(stdout, "%s", [op.outputString UTF8String]);
+        [[ToolCommon sharedInstance] writeOutputData:[op.outputString dataUsingEncoding:NSUTF8StringEncoding]];
     }
     
     return success;
@@ -139,10 +141,21 @@
 - (BOOL)runError:(NSError **)errorPtr
 {
     BOOL        success;
+    NSData *    fileData;
     NSString *  fileString;
     
-    fileString = [NSString stringWithContentsOfURL:[NSURL fileURLWithPath:self.arguments[0]] encoding:NSUTF8StringEncoding error:errorPtr];
-    success = (fileString != nil);
+    fileString = nil;
+    fileData = [[ToolCommon sharedInstance] dataWithContentsOfFile:self.arguments[0] error:errorPtr];
+    success = (fileData != nil);
+    if (success) {
+        fileString = [[NSString alloc] initWithData:fileData encoding:NSUTF8StringEncoding];
+        if (fileString == nil) {
+            success = NO;
+            if (errorPtr != NULL) {
+                *errorPtr = [NSError errorWithDomain:NSCocoaErrorDomain code:NSFileReadInapplicableStringEncodingError userInfo:nil];
+            }
+        }
+    }
     
     if (success) {
         QCCBase64Decode *   op;
@@ -155,7 +168,7 @@
                 *errorPtr = [NSError errorWithDomain:NSCocoaErrorDomain code:NSFileReadCorruptFileError userInfo:nil];
             }
         } else {
-            (void) fwrite([op.outputData bytes], [op.outputData length], 1, stdout);
+            [[ToolCommon sharedInstance] writeOutputData:op.outputData];
         }
     }
     
@@ -164,3 +177,127 @@
 
 @end
 
+@interface Base64BigEncodeCommand ()
+
+@property (nonatomic, assign, readwrite) BOOL   addLineBreaks;
+
+@end
+
+@implementation Base64BigEncodeCommand
+
++ (NSString *)commandName
+{
+    return @"base64-big-encode";
+}
+
++ (NSString *)commandUsage
+{
+    return [NSString stringWithFormat:@"%@ [-l] inputFile outputFile", [self commandName]];
+}
+
+- (NSString *)commandOptions
+{
+    return @"l";
+}
+
+- (void)setOption_l
+{
+    self.addLineBreaks = YES;
+}
+
+- (BOOL)validateOptionsAndArguments:(NSArray *)optionsAndArguments
+{
+    BOOL    success;
+    
+    success = [super validateOptionsAndArguments:optionsAndArguments];
+    if (success && ([self.arguments count] != 2)) {
+        success = NO;
+    }
+    return success;
+}
+
+- (BOOL)runError:(NSError **)errorPtr
+{
+    BOOL                    success;
+    NSInputStream *         inputStream;
+    NSOutputStream *        outputStream;
+    QCCBase64BigEncode *    op;
+
+    inputStream = [NSInputStream inputStreamWithFileAtPath:self.arguments[0]];
+    success = (inputStream != nil);
+
+    if (success) {
+        outputStream = [NSOutputStream outputStreamToFileAtPath:self.arguments[1] append:NO];
+        success = (outputStream != nil);
+    }
+    
+    if (success) {
+        op = [[QCCBase64BigEncode alloc] initWithInputStream:inputStream outputStream:outputStream];
+        op.addLineBreaks = self.addLineBreaks;
+        [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
+        if (op.error != nil) {
+            if (errorPtr != NULL) {
+                *errorPtr = op.error;
+            }
+            success = NO;
+        }
+    }
+    
+    return success;
+}
+
+@end
+
+@implementation Base64BigDecodeCommand
+
++ (NSString *)commandName
+{
+    return @"base64-big-decode";
+}
+
++ (NSString *)commandUsage
+{
+    return [NSString stringWithFormat:@"%@ inputFile outputFile", [self commandName]];
+}
+
+- (BOOL)validateOptionsAndArguments:(NSArray *)optionsAndArguments
+{
+    BOOL    success;
+    
+    success = [super validateOptionsAndArguments:optionsAndArguments];
+    if (success && ([self.arguments count] != 2)) {
+        success = NO;
+    }
+    return success;
+}
+
+- (BOOL)runError:(NSError **)errorPtr
+{
+    BOOL                    success;
+    NSInputStream *         inputStream;
+    NSOutputStream *        outputStream;
+    QCCBase64BigDecode *    op;
+
+    inputStream = [NSInputStream inputStreamWithFileAtPath:self.arguments[0]];
+    success = (inputStream != nil);
+
+    if (success) {
+        outputStream = [NSOutputStream outputStreamToFileAtPath:self.arguments[1] append:NO];
+        success = (outputStream != nil);
+    }
+    
+    if (success) {
+        op = [[QCCBase64BigDecode alloc] initWithInputStream:inputStream outputStream:outputStream];
+        [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
+        if (op.error != nil) {
+            if (errorPtr != NULL) {
+                *errorPtr = op.error;
+            }
+            success = NO;
+        }
+    }
+    
+    return success;
+}
+
+@end
@@ -0,0 +1,93 @@
+/*
+     File: BatchCommands.h
+ Abstract: A command that runs a batch of other commands.
+  Version: 1.0
+ 
+ Disclaimer: IMPORTANT:  This Apple software is supplied to you by Apple
+ Inc. ("Apple") in consideration of your agreement to the following
+ terms, and your use, installation, modification or redistribution of
+ this Apple software constitutes acceptance of these terms.  If you do
+ not agree with these terms, please do not use, install, modify or
+ redistribute this Apple software.
+ 
+ In consideration of your agreement to abide by the following terms, and
+ subject to these terms, Apple grants you a personal, non-exclusive
+ license, under Apple's copyrights in this original Apple software (the
+ "Apple Software"), to use, reproduce, modify and redistribute the Apple
+ Software, with or without modifications, in source and/or binary forms;
+ provided that if you redistribute the Apple Software in its entirety and
+ without modifications, you must retain this notice and the following
+ text and disclaimers in all such redistributions of the Apple Software.
+ Neither the name, trademarks, service marks or logos of Apple Inc. may
+ be used to endorse or promote products derived from the Apple Software
+ without specific prior written permission from Apple.  Except as
+ expressly stated in this notice, no other rights or licenses, express or
+ implied, are granted by Apple herein, including but not limited to any
+ patent rights that may be infringed by your derivative works or by other
+ works in which the Apple Software may be incorporated.
+ 
+ The Apple Software is provided by Apple on an "AS IS" basis.  APPLE
+ MAKES NO WARRANTIES, EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION
+ THE IMPLIED WARRANTIES OF NON-INFRINGEMENT, MERCHANTABILITY AND FITNESS
+ FOR A PARTICULAR PURPOSE, REGARDING THE APPLE SOFTWARE OR ITS USE AND
+ OPERATION ALONE OR IN COMBINATION WITH YOUR PRODUCTS.
+ 
+ IN NO EVENT SHALL APPLE BE LIABLE FOR ANY SPECIAL, INDIRECT, INCIDENTAL
+ OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+ SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+ INTERRUPTION) ARISING IN ANY WAY OUT OF THE USE, REPRODUCTION,
+ MODIFICATION AND/OR DISTRIBUTION OF THE APPLE SOFTWARE, HOWEVER CAUSED
+ AND WHETHER UNDER THEORY OF CONTRACT, TORT (INCLUDING NEGLIGENCE),
+ STRICT LIABILITY OR OTHERWISE, EVEN IF APPLE HAS BEEN ADVISED OF THE
+ POSSIBILITY OF SUCH DAMAGE.
+ 
+ Copyright (C) 2013 Apple Inc. All Rights Reserved.
+ 
+ */
+
+#import "QToolCommand.h"
+
+// The batch command reads a sequence of requests from stdin, runs each one as 
+// if it had been given on the command line, and writes a response for each to 
+// stdout.  This lets a client run many commands without paying the process 
+// start-up cost for each.
+// 
+// All integers are 32-bit big endian.  A request is:
+// 
+// o the argument count, followed by that many (length, UTF-8 bytes) arguments, 
+//   the first being the subcommand name
+// 
+// o the payload count, followed by that many (length, bytes) payloads
+// 
+// A file argument of the form "@N" refers to payload N rather than a file.  This 
+// only works for commands that read their input in one shot; the big cryptor 
+// commands always use real files.
+// 
+// A response is a status (kBatchStatusXxx), a length, and that many bytes.  For 
+// success the bytes are what the command would have written to stdout.  For an 
+// error they are the UTF-8 string "domain / code".  For a usage error they are 
+// the command's usage.
+// 
+// Responses are written in request order, and each is flushed as soon as it's 
+// done, so the client can pipeline requests.  The batch ends at end of file 
+// on stdin.
+//
+// With "-p" the command runs requests concurrently, up to the tool's 
+// maximum concurrent operation count (see the "-j" option) at a time, while 
+// still writing the responses in request order.  Only use this if the requests 
+// are independent; for example, a request mustn't read a file that an earlier 
+// request in the same batch writes.
+
+enum {
+    kBatchStatusSuccess = 0, 
+    kBatchStatusError   = 1, 
+    kBatchStatusUsage   = 2
+};
+
+@interface BatchCommand : QToolCommand
+
+@property (nonatomic, copy,   readwrite) NSArray *  subcommandClasses;
+    // The classes of the commands that a request may run.  The main command 
+    // sets this before running the batch.
+
+@end
@@ -0,0 +1,391 @@
+/*
+     File: BatchCommands.m
+ Abstract: A command that runs a batch of other commands.
+  Version: 1.0
+ 
+ Disclaimer: IMPORTANT:  This Apple software is supplied to you by Apple
+ Inc. ("Apple") in consideration of your agreement to the following
+ terms, and your use, installation, modification or redistribution of
+ this Apple software constitutes acceptance of these terms.  If you do
+ not agree with these terms, please do not use, install, modify or
+ redistribute this Apple software.
+ 
+ In consideration of your agreement to abide by the following terms, and
+ subject to these terms, Apple grants you a personal, non-exclusive
+ license, under Apple's copyrights in this original Apple software (the
+ "Apple Software"), to use, reproduce, modify and redistribute the Apple
+ Software, with or without modifications, in source and/or binary forms;
+ provided that if you redistribute the Apple Software in its entirety and
+ without modifications, you must retain this notice and the following
+ text and disclaimers in all such redistributions of the Apple Software.
+ Neither the name, trademarks, service marks or logos of Apple Inc. may
+ be used to endorse or promote products derived from the Apple Software
+ without specific prior written permission from Apple.  Except as
+ expressly stated in this notice, no other rights or licenses, express or
+ implied, are granted by Apple herein, including but not limited to any
+ patent rights that may be infringed by your derivative works or by other
+ works in which the Apple Software may be incorporated.
+ 
+ The Apple Software is provided by Apple on an "AS IS" basis.  APPLE
+ MAKES NO WARRANTIES, EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION
+ THE IMPLIED WARRANTIES OF NON-INFRINGEMENT, MERCHANTABILITY AND FITNESS
+ FOR A PARTICULAR PURPOSE, REGARDING THE APPLE SOFTWARE OR ITS USE AND
+ OPERATION ALONE OR IN COMBINATION WITH YOUR PRODUCTS.
+ 
+ IN NO EVENT SHALL APPLE BE LIABLE FOR ANY SPECIAL, INDIRECT, INCIDENTAL
+ OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+ SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+ INTERRUPTION) ARISING IN ANY WAY OUT OF THE USE, REPRODUCTION,
+ MODIFICATION AND/OR DISTRIBUTION OF THE APPLE SOFTWARE, HOWEVER CAUSED
+ AND WHETHER UNDER THEORY OF CONTRACT, TORT (INCLUDING NEGLIGENCE),
+ STRICT LIABILITY OR OTHERWISE, EVEN IF APPLE HAS BEEN ADVISED OF THE
+ POSSIBILITY OF SUCH DAMAGE.
+ 
+ Copyright (C) 2013 Apple Inc. All Rights Reserved.
+ 
+ */
+
+#import "BatchCommands.h"
+
+#import "ToolCommon.h"
+
+#include <libkern/OSByteOrder.h>
+
+@interface BatchCommand ()
+
+@property (nonatomic, assign, readwrite) BOOL   parallel;
+
+@end
+
+@implementation BatchCommand
+
++ (NSString *)commandName
+{
+    return @"batch";
+}
+
++ (NSString *)commandUsage
+{
+    return [NSString stringWithFormat:@"%@ [-p] < requests", [self commandName]];
+}
+
+- (NSString *)commandOptions
+{
+    return @"p";
+}
+
+- (void)setOption_p
+{
+    self.parallel = YES;
+}
+
+- (BOOL)validateOptionsAndArguments:(NSArray *)optionsAndArguments
+{
+    BOOL    success;
+    
+    success = [super validateOptionsAndArguments:optionsAndArguments];
+    if (success && ([self.arguments count] != 0)) {
+        success = NO;
+    }
+    return success;
+}
+
+static BOOL ReadBytes(void * buffer, size_t length)
+    // Reads exactly length bytes from stdin, returning NO on end of file or error.
+{
+    return (length == 0) || (fread(buffer, length, 1, stdin) == 1);
+}
+
+static BOOL ReadUInt32(uint32_t * valuePtr)
+{
+    BOOL        success;
+    uint8_t     bytes[4];
+    
+    success = ReadBytes(bytes, sizeof(bytes));
+    if (success) {
+        *valuePtr = OSReadBigInt32(bytes, 0);
+    }
+    return success;
+}
+
+static NSData * ReadData(void)
+    // Reads a length followed by that many bytes from stdin, returning nil on 
+    // end of file or error.
+{
+    NSMutableData *     result;
+    uint32_t            length;
+    
+    result = nil;
+    if (ReadUInt32(&length)) {
+        result = [NSMutableData dataWithLength:length];
+        if ( ! ReadBytes([result mutableBytes], length) ) {
+            result = nil;
+        }
+    }
+    return result;
+}
+
+static void WriteUInt32(uint32_t value)
+{
+    uint8_t     bytes[4];
+    
+    OSWriteBigInt32(bytes, 0, value);
+    (void) fwrite(bytes, sizeof(bytes), 1, stdout);
+}
+
+- (BOOL)readRequestArguments:(NSArray **)argumentsPtr payloads:(NSArray **)payloadsPtr
+    // Reads a request from stdin.  Returns NO if the request is truncated or 
+    // an argument isn't valid UTF-8.
+{
+    BOOL                success;
+    uint32_t            count;
+    NSMutableArray *    arguments;
+    NSMutableArray *    payloads;
+    NSData *            data;
+    
+    assert(argumentsPtr != NULL);
+    assert(payloadsPtr != NULL);
+    
+    arguments = [[NSMutableArray alloc] init];
+    payloads = [[NSMutableArray alloc] init];
+    
+    success = ReadUInt32(&count);
+    while (success && ([arguments count] < count)) {
+        NSString *  argument;
+        
+        argument = nil;
+        data = ReadData();
+        if (data != nil) {
+            argument = [[NSString alloc] initWithData:data encoding:NSUTF8StringEncoding];
+        }
+        success = (argument != nil);
+        if (success) {
+            [arguments addObject:argument];
+        }
+    }
+    if (success) {
+        success = ReadUInt32(&count);
+    }
+    while (success && ([payloads count] < count)) {
+        data = ReadData();
+        success = (data != nil);
+        if (success) {
+            [payloads addObject:data];
+        }
+    }
+    
+    if (success) {
+        *argumentsPtr = arguments;
+        *payloadsPtr = payloads;
+    }
+    return success;
+}
+
+static void WriteResponse(uint32_t status, NSData * responseData)
+{
+    WriteUInt32(status);
+    WriteUInt32((uint32_t) [responseData length]);
+    (void) fwrite([responseData bytes], [responseData length], 1, stdout);
+    (void) fflush(stdout);
+}
+
+- (NSData *)responseDataForRequestWithArguments:(NSArray *)arguments payloads:(NSArray *)payloads status:(uint32_t *)statusPtr
+    // Runs a single request and returns its response.
+{
+    uint32_t        status;
+    NSData *        responseData;
+    QToolCommand *  command;
+    
+    assert(statusPtr != NULL);
+    
+    command = nil;
+    if ([arguments count] != 0) {
+        for (Class commandClass in self.subcommandClasses) {
+            if ( [arguments[0] isEqual:[commandClass commandName]] ) {
+                command = [[commandClass alloc] init];
+                break;
+            }
+        }
+    }
+    
+    if ( (command == nil) || ! [command validateOptionsAndArguments:[arguments subarrayWithRange:NSMakeRange(1, [arguments count] - 1)]] ) {
+        NSMutableArray *    usages;
+        
+        usages = [[NSMutableArray alloc] init];
+        if (command != nil) {
+            [usages addObject:[[command class] commandUsage]];
+        } else {
+            for (Class commandClass in self.subcommandClasses) {
+                [usages addObject:[commandClass commandUsage]];
+            }
+        }
+        status = kBatchStatusUsage;
+        responseData = [[usages componentsJoinedByString:@"\n"] dataUsingEncoding:NSUTF8StringEncoding];
+    } else {
+        ToolCommon *            common;
+        NSMutableDictionary *   inputDataByPath;
+        NSError *               error;
+        
+        common = [ToolCommon sharedInstance];
+        
+        inputDataByPath = [[NSMutableDictionary alloc] init];
+        for (NSUInteger payloadIndex = 0; payloadIndex < [payloads count]; payloadIndex++) {
+            inputDataByPath[[NSString stringWithFormat:@"@%zu", (size_t) payloadIndex]] = payloads[payloadIndex];
+        }
+        common.inputDataByPath = inputDataByPath;
+        common.outputData = [[NSMutableData alloc] init];
+        
+        error = nil;
+        if ([command runError:&error]) {
+            status = kBatchStatusSuccess;
+            responseData = common.outputData;
+        } else {
+            status = kBatchStatusError;
+            responseData = [[NSString stringWithFormat:@"%@ / %d", [error domain], (int) [error code]] dataUsingEncoding:NSUTF8StringEncoding];
+        }
+        
+        common.inputDataByPath = nil;
+        common.outputData = nil;
+    }
+    
+    *statusPtr = status;
+    return responseData;
+}
+
+- (NSOperation *)startRequestWithArguments:(NSArray *)arguments payloads:(NSArray *)payloads onQueue:(NSOperationQueue *)requestQueue respondOnQueue:(NSOperationQueue *)responseQueue afterResponse:(NSOperation *)previousResponseOp inFlightSemaphore:(dispatch_semaphore_t)inFlightSemaphore
+    // Runs the request on the request queue, and writes its response from the response 
+    // queue, returning the operation that writes the response.  The response queue is 
+    // serial, and each response waits for the one before it, so the responses go out in 
+    // request order even though the requests finish in any order.  Once the response is 
+    // written we signal inFlightSemaphore, which frees up a slot for the next request.
+    //
+    // An operation holds on to its dependencies even after it has finished, so each 
+    // response would keep every earlier response (and request) alive for the life of 
+    // the batch.  We stop that by removing the response's dependencies once it's been 
+    // written, and, for good measure, let go of the request and response data as soon 
+    // as we're done with it.
+{
+    __block NSArray *           requestArguments;
+    __block NSArray *           requestPayloads;
+    __block uint32_t            status;
+    __block NSData *            responseData;
+    NSBlockOperation *          requestOp;
+    NSBlockOperation *          responseOp;
+    __weak NSBlockOperation *   weakResponseOp;
+    
+    requestArguments = arguments;
+    requestPayloads = payloads;
+    requestOp = [NSBlockOperation blockOperationWithBlock:^{
+        @autoreleasepool {
+            responseData = [self responseDataForRequestWithArguments:requestArguments payloads:requestPayloads status:&status];
+            requestArguments = nil;
+            requestPayloads = nil;
+        }
+    }];
+    responseOp = [[NSBlockOperation alloc] init];
+    weakResponseOp = responseOp;
+    [responseOp addExecutionBlock:^{
+        WriteResponse(status, responseData);
+        responseData = nil;
+        for (NSOperation * dependency in [weakResponseOp dependencies]) {
+            [weakResponseOp removeDependency:dependency];
+        }
+        (void) dispatch_semaphore_signal(inFlightSemaphore);
+    }];
+    [responseOp addDependency:requestOp];
+    if (previousResponseOp != nil) {
+        [responseOp addDependency:previousResponseOp];
+    }
+    [requestQueue addOperation:requestOp];
+    [responseQueue addOperation:responseOp];
+    return responseOp;
+}
+
+- (BOOL)runError:(NSError **)errorPtr
+{
+    BOOL                    success;
+    int                     firstByte;
+    NSOperationQueue *      requestQueue;
+    NSOperationQueue *      responseQueue;
+    NSOperation *           previousResponseOp;
+    dispatch_semaphore_t    inFlightSemaphore;
+    
+    assert(self.subcommandClasses != nil);
+    
+    // In parallel mode the requests run on their own queue, not the ToolCommon queue, 
+    // because they in turn run operations on that queue, and if a request took one of 
+    // its slots then enough requests could leave no slot for their operations.
+    //
+    // We also limit the number of requests in flight (read but not yet responded to) to 
+    // the width of the request queue.  Without that a client that writes requests faster 
+    // than we can run them would have us buffer an unbounded number of requests and 
+    // responses.
+    
+    requestQueue = nil;
+    responseQueue = nil;
+    inFlightSemaphore = NULL;
+    if ( self.parallel && ! [ToolCommon sharedInstance].debugRunOpOnMainThread ) {
+        requestQueue = [[NSOperationQueue alloc] init];
+        requestQueue.maxConcurrentOperationCount = [ToolCommon sharedInstance].maxConcurrentOperationCount;
+        responseQueue = [[NSOperationQueue alloc] init];
+        responseQueue.maxConcurrentOperationCount = 1;
+        inFlightSemaphore = dispatch_semaphore_create(requestQueue.maxConcurrentOperationCount);
+        assert(inFlightSemaphore != NULL);
+    }
+    previousResponseOp = nil;
+    
+    success = YES;
+    do {
+        // Peek at stdin so that we can tell the end of the batch apart from a 
+        // truncated request.
+        
+        firstByte = getc(stdin);
+        if (firstByte != EOF) {
+            (void) ungetc(firstByte, stdin);
+            
+            if (inFlightSemaphore != NULL) {
+                (void) dispatch_semaphore_wait(inFlightSemaphore, DISPATCH_TIME_FOREVER);
+            }
+            
+            @autoreleasepool {
+                NSArray *   arguments;
+                NSArray *   payloads;
+                
+                success = [self readRequestArguments:&arguments payloads:&payloads];
+                if (success) {
+                    if (requestQueue == nil) {
+                        NSData *    responseData;
+                        uint32_t    status;
+                        
+                        responseData = [self responseDataForRequestWithArguments:arguments payloads:payloads status:&status];
+                        WriteResponse(status, responseData);
+                    } else {
+                        previousResponseOp = [self startRequestWithArguments:arguments payloads:payloads onQueue:requestQueue respondOnQueue:responseQueue afterResponse:previousResponseOp inFlightSemaphore:inFlightSemaphore];
+                    }
+                } else if (inFlightSemaphore != NULL) {
+                    (void) dispatch_semaphore_signal(inFlightSemaphore);
+                }
+            }
+        }
+    } while ( success && (firstByte != EOF) );
+    
+    // Write out the responses to the requests we've read, even if the last one was 
+    // truncated.
+    
+    [responseQueue waitUntilAllOperationsAreFinished];
+    
+    // The deployment target predates dispatch objects being managed by ARC.
+    
+    if (inFlightSemaphore != NULL) {
+        dispatch_release(inFlightSemaphore);
+    }
+    
+    if ( ! success ) {
+        if (errorPtr != NULL) {
+            *errorPtr = [NSError errorWithDomain:NSCocoaErrorDomain code:NSFileReadCorruptFileError userInfo:nil];
+        }
+    }
+    return success;
+}
+
+@end
@@ -78,3 +78,15 @@
 @interface AESPadBigDecryptCommand : AESBigCryptorCommand
 
 @end
+
+@interface AESCTRBigCryptorCommand : AESCryptorCommand
+
+@end
+
+@interface AESCTRBigEncryptCommand : AESCTRBigCryptorCommand
+
+@end
+
+@interface AESCTRBigDecryptCommand : AESCTRBigCryptorCommand
+
+@end
@@ -50,6 +50,7 @@
 #import "QCCAESCryptor.h"
 #import "QCCAESPadCryptor.h"
 #import "QCCAESPadBigCryptor.h"
+#import "QCCAESCTRBigCryptor.h"
 
 #import "ToolCommon.h"
 
@@ -138,7 +139,7 @@
     NSData *            fileData;
     QCCAESCryptor *     op;
 
-    fileData = [NSData dataWithContentsOfURL:[NSURL fileURLWithPath:self.arguments[0]] options:0 error:errorPtr];
+    fileData = [[ToolCommon sharedInstance] dataWithContentsOfFile:self.arguments[0] error:errorPtr];
     success = (fileData != nil);
     
     if (success) {
@@ -160,7 +161,7 @@
         }
         [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
         if (op.error == nil) {
-            (void) fwrite([op.outputData bytes], [op.outputData length], 1, stdout);
+            [[ToolCommon sharedInstance] writeOutputData:op.outputData];
         } else {
             if (errorPtr != NULL) {
                 *errorPtr = op.error;
@@ -250,6 +251,15 @@
 
 @end
 
+@interface AESBigCryptorCommand ()
+
+@property (nonatomic, assign, readwrite) BOOL           parallel;
+@property (nonatomic, assign, readwrite) NSInteger      chunkSize;
+@property (nonatomic, assign, readwrite) NSInteger      maxChunkSize;
+@property (nonatomic, copy,   readwrite) NSData *       hmacKeyData;
+
+@end
+
 @implementation AESBigCryptorCommand
 
 - (BOOL)validateArguments
@@ -259,7 +269,30 @@
 
 + (NSString *)commandUsage
 {
-    return [NSString stringWithFormat:@"%@ -k keyHexStr (-e | [-i ivHexStr]) inputFile outputFile", [self commandName]];
+    return [NSString stringWithFormat:@"%@ [-c chunkSize] [-a maxChunkSize] [-h hmacKeyHexStr] -k keyHexStr (-e | [-i ivHexStr]) inputFile outputFile", [self commandName]];
+}
+
+- (NSString *)commandOptions
+{
+    return @"k:i:ec:a:h:";
+}
+
+- (BOOL)setOption_c_argument:(NSString *)argument
+{
+    self.chunkSize = [argument integerValue];
+    return (self.chunkSize > 0);
+}
+
+- (BOOL)setOption_a_argument:(NSString *)argument
+{
+    self.maxChunkSize = [argument integerValue];
+    return (self.maxChunkSize > 0);
+}
+
+- (BOOL)setOption_h_argument:(NSString *)argument
+{
+    self.hmacKeyData = [QHex dataWithHexString:argument];
+    return (self.hmacKeyData != nil);
 }
 
 - (BOOL)runError:(NSError **)errorPtr
@@ -294,12 +327,22 @@
         } else if (self.ivData != nil) {
             op.ivData = self.ivData;
         }
+        op.parallel = self.parallel;
+        if (self.chunkSize != 0) {
+            op.chunkSize = (NSUInteger) self.chunkSize;
+        }
+        op.maxChunkSize = (NSUInteger) self.maxChunkSize;
+        op.hmacKeyData = self.hmacKeyData;
         [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
         if (op.error != nil) {
             if (errorPtr != NULL) {
                 *errorPtr = op.error;
             }
             success = NO;
+        } else if (op.outputHMAC != nil) {
+            // The operation has closed the output file by now, so if it's stdout the 
+            // HMAC follows the cyphertext (or plaintext).
+            [[ToolCommon sharedInstance] writeOutputDataAsHexLine:op.outputHMAC];
         }
     }
     
@@ -334,6 +377,21 @@
     return @"aes-pad-big-decrypt";
 }
 
++ (NSString *)commandUsage
+{
+    return [NSString stringWithFormat:@"%@ [-p] [-c chunkSize] [-a maxChunkSize] [-h hmacKeyHexStr] -k keyHexStr (-e | [-i ivHexStr]) inputFile outputFile", [self commandName]];
+}
+
+- (NSString *)commandOptions
+{
+    return @"k:i:ec:a:ph:";
+}
+
+- (void)setOption_p
+{
+    self.parallel = YES;
+}
+
 + (Class)cryptorClass
 {
     return [QCCAESPadBigCryptor class];
@@ -345,3 +403,113 @@
 }
 
 @end
+
+@interface AESCTRBigCryptorCommand ()
+
+@property (nonatomic, assign, readwrite) BOOL           parallel;
+@property (nonatomic, assign, readwrite) NSInteger      chunkSize;
+
+@end
+
+@implementation AESCTRBigCryptorCommand
+
+- (BOOL)validateArguments
+{
+    return ([self.arguments count] == 2);
+}
+
++ (NSString *)commandUsage
+{
+    return [NSString stringWithFormat:@"%@ [-p] [-c chunkSize] -k keyHexStr [-i ivHexStr] inputFile outputFile", [self commandName]];
+}
+
+- (NSString *)commandOptions
+{
+    return @"k:i:c:p";              // no "-e", because CTR mode always needs a counter
+}
+
+- (BOOL)setOption_c_argument:(NSString *)argument
+{
+    self.chunkSize = [argument integerValue];
+    return (self.chunkSize > 0);
+}
+
+- (void)setOption_p
+{
+    self.parallel = YES;
+}
+
++ (Class)cryptorClass
+{
+    return [QCCAESCTRBigCryptor class];
+}
+
+- (BOOL)runError:(NSError **)errorPtr
+{
+    BOOL                    success;
+    NSInputStream *         inputStream;
+    NSOutputStream *        outputStream;
+    QCCAESCTRBigCryptor *   op;
+
+    inputStream = [NSInputStream inputStreamWithFileAtPath:self.arguments[0]];
+    success = (inputStream != nil);
+
+    if (success) {
+        outputStream = [NSOutputStream outputStreamToFileAtPath:self.arguments[1] append:NO];
+        success = (outputStream != nil);
+    }
+    
+    if (success) {
+        if ([[self class] encrypt]) {
+            op = [[QCCAESCTRBigCryptor alloc] initToEncryptInputStream:inputStream toOutputStream:outputStream keyData:self.keyData];
+        } else {
+            op = [[QCCAESCTRBigCryptor alloc] initToDecryptInputStream:inputStream toOutputStream:outputStream keyData:self.keyData];
+        }
+        if (self.ivData != nil) {
+            op.ivData = self.ivData;
+        }
+        op.parallel = self.parallel;
+        if (self.chunkSize != 0) {
+            op.chunkSize = (NSUInteger) self.chunkSize;
+        }
+        [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
+        if (op.error != nil) {
+            if (errorPtr != NULL) {
+                *errorPtr = op.error;
+            }
+            success = NO;
+        }
+    }
+    
+    return success;
+}
+
+@end
+
+@implementation AESCTRBigEncryptCommand
+
++ (NSString *)commandName
+{
+    return @"aes-ctr-big-encrypt";
+}
+
++ (BOOL)encrypt
+{
+    return YES;
+}
+
+@end
+
+@implementation AESCTRBigDecryptCommand
+
++ (NSString *)commandName
+{
+    return @"aes-ctr-big-decrypt";
+}
+
++ (BOOL)encrypt
+{
+    return NO;
+}
+
+@end
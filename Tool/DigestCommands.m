@@ -55,12 +55,29 @@
 
 #import "QHex.h"
 
+// When digesting multiple files, we submit the files to the queue in windows of this many 
+// files per concurrent operation, which keeps the queue busy without holding an operation 
+// (and its result) for every file at once.
+
+enum {
+    kDigestFilesPerConcurrentOperation = 16
+};
+
 @interface DigestCommand ()
 
 + (Class)digestOperationClass;
 
+@property (nonatomic, assign, readwrite) BOOL           stream;
+@property (nonatomic, copy,   readwrite) NSString *     listPath;
+
 @end
 
+static NSError * MissingFileError(NSString * path)
+    // Returns the error for a file we couldn't open a stream on.
+{
+    return [NSError errorWithDomain:NSPOSIXErrorDomain code:ENOENT userInfo:@{ NSFilePathErrorKey: path }];
+}
+
 @implementation DigestCommand
 
 + (Class)digestOperationClass
@@ -71,7 +88,23 @@
 
 + (NSString *)commandUsage
 {
-    return [NSString stringWithFormat:@"%@ file", [self commandName]];
+    return [NSString stringWithFormat:@"%@ [-s] (-l listFile | file...)", [self commandName]];
+}
+
+- (NSString *)commandOptions
+{
+    return @"sl:";
+}
+
+- (void)setOption_s
+{
+    self.stream = YES;
+}
+
+- (BOOL)setOption_l_argument:(NSString *)argument
+{
+    self.listPath = argument;
+    return YES;
 }
 
 - (BOOL)validateOptionsAndArguments:(NSArray *)optionsAndArguments
@@ -79,32 +112,169 @@
     BOOL    success;
     
     success = [super validateOptionsAndArguments:optionsAndArguments];
-    if (success && ([self.arguments count] != 1)) {
+    if (success && (([self.arguments count] != 0) == (self.listPath != nil))) {
         success = NO;
     }
     return success;
 }
 
-- (BOOL)runError:(NSError **)errorPtr
+- (BOOL)digestFileAtPath:(NSString *)path error:(NSError **)errorPtr
+    // Digests a single file and writes out the digest.
 {
-    BOOL        success;
-    NSData *    data;
+    BOOL                success;
+    NSData *            data;
+    NSInputStream *     inputStream;
+    QCCMD5Digest *      op;
     
-    data = [NSData dataWithContentsOfURL:[NSURL fileURLWithPath:self.arguments[0]] options:0 error:errorPtr];
-    success = (data != nil);
+    // We're playing fast'n'loose with types here.  The various digest operations 
+    // don't share a command base class (becasue I don't want to have them coupled together) 
+    // so we don't have a class we can use for "op".  Rather than write lots of pointless 
+    // code just to keep the compiler happy, I tell the compile that "op" is of type 
+    // QCCMD5Digest.  In reality it could be any of the other digest classes.
+    
+    op = nil;
+    if (self.stream) {
+        inputStream = [[ToolCommon sharedInstance] inputStreamWithContentsOfFile:path];
+        success = (inputStream != nil);
+        if (success) {
+            op = [[[[self class] digestOperationClass] alloc] initWithInputStream:inputStream];
+        } else if (errorPtr != NULL) {
+            *errorPtr = MissingFileError(path);
+        }
+    } else {
+        data = [[ToolCommon sharedInstance] dataWithContentsOfFile:path error:errorPtr];
+        success = (data != nil);
+        if (success) {
+            op = [[[[self class] digestOperationClass] alloc] initWithInputData:data];
+        }
+    }
     
     if (success) {
-        QCCMD5Digest *      op;
+        [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
+        if (op.error != nil) {
+            if (errorPtr != NULL) {
+                *errorPtr = op.error;
+            }
+            success = NO;
+        } else {
+            [[ToolCommon sharedInstance] writeOutputDataAsHexLine:op.outputDigest];
+        }
+    }
+    
+    return success;
+}
+
+- (BOOL)digestFilesAtPaths:(NSArray *)paths error:(NSError **)errorPtr
+    // Digests each of the files on a queue and writes out the digests, one per line, in 
+    // the order of paths.  If a file can't be digested, we stop there; the digests of 
+    // the files before it have already been written out.  That includes a file we can't 
+    // even open a stream on, in which case we digest the files before it in its window 
+    // and then stop.
+    //
+    // Each operation reads its file via a stream, so that the reading happens on the 
+    // queue, concurrently, rather than here.
+{
+    NSError *           error;
+    NSError *           missingFileError;
+    NSUInteger          windowLength;
+    NSUInteger          windowStart;
+    
+    windowLength = (NSUInteger) [ToolCommon sharedInstance].maxConcurrentOperationCount * kDigestFilesPerConcurrentOperation;
+    
+    error = nil;
+    for (windowStart = 0; (error == nil) && (windowStart < [paths count]); windowStart += windowLength) {
+        NSMutableArray *    ops;
         
-        // We're playing fast'n'loose with types here.  The various digest operations 
-        // don't share a command base class (becasue I don't want to have them coupled together) 
-        // so we don't have a class we can use for "op".  Rather than write lots of pointless 
-        // code just to keep the compiler happy, I tell the compile that "op" is of type 
-        // QCCMD5Digest.  In reality it could be any of the other digest classes.
+        // See the comment in -digestFileAtPath:error: for why "op" is of type QCCMD5Digest.
         
-        op = [[[[self class] digestOperationClass] alloc] initWithInputData:data];
-        [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
-        fprintf(stdout, "%s\n", [[QHex hexStringWithData:op.outputDigest] UTF8String]);
+        ops = [[NSMutableArray alloc] init];
+        missingFileError = nil;
+        for (NSString * path in [paths subarrayWithRange:NSMakeRange(windowStart, MIN(windowLength, [paths count] - windowStart))]) {
+            NSInputStream *     inputStream;
+            QCCMD5Digest *      op;
+            
+            inputStream = [[ToolCommon sharedInstance] inputStreamWithContentsOfFile:path];
+            if (inputStream == nil) {
+                missingFileError = MissingFileError(path);
+                break;
+            }
+            op = [[[[self class] digestOperationClass] alloc] initWithInputStream:inputStream];
+            [ops addObject:op];
+        }
+        
+        [[ToolCommon sharedInstance] synchronouslyRunOperations:ops];
+        
+        for (QCCMD5Digest * op in ops) {
+            if (error == nil) {
+                if (op.error != nil) {
+                    error = op.error;
+                } else {
+                    [[ToolCommon sharedInstance] writeOutputDataAsHexLine:op.outputDigest];
+                }
+            }
+        }
+        if (error == nil) {
+            error = missingFileError;
+        }
+    }
+    
+    if ( (error != nil) && (errorPtr != NULL) ) {
+        *errorPtr = error;
+    }
+    return (error == nil);
+}
+
+- (NSArray *)pathsFromListFileError:(NSError **)errorPtr
+    // Returns the paths listed in the list file, one per line, ignoring empty lines.
+{
+    NSMutableArray *    result;
+    NSData *            listData;
+    NSString *          listString;
+    
+    result = nil;
+    listString = nil;
+    listData = [[ToolCommon sharedInstance] dataWithContentsOfFile:self.listPath error:errorPtr];
+    if (listData != nil) {
+        listString = [[NSString alloc] initWithData:listData encoding:NSUTF8StringEncoding];
+        if (listString == nil) {
+            if (errorPtr != NULL) {
+                *errorPtr = [NSError errorWithDomain:NSCocoaErrorDomain code:NSFileReadInapplicableStringEncodingError userInfo:nil];
+            }
+        }
+    }
+    if (listString != nil) {
+        result = [[NSMutableArray alloc] init];
+        for (NSString * line in [listString componentsSeparatedByCharactersInSet:[NSCharacterSet newlineCharacterSet]]) {
+            if ([line length] != 0) {
+                [result addObject:line];
+            }
+        }
+    }
+    return result;
+}
+
+- (BOOL)runError:(NSError **)errorPtr
+{
+    BOOL        success;
+    NSArray *   paths;
+    
+    // A single file on the command line gets the original treatment, honouring "-s".  
+    // Anything else is digested on a queue, which always uses the stream variant of the 
+    // digest operation.
+    
+    if (self.listPath == nil) {
+        paths = self.arguments;
+    } else {
+        paths = [self pathsFromListFileError:errorPtr];
+    }
+    success = (paths != nil);
+    
+    if (success) {
+        if ( (self.listPath == nil) && ([paths count] == 1) ) {
+            success = [self digestFileAtPath:paths[0] error:errorPtr];
+        } else {
+            success = [self digestFilesAtPaths:paths error:errorPtr];
+        }
     }
     
     return success;
@@ -143,6 +313,7 @@
 @interface SHA1HMACCommand ()
 
 @property (nonatomic, copy,   readwrite) NSData *       keyData;
+@property (nonatomic, assign, readwrite) BOOL           stream;
 
 @end
 
@@ -155,12 +326,17 @@
 
 + (NSString *)commandUsage
 {
-    return [NSString stringWithFormat:@"%@ -k keyHexStr file", [self commandName]];
+    return [NSString stringWithFormat:@"%@ [-s] -k keyHexStr file", [self commandName]];
 }
 
 - (NSString *)commandOptions
 {
-    return @"k:";
+    return @"k:s";
+}
+
+- (void)setOption_s
+{
+    self.stream = YES;
 }
 
 - (BOOL)setOption_k_argument:(NSString *)argument
@@ -186,18 +362,38 @@
 
 - (BOOL)runError:(NSError **)errorPtr
 {
-    BOOL        success;
-    NSData *    data;
+    BOOL                            success;
+    NSData *                        data;
+    NSInputStream *                 inputStream;
+    QCCHMACSHA1Authentication *     op;
     
-    data = [NSData dataWithContentsOfURL:[NSURL fileURLWithPath:self.arguments[0]] options:0 error:errorPtr];
-    success = (data != nil);
+    op = nil;
+    if (self.stream) {
+        inputStream = [[ToolCommon sharedInstance] inputStreamWithContentsOfFile:self.arguments[0]];
+        success = (inputStream != nil);
+        if (success) {
+            op = [[QCCHMACSHA1Authentication alloc] initWithInputStream:inputStream keyData:self.keyData];
+        } else if (errorPtr != NULL) {
+            *errorPtr = MissingFileError(self.arguments[0]);
+        }
+    } else {
+        data = [[ToolCommon sharedInstance] dataWithContentsOfFile:self.arguments[0] error:errorPtr];
+        success = (data != nil);
+        if (success) {
+            op = [[QCCHMACSHA1Authentication alloc] initWithInputData:data keyData:self.keyData];
+        }
+    }
     
     if (success) {
-        QCCHMACSHA1Authentication *     op;
-        
-        op = [[QCCHMACSHA1Authentication alloc] initWithInputData:data keyData:self.keyData];
         [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
-        fprintf(stdout, "%s\n", [[QHex hexStringWithData:op.outputHMAC] UTF8String]);
+        if (op.error != nil) {
+            if (errorPtr != NULL) {
+                *errorPtr = op.error;
+            }
+            success = NO;
+        } else {
+            [[ToolCommon sharedInstance] writeOutputDataAsHexLine:op.outputHMAC];
+        }
     }
     
     return success;
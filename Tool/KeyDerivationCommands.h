@@ -50,3 +50,7 @@
 @interface PBKDF2KeyDerivationCommand : QToolCommand
 
 @end
+
+@interface PBKDF2CalibrateCommand : QToolCommand
+
+@end
@@ -49,16 +49,29 @@
 
 #import "QCCPBKDF2SHA1KeyDerivation.h"
 
+#include <CommonCrypto/CommonCrypto.h>
+
 #import "ToolCommon.h"
 
 #import "QHex.h"
 
+// When deriving keys from a list of passwords, we submit the derivations to the queue in 
+// windows of this many passwords per concurrent operation, which keeps the queue busy 
+// without holding an operation (and its derived key) for every password at once.
+
+enum {
+    kPBKDF2PasswordsPerConcurrentOperation = 16
+};
+
 @interface PBKDF2KeyDerivationCommand ()
 
 @property (nonatomic, copy,   readwrite) NSString *     passwordString;
+@property (nonatomic, copy,   readwrite) NSString *     passwordListPath;
 @property (nonatomic, copy,   readwrite) NSData *       saltData;
 @property (nonatomic, assign, readwrite) NSInteger      rounds;
 @property (nonatomic, assign, readwrite) NSInteger      derivedKeyLength;
+@property (nonatomic, assign, readwrite) BOOL           parallel;
+@property (nonatomic, assign, readwrite) NSInteger      cacheCountLimit;
 
 @end
 
@@ -71,12 +84,12 @@
 
 + (NSString *)commandUsage
 {
-    return [NSString stringWithFormat:@"%@ -p passwordStr -s saltHexStr [-r rounds] [-z derivedKeyLength] file", [self commandName]];
+    return [NSString stringWithFormat:@"%@ (-p passwordStr | -l passwordListFile) -s saltHexStr [-r rounds] [-z derivedKeyLength] [-P] [-c cacheCount]", [self commandName]];
 }
 
 - (NSString *)commandOptions
 {
-    return @"p:s:r:z:";
+    return @"p:l:s:r:z:Pc:";
 }
 
 - (BOOL)setOption_p_argument:(NSString *)argument
@@ -85,6 +98,12 @@
     return YES;
 }
 
+- (BOOL)setOption_l_argument:(NSString *)argument
+{
+    self.passwordListPath = argument;
+    return YES;
+}
+
 - (BOOL)setOption_s_argument:(NSString *)argument
 {
     self.saltData = [QHex dataWithHexString:argument];
@@ -103,6 +122,17 @@
     return (self.derivedKeyLength >= 0);
 }
 
+- (void)setOption_P
+{
+    self.parallel = YES;
+}
+
+- (BOOL)setOption_c_argument:(NSString *)argument
+{
+    self.cacheCountLimit = [argument integerValue];
+    return (self.cacheCountLimit > 0);
+}
+
 - (BOOL)validateOptionsAndArguments:(NSArray *)optionsAndArguments
 {
     BOOL    success;
@@ -111,7 +141,7 @@
     if (success) {
         if ([self.arguments count] != 0) {
             success = NO;
-        } else if (self.passwordString == nil) {
+        } else if ((self.passwordString == nil) == (self.passwordListPath == nil)) {
             success = NO;
         } else if (self.saltData == nil) {
             success = NO;
@@ -120,27 +150,221 @@
     return success;
 }
 
++ (QCCPBKDF2SHA1KeyDerivationCache *)sharedCache
+    // The cache used by "-c".  It's shared by every invocation of the command, which 
+    // matters in batch mode, where one process runs many commands.
+{
+    static QCCPBKDF2SHA1KeyDerivationCache *    sSharedCache;
+    static dispatch_once_t                      sOnceToken;
+    dispatch_once(&sOnceToken, ^{
+        sSharedCache = [[QCCPBKDF2SHA1KeyDerivationCache alloc] initWithCountLimit:1];
+    });
+    return sSharedCache;
+}
+
+- (NSArray *)passwordStringsError:(NSError **)errorPtr
+    // Returns the passwords to derive keys from, either the one from "-p" or those listed 
+    // in the password list file, one per line.  A password can be empty, so we keep 
+    // empty lines, except for the one implied by a trailing newline.  The list may use 
+    // CRLF line endings, so we strip a trailing CR from each line; otherwise every 
+    // password would silently gain an extra byte.
+{
+    NSMutableArray *    result;
+    NSData *            listData;
+    NSString *          listString;
+    
+    result = nil;
+    listString = nil;
+    if (self.passwordListPath == nil) {
+        result = [@[ self.passwordString ] mutableCopy];
+    } else {
+        listData = [[ToolCommon sharedInstance] dataWithContentsOfFile:self.passwordListPath error:errorPtr];
+        if (listData != nil) {
+            listString = [[NSString alloc] initWithData:listData encoding:NSUTF8StringEncoding];
+            if (listString == nil) {
+                if (errorPtr != NULL) {
+                    *errorPtr = [NSError errorWithDomain:NSCocoaErrorDomain code:NSFileReadInapplicableStringEncodingError userInfo:nil];
+                }
+            }
+        }
+        if (listString != nil) {
+            result = [[NSMutableArray alloc] init];
+            for (NSString * line in [listString componentsSeparatedByString:@"\n"]) {
+                if ([line hasSuffix:@"\r"]) {
+                    [result addObject:[line substringToIndex:[line length] - 1]];
+                } else {
+                    [result addObject:line];
+                }
+            }
+            if ([[result lastObject] length] == 0) {
+                [result removeLastObject];
+            }
+        }
+    }
+    return result;
+}
+
 - (BOOL)runError:(NSError **)errorPtr
 {
-    BOOL                            success;
-    QCCPBKDF2SHA1KeyDerivation *    op;
+    BOOL                success;
+    NSArray *           passwordStrings;
+    NSError *           error;
+    NSUInteger          windowLength;
+    NSUInteger          windowStart;
+    
+    passwordStrings = [self passwordStringsError:errorPtr];
+    success = (passwordStrings != nil);
+    
+    // Derive a key from each password.  With a list of passwords, we run the operations 
+    // on a queue, a window at a time, so the derivations happen concurrently, and print 
+    // the keys in order.  If a derivation fails we stop there; the keys before it have 
+    // already been written out.
     
-    success = YES;
-    op = [[QCCPBKDF2SHA1KeyDerivation alloc] initWithPasswordString:self.passwordString saltData:self.saltData];
-    if (self.rounds != 0) {
-        op.rounds = self.rounds;
+    if (success) {
+        if (self.cacheCountLimit != 0) {
+            [[self class] sharedCache].countLimit = (NSUInteger) self.cacheCountLimit;
+        }
+        
+        windowLength = (NSUInteger) [ToolCommon sharedInstance].maxConcurrentOperationCount * kPBKDF2PasswordsPerConcurrentOperation;
+        
+        error = nil;
+        for (windowStart = 0; (error == nil) && (windowStart < [passwordStrings count]); windowStart += windowLength) {
+            NSMutableArray *    ops;
+            
+            ops = [[NSMutableArray alloc] init];
+            for (NSString * passwordString in [passwordStrings subarrayWithRange:NSMakeRange(windowStart, MIN(windowLength, [passwordStrings count] - windowStart))]) {
+                QCCPBKDF2SHA1KeyDerivation *    op;
+                
+                op = [[QCCPBKDF2SHA1KeyDerivation alloc] initWithPasswordString:passwordString saltData:self.saltData];
+                if (self.rounds != 0) {
+                    op.rounds = self.rounds;
+                }
+                if (self.derivedKeyLength != 0) {
+                    op.derivedKeyLength = self.derivedKeyLength;
+                }
+                op.parallel = self.parallel;
+                if (self.cacheCountLimit != 0) {
+                    op.cache = [[self class] sharedCache];
+                }
+                [ops addObject:op];
+            }
+            
+            [[ToolCommon sharedInstance] synchronouslyRunOperations:ops];
+            
+            for (QCCPBKDF2SHA1KeyDerivation * op in ops) {
+                if (error == nil) {
+                    if (op.error != nil) {
+                        error = op.error;
+                    } else {
+                        [[ToolCommon sharedInstance] writeOutputDataAsHexLine:op.derivedKeyData];
+                    }
+                }
+            }
+        }
+        if (error != nil) {
+            if (errorPtr != NULL) {
+                *errorPtr = error;
+            }
+            success = NO;
+        }
     }
-    if (self.derivedKeyLength != 0) {
-        op.derivedKeyLength = self.derivedKeyLength;
+    
+    return success;
+}
+
+@end
+
+@interface PBKDF2CalibrateCommand ()
+
+@property (nonatomic, assign, readwrite) NSInteger      passwordLength;
+@property (nonatomic, assign, readwrite) NSInteger      saltLength;
+@property (nonatomic, assign, readwrite) NSInteger      derivedKeyLength;
+@property (nonatomic, assign, readwrite) NSInteger      derivationTimeMilliseconds;
+
+@end
+
+@implementation PBKDF2CalibrateCommand
+
++ (NSString *)commandName
+{
+    return @"pbkdf2-sha1-calibrate";
+}
+
++ (NSString *)commandUsage
+{
+    return [NSString stringWithFormat:@"%@ [-p passwordLength] [-s saltLength] [-z derivedKeyLength] [-t milliseconds]", [self commandName]];
+}
+
+- (id)init
+{
+    self = [super init];
+    if (self != nil) {
+        self->_passwordLength = 8;
+        self->_saltLength = 8;
+        self->_derivedKeyLength = 16;
+        self->_derivationTimeMilliseconds = 100;
+    }
+    return self;
+}
+
+- (NSString *)commandOptions
+{
+    return @"p:s:z:t:";
+}
+
+- (BOOL)setOption_p_argument:(NSString *)argument
+{
+    self.passwordLength = [argument integerValue];
+    return (self.passwordLength >= 0);
+}
+
+- (BOOL)setOption_s_argument:(NSString *)argument
+{
+    self.saltLength = [argument integerValue];
+    return (self.saltLength >= 0);
+}
+
+- (BOOL)setOption_z_argument:(NSString *)argument
+{
+    self.derivedKeyLength = [argument integerValue];
+    return (self.derivedKeyLength > 0);
+}
+
+- (BOOL)setOption_t_argument:(NSString *)argument
+{
+    self.derivationTimeMilliseconds = [argument integerValue];
+    return (self.derivationTimeMilliseconds > 0);
+}
+
+- (BOOL)validateOptionsAndArguments:(NSArray *)optionsAndArguments
+{
+    BOOL    success;
+    
+    success = [super validateOptionsAndArguments:optionsAndArguments];
+    if (success && ([self.arguments count] != 0)) {
+        success = NO;
     }
-    [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
-    if (op.error == nil) {
-        fprintf(stdout, "%s\n", [[QHex hexStringWithData:op.derivedKeyData] UTF8String]);
+    return success;
+}
+
+- (BOOL)runError:(NSError **)errorPtr
+{
+    BOOL            success;
+    NSUInteger      rounds;
+    
+    rounds = [QCCPBKDF2SHA1KeyDerivation 
+        calibratedRoundsForPasswordLength:(NSUInteger) self.passwordLength 
+        saltLength:(NSUInteger) self.saltLength 
+        derivedKeyLength:(NSUInteger) self.derivedKeyLength 
+        derivationTime:self.derivationTimeMilliseconds / 1000.0
+    ];
+    success = (rounds != 0);
+    if (success) {
+        [[ToolCommon sharedInstance] writeOutputLine:[NSString stringWithFormat:@"%zu", (size_t) rounds]];
     } else {
         if (errorPtr != NULL) {
-            *errorPtr = op.error;
+            *errorPtr = [NSError errorWithDomain:kQCCPBKDF2KeyDerivationErrorDomain code:kCCParamError userInfo:nil];
         }
-        success = NO;
     }
     
     return success;
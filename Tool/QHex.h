@@ -52,6 +52,18 @@
 + (NSString *)hexStringWithBytes:(const void *)bytes length:(NSUInteger)length;
 + (NSString *)hexStringWithData:(NSData *)data;
 
+// Returns nil if the string has an odd length or contains anything other than hex 
+// digits (of either case).
+
 + (NSData *)dataWithHexString:(NSString *)hexString;
 
+// The following work on raw buffers, which saves creating strings when you're going 
+// to write the hex out anyway.  The first writes length * 2 lower case hex digits 
+// to hexChars, without a null terminator.  The second writes hexLength / 2 bytes to 
+// bytes; hexLength must be even.  It returns NO if any of the characters isn't a hex 
+// digit, in which case the contents of bytes are undefined.
+
++ (void)getHexChars:(char *)hexChars fromBytes:(const void *)bytes length:(NSUInteger)length;
++ (BOOL)getBytes:(void *)bytes fromHexChars:(const char *)hexChars length:(NSUInteger)hexLength;
+
 @end
@@ -47,17 +47,66 @@
 
 #import "QHex.h"
 
+// kHexChars maps a nibble to its lower case hex digit.  kHexValues maps a character to 
+// its value plus one, so that the zero entries, which is all the ones we don't list, 
+// mark the characters that aren't hex digits.
+
+static const char kHexChars[16] = "0123456789abcdef";
+
+static const uint8_t kHexValues[256] = {
+    ['0'] =  1, ['1'] =  2, ['2'] =  3, ['3'] =  4, ['4'] =  5, 
+    ['5'] =  6, ['6'] =  7, ['7'] =  8, ['8'] =  9, ['9'] = 10, 
+    ['a'] = 11, ['b'] = 12, ['c'] = 13, ['d'] = 14, ['e'] = 15, ['f'] = 16, 
+    ['A'] = 11, ['B'] = 12, ['C'] = 13, ['D'] = 14, ['E'] = 15, ['F'] = 16
+};
+
 @implementation QHex
 
-+ (NSString *)hexStringWithBytes:(const void *)bytes length:(NSUInteger)length
++ (void)getHexChars:(char *)hexChars fromBytes:(const void *)bytes length:(NSUInteger)length
 {
-    NSMutableString *   result;
+    const uint8_t *     cursor;
+    
+    assert( (hexChars != NULL) || (length == 0) );
+    assert( (bytes    != NULL) || (length == 0) );
     
-    result = [[NSMutableString alloc] initWithCapacity:length * 2];
-    for (size_t i = 0; i < length; i++) {
-        [result appendFormat:@"%02x", ((const uint8_t *) bytes)[i]];
+    cursor = (const uint8_t *) bytes;
+    for (NSUInteger i = 0; i < length; i++) {
+        hexChars[i * 2    ] = kHexChars[cursor[i] >> 4];
+        hexChars[i * 2 + 1] = kHexChars[cursor[i] & 0x0f];
     }
-    return result;
+}
+
++ (BOOL)getBytes:(void *)bytes fromHexChars:(const char *)hexChars length:(NSUInteger)hexLength
+{
+    const uint8_t *     cursor;
+    uint8_t *           output;
+    uint8_t             high;
+    uint8_t             low;
+    
+    assert( (bytes    != NULL) || (hexLength == 0) );
+    assert( (hexChars != NULL) || (hexLength == 0) );
+    assert( (hexLength % 2) == 0 );
+    
+    cursor = (const uint8_t *) hexChars;
+    output = (uint8_t *) bytes;
+    for (NSUInteger i = 0; i < (hexLength / 2); i++) {
+        high = kHexValues[cursor[i * 2    ]];
+        low  = kHexValues[cursor[i * 2 + 1]];
+        if ( (high == 0) || (low == 0) ) {
+            return NO;
+        }
+        output[i] = (uint8_t) (((high - 1) << 4) | (low - 1));
+    }
+    return YES;
+}
+
++ (NSString *)hexStringWithBytes:(const void *)bytes length:(NSUInteger)length
+{
+    NSMutableData *     hexData;
+    
+    hexData = [[NSMutableData alloc] initWithLength:length * 2];
+    [self getHexChars:[hexData mutableBytes] fromBytes:bytes length:length];
+    return [[NSString alloc] initWithData:hexData encoding:NSASCIIStringEncoding];
 }
 
 + (NSString *)hexStringWithData:(NSData *)data
@@ -68,26 +117,17 @@
 + (NSData *)dataWithHexString:(NSString *)hexString
 {
     NSMutableData *     result;
-    NSUInteger          cursor;
-    NSUInteger          limit;
+    NSData *            hexData;
+    
+    // Anything that isn't ASCII can't be hex, so a failed conversion is just another 
+    // way of the string being invalid.
     
     result = nil;
-    cursor = 0;
-    limit = [hexString length];
-    if ((limit % 2) == 0) {
-        result = [[NSMutableData alloc] init];
-        
-        while (cursor != limit) {
-            unsigned int    thisUInt;
-            uint8_t         thisByte;
-            
-            if ( sscanf([[hexString substringWithRange:NSMakeRange(cursor, 2)] UTF8String], "%x", &thisUInt) != 1 ) {
-                result = nil;
-                break;
-            }
-            thisByte = (uint8_t) thisUInt;
-            [result appendBytes:&thisByte length:sizeof(thisByte)];
-            cursor += 2;
+    hexData = [hexString dataUsingEncoding:NSASCIIStringEncoding];
+    if ( (hexData != nil) && (([hexData length] % 2) == 0) ) {
+        result = [[NSMutableData alloc] initWithLength:[hexData length] / 2];
+        if ( ! [self getBytes:[result mutableBytes] fromHexChars:[hexData bytes] length:[hexData length]] ) {
+            result = nil;
         }
     }
     
@@ -138,6 +138,10 @@
     //
     // The ddefault implementation throws.
 
+@property (nonatomic, strong, readonly ) QToolCommand * subcommand;
+    // The subcommand selected by -validateOptionsAndArguments:, or nil if 
+    // validation has not been done or failed.
+
 + (NSString *)commandUsage;
     // This override returns the usage of each of the subcommands, separated by "\n".
 
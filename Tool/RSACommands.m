@@ -53,8 +53,6 @@
 
 #import "ToolCommon.h"
 
-#import "QHex.h"
-
 static SecKeyRef CopyKeyOfClassAndName(CFStringRef keyClass, NSString * keyName, NSError **errorPtr)
 {
     OSStatus        err;
@@ -93,6 +91,51 @@ static SecKeyRef CopyPrivateKeyNamed(NSString * privateKeyName, NSError **errorP
     return CopyKeyOfClassAndName(kSecAttrKeyClassPrivate, privateKeyName, errorPtr); 
 }
 
+// When signing or verifying a list of files, we read the files and submit their operations 
+// to the queue in windows of this many files per concurrent operation, which keeps the queue 
+// busy without holding the contents of every file (and every result) at once.  All of the 
+// operations share a single SecKeyRef, which is fine because the Security framework 
+// doesn't modify a key when it's used.
+
+enum {
+    kRSAFilesPerConcurrentOperation = 16
+};
+
+static NSArray * LinesFromListFile(NSString * listPath, NSError **errorPtr)
+    // Returns the lines of the list file, ignoring empty lines.
+{
+    NSMutableArray *    result;
+    NSData *            listData;
+    NSString *          listString;
+    
+    result = nil;
+    listString = nil;
+    listData = [[ToolCommon sharedInstance] dataWithContentsOfFile:listPath error:errorPtr];
+    if (listData != nil) {
+        listString = [[NSString alloc] initWithData:listData encoding:NSUTF8StringEncoding];
+        if (listString == nil) {
+            if (errorPtr != NULL) {
+                *errorPtr = [NSError errorWithDomain:NSCocoaErrorDomain code:NSFileReadInapplicableStringEncodingError userInfo:nil];
+            }
+        }
+    }
+    if (listString != nil) {
+        result = [[NSMutableArray alloc] init];
+        for (NSString * line in [listString componentsSeparatedByCharactersInSet:[NSCharacterSet newlineCharacterSet]]) {
+            if ([line length] != 0) {
+                [result addObject:line];
+            }
+        }
+    }
+    return result;
+}
+
+@interface RSASHA1VerifyCommand ()
+
+@property (nonatomic, copy,   readwrite) NSString *     listPath;
+
+@end
+
 @implementation RSASHA1VerifyCommand
 
 + (NSString *)commandName
@@ -102,7 +145,18 @@ static SecKeyRef CopyPrivateKeyNamed(NSString * privateKeyName, NSError **errorP
 
 + (NSString *)commandUsage
 {
-    return [NSString stringWithFormat:@"%@ publicKeyName signatureFile dataFile", [self commandName]];
+    return [NSString stringWithFormat:@"%@ (-l listFile publicKeyName | publicKeyName signatureFile dataFile)", [self commandName]];
+}
+
+- (NSString *)commandOptions
+{
+    return @"l:";
+}
+
+- (BOOL)setOption_l_argument:(NSString *)argument
+{
+    self.listPath = argument;
+    return YES;
 }
 
 - (BOOL)validateOptionsAndArguments:(NSArray *)optionsAndArguments
@@ -110,13 +164,127 @@ static SecKeyRef CopyPrivateKeyNamed(NSString * privateKeyName, NSError **errorP
     BOOL    success;
     
     success = [super validateOptionsAndArguments:optionsAndArguments];
-    if (success && ([self.arguments count] != 3)) {
+    if (success && ([self.arguments count] != ((self.listPath == nil) ? 3 : 1))) {
         success = NO;
     }
     return success;
 }
 
-- (BOOL)runError:(NSError **)errorPtr
+- (NSArray *)pairsFromListFileError:(NSError **)errorPtr
+    // Returns the (signatureFile, dataFile) pairs listed in the list file, one pair per 
+    // line with the paths separated by a tab, ignoring empty lines.
+{
+    NSMutableArray *    result;
+    NSArray *           lines;
+    
+    result = nil;
+    lines = LinesFromListFile(self.listPath, errorPtr);
+    if (lines != nil) {
+        result = [[NSMutableArray alloc] init];
+        for (NSString * line in lines) {
+            NSArray *   pair;
+            
+            pair = [line componentsSeparatedByString:@"\t"];
+            if ([pair count] != 2) {
+                result = nil;
+                if (errorPtr != NULL) {
+                    *errorPtr = [NSError errorWithDomain:NSCocoaErrorDomain code:NSFileReadCorruptFileError userInfo:nil];
+                }
+                break;
+            }
+            [result addObject:pair];
+        }
+    }
+    return result;
+}
+
+- (BOOL)verifyPairs:(NSArray *)pairs publicKey:(SecKeyRef)publicKey error:(NSError **)errorPtr
+    // Verifies each (signatureFile, dataFile) pair on a queue and writes out the results, 
+    // one per line, in the order of pairs.  If a file can't be read, or an operation fails, 
+    // we stop there; the results for the pairs before it have already been written out.
+{
+    NSError *           error;
+    NSUInteger          windowLength;
+    NSUInteger          windowStart;
+    
+    windowLength = (NSUInteger) [ToolCommon sharedInstance].maxConcurrentOperationCount * kRSAFilesPerConcurrentOperation;
+    
+    error = nil;
+    for (windowStart = 0; (error == nil) && (windowStart < [pairs count]); windowStart += windowLength) {
+        NSMutableArray *    ops;
+        NSError *           readError;
+        
+        ops = [[NSMutableArray alloc] init];
+        readError = nil;
+        for (NSArray * pair in [pairs subarrayWithRange:NSMakeRange(windowStart, MIN(windowLength, [pairs count] - windowStart))]) {
+            NSData *    signatureData;
+            NSData *    fileData;
+            
+            fileData = nil;
+            signatureData = [[ToolCommon sharedInstance] dataWithContentsOfFile:pair[0] error:&readError];
+            if (signatureData != nil) {
+                fileData = [[ToolCommon sharedInstance] dataWithContentsOfFile:pair[1] error:&readError];
+            }
+            if (fileData == nil) {
+                break;
+            }
+            [ops addObject:[[QCCRSASHA1VerifyT alloc] initWithInputData:fileData publicKey:publicKey signatureData:signatureData]];
+        }
+        
+        // We run the operations we have even if a read failed, so that we write out the 
+        // results for the pairs before the one that failed.
+        
+        [[ToolCommon sharedInstance] synchronouslyRunOperations:ops];
+        
+        for (QCCRSASHA1VerifyT * op in ops) {
+            if (error == nil) {
+                if (op.error != nil) {
+                    error = op.error;
+                } else {
+                    [[ToolCommon sharedInstance] writeOutputLine:op.verified ? @"verified" : @"not verified"];
+                }
+            }
+        }
+        if (error == nil) {
+            error = readError;
+        }
+    }
+    
+    if ( (error != nil) && (errorPtr != NULL) ) {
+        *errorPtr = error;
+    }
+    return (error == nil);
+}
+
+- (BOOL)runListError:(NSError **)errorPtr
+    // Verifies the pairs in the list file, looking up the key just once.
+{
+    BOOL        success;
+    NSArray *   pairs;
+    SecKeyRef   publicKey;
+    
+    publicKey = NULL;
+    
+    pairs = [self pairsFromListFileError:errorPtr];
+    success = (pairs != nil);
+    
+    if (success) {
+        publicKey = CopyPublicKeyNamed(self.arguments[0], errorPtr);
+        success = (publicKey != NULL);
+    }
+    
+    if (success) {
+        success = [self verifyPairs:pairs publicKey:publicKey error:errorPtr];
+    }
+    
+    if (publicKey != NULL) {
+        CFRelease(publicKey);
+    }
+    
+    return success;
+}
+
+- (BOOL)runSingleError:(NSError **)errorPtr
 {
     BOOL        success;
     NSString *  publicKeyName;
@@ -127,10 +295,10 @@ static SecKeyRef CopyPrivateKeyNamed(NSString * privateKeyName, NSError **errorP
     publicKey = NULL;
     
     publicKeyName = self.arguments[0];
-    signatureData = [NSData dataWithContentsOfURL:[NSURL fileURLWithPath:self.arguments[1]] options:0 error:errorPtr];
+    signatureData = [[ToolCommon sharedInstance] dataWithContentsOfFile:self.arguments[1] error:errorPtr];
     success = (signatureData != nil);
     if (success) {
-        fileData = [NSData dataWithContentsOfURL:[NSURL fileURLWithPath:self.arguments[2]] options:0 error:errorPtr];
+        fileData = [[ToolCommon sharedInstance] dataWithContentsOfFile:self.arguments[2] error:errorPtr];
         success = (fileData != nil);
     }
     
@@ -147,9 +315,9 @@ static SecKeyRef CopyPrivateKeyNamed(NSString * privateKeyName, NSError **errorP
         success = (op.error == nil);
         if (success) {
             if (op.verified) {
-                fprintf(stdout, "verified\n");
+                [[ToolCommon sharedInstance] writeOutputLine:@"verified"];
             } else {
-                fprintf(stdout, "not verified\n");
+                [[ToolCommon sharedInstance] writeOutputLine:@"not verified"];
             }
         } else if (errorPtr != NULL) {
             *errorPtr = op.error;
@@ -163,6 +331,24 @@ static SecKeyRef CopyPrivateKeyNamed(NSString * privateKeyName, NSError **errorP
     return success;
 }
 
+- (BOOL)runError:(NSError **)errorPtr
+{
+    BOOL        success;
+    
+    if (self.listPath == nil) {
+        success = [self runSingleError:errorPtr];
+    } else {
+        success = [self runListError:errorPtr];
+    }
+    return success;
+}
+
+@end
+
+@interface RSASHA1SignCommand ()
+
+@property (nonatomic, copy,   readwrite) NSString *     listPath;
+
 @end
 
 @implementation RSASHA1SignCommand
@@ -174,7 +360,18 @@ static SecKeyRef CopyPrivateKeyNamed(NSString * privateKeyName, NSError **errorP
 
 + (NSString *)commandUsage
 {
-    return [NSString stringWithFormat:@"%@ privateKeyName file", [self commandName]];
+    return [NSString stringWithFormat:@"%@ (-l listFile privateKeyName | privateKeyName file...)", [self commandName]];
+}
+
+- (NSString *)commandOptions
+{
+    return @"l:";
+}
+
+- (BOOL)setOption_l_argument:(NSString *)argument
+{
+    self.listPath = argument;
+    return YES;
 }
 
 - (BOOL)validateOptionsAndArguments:(NSArray *)optionsAndArguments
@@ -182,13 +379,101 @@ static SecKeyRef CopyPrivateKeyNamed(NSString * privateKeyName, NSError **errorP
     BOOL    success;
     
     success = [super validateOptionsAndArguments:optionsAndArguments];
-    if (success && ([self.arguments count] != 2)) {
-        success = NO;
+    if (success) {
+        if (self.listPath == nil) {
+            success = ([self.arguments count] >= 2);
+        } else {
+            success = ([self.arguments count] == 1);
+        }
     }
     return success;
 }
 
-- (BOOL)runError:(NSError **)errorPtr
+- (BOOL)signFilesAtPaths:(NSArray *)paths privateKey:(SecKeyRef)privateKey error:(NSError **)errorPtr
+    // Signs each of the files on a queue and writes out the signatures, one per line, in 
+    // the order of paths.  If a file can't be read, or an operation fails, we stop there; 
+    // the signatures of the files before it have already been written out.
+{
+    NSError *           error;
+    NSUInteger          windowLength;
+    NSUInteger          windowStart;
+    
+    windowLength = (NSUInteger) [ToolCommon sharedInstance].maxConcurrentOperationCount * kRSAFilesPerConcurrentOperation;
+    
+    error = nil;
+    for (windowStart = 0; (error == nil) && (windowStart < [paths count]); windowStart += windowLength) {
+        NSMutableArray *    ops;
+        NSError *           readError;
+        
+        ops = [[NSMutableArray alloc] init];
+        readError = nil;
+        for (NSString * path in [paths subarrayWithRange:NSMakeRange(windowStart, MIN(windowLength, [paths count] - windowStart))]) {
+            NSData *    fileData;
+            
+            fileData = [[ToolCommon sharedInstance] dataWithContentsOfFile:path error:&readError];
+            if (fileData == nil) {
+                break;
+            }
+            [ops addObject:[[QCCRSASHA1SignT alloc] initWithInputData:fileData privateKey:privateKey]];
+        }
+        
+        // See the comment in -[RSASHA1VerifyCommand verifyPairs:publicKey:error:].
+        
+        [[ToolCommon sharedInstance] synchronouslyRunOperations:ops];
+        
+        for (QCCRSASHA1SignT * op in ops) {
+            if (error == nil) {
+                if (op.error != nil) {
+                    error = op.error;
+                } else {
+                    [[ToolCommon sharedInstance] writeOutputDataAsHexLine:op.signatureData];
+                }
+            }
+        }
+        if (error == nil) {
+            error = readError;
+        }
+    }
+    
+    if ( (error != nil) && (errorPtr != NULL) ) {
+        *errorPtr = error;
+    }
+    return (error == nil);
+}
+
+- (BOOL)runMultipleError:(NSError **)errorPtr
+    // Signs the files in the list file, or on the command line, looking up the key just once.
+{
+    BOOL        success;
+    NSArray *   paths;
+    SecKeyRef   privateKey;
+    
+    privateKey = NULL;
+    
+    if (self.listPath == nil) {
+        paths = [self.arguments subarrayWithRange:NSMakeRange(1, [self.arguments count] - 1)];
+    } else {
+        paths = LinesFromListFile(self.listPath, errorPtr);
+    }
+    success = (paths != nil);
+    
+    if (success) {
+        privateKey = CopyPrivateKeyNamed(self.arguments[0], errorPtr);
+        success = (privateKey != NULL);
+    }
+    
+    if (success) {
+        success = [self signFilesAtPaths:paths privateKey:privateKey error:errorPtr];
+    }
+    
+    if (privateKey != NULL) {
+        CFRelease(privateKey);
+    }
+    
+    return success;
+}
+
+- (BOOL)runSingleError:(NSError **)errorPtr
 {
     BOOL        success;
     NSString *  privateKeyName;
@@ -198,7 +483,7 @@ static SecKeyRef CopyPrivateKeyNamed(NSString * privateKeyName, NSError **errorP
     privateKey = NULL;
     
     privateKeyName = self.arguments[0];
-    fileData = [NSData dataWithContentsOfURL:[NSURL fileURLWithPath:self.arguments[1]] options:0 error:errorPtr];
+    fileData = [[ToolCommon sharedInstance] dataWithContentsOfFile:self.arguments[1] error:errorPtr];
     success = (fileData != nil);
     
     if (success) {
@@ -213,7 +498,7 @@ static SecKeyRef CopyPrivateKeyNamed(NSString * privateKeyName, NSError **errorP
         [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
         success = (op.error == nil);
         if (success) {
-            fprintf(stdout, "%s\n", [[QHex hexStringWithData:op.signatureData] UTF8String]);
+            [[ToolCommon sharedInstance] writeOutputDataAsHexLine:op.signatureData];
         } else if (errorPtr != NULL) {
             *errorPtr = op.error;
         }
@@ -226,6 +511,21 @@ static SecKeyRef CopyPrivateKeyNamed(NSString * privateKeyName, NSError **errorP
     return success;
 }
 
+- (BOOL)runError:(NSError **)errorPtr
+{
+    BOOL        success;
+    
+    // A single file on the command line gets the original treatment.  Anything else is 
+    // signed on a queue.
+    
+    if ( (self.listPath == nil) && ([self.arguments count] == 2) ) {
+        success = [self runSingleError:errorPtr];
+    } else {
+        success = [self runMultipleError:errorPtr];
+    }
+    return success;
+}
+
 @end
 
 @interface RSACryptorCommand ()
@@ -304,7 +604,7 @@ static SecKeyRef CopyPrivateKeyNamed(NSString * privateKeyName, NSError **errorP
     publicKey = NULL;
     
     publicKeyName = self.arguments[0];
-    fileData = [NSData dataWithContentsOfURL:[NSURL fileURLWithPath:self.arguments[1]] options:0 error:errorPtr];
+    fileData = [[ToolCommon sharedInstance] dataWithContentsOfFile:self.arguments[1] error:errorPtr];
     success = (fileData != nil);
     
     if (success) {
@@ -320,7 +620,7 @@ static SecKeyRef CopyPrivateKeyNamed(NSString * privateKeyName, NSError **errorP
         [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
         success = (op.error == nil);
         if (success) {
-            fprintf(stdout, "%s\n", [[QHex hexStringWithData:op.smallOutputData] UTF8String]);
+            [[ToolCommon sharedInstance] writeOutputDataAsHexLine:op.smallOutputData];
         } else if (errorPtr != NULL) {
             *errorPtr = op.error;
         }
@@ -374,7 +674,7 @@ static SecKeyRef CopyPrivateKeyNamed(NSString * privateKeyName, NSError **errorP
     privateKey = NULL;
     
     privateKeyName = self.arguments[0];
-    fileData = [NSData dataWithContentsOfURL:[NSURL fileURLWithPath:self.arguments[1]] options:0 error:errorPtr];
+    fileData = [[ToolCommon sharedInstance] dataWithContentsOfFile:self.arguments[1] error:errorPtr];
     success = (fileData != nil);
     
     if (success) {
@@ -390,7 +690,7 @@ static SecKeyRef CopyPrivateKeyNamed(NSString * privateKeyName, NSError **errorP
         [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
         success = (op.error == nil);
         if (success) {
-            fprintf(stdout, "%s\n", [[QHex hexStringWithData:op.smallOutputData] UTF8String]);
+            [[ToolCommon sharedInstance] writeOutputDataAsHexLine:op.smallOutputData];
         } else if (errorPtr != NULL) {
             *errorPtr = op.error;
         }
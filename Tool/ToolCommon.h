@@ -53,6 +53,39 @@
 
 @property (nonatomic, assign, readwrite) BOOL   debugRunOpOnMainThread;
 
+// Operations run on a shared queue.  maxConcurrentOperationCount limits the number 
+// that run at once; it defaults to the number of active processors.
+//
+// -synchronouslyRunOperation: runs a single operation and waits for it.  To run many 
+// operations at once, start each with -startOperation: and then collect them with 
+// -waitForOperations:, which returns once they've all finished; or just call 
+// -synchronouslyRunOperations:, which does both.  These only wait for the operations 
+// you pass in, so it's safe for several threads to use them at the same time.  If 
+// debugRunOpOnMainThread is set, -startOperation: runs the operation there and then.
+
+@property (atomic, assign, readwrite) NSInteger maxConcurrentOperationCount;
+
 - (void)synchronouslyRunOperation:(NSOperation *)op;
+- (void)startOperation:(NSOperation *)op;
+- (void)waitForOperations:(NSArray *)ops;
+- (void)synchronouslyRunOperations:(NSArray *)ops;
+
+// Commands read their input files and write their output via the following, rather 
+// than going to the file system and stdout directly.  This lets the batch command 
+// supply a command's input from memory and capture its output.
+//
+// inputDataByPath and outputData are per thread, so that the batch command can run 
+// several commands at once, each on its own thread.
+
+@property (atomic, copy,   readwrite) NSDictionary *    inputDataByPath;    // maps a path to data used in place of that file's contents
+@property (atomic, strong, readwrite) NSMutableData *   outputData;         // if not nil, output is appended to this rather than written to stdout
+@property (atomic, assign, readwrite) BOOL              mapInputFiles;      // if YES, input files are memory mapped (if safe) rather than copied into memory
+@property (atomic, assign, readwrite) BOOL              binaryOutput;       // if YES, -writeOutputDataAsHexLine: writes raw bytes rather than hex
+
+- (NSData *)dataWithContentsOfFile:(NSString *)path error:(NSError **)errorPtr;
+- (NSInputStream *)inputStreamWithContentsOfFile:(NSString *)path;
+- (void)writeOutputData:(NSData *)data;
+- (void)writeOutputLine:(NSString *)line;
+- (void)writeOutputDataAsHexLine:(NSData *)data;
 
 @end
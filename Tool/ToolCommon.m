@@ -47,6 +47,8 @@
 
 #import "ToolCommon.h"
 
+#import "QHex.h"
+
 @interface ToolCommon ()
 
 @property (atomic, strong, readonly ) NSOperationQueue *    queue;
@@ -70,6 +72,7 @@
     self = [super init];
     if (self != nil) {
         self->_queue = [[NSOperationQueue alloc] init];
+        self->_queue.maxConcurrentOperationCount = (NSInteger) [[NSProcessInfo processInfo] activeProcessorCount];
     }
     return self;
 }
@@ -79,7 +82,23 @@
     assert(NO);
 }
 
+- (NSInteger)maxConcurrentOperationCount
+{
+    return self.queue.maxConcurrentOperationCount;
+}
+
+- (void)setMaxConcurrentOperationCount:(NSInteger)maxConcurrentOperationCount
+{
+    assert(maxConcurrentOperationCount > 0);
+    self.queue.maxConcurrentOperationCount = maxConcurrentOperationCount;
+}
+
 - (void)synchronouslyRunOperation:(NSOperation *)op
+{
+    [self synchronouslyRunOperations:@[ op ]];
+}
+
+- (void)startOperation:(NSOperation *)op
 {
     if (self.debugRunOpOnMainThread) {
         // This is the hacky way we do it to simplify debugging.
@@ -87,7 +106,127 @@
     } else {
         // This is how it /should/ be done.
         [self.queue addOperation:op];
-        [self.queue waitUntilAllOperationsAreFinished];
+    }
+}
+
+- (void)waitForOperations:(NSArray *)ops
+    // We wait for each of the operations in turn, rather than using 
+    // -waitUntilAllOperationsAreFinished, because the latter would also wait for 
+    // operations started by other threads.
+{
+    if ( ! self.debugRunOpOnMainThread ) {
+        for (NSOperation * op in ops) {
+            [op waitUntilFinished];
+        }
+    }
+}
+
+- (void)synchronouslyRunOperations:(NSArray *)ops
+{
+    for (NSOperation * op in ops) {
+        [self startOperation:op];
+    }
+    [self waitForOperations:ops];
+}
+
+// The per-thread state lives in the thread dictionary under these keys.
+
+static NSString * kInputDataByPathKey = @"ToolCommon.inputDataByPath";
+static NSString * kOutputDataKey      = @"ToolCommon.outputData";
+
+- (NSDictionary *)inputDataByPath
+{
+    return [[NSThread currentThread] threadDictionary][kInputDataByPathKey];
+}
+
+- (void)setInputDataByPath:(NSDictionary *)inputDataByPath
+{
+    if (inputDataByPath == nil) {
+        [[[NSThread currentThread] threadDictionary] removeObjectForKey:kInputDataByPathKey];
+    } else {
+        [[NSThread currentThread] threadDictionary][kInputDataByPathKey] = [inputDataByPath copy];
+    }
+}
+
+- (NSMutableData *)outputData
+{
+    return [[NSThread currentThread] threadDictionary][kOutputDataKey];
+}
+
+- (void)setOutputData:(NSMutableData *)outputData
+{
+    if (outputData == nil) {
+        [[[NSThread currentThread] threadDictionary] removeObjectForKey:kOutputDataKey];
+    } else {
+        [[NSThread currentThread] threadDictionary][kOutputDataKey] = outputData;
+    }
+}
+
+- (NSData *)dataWithContentsOfFile:(NSString *)path error:(NSError **)errorPtr
+{
+    NSData *    result;
+    
+    result = self.inputDataByPath[path];
+    if (result == nil) {
+        // Mapping the file means that a large input doesn't need a copy of the whole file 
+        // on the heap.  Foundation only maps if it's safe to do so, that is, if the file is 
+        // on a volume that can't disappear out from under us; otherwise it reads the file 
+        // as usual.
+        
+        result = [NSData dataWithContentsOfURL:[NSURL fileURLWithPath:path] options:(self.mapInputFiles ? NSDataReadingMappedIfSafe : 0) error:errorPtr];
+    }
+    return result;
+}
+
+- (NSInputStream *)inputStreamWithContentsOfFile:(NSString *)path
+{
+    NSInputStream *     result;
+    NSData *            data;
+    
+    data = self.inputDataByPath[path];
+    if (data != nil) {
+        result = [NSInputStream inputStreamWithData:data];
+    } else {
+        result = [NSInputStream inputStreamWithFileAtPath:path];
+    }
+    return result;
+}
+
+- (void)writeOutputData:(NSData *)data
+{
+    NSMutableData *     outputData;
+    
+    outputData = self.outputData;
+    if (outputData != nil) {
+        [outputData appendData:data];
+    } else {
+        (void) fwrite([data bytes], [data length], 1, stdout);
+    }
+}
+
+- (void)writeOutputLine:(NSString *)line
+{
+    NSMutableData *     lineData;
+    
+    lineData = [[line dataUsingEncoding:NSUTF8StringEncoding] mutableCopy];
+    [lineData appendBytes:"\n" length:1];
+    [self writeOutputData:lineData];
+}
+
+- (void)writeOutputDataAsHexLine:(NSData *)data
+    // Writes data as a line of hex or, if binaryOutput is set, as is.  We build the 
+    // line in a buffer rather than going through an NSString, which matters when 
+    // there's a lot of output.
+{
+    NSMutableData *     lineData;
+    
+    if (self.binaryOutput) {
+        [self writeOutputData:data];
+    } else {
+        lineData = [[NSMutableData alloc] initWithLength:[data length] * 2 + 1];
+        [QHex getHexChars:[lineData mutableBytes] fromBytes:[data bytes] length:[data length]];
+        ((char *) [lineData mutableBytes])[[data length] * 2] = '\n';
+        [self writeOutputData:lineData];
     }
 }
 
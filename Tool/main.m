@@ -52,6 +52,7 @@
 #import "KeyDerivationCommands.h"
 #import "CryptorCommands.h"
 #import "RSACommands.h"
+#import "BatchCommands.h"
 
 #import "ToolCommon.h"
 
@@ -61,6 +62,9 @@
 
 @property (nonatomic, assign, readwrite) NSUInteger verbose;
 @property (nonatomic, assign, readwrite) BOOL       debug;
+@property (nonatomic, assign, readwrite) BOOL       mapInputFiles;
+@property (nonatomic, assign, readwrite) BOOL       binaryOutput;
+@property (nonatomic, assign, readwrite) NSInteger  maxConcurrentOperationCount;
 
 @end
 
@@ -71,20 +75,26 @@
     return @[
         [Base64EncodeCommand class], 
         [Base64DecodeCommand class],
+        [Base64BigEncodeCommand class], 
+        [Base64BigDecodeCommand class],
         [SHA1DigestCommand class],
         [MD5DigestCommand class],
         [SHA1HMACCommand class], 
         [PBKDF2KeyDerivationCommand class], 
+        [PBKDF2CalibrateCommand class], 
         [AESEncryptCommand class], 
         [AESDecryptCommand class], 
         [AESPadEncryptCommand class], 
         [AESPadDecryptCommand class], 
         [AESPadBigEncryptCommand class], 
         [AESPadBigDecryptCommand class], 
+        [AESCTRBigEncryptCommand class], 
+        [AESCTRBigDecryptCommand class], 
         [RSASHA1VerifyCommand class], 
         [RSASHA1SignCommand class], 
         [RSASmallEncryptCommand class], 
-        [RSASmallDecryptCommand class]
+        [RSASmallDecryptCommand class], 
+        [BatchCommand class]
     ];
 }
 
@@ -95,7 +105,7 @@
 
 + (NSString *)commandUsage
 {
-    return [[NSString alloc] initWithFormat:@"%@ [-v] subcommand\n"
+    return [[NSString alloc] initWithFormat:@"%@ [-v] [-m] [-b] [-j count] subcommand\n"
         "\n"
         "Subcommands:\n"
         "\n"
@@ -107,7 +117,24 @@
 
 - (NSString *)commandOptions
 {
-    return @"vd";
+    return @"vdmbj:";
+}
+
+- (BOOL)validateOptionsAndArguments:(NSArray *)optionsAndArguments
+{
+    BOOL    success;
+    
+    success = [super validateOptionsAndArguments:optionsAndArguments];
+    if ( success && [self.subcommand isKindOfClass:[BatchCommand class]] ) {
+        NSMutableArray *    batchSubcommandClasses;
+        
+        // A batch can run any subcommand except another batch.
+        
+        batchSubcommandClasses = [[[self class] subcommandClasses] mutableCopy];
+        [batchSubcommandClasses removeObject:[BatchCommand class]];
+        ((BatchCommand *) self.subcommand).subcommandClasses = batchSubcommandClasses;
+    }
+    return success;
 }
 
 - (void)setOption_v
@@ -120,6 +147,22 @@
     self.debug = YES;
 }
 
+- (void)setOption_m
+{
+    self.mapInputFiles = YES;
+}
+
+- (void)setOption_b
+{
+    self.binaryOutput = YES;
+}
+
+- (BOOL)setOption_j_argument:(NSString *)argument
+{
+    self.maxConcurrentOperationCount = [argument integerValue];
+    return (self.maxConcurrentOperationCount > 0);
+}
+
 @end
 
 int main(int argc, char **argv)
@@ -142,6 +185,15 @@ int main(int argc, char **argv)
             if (mainCommand.debug) {
                 [ToolCommon sharedInstance].debugRunOpOnMainThread = YES;
             }
+            if (mainCommand.mapInputFiles) {
+                [ToolCommon sharedInstance].mapInputFiles = YES;
+            }
+            if (mainCommand.binaryOutput) {
+                [ToolCommon sharedInstance].binaryOutput = YES;
+            }
+            if (mainCommand.maxConcurrentOperationCount != 0) {
+                [ToolCommon sharedInstance].maxConcurrentOperationCount = mainCommand.maxConcurrentOperationCount;
+            }
             success = [mainCommand runError:&error];
             if (success) {
                 if (mainCommand.verbose != 0) {
@@ -51,54 +51,799 @@ import os
 import subprocess
 import tempfile
 import time
+import io
+import random
+import binascii
+import threading
+import argparse
+import multiprocessing
+import multiprocessing.pool
+import traceback
+import json
+import platform
+import struct
+import hashlib
+import hmac
+import imp
+import itertools
+import shutil
+import pipes
 
 def pathForResource(relPath):
     return os.path.join(os.path.dirname(sys.argv[0]), "..", "TestData", relPath)
 
 gPathForTool = None
 
-def setupPathForTool():
+def setupPathForTool(path=None):
     global gPathForTool
-    if len(sys.argv) == 1:
+    if path is None:
         gPathForTool = os.path.join(os.path.dirname(sys.argv[0]), "..", "build", "Debug", "CryptoCompatibility")
     else:
-        gPathForTool = sys.argv[1]
+        gPathForTool = path
     
 def pathForTool():
     return gPathForTool
 
+def pathForReferenceTool():
+    # The pure Python implementation of the tool, for use where the tool itself can't 
+    # be built.  It has the same command line interface, and takes its RSA keys from 
+    # "TestData" rather than the keychain.
+    return os.path.join(os.path.dirname(sys.argv[0]), "CryptoCompatibilityReference.py")
+
+# The output comparison works on streams of chunks rather than on complete outputs, 
+# so that comparing a large output doesn't require holding it in memory.  A stream is 
+# any iterator of non-empty strings.  A filter is a function that takes a stream and 
+# returns a transformed stream.
+
+kStreamChunkSize = 64 * 1024
+kMismatchContextSize = 32
+
+class PipeReader(object):
+    # Reads a pipe one chunk at a time into a single, reusable buffer.  atEOF is set 
+    # once the pipe has been read to the end.
+
+    def __init__(self, pipe, chunkSize=kStreamChunkSize):
+        self.file = io.FileIO(pipe.fileno(), "rb", closefd=False)
+        self.buffer = bytearray(chunkSize)
+        self.atEOF = False
+
+    def chunks(self):
+        view = memoryview(self.buffer)
+        while True:
+            count = self.file.readinto(self.buffer)
+            if not count:
+                break
+            yield view[:count].tobytes()
+        self.atEOF = True
+
+def hexFilter(chunks):
+    # Hex encodes the stream and adds a trailing newline, which is how the tool 
+    # prints binary results.
+    for chunk in chunks:
+        yield binascii.hexlify(chunk)
+    yield "\n"
+
+def skipPastFilter(delimiter):
+    # Returns a filter that drops everything up to and including the first occurrence 
+    # of delimiter.  For example, skipPastFilter("= ") turns "MD5(x)= abc\n" into "abc\n".
+    def filterChunks(chunks):
+        prefix = ""
+        chunks = iter(chunks)
+        for chunk in chunks:
+            prefix += chunk
+            index = prefix.find(delimiter)
+            if index != -1:
+                if index + len(delimiter) != len(prefix):
+                    yield prefix[index + len(delimiter):]
+                for chunk in chunks:
+                    yield chunk
+                return
+            # Keep just enough to match a delimiter that straddles two chunks.
+            prefix = prefix[-(len(delimiter) - 1):] if len(delimiter) > 1 else ""
+        raise AssertionError("delimiter %r not found" % delimiter)
+    return filterChunks
+
+def wholeOutputFilter(function):
+    # Returns a filter that applies function to the entire stream at once.  This is 
+    # only appropriate for small outputs, like the one line printed by "openssl dgst -verify".
+    def filterChunks(chunks):
+        result = function("".join(chunks))
+        if len(result) != 0:
+            yield result
+    return filterChunks
+
+def compareStreams(chunks1, chunks2):
+    # Compares two streams chunk by chunk, stopping at the first difference.  Returns None 
+    # if the streams are identical.  Otherwise returns an (offset, window1, window2) tuple, 
+    # where offset is the offset of the first difference and the windows are the bytes 
+    # of each stream from at most kMismatchContextSize bytes before that offset to at most 
+    # kMismatchContextSize bytes after it.  Memory use is bounded by the chunk sizes.
+    #
+    # We track our position in each pending chunk, rather than slicing off the part 
+    # we've compared, so that a stream with large chunks doesn't get copied repeatedly.
+    chunks1 = iter(chunks1)
+    chunks2 = iter(chunks2)
+    pending1 = ""
+    pending2 = ""
+    position1 = 0
+    position2 = 0
+    offset = 0
+    context = ""
+    while True:
+        if position1 == len(pending1):
+            pending1 = next(chunks1, None)
+            position1 = 0
+        if position2 == len(pending2):
+            pending2 = next(chunks2, None)
+            position2 = 0
+        if (pending1 is None) and (pending2 is None):
+            return None
+        if (pending1 is None) or (pending2 is None):
+            index = 0
+            pending1 = pending1 or ""
+            pending2 = pending2 or ""
+            break
+        count = min(len(pending1) - position1, len(pending2) - position2)
+        if pending1[position1:position1 + count] != pending2[position2:position2 + count]:
+            index = 0
+            while pending1[position1 + index] == pending2[position2 + index]:
+                index += 1
+            break
+        context = (context + pending1[max(position1, position1 + count - kMismatchContextSize):position1 + count])[-kMismatchContextSize:]
+        offset += count
+        position1 += count
+        position2 += count
+
+    # Grab a little more of each stream so that the report shows what follows the difference.
+
+    def after(pending, chunks):
+        while len(pending) < index + kMismatchContextSize:
+            chunk = next(chunks, None)
+            if chunk is None:
+                break
+            pending += chunk
+        return pending[index:index + kMismatchContextSize]
+    context = (context + pending1[position1:position1 + index])[-kMismatchContextSize:]
+    window1 = context + after(pending1[position1:], chunks1)
+    window2 = context + after(pending2[position2:], chunks2)
+    return (offset + index, window1, window2)
+
+def mismatchMessage(mismatch, name1="output1", name2="output2"):
+    (offset, window1, window2) = mismatch
+    windowStart = offset - min(offset, kMismatchContextSize)
+    return "outputs differ at offset %d\n%s[%d:] = %s\n%s[%d:] = %s" % (
+        offset, 
+        name1, windowStart, binascii.hexlify(window1), 
+        name2, windowStart, binascii.hexlify(window2)
+    )
+
+kSyntheticPoolSize = 1024 * 1024
+
+class SyntheticData(object):
+    # A deterministic stream of size pseudo-random bytes derived from seed.  The data is 
+    # generated on the fly, so any size can be streamed without holding it in memory or 
+    # storing it on disk, and the expected output of a check can be recomputed rather 
+    # than saved.
+    #
+    # Generating every byte with random.Random is too slow for multi-GB runs, so we 
+    # generate a pool of random bytes once and then emit rotations of that pool at random 
+    # (and thus generally not block-aligned) offsets.
+
+    def __init__(self, size, seed=0):
+        self.size = size
+        self.seed = seed
+        generator = random.Random(seed)
+        self.pool = binascii.unhexlify("%0*x" % (kSyntheticPoolSize * 2, generator.getrandbits(kSyntheticPoolSize * 8)))
+        self.offsetSeed = generator.getrandbits(64)
+
+    def chunks(self):
+        generator = random.Random(self.offsetSeed)
+        remaining = self.size
+        while remaining != 0:
+            offset = generator.randrange(kSyntheticPoolSize)
+            chunk = self.pool[offset:] + self.pool[:offset]
+            if remaining < len(chunk):
+                chunk = chunk[:remaining]
+            remaining -= len(chunk)
+            yield chunk
+
+def parseSize(sizeStr):
+    # Parses a size like "65537", "64K", "1M" or "16G".
+    multipliers = { "K": 1024, "M": 1024 * 1024, "G": 1024 * 1024 * 1024 }
+    sizeStr = sizeStr.strip().upper()
+    if sizeStr[-1:] in multipliers:
+        return int(sizeStr[:-1]) * multipliers[sizeStr[-1]]
+    return int(sizeStr)
+
+# The input sizes used by the big cryptor checks.  These deliberately include sizes that 
+# aren't a multiple of the AES block size and sizes either side of the 64 KiB chunk 
+# that QCCAESPadBigCryptor reads at a time.  Override with --big-sizes.
+
+gBigSizes = [
+    0, 
+    1, 
+    15, 
+    16, 
+    17, 
+    64 * 1024 - 1, 
+    64 * 1024, 
+    64 * 1024 + 1, 
+    64 * 1024 + 16, 
+    3 * 64 * 1024 - 15, 
+    1024 * 1024, 
+    16 * 1024 * 1024 + 13, 
+]
+
 def checkCommandOutputAgainOtherCommand(command1, command2, command2Filter=None, ignoreRetCode1=False, ignoreRetCode2=False):
 
+    # The two commands are independent, so we run them at the same time and compare 
+    # their outputs as they arrive, stopping at the first difference.  If a command 
+    # has run to completion, a non-zero return code takes precedence over any output 
+    # mismatch, and we check the return codes in the same order as we'd have done if 
+    # we'd run the commands one after the other.
+    #
+    # Either command can instead be a function that returns the output, typically a 
+    # call to an in-process backend (see below), in which case there's no process.
+
+    processes = []
+    readers = []
+    chunkStreams = []
     try:
-        output1 = subprocess.check_output(command1)
-    except subprocess.CalledProcessError, e:
-        if ignoreRetCode1:
-            output1 = e.output
-        else:
-            raise e
-    
-    try:
-        output2 = subprocess.check_output(command2)
-    except subprocess.CalledProcessError, e:
-        if ignoreRetCode2:
-            output2 = e.output
-        else:
-            raise e
-    
+        for command in (command1, command2):
+            if callable(command):
+                output = command()
+                processes.append(None)
+                readers.append(None)
+                chunkStreams.append(iter([output] if len(output) != 0 else []))
+            else:
+                process = subprocess.Popen(command, stdout=subprocess.PIPE)
+                processes.append(process)
+                readers.append(PipeReader(process.stdout))
+                chunkStreams.append(readers[-1].chunks())
+    except:
+        for process in processes:
+            if process is not None:
+                process.kill()
+                process.wait()
+        raise
+
+    (chunks1, chunks2) = chunkStreams
     if command2Filter != None:
-        output2 = command2Filter(output2)
+        chunks2 = command2Filter(chunks2)
+
+    try:
+        mismatch = compareStreams(chunks1, chunks2)
+    finally:
+        # Any command we haven't read to the end is only still running because we stopped 
+        # early, so kill it rather than wait for it.
+        retCodes = []
+        for (process, reader) in zip(processes, readers):
+            if process is None:
+                retCodes.append(0)
+                continue
+            if not reader.atEOF:
+                process.kill()
+            process.stdout.close()
+            retCode = process.wait()
+            retCodes.append(retCode if reader.atEOF else None)
 
-    if output1 != output2:
-        print "output1 = %s" % output1.encode("hex")
-        print "output2 = %s" % output2.encode("hex")
-        assert False
+    if (retCodes[0] not in (0, None)) and not ignoreRetCode1:
+        raise subprocess.CalledProcessError(retCodes[0], command1)
+    if (retCodes[1] not in (0, None)) and not ignoreRetCode2:
+        raise subprocess.CalledProcessError(retCodes[1], command2)
+
+    if mismatch is not None:
+        raise AssertionError(mismatchMessage(mismatch))
+
+def startPipeline(commands, hasInput=False):
+    # Starts the commands with each one's stdout connected to the next one's stdin, 
+    # returning the list of processes.  If hasInput is set, the first process's stdin 
+    # is a pipe for us to write to.  Only the last process's stdout is available to 
+    # us; the intermediate pipes are owned by the processes at either end.
+    processes = []
+    try:
+        for command in commands:
+            if len(processes) != 0:
+                stdin = processes[-1].stdout
+            elif hasInput:
+                stdin = subprocess.PIPE
+            else:
+                stdin = None
+            processes.append(subprocess.Popen(command, stdin=stdin, stdout=subprocess.PIPE))
+            if len(processes) > 1:
+                # Close our copy so that EOF and SIGPIPE propagate along the pipeline.
+                stdin.close()
+    except:
+        for process in processes:
+            process.kill()
+            process.wait()
+        raise
+    return processes
+
+def startWriter(pipe, chunks):
+    # Starts a thread that writes the stream to pipe and then closes it.  If the reader 
+    # goes away early (typically because we killed it), the thread just stops.
+    return startTeeWriter([pipe], chunks)
+
+def startTeeWriter(pipes, chunks):
+    # Like startWriter, but writes each chunk of the stream to every one of the pipes.  
+    # If the reader of one pipe goes away early, we carry on writing to the others, and 
+    # only stop once they've all gone.
+    def write():
+        livePipes = list(pipes)
+        try:
+            for chunk in chunks:
+                for pipe in list(livePipes):
+                    try:
+                        pipe.write(chunk)
+                    except IOError:
+                        livePipes.remove(pipe)
+                if len(livePipes) == 0:
+                    break
+        finally:
+            for pipe in pipes:
+                try:
+                    pipe.close()
+                except IOError:
+                    pass
+    writer = threading.Thread(target=write)
+    writer.daemon = True
+    writer.start()
+    return writer
+
+def checkPipelineOutputAgainstStream(commands, expectedChunks, inputChunks=None, expectedName="expected"):
+    # Runs the commands as a pipeline, feeding inputChunks (if any) to the first one, and 
+    # compares the output of the last one against expectedChunks, incrementally, so none 
+    # of the data is held in memory or written to disk.  If we find a difference before 
+    # the pipeline is done, we kill it and report the difference; otherwise every command 
+    # must succeed.
+
+    processes = startPipeline(commands, inputChunks is not None)
+    writer = None
+    if inputChunks is not None:
+        writer = startWriter(processes[0].stdin, inputChunks)
+    reader = PipeReader(processes[-1].stdout)
+    try:
+        mismatch = compareStreams(reader.chunks(), expectedChunks)
+    finally:
+        for process in processes:
+            if not reader.atEOF:
+                process.kill()
+            process.stdout.close()
+            process.wait()
+        if writer is not None:
+            writer.join()
+
+    if reader.atEOF:
+        for (process, command) in zip(processes, commands):
+            if process.returncode != 0:
+                raise subprocess.CalledProcessError(process.returncode, command)
+
+    if mismatch is not None:
+        raise AssertionError(mismatchMessage(mismatch, "output", expectedName))
+
+def checkCommandPairsOnSharedStream(pairs, inputChunks, inputName="input"):
+    # Each pair is a (command1, command2, command2Filter) tuple, as you'd pass to 
+    # checkCommandOutputAgainOtherCommand.  We run all the commands at once, feed the same 
+    # stream to every one of them on stdin, and then compare each pair's outputs.  The 
+    # stream is generated once, as it's written, so it's never held in memory or written 
+    # to disk, and thus can be larger than RAM.  We only read the outputs once the commands 
+    # are done, so this is only suitable for commands with a small output, like a digest.
+
+    commands = []
+    for (command1, command2, command2Filter) in pairs:
+        commands.extend([command1, command2])
+    processes = []
+    try:
+        for command in commands:
+            processes.append(subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE))
+    except:
+        for process in processes:
+            process.kill()
+            process.wait()
+        raise
+    writer = startTeeWriter([process.stdin for process in processes], inputChunks)
+    try:
+        outputs = [process.stdout.read() for process in processes]
+    finally:
+        writer.join()
+        for process in processes:
+            process.stdout.close()
+            process.wait()
+
+    for (process, command) in zip(processes, commands):
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, command)
+
+    for (index, (command1, command2, command2Filter)) in enumerate(pairs):
+        output1 = outputs[index * 2]
+        output2 = outputs[index * 2 + 1]
+        if command2Filter != None:
+            output2 = "".join(command2Filter([output2]))
+        mismatch = compareStreams([output1], [output2])
+        if mismatch is not None:
+            raise AssertionError("%s on %s: %s" % (" ".join(command1[1:-1]), inputName, mismatchMessage(mismatch)))
 
 def checkCommandOutputFixed(command, expectedOutput):
     actualOutput = subprocess.check_output(command)
-    if actualOutput != expectedOutput:
-        print "actualOutput = %s" % actualOutput.encode("hex")
-        print "expectedOutput = %s" % expectedOutput.encode("hex")
-        assert False
+    mismatch = compareStreams([actualOutput], [expectedOutput])
+    if mismatch is not None:
+        raise AssertionError(mismatchMessage(mismatch, "actualOutput", "expectedOutput"))
+
+# Batch mode.  "CryptoCompatibility batch" reads a sequence of requests from stdin and 
+# writes a response for each to stdout, so a run of small requests pays the tool's 
+# start-up cost once rather than once per request.  See "Tool/BatchCommands.h" for the 
+# wire format.  A request is an (arguments, payloads) tuple, where arguments starts with 
+# the subcommand name and an argument of the form "@N" refers to payload N.  A response 
+# is a (status, output) tuple.
+
+kBatchStatusSuccess = 0
+kBatchStatusError   = 1
+kBatchStatusUsage   = 2
+
+def encodeBatchRequest(request):
+    (arguments, payloads) = request
+    parts = [struct.pack(">I", len(arguments))]
+    for item in arguments:
+        item = item.encode("utf-8") if isinstance(item, unicode) else item
+        parts.append(struct.pack(">I", len(item)))
+        parts.append(item)
+    parts.append(struct.pack(">I", len(payloads)))
+    for item in payloads:
+        parts.append(struct.pack(">I", len(item)))
+        parts.append(item)
+    return "".join(parts)
+
+def batchRequestFromCommand(command):
+    # Converts a tool command line into the equivalent batch request, replacing each 
+    # argument that names an existing file with a reference to a payload holding that 
+    # file's contents.
+    arguments = []
+    payloads = []
+    for argument in command[1:]:
+        if os.path.isfile(argument):
+            with open(argument, "rb") as f:
+                payloads.append(f.read())
+            argument = "@%d" % (len(payloads) - 1)
+        arguments.append(argument)
+    return (arguments, payloads)
+
+class BatchClient(object):
+    # Runs a batch mode tool process and pipelines requests into it.  globalOptions go 
+    # before the "batch" subcommand, and batchOptions after it, so, for example, 
+    # BatchClient(globalOptions=["-j", "4"], batchOptions=["-p"]) runs up to four 
+    # requests at once.
+
+    def __init__(self, toolPath=None, globalOptions=(), batchOptions=()):
+        self.command = [toolPath or pathForTool()] + list(globalOptions) + ["batch"] + list(batchOptions)
+        self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def readExactly(self, length):
+        parts = []
+        while length != 0:
+            part = self.process.stdout.read(length)
+            if len(part) == 0:
+                raise IOError("batch tool exited with a response outstanding")
+            parts.append(part)
+            length -= len(part)
+        return "".join(parts)
+
+    def runRequests(self, requests):
+        # Sends the requests and yields the responses, in order.  A separate thread writes 
+        # the requests while we read the responses, so neither side ever waits on the other 
+        # and the tool never sits idle between requests.
+        requests = list(requests)
+        def write():
+            try:
+                for request in requests:
+                    self.process.stdin.write(encodeBatchRequest(request))
+                self.process.stdin.flush()
+            except IOError:
+                pass        # the tool died; the reader will notice
+        writer = threading.Thread(target=write)
+        writer.daemon = True
+        writer.start()
+        try:
+            for _ in requests:
+                (status, length) = struct.unpack(">II", self.readExactly(8))
+                yield (status, self.readExactly(length))
+        finally:
+            writer.join()
+
+    def run(self, arguments, payloads=()):
+        return list(self.runRequests([(arguments, payloads)]))[0]
+
+    def close(self):
+        self.process.stdin.close()
+        retCode = self.process.wait()
+        self.process.stdout.close()
+        if retCode != 0:
+            raise subprocess.CalledProcessError(retCode, self.command)
+
+# Backends.  A backend performs the operations that the checks compare, taking and 
+# returning raw bytes rather than command lines and text output.  There are three:
+#
+# o ToolBackend runs the operations in the tool, via a single batch process
+#
+# o ReferenceBackend runs them in this process, using the pure Python reference 
+#   implementation, so each operation takes microseconds rather than a process launch
+#
+# o OpenSSLBackend runs them using the openssl command line tool
+#
+# They all have the same methods.  For AES, op is "encrypt" or "decrypt" and mode is 
+# "ecb" or "cbc".  RSA keys are named as they are in the keychain.  If an operation 
+# fails, the backend raises BackendError.  Call close when you're done with a backend.
+
+class BackendError(Exception):
+    pass
+
+kRSAKeyPathsByName = {
+    "Imported Public Key":  "public.pem", 
+    "Imported Private Key": "private.pem", 
+}
+
+class ToolBackend(object):
+
+    def __init__(self, toolPath=None):
+        self.client = BatchClient(toolPath)
+
+    def close(self):
+        self.client.close()
+
+    def run(self, arguments, payloads):
+        (status, output) = self.client.run(arguments, payloads)
+        if status != kBatchStatusSuccess:
+            raise BackendError("%s: %s" % (arguments[0], output))
+        return output
+
+    def runHex(self, arguments, payloads):
+        return binascii.unhexlify(self.run(arguments, payloads).rstrip("\n"))
+
+    def digest(self, algorithm, data):
+        return self.runHex(["%s-digest" % algorithm, "@0"], [data])
+
+    def hmac(self, algorithm, key, data):
+        assert algorithm == "sha1"
+        return self.runHex(["hmac-sha1", "-k", binascii.hexlify(key), "@0"], [data])
+
+    def pbkdf2(self, algorithm, password, salt, rounds, length):
+        assert algorithm == "sha1"
+        return self.runHex(["pbkdf2-sha1-key-derivation", "-p", password, "-s", binascii.hexlify(salt), "-r", str(rounds), "-z", str(length)], [])
+
+    def base64Encode(self, data, addLineBreaks):
+        return self.run(["base64-encode"] + (["-l"] if addLineBreaks else []) + ["@0"], [data])
+
+    def base64Decode(self, string):
+        return self.run(["base64-decode", "@0"], [string])
+
+    def aes(self, op, mode, key, iv, data, padding=False):
+        arguments = [("aes-pad-%s" if padding else "aes-%s") % op, "-k", binascii.hexlify(key)]
+        if mode == "ecb":
+            arguments.append("-e")
+        else:
+            arguments.extend(["-i", binascii.hexlify(iv)])
+        return self.run(arguments + ["@0"], [data])
+
+    def rsaSign(self, keyName, data):
+        return self.runHex(["rsa-sha1-sign", keyName, "@0"], [data])
+
+    def rsaVerify(self, keyName, signature, data):
+        return self.run(["rsa-sha1-verify", keyName, "@0", "@1"], [signature, data]) == "verified\n"
+
+    def rsaEncrypt(self, keyName, data, padding="pkcs1"):
+        return self.runHex(["rsa-small-encrypt", "-p", padding, keyName, "@0"], [data])
+
+    def rsaDecrypt(self, keyName, data, padding="pkcs1"):
+        return self.runHex(["rsa-small-decrypt", "-p", padding, keyName, "@0"], [data])
+
+gReferenceModule = None
+gReferenceModuleLock = threading.Lock()
+
+def referenceModule():
+    # Returns the reference implementation, loaded as a module.  We don't let it write 
+    # a ".pyc" file because that would end up in the source tree.
+    global gReferenceModule
+    with gReferenceModuleLock:
+        if gReferenceModule is None:
+            dontWriteBytecode = sys.dont_write_bytecode
+            sys.dont_write_bytecode = True
+            try:
+                gReferenceModule = imp.load_source("CryptoCompatibilityReference", pathForReferenceTool())
+            finally:
+                sys.dont_write_bytecode = dontWriteBytecode
+    return gReferenceModule
+
+class ReferenceBackend(object):
+
+    def __init__(self):
+        self.reference = referenceModule()
+
+    def close(self):
+        pass
+
+    def rsaKey(self, keyClass, keyName):
+        try:
+            return self.reference.rsaKeyNamed(keyClass, keyName)
+        except self.reference.ToolError, e:
+            raise BackendError(str(e))
+
+    def digest(self, algorithm, data):
+        return hashlib.new(algorithm, data).digest()
+
+    def hmac(self, algorithm, key, data):
+        return hmac.new(key, data, getattr(hashlib, algorithm)).digest()
+
+    def pbkdf2(self, algorithm, password, salt, rounds, length):
+        return hashlib.pbkdf2_hmac(algorithm, password, salt, rounds, length)
+
+    def base64Encode(self, data, addLineBreaks):
+        return self.reference.base64Encode(data, addLineBreaks)
+
+    def base64Decode(self, string):
+        result = self.reference.base64Decode(string)
+        if result is None:
+            raise BackendError("base64Decode: invalid input")
+        return result
+
+    def aes(self, op, mode, key, iv, data, padding=False):
+        if ((op == "decrypt") or not padding) and ((len(data) % 16) != 0):
+            raise BackendError("aes: input is not a whole number of blocks")
+        try:
+            cryptor = self.reference.AESCryptor(op == "encrypt", key, iv if mode == "cbc" else None, padding)
+            return cryptor.update(data) + cryptor.final()
+        except self.reference.CommonCryptoError, e:
+            raise BackendError("aes: %d" % e.code)
+
+    def rsaSign(self, keyName, data):
+        return self.reference.rsaSHA1Signature(self.rsaKey("private", keyName), data)
+
+    def rsaVerify(self, keyName, signature, data):
+        return self.reference.rsaSHA1Verify(self.rsaKey("public", keyName), signature, data)
+
+    def rsaEncrypt(self, keyName, data, padding="pkcs1"):
+        try:
+            return self.reference.rsaSmallEncrypt(self.rsaKey("public", keyName), data, padding)
+        except self.reference.ToolError, e:
+            raise BackendError(str(e))
+
+    def rsaDecrypt(self, keyName, data, padding="pkcs1"):
+        try:
+            return self.reference.rsaSmallDecrypt(self.rsaKey("private", keyName), data, padding)
+        except self.reference.ToolError, e:
+            raise BackendError(str(e))
+
+def opensslHMACKeyOption(key):
+    # OpenSSL rejects an empty "hexkey", but HMAC pads short keys with zeros, so a single 
+    # zero byte is equivalent.
+    return "hexkey:" + (binascii.hexlify(key) or "00")
+
+class OpenSSLBackend(object):
+
+    def close(self):
+        pass
+
+    def run(self, arguments, data, okRetCodes=(0,)):
+        process = subprocess.Popen(["openssl"] + arguments, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (output, errors) = process.communicate(data)
+        if process.returncode not in okRetCodes:
+            raise BackendError("openssl %s: %s" % (arguments[0], errors.strip()))
+        return output
+
+    def digest(self, algorithm, data):
+        return self.run(["dgst", "-" + algorithm, "-binary"], data)
+
+    def hmac(self, algorithm, key, data):
+        return self.run(["dgst", "-" + algorithm, "-mac", "HMAC", "-macopt", opensslHMACKeyOption(key), "-binary"], data)
+
+    def pbkdf2(self, algorithm, password, salt, rounds, length):
+        # "openssl kdf" is only available in OpenSSL 3.0 and later.
+        output = self.run([
+            "kdf", "-keylen", str(length), 
+            "-kdfopt", "digest:" + algorithm.upper(), 
+            "-kdfopt", "hexpass:" + binascii.hexlify(password), 
+            "-kdfopt", "hexsalt:" + binascii.hexlify(salt), 
+            "-kdfopt", "iter:%d" % rounds, 
+            "PBKDF2"
+        ], "")
+        return binascii.unhexlify(output.strip().replace(":", ""))
+
+    def base64Encode(self, data, addLineBreaks):
+        if addLineBreaks:
+            return self.run(["enc", "-e", "-base64"], data)
+        return self.run(["enc", "-e", "-base64", "-A"], data).rstrip("\n")
+
+    def base64Decode(self, string):
+        return self.run(["enc", "-d", "-base64", "-A"], string.translate(None, " \t\n\v\f\r"))
+
+    def aes(self, op, mode, key, iv, data, padding=False):
+        arguments = ["enc", "-d" if op == "decrypt" else "-e", "-aes-%d-%s" % (len(key) * 8, mode), "-K", binascii.hexlify(key)]
+        if mode == "cbc":
+            arguments.extend(["-iv", binascii.hexlify(iv)])
+        if not padding:
+            arguments.append("-nopad")
+        return self.run(arguments, data)
+
+    def rsaSign(self, keyName, data):
+        return self.run(["dgst", "-sha1", "-sign", pathForResource(kRSAKeyPathsByName[keyName])], data)
+
+    def rsaVerify(self, keyName, signature, data):
+        signatureFile = tempfile.NamedTemporaryFile()
+        try:
+            signatureFile.write(signature)
+            signatureFile.flush()
+            output = self.run(["dgst", "-sha1", "-verify", pathForResource(kRSAKeyPathsByName[keyName]), "-signature", signatureFile.name], data, (0, 1))
+        finally:
+            signatureFile.close()
+        return output == "Verified OK\n"
+
+    def rsaEncrypt(self, keyName, data, padding="pkcs1"):
+        return self.run(["pkeyutl", "-encrypt", "-pubin", "-inkey", pathForResource(kRSAKeyPathsByName[keyName]), "-pkeyopt", "rsa_padding_mode:" + padding], data)
+
+    def rsaDecrypt(self, keyName, data, padding="pkcs1"):
+        return self.run(["pkeyutl", "-decrypt", "-inkey", pathForResource(kRSAKeyPathsByName[keyName]), "-pkeyopt", "rsa_padding_mode:" + padding], data)
+
+def randomBytes(rng, length):
+    return binascii.unhexlify("%0*x" % (length * 2, rng.getrandbits(length * 8))) if length != 0 else ""
+
+def checkBackendsAgree(backend1, backend2, method, *args):
+    # Runs the named operation on both backends and checks that they get the same result.
+    result1 = getattr(backend1, method)(*args)
+    result2 = getattr(backend2, method)(*args)
+    if result1 != result2:
+        if isinstance(result1, str) and isinstance(result2, str):
+            raise AssertionError("%s: %s" % (method, mismatchMessage(compareStreams([result1], [result2]), type(backend1).__name__, type(backend2).__name__)))
+        raise AssertionError("%s: %r != %r" % (method, result1, result2))
+    return result1
+
+def commandOutputChunks(command, inputChunks):
+    # Runs command with inputChunks on its stdin and yields its output as it arrives.  
+    # This lets an external command, typically openssl, supply the expected stream for 
+    # checkPipelineOutputAgainstStream.  If we're abandoned part way through, because 
+    # the caller found a difference, we kill the command.
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    writer = startWriter(process.stdin, inputChunks)
+    reader = PipeReader(process.stdout)
+    try:
+        for chunk in reader.chunks():
+            yield chunk
+    finally:
+        if not reader.atEOF:
+            process.kill()
+        process.stdout.close()
+        process.wait()
+        writer.join()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+# The big Base64 checks add sizes either side of a 48 byte line, and of the 48 KiB 
+# chunk that QCCBase64BigEncode reads at a time, to gBigSizes.  They do this when they 
+# run, so that "--big-sizes" applies.  The edge cases are for the streaming decoder, 
+# whose state has to carry the padding rules across chunks.
+
+kBase64EdgeSizes = [47, 48, 49, 48 * 1024 - 1, 48 * 1024, 48 * 1024 + 1]
+
+kBase64DecodeEdgeCases = [
+    "", 
+    "QQ==", 
+    "QUI=", 
+    "QUJD", 
+    " Q Q = = \n", 
+    "QQ=\n=", 
+    "QQ=", 
+    "Q", 
+    "QUJ", 
+    "QR==", 
+    "QUJ=", 
+    "QQ==QQ==", 
+    "QQ== Q", 
+    "Q===", 
+    "=", 
+    "*", 
+    "QQ\xc3\xa9", 
+    "QUJD" * (16 * 1024) + "\n=", 
+    "QUJD" * (16 * 1024) + "QQ==", 
+    "QUJD" * (16 * 1024 - 1) + "QQ\n==", 
+]
 
 def checkBase64Encode():
     checkCommandOutputAgainOtherCommand([
@@ -129,6 +874,14 @@ def checkBase64Encode():
             pathForResource("plaintext-0.dat")
         ]
     )
+    for size in sorted(set(kBase64EdgeSizes + gBigSizes)):
+        for (toolOptions, opensslOptions) in ((["-l"], []), ([], ["-A"])):
+            checkPipelineOutputAgainstStream([
+                [pathForTool(), "base64-big-encode"] + toolOptions + ["/dev/stdin", "/dev/stdout"]
+            ], commandOutputChunks(
+                ["openssl", "enc", "-e", "-base64"] + opensslOptions, 
+                SyntheticData(size, size).chunks()
+            ), SyntheticData(size, size).chunks(), "openssl-%d" % size)
 
 def checkBase64Decode():
     checkCommandOutputAgainOtherCommand([
@@ -157,6 +910,34 @@ def checkBase64Decode():
             pathForResource("plaintext-0.dat")
         ]
     )
+    for size in sorted(set(kBase64EdgeSizes + gBigSizes)):
+        for opensslOptions in ([], ["-A"]):
+            checkPipelineOutputAgainstStream([
+                ["openssl", "enc", "-e", "-base64"] + opensslOptions, 
+                [pathForTool(), "base64-big-decode", "/dev/stdin", "/dev/stdout"]
+            ], SyntheticData(size, size).chunks(), SyntheticData(size, size).chunks(), "synthetic-%d" % size)
+
+    # The streaming decoder must accept and reject exactly what base64-decode does, 
+    # even though it sees the input a chunk at a time.
+
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "input.txt")
+        for (index, string) in enumerate(kBase64DecodeEdgeCases):
+            with open(path, "wb") as f:
+                f.write(string)
+            results = []
+            for command in (
+                [pathForTool(), "base64-decode", path], 
+                [pathForTool(), "base64-big-decode", path, "/dev/stdout"]
+            ):
+                process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                (output, _) = process.communicate()
+                results.append((process.returncode, output if process.returncode == 0 else None))
+            assert results[0][0] == results[1][0], "kBase64DecodeEdgeCases[%d]: base64-decode exit status %d, base64-big-decode exit status %d" % (index, results[0][0], results[1][0])
+            assert results[0][1] == results[1][1], "kBase64DecodeEdgeCases[%d]: outputs differ" % index
+    finally:
+        shutil.rmtree(directory)
 
 def checkMD5Digest():
     checkCommandOutputAgainOtherCommand([
@@ -169,7 +950,7 @@ def checkMD5Digest():
             "-md5", 
             pathForResource("test.cer")
         ], 
-        lambda s : s[s.index("=")+2:]
+        skipPastFilter("= ")
     )
     checkCommandOutputAgainOtherCommand([
             pathForTool(), 
@@ -181,7 +962,7 @@ def checkMD5Digest():
             "-md5", 
             pathForResource("plaintext-0.dat")
         ], 
-        lambda s : s[s.index("=")+2:]
+        skipPastFilter("= ")
     )
 
 def checkSHA1Digest():
@@ -195,7 +976,7 @@ def checkSHA1Digest():
             "-sha1", 
             pathForResource("test.cer")
         ], 
-        lambda s : s[s.index("=")+2:]
+        skipPastFilter("= ")
     )
     checkCommandOutputAgainOtherCommand([
             pathForTool(), 
@@ -207,7 +988,7 @@ def checkSHA1Digest():
             "-sha1", 
             pathForResource("plaintext-0.dat")
         ], 
-        lambda s : s[s.index("=")+2:]
+        skipPastFilter("= ")
     )
 
 def checkHMACSHA1():
@@ -230,7 +1011,7 @@ def checkHMACSHA1():
             "Hello Cruel World!", 
             pathForResource("test.cer")
         ], 
-        lambda s : s[s.index("=")+2:]
+        skipPastFilter("= ")
     )
     checkCommandOutputAgainOtherCommand([
             pathForTool(), 
@@ -246,12 +1027,155 @@ def checkHMACSHA1():
             "", 
             pathForResource("test.cer")
         ], 
-        lambda s : s[s.index("=")+2:]
+        skipPastFilter("= ")
     )
 
+# The streaming digest check runs the digest and HMAC subcommands in stream mode ("-s") 
+# over synthetic input of each of the sizes in gBigSizes, and compares the results against 
+# "openssl dgst".  The tool reads the input via "/dev/stdin", and each size is generated 
+# once and fed to all the commands at the same time, so you can use "--big-sizes" to 
+# check inputs that are larger than RAM.
+
+kStreamHMACKeyHexStr = "48656c6c6f20437275656c20576f726c6421"
+
+def checkStreamDigests():
+    for size in gBigSizes:
+        checkCommandPairsOnSharedStream([
+            (
+                [pathForTool(), "md5-digest", "-s", "/dev/stdin"], 
+                ["openssl", "dgst", "-md5"], 
+                skipPastFilter("= ")
+            ), (
+                [pathForTool(), "sha1-digest", "-s", "/dev/stdin"], 
+                ["openssl", "dgst", "-sha1"], 
+                skipPastFilter("= ")
+            ), (
+                [pathForTool(), "hmac-sha1", "-s", "-k", kStreamHMACKeyHexStr, "/dev/stdin"], 
+                ["openssl", "dgst", "-sha1", "-mac", "HMAC", "-macopt", opensslHMACKeyOption(binascii.unhexlify(kStreamHMACKeyHexStr))], 
+                skipPastFilter("= ")
+            )
+        ], SyntheticData(size, size).chunks(), "synthetic-%d" % size)
+
+# The multi-file digest check generates a tree of files of assorted sizes (including empty 
+# files and names with spaces) and checks that digesting them all in one go, whether the 
+# paths are given as arguments or in a list file, matches running "openssl dgst" over 
+# them.  The tool digests the files concurrently, but must print the digests in order.
+
+kDigestTreeFileCount = 500
+kDigestTreeDirectoryCount = 16
+kOpenSSLDigestGroupSize = 100
+
+def makeDigestTree(directory, rng, fileCount=kDigestTreeFileCount):
+    # Creates the files, returning their paths in a shuffled order so that the order 
+    # of the output doesn't happen to match the order of the directory.
+    paths = []
+    for index in range(fileCount):
+        dirPath = os.path.join(directory, "dir %d" % (index % kDigestTreeDirectoryCount), str(index % 3))
+        if not os.path.isdir(dirPath):
+            os.makedirs(dirPath)
+        path = os.path.join(dirPath, "file %d.dat" % index)
+        size = rng.choice([0, 1, 63, 64, 65, rng.randint(0, 4096), rng.randint(0, 256 * 1024)])
+        with open(path, "wb") as f:
+            f.write(randomBytes(rng, size))
+        paths.append(path)
+    rng.shuffle(paths)
+    return paths
+
+def opensslDigestFiles(algorithm, paths):
+    # Returns the digests of the files as the tool prints them, one per line, running 
+    # "openssl dgst" over a group of files at a time to stay clear of argument limits.
+    lines = []
+    for start in range(0, len(paths), kOpenSSLDigestGroupSize):
+        output = subprocess.check_output(["openssl", "dgst", "-" + algorithm, "-r"] + paths[start:start + kOpenSSLDigestGroupSize])
+        lines.extend(line.split()[0] + "\n" for line in output.splitlines())
+    return "".join(lines)
+
+def checkMultiFileDigests():
+    directory = tempfile.mkdtemp()
+    try:
+        paths = makeDigestTree(directory, random.Random(0))
+        listPath = os.path.join(directory, "list.txt")
+        with open(listPath, "wb") as f:
+            f.write("".join(path + "\n" for path in paths))
+        for (subcommand, algorithm) in (("md5-digest", "md5"), ("sha1-digest", "sha1")):
+            expected = opensslDigestFiles(algorithm, paths)
+            checkCommandOutputAgainOtherCommand(
+                [pathForTool(), subcommand, "-l", listPath], 
+                lambda: expected
+            )
+            checkCommandOutputAgainOtherCommand(
+                [pathForTool(), subcommand] + paths[:kOpenSSLDigestGroupSize], 
+                lambda: opensslDigestFiles(algorithm, paths[:kOpenSSLDigestGroupSize])
+            )
+
+        # A missing file must fail the command, after printing the digests of the files 
+        # before it.
+        
+        missingPaths = paths[:10] + [os.path.join(directory, "missing.dat")] + paths[10:20]
+        process = subprocess.Popen([pathForTool(), "sha1-digest"] + missingPaths, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (output, _) = process.communicate()
+        assert process.returncode == 1, "missing file: unexpected exit status %d" % process.returncode
+        assert output == opensslDigestFiles("sha1", paths[:10]), "missing file: unexpected output %r" % output
+    finally:
+        shutil.rmtree(directory)
+
+# The PBKDF2 check uses Python's hashlib.pbkdf2_hmac as the oracle, because the OpenSSL 
+# command line tool on OS X can't do PBKDF2 )-:  It covers empty passwords and salts, keys 
+# shorter than, equal to, and longer than a SHA-1 block (the last being where "-P" derives 
+# the blocks in parallel), and password lists ("-l") with repeated passwords, with and 
+# without the cache ("-c").  It always specifies the rounds, because otherwise the tool 
+# calibrates them, and the result depends on the speed of the machine.
+
+kPBKDF2Passwords = ["Hello Cruel World!", "", "pass word", "p\xc3\xa4ssw\xc3\xb6rd", "x" * 100, "Hello Cruel World!", ""]
+kPBKDF2Salts = ["", "0102030405060708", "AB" * 64]
+kPBKDF2Parameters = [(1, 20), (2, 21), (1000, 16), (1000, 64), (4096, 100)]
+
 def checkPBKDF2KeyDerivation():
-    # AFAICT there's no way to get the OpenSSL command line tool to do PBKDF2 )-:
-    pass
+    passwordList = "".join(password + "\n" for password in kPBKDF2Passwords)
+    listFile = tempfile.NamedTemporaryFile()
+    listFile.write(passwordList)
+    listFile.flush()
+    for saltHexStr in kPBKDF2Salts:
+        salt = binascii.unhexlify(saltHexStr)
+        for (rounds, length) in kPBKDF2Parameters:
+            expectedKeys = [binascii.hexlify(hashlib.pbkdf2_hmac("sha1", password, salt, rounds, length)) + "\n" for password in kPBKDF2Passwords]
+            command = [pathForTool(), "pbkdf2-sha1-key-derivation", "-s", saltHexStr, "-r", str(rounds), "-z", str(length)]
+            if length > 20:
+                checkCommandOutputFixed(command + ["-p", kPBKDF2Passwords[3], "-P"], expectedKeys[3])
+            for options in ([], ["-P"], ["-c", "2"]):
+                checkCommandOutputFixed(command + ["-l", listFile.name] + options, "".join(expectedKeys))
+
+    # A list with CRLF line endings gives the same keys as one with LF line endings, and 
+    # a list longer than a window (16 passwords at "-j 1") comes out in order.
+    
+    crlfListFile = tempfile.NamedTemporaryFile()
+    crlfListFile.write(passwordList.replace("\n", "\r\n"))
+    crlfListFile.flush()
+    expectedKeys = [binascii.hexlify(hashlib.pbkdf2_hmac("sha1", password, "", 1, 20)) + "\n" for password in kPBKDF2Passwords]
+    checkCommandOutputFixed([pathForTool(), "pbkdf2-sha1-key-derivation", "-s", "", "-r", "1", "-z", "20", "-l", crlfListFile.name], "".join(expectedKeys))
+    longListFile = tempfile.NamedTemporaryFile()
+    longListFile.write(passwordList * 5)
+    longListFile.flush()
+    checkCommandOutputFixed([pathForTool(), "-j", "1", "pbkdf2-sha1-key-derivation", "-s", "", "-r", "1", "-z", "20", "-l", longListFile.name], "".join(expectedKeys * 5))
+
+    # In batch mode the cache lives from one request to the next, so the repeats should 
+    # come from the cache, and must give the same result.
+
+    client = BatchClient()
+    try:
+        arguments = ["pbkdf2-sha1-key-derivation", "-l", "@0", "-s", "0102030405060708", "-r", "1000", "-z", "64", "-c", "8"]
+        expected = "".join(binascii.hexlify(hashlib.pbkdf2_hmac("sha1", password, "\x01\x02\x03\x04\x05\x06\x07\x08", 1000, 64)) + "\n" for password in kPBKDF2Passwords)
+        for (status, output) in client.runRequests([(arguments, [passwordList])] * 3):
+            assert (status, output) == (kBatchStatusSuccess, expected), "batch: unexpected response %r" % ((status, output),)
+    finally:
+        client.close()
+
+def checkPBKDF2Calibration():
+    # The calibrated round count depends on the speed of the machine, so all we can check 
+    # here is that it's sane.  See "--calibrate" for a proper look at its stability.
+    for options in ([], ["-p", "0", "-s", "0", "-z", "64", "-t", "10"], ["-p", "100", "-s", "200", "-z", "20", "-t", "50"]):
+        output = subprocess.check_output([pathForTool(), "pbkdf2-sha1-calibrate"] + options)
+        assert output.strip().isdigit() and (int(output) > 0), "unexpected output %r" % output
 
 def checkAES128ECBEncryption():
     checkCommandOutputAgainOtherCommand([
@@ -561,50 +1485,128 @@ def checkAES128PadCBCDecryption():
         ]
     )
 
+# The big cryptor checks verify a round trip through OpenSSL for each of the sizes in 
+# gBigSizes.  The input is synthetic, and is streamed into the pipeline rather than 
+# read from a file.  The tool reads and writes the pipeline via "/dev/stdin" and 
+# "/dev/stdout", and the final output is compared against a regenerated copy of the 
+# input as it arrives, so nothing is written to disk.
+
 def checkAES128PadBigCBCEncryption():
-    ourEncryptedOutput = tempfile.NamedTemporaryFile()
-    theirDecryptedOutput = tempfile.NamedTemporaryFile()
+    for size in gBigSizes:
+        checkPipelineOutputAgainstStream([
+            [
+                pathForTool(), 
+                "aes-pad-big-encrypt", 
+                "-k", 
+                "0C1032520302EC8537A4A82C4EF7579D", 
+                "-i", 
+                "AB5BBEB426015DA7EEDCEE8BEE3DFFB7", 
+                "/dev/stdin", 
+                "/dev/stdout"
+            ], [
+                "openssl", 
+                "enc", 
+                "-d", 
+                "-aes-128-cbc", 
+                "-K", 
+                "0C1032520302EC8537A4A82C4EF7579D", 
+                "-iv", 
+                "AB5BBEB426015DA7EEDCEE8BEE3DFFB7"
+            ]
+        ], SyntheticData(size, size).chunks(), SyntheticData(size, size).chunks(), "synthetic-%d" % size)
 
-    subprocess.check_call([
-        pathForTool(), 
-        "aes-pad-big-encrypt", 
-        "-k", 
-        "0C1032520302EC8537A4A82C4EF7579D", 
-        "-i", 
-        "AB5BBEB426015DA7EEDCEE8BEE3DFFB7", 
-        "/mach_kernel", 
-        ourEncryptedOutput.name
-    ])
+def checkAES128PadBigCBCDecryption():
+    for size in gBigSizes:
+        checkPipelineOutputAgainstStream([
+            [
+                "openssl", 
+                "enc", 
+                "-e", 
+                "-aes-128-cbc", 
+                "-K", 
+                "0C1032520302EC8537A4A82C4EF7579D", 
+                "-iv", 
+                "AB5BBEB426015DA7EEDCEE8BEE3DFFB7"
+            ], [
+                pathForTool(), 
+                "aes-pad-big-decrypt", 
+                "-k", 
+                "0C1032520302EC8537A4A82C4EF7579D", 
+                "-i", 
+                "AB5BBEB426015DA7EEDCEE8BEE3DFFB7", 
+                "/dev/stdin", 
+                "/dev/stdout"
+            ]
+        ], SyntheticData(size, size).chunks(), SyntheticData(size, size).chunks(), "synthetic-%d" % size)
 
-    subprocess.check_call([
-        "openssl", 
-        "enc", 
-        "-d", 
-        "-aes-128-cbc", 
-        "-K", 
-        "0C1032520302EC8537A4A82C4EF7579D", 
-        "-iv", 
-        "AB5BBEB426015DA7EEDCEE8BEE3DFFB7", 
-        "-in", 
-        ourEncryptedOutput.name, 
-        "-out", 
-        theirDecryptedOutput.name
-    ])
+# The parallel big decryption check also covers sizes either side of the tool's 1 MiB 
+# segment boundary, where the segmentation is most likely to go wrong, and ECB, where 
+# segments don't chain.
 
-    subprocess.check_call([
-        "cmp", 
-        "/mach_kernel", 
-        theirDecryptedOutput.name
-    ])
-    
-    ourEncryptedOutput.close();
-    theirDecryptedOutput.close();
+kParallelSegmentSize = 1024 * 1024
 
-def checkAES128PadBigCBCDecryption():
-    theirEncryptedOutput = tempfile.NamedTemporaryFile()
-    ourDecryptedOutput = tempfile.NamedTemporaryFile()
+def checkAES128PadBigParallelDecryption():
+    for size in sorted(set([0, kParallelSegmentSize - 1, kParallelSegmentSize, 2 * kParallelSegmentSize + 15] + gBigSizes)):
+        checkPipelineOutputAgainstStream([
+            [
+                "openssl", 
+                "enc", 
+                "-e", 
+                "-aes-128-cbc", 
+                "-K", 
+                "0C1032520302EC8537A4A82C4EF7579D", 
+                "-iv", 
+                "AB5BBEB426015DA7EEDCEE8BEE3DFFB7"
+            ], [
+                pathForTool(), 
+                "aes-pad-big-decrypt", 
+                "-p", 
+                "-k", 
+                "0C1032520302EC8537A4A82C4EF7579D", 
+                "-i", 
+                "AB5BBEB426015DA7EEDCEE8BEE3DFFB7", 
+                "/dev/stdin", 
+                "/dev/stdout"
+            ]
+        ], SyntheticData(size, size).chunks(), SyntheticData(size, size).chunks(), "synthetic-%d" % size)
+    size = 2 * kParallelSegmentSize + 15
+    checkPipelineOutputAgainstStream([
+        [
+            "openssl", 
+            "enc", 
+            "-e", 
+            "-aes-128-ecb", 
+            "-K", 
+            "0C1032520302EC8537A4A82C4EF7579D"
+        ], [
+            pathForTool(), 
+            "aes-pad-big-decrypt", 
+            "-p", 
+            "-k", 
+            "0C1032520302EC8537A4A82C4EF7579D", 
+            "-e", 
+            "/dev/stdin", 
+            "/dev/stdout"
+        ]
+    ], SyntheticData(size, size).chunks(), SyntheticData(size, size).chunks(), "synthetic-%d" % size)
+
+# The encrypt-then-MAC check runs the big cryptor with an HMAC key ("-h"), which makes 
+# the tool print an HMAC-SHA1 of the cyphertext once it has written its output.  With 
+# "/dev/stdout" as the output file, that's the output followed by a line of hex.  We 
+# recompute the cyphertext with "openssl enc" and its HMAC with "openssl dgst -hmac", 
+# streaming the former into the latter, so that nothing is held in memory or written to 
+# disk.  See checkHMACSHA1 for why the OpenSSL key is a string.
+
+kEncryptThenMACKeyHexStr = "48656c6c6f20437275656c20576f726c6421"
+kEncryptThenMACKeyString = "Hello Cruel World!"
 
-    subprocess.check_call([
+def opensslEncryptThenMACChunks(inputChunks, includeCyphertext):
+    # Encrypts inputChunks with "openssl enc" and HMACs the result with "openssl dgst -hmac", 
+    # yielding the cyphertext, if includeCyphertext is set, and then the HMAC as a line of hex.
+    #
+    # We close the other descriptors in each child so that neither holds on to a pipe, 
+    # and thus stops the other, or the tool being checked, from seeing EOF.
+    encryptor = subprocess.Popen([
         "openssl", 
         "enc", 
         "-e", 
@@ -612,32 +1614,217 @@ def checkAES128PadBigCBCDecryption():
         "-K", 
         "0C1032520302EC8537A4A82C4EF7579D", 
         "-iv", 
-        "AB5BBEB426015DA7EEDCEE8BEE3DFFB7", 
-        "-in", 
-        "/mach_kernel", 
-        "-out", 
-        theirEncryptedOutput.name
-    ])
+        "AB5BBEB426015DA7EEDCEE8BEE3DFFB7"
+    ], stdin=subprocess.PIPE, stdout=subprocess.PIPE, close_fds=True)
+    authenticator = subprocess.Popen([
+        "openssl", 
+        "dgst", 
+        "-sha1", 
+        "-hmac", 
+        kEncryptThenMACKeyString
+    ], stdin=subprocess.PIPE, stdout=subprocess.PIPE, close_fds=True)
+    writer = startWriter(encryptor.stdin, inputChunks)
+    reader = PipeReader(encryptor.stdout)
+    output = None
+    try:
+        for chunk in reader.chunks():
+            authenticator.stdin.write(chunk)
+            if includeCyphertext:
+                yield chunk
+        authenticator.stdin.close()
+        output = authenticator.stdout.read()
+    finally:
+        for process in (encryptor, authenticator):
+            if output is None:
+                process.kill()
+            process.stdout.close()
+            process.wait()
+        writer.join()
+    if encryptor.returncode != 0:
+        raise subprocess.CalledProcessError(encryptor.returncode, "openssl enc")
+    if authenticator.returncode != 0:
+        raise subprocess.CalledProcessError(authenticator.returncode, "openssl dgst")
+    for chunk in skipPastFilter("= ")([output]):
+        yield chunk
 
-    subprocess.check_call([
-        pathForTool(), 
-        "aes-pad-big-decrypt", 
-        "-k", 
-        "0C1032520302EC8537A4A82C4EF7579D", 
-        "-i", 
-        "AB5BBEB426015DA7EEDCEE8BEE3DFFB7", 
-        theirEncryptedOutput.name, 
-        ourDecryptedOutput.name
-    ])
+def checkAES128PadBigEncryptThenMAC():
+    for size in gBigSizes:
+        checkPipelineOutputAgainstStream([
+            [
+                pathForTool(), 
+                "aes-pad-big-encrypt", 
+                "-h", 
+                kEncryptThenMACKeyHexStr, 
+                "-k", 
+                "0C1032520302EC8537A4A82C4EF7579D", 
+                "-i", 
+                "AB5BBEB426015DA7EEDCEE8BEE3DFFB7", 
+                "/dev/stdin", 
+                "/dev/stdout"
+            ]
+        ], opensslEncryptThenMACChunks(SyntheticData(size, size).chunks(), True), SyntheticData(size, size).chunks(), "synthetic-%d" % size)
 
-    subprocess.check_call([
-        "cmp", 
-        "/mach_kernel", 
-        ourDecryptedOutput.name
-    ])
+        # On decrypt the tool HMACs its input, so it prints the same HMAC after the 
+        # plaintext, in both the serial and parallel cases.
+
+        for options in ([], ["-p"]):
+            checkPipelineOutputAgainstStream([
+                [
+                    "openssl", 
+                    "enc", 
+                    "-e", 
+                    "-aes-128-cbc", 
+                    "-K", 
+                    "0C1032520302EC8537A4A82C4EF7579D", 
+                    "-iv", 
+                    "AB5BBEB426015DA7EEDCEE8BEE3DFFB7"
+                ], [
+                    pathForTool(), 
+                    "aes-pad-big-decrypt"
+                ] + options + [
+                    "-h", 
+                    kEncryptThenMACKeyHexStr, 
+                    "-k", 
+                    "0C1032520302EC8537A4A82C4EF7579D", 
+                    "-i", 
+                    "AB5BBEB426015DA7EEDCEE8BEE3DFFB7", 
+                    "/dev/stdin", 
+                    "/dev/stdout"
+                ]
+            ], itertools.chain(
+                SyntheticData(size, size).chunks(), 
+                opensslEncryptThenMACChunks(SyntheticData(size, size).chunks(), False)
+            ), SyntheticData(size, size).chunks(), "synthetic-%d" % size)
+
+def checkAES128CTRBigEncryption():
+    for size in gBigSizes:
+        checkPipelineOutputAgainstStream([
+            [
+                pathForTool(), 
+                "aes-ctr-big-encrypt", 
+                "-k", 
+                "0C1032520302EC8537A4A82C4EF7579D", 
+                "-i", 
+                "AB5BBEB426015DA7EEDCEE8BEE3DFFB7", 
+                "/dev/stdin", 
+                "/dev/stdout"
+            ], [
+                "openssl", 
+                "enc", 
+                "-d", 
+                "-aes-128-ctr", 
+                "-K", 
+                "0C1032520302EC8537A4A82C4EF7579D", 
+                "-iv", 
+                "AB5BBEB426015DA7EEDCEE8BEE3DFFB7"
+            ]
+        ], SyntheticData(size, size).chunks(), SyntheticData(size, size).chunks(), "synthetic-%d" % size)
 
-    theirEncryptedOutput.close();
-    ourDecryptedOutput.close();
+def checkAES128CTRBigDecryption():
+    for size in gBigSizes:
+        checkPipelineOutputAgainstStream([
+            [
+                "openssl", 
+                "enc", 
+                "-e", 
+                "-aes-128-ctr", 
+                "-K", 
+                "0C1032520302EC8537A4A82C4EF7579D", 
+                "-iv", 
+                "AB5BBEB426015DA7EEDCEE8BEE3DFFB7"
+            ], [
+                pathForTool(), 
+                "aes-ctr-big-decrypt", 
+                "-k", 
+                "0C1032520302EC8537A4A82C4EF7579D", 
+                "-i", 
+                "AB5BBEB426015DA7EEDCEE8BEE3DFFB7", 
+                "/dev/stdin", 
+                "/dev/stdout"
+            ]
+        ], SyntheticData(size, size).chunks(), SyntheticData(size, size).chunks(), "synthetic-%d" % size)
+
+# The AES-256 CTR check uses a chunk size that isn't a multiple of the block size, so 
+# that the key stream has to carry over from one chunk to the next.
+
+def checkAES256CTRBigEncryption():
+    for size in gBigSizes:
+        checkPipelineOutputAgainstStream([
+            [
+                pathForTool(), 
+                "aes-ctr-big-encrypt", 
+                "-c", 
+                "4099", 
+                "-k", 
+                "0C1032520302EC8537A4A82C4EF7579D2b88e4309655eb40707decdb143e328a", 
+                "-i", 
+                "AB5BBEB426015DA7EEDCEE8BEE3DFFB7", 
+                "/dev/stdin", 
+                "/dev/stdout"
+            ], [
+                "openssl", 
+                "enc", 
+                "-d", 
+                "-aes-256-ctr", 
+                "-K", 
+                "0C1032520302EC8537A4A82C4EF7579D2b88e4309655eb40707decdb143e328a", 
+                "-iv", 
+                "AB5BBEB426015DA7EEDCEE8BEE3DFFB7"
+            ]
+        ], SyntheticData(size, size).chunks(), SyntheticData(size, size).chunks(), "synthetic-%d" % size)
+
+# The parallel CTR check covers the same sizes as the parallel big decryption check.  Its 
+# initial counter is 16 blocks short of overflowing the low 64 bits, so the per-segment 
+# counters have to carry correctly.
+
+kCTRWrappingIVHexStr = "AB5BBEB426015DA7FFFFFFFFFFFFFFF0"
+
+def checkAES128CTRBigParallelCryption():
+    for size in sorted(set([0, kParallelSegmentSize - 1, kParallelSegmentSize, 2 * kParallelSegmentSize + 15] + gBigSizes)):
+        checkPipelineOutputAgainstStream([
+            [
+                pathForTool(), 
+                "aes-ctr-big-encrypt", 
+                "-p", 
+                "-k", 
+                "0C1032520302EC8537A4A82C4EF7579D", 
+                "-i", 
+                kCTRWrappingIVHexStr, 
+                "/dev/stdin", 
+                "/dev/stdout"
+            ], [
+                "openssl", 
+                "enc", 
+                "-d", 
+                "-aes-128-ctr", 
+                "-K", 
+                "0C1032520302EC8537A4A82C4EF7579D", 
+                "-iv", 
+                kCTRWrappingIVHexStr
+            ]
+        ], SyntheticData(size, size).chunks(), SyntheticData(size, size).chunks(), "synthetic-%d" % size)
+        checkPipelineOutputAgainstStream([
+            [
+                "openssl", 
+                "enc", 
+                "-e", 
+                "-aes-128-ctr", 
+                "-K", 
+                "0C1032520302EC8537A4A82C4EF7579D", 
+                "-iv", 
+                kCTRWrappingIVHexStr
+            ], [
+                pathForTool(), 
+                "aes-ctr-big-decrypt", 
+                "-p", 
+                "-k", 
+                "0C1032520302EC8537A4A82C4EF7579D", 
+                "-i", 
+                kCTRWrappingIVHexStr, 
+                "/dev/stdin", 
+                "/dev/stdout"
+            ]
+        ], SyntheticData(size, size).chunks(), SyntheticData(size, size).chunks(), "synthetic-%d" % size)
 
 def checkAES256PadCBCEncryption():
     checkCommandOutputAgainOtherCommand([
@@ -692,7 +1879,7 @@ def checkRSAVerifySHA1Digest():
     def normaliseVerificationOutput(s):
         if s == "Verified OK\n":
             result = "verified\n"
-        elif s == "Verification Failure\n":
+        elif s in ("Verification Failure\n", "Verification failure\n"):     # OpenSSL 3 uses lower case
             result = "not verified\n"
         else:
             assert False
@@ -714,7 +1901,7 @@ def checkRSAVerifySHA1Digest():
             pathForResource("test.cer.sig"), 
             pathForResource("test.cer")
         ], 
-        normaliseVerificationOutput, 
+        wholeOutputFilter(normaliseVerificationOutput), 
         ignoreRetCode2=True
     )
     checkCommandOutputAgainOtherCommand([
@@ -733,7 +1920,7 @@ def checkRSAVerifySHA1Digest():
             pathForResource("test.cer.sig"), 
             pathForResource("test-corrupted.cer")
         ], 
-        normaliseVerificationOutput, 
+        wholeOutputFilter(normaliseVerificationOutput), 
         ignoreRetCode2=True
     )
     checkCommandOutputAgainOtherCommand([
@@ -752,7 +1939,7 @@ def checkRSAVerifySHA1Digest():
             pathForResource("plaintext-0.dat.sig"),
             pathForResource("plaintext-0.dat")
         ], 
-        normaliseVerificationOutput, 
+        wholeOutputFilter(normaliseVerificationOutput), 
         ignoreRetCode2=True
     )
 
@@ -770,7 +1957,7 @@ def checkRSASignSHA1Digest():
             pathForResource("private.pem"), 
             pathForResource("test.cer"), 
         ], 
-        lambda s : s.encode("hex") + "\n"
+        hexFilter
     )
     checkCommandOutputAgainOtherCommand([
             pathForTool(), 
@@ -785,7 +1972,7 @@ def checkRSASignSHA1Digest():
             pathForResource("private.pem"), 
             pathForResource("plaintext-0.dat"), 
         ], 
-        lambda s : s.encode("hex") + "\n"
+        hexFilter
     )
 
 def checkRSASmallEncrypt():
@@ -808,7 +1995,7 @@ def checkRSASmallEncrypt():
             "-in",
             pathForResource("plaintext-256.dat")
         ], 
-        lambda s : s.encode("hex") + "\n"
+        hexFilter
     )
     # In the PKCS#1 padding case we have OpenSSL decrypt our results.
     cypherText = subprocess.check_output([
@@ -820,7 +2007,7 @@ def checkRSASmallEncrypt():
     assert cypherText[-1] == "\n"
     cypherText = cypherText[:-1]
     cypherTextFile = tempfile.NamedTemporaryFile()
-    cypherTextFile.write(cypherText.decode("hex"))
+    cypherTextFile.write(binascii.unhexlify(cypherText))
     cypherTextFile.flush()
     decryptedCypherText = subprocess.check_output([
             "openssl", 
@@ -854,7 +2041,7 @@ def checkRSASmallDecrypt():
             "-in",
             pathForResource("cyphertext-rsa-nopad-256.dat")
         ], 
-        lambda s : s.encode("hex") + "\n"
+        hexFilter
     )
     # In the PKCS#1 padding case we decrypt OpenSSL's results.
     cypherText = subprocess.check_output([
@@ -878,42 +2065,1417 @@ def checkRSASmallDecrypt():
             cypherTextFile.name
     ])
     cypherTextFile.close()
-    assert decryptedCypherText == (open(pathForResource("plaintext-32.dat")).read().encode("hex") + "\n")
+    assert decryptedCypherText == (binascii.hexlify(open(pathForResource("plaintext-32.dat")).read()) + "\n")
+
+# The RSA list checks sign a corpus of files with "rsa-sha1-sign -l", check every signature 
+# with "openssl dgst -verify", then have "rsa-sha1-verify -l" check the signatures, some 
+# of which have been corrupted, against what OpenSSL says about them.  OpenSSL can only 
+# verify one signature per run, so we run it from a shell script, a group of pairs at a 
+# time, rather than starting each run from Python.
+
+kRSACorpusFileCount = 200
+kRSACorruptInterval = 7
+
+def opensslVerifyPairs(pairs):
+    # Returns the results of verifying each (signatureFile, dataFile) pair as the tool 
+    # prints them, one per line.
+    lines = []
+    for start in range(0, len(pairs), kOpenSSLDigestGroupSize):
+        script = "".join(
+            "if openssl dgst -sha1 -verify %s -signature %s %s > /dev/null 2>&1; then echo verified; else echo 'not verified'; fi\n" % (
+                pipes.quote(pathForResource("public.pem")), 
+                pipes.quote(signaturePath), 
+                pipes.quote(dataPath)
+            )
+            for (signaturePath, dataPath) in pairs[start:start + kOpenSSLDigestGroupSize]
+        )
+        lines.append(subprocess.check_output(["sh", "-c", script]))
+    return "".join(lines)
+
+def checkRSAListSignVerify():
+    directory = tempfile.mkdtemp()
+    try:
+        paths = makeDigestTree(directory, random.Random(0), kRSACorpusFileCount)
+        listPath = os.path.join(directory, "list.txt")
+        with open(listPath, "wb") as f:
+            f.write("".join(path + "\n" for path in paths))
+        
+        # Sign everything and check the signatures with OpenSSL.
+        
+        output = subprocess.check_output([pathForTool(), "rsa-sha1-sign", "-l", listPath, "Imported Private Key"])
+        signatures = [binascii.unhexlify(line) for line in output.splitlines()]
+        assert len(signatures) == len(paths), "sign: expected %d signatures, got %d" % (len(paths), len(signatures))
+        pairs = []
+        for (index, (path, signature)) in enumerate(zip(paths, signatures)):
+            if index % kRSACorruptInterval == 0:
+                signature = signature[:-1] + chr(ord(signature[-1]) ^ 1)
+            signaturePath = path + ".sig"
+            with open(signaturePath, "wb") as f:
+                f.write(signature)
+            pairs.append((signaturePath, path))
+        expected = opensslVerifyPairs(pairs)
+        assert expected.count("not verified\n") == len(range(0, len(paths), kRSACorruptInterval)), "sign: OpenSSL rejected a signature"
+        
+        # PKCS#1 v1.5 signatures are deterministic, so signing files on the command line 
+        # must give exactly what OpenSSL gives.
+        
+        checkCommandOutputAgainOtherCommand(
+            [pathForTool(), "rsa-sha1-sign", "Imported Private Key"] + paths[:3], 
+            lambda: "".join(binascii.hexlify(subprocess.check_output(["openssl", "dgst", "-sha1", "-sign", pathForResource("private.pem"), path])) + "\n" for path in paths[:3])
+        )
+        
+        # Verify everything, including the corrupted signatures.
+        
+        pairsPath = os.path.join(directory, "pairs.txt")
+        with open(pairsPath, "wb") as f:
+            f.write("".join("%s\t%s\n" % pair for pair in pairs))
+        checkCommandOutputAgainOtherCommand(
+            [pathForTool(), "rsa-sha1-verify", "-l", pairsPath, "Imported Public Key"], 
+            lambda: expected
+        )
+        
+        # A missing file must fail the command, after printing the results for the pairs 
+        # before it.
+        
+        with open(pairsPath, "wb") as f:
+            f.write("".join("%s\t%s\n" % pair for pair in pairs[:10] + [(pairs[10][0], os.path.join(directory, "missing.dat"))] + pairs[11:20]))
+        process = subprocess.Popen([pathForTool(), "rsa-sha1-verify", "-l", pairsPath, "Imported Public Key"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (output, _) = process.communicate()
+        assert process.returncode == 1, "missing file: unexpected exit status %d" % process.returncode
+        assert output == opensslVerifyPairs(pairs[:10]), "missing file: unexpected output %r" % output
+    finally:
+        shutil.rmtree(directory)
+
+kBatchParallelRequestCount = 64
+kBatchParallelJobs = 4
+
+def checkBatchMode():
+    # Runs a mix of commands through one batch process and checks that each response 
+    # matches what the same command writes when run on its own, and that errors and 
+    # usage problems are reported per request without ending the batch.
+    commands = [
+        [pathForTool(), "base64-encode", "-l", pathForResource("test.cer")], 
+        [pathForTool(), "base64-decode", pathForResource("test.pem")], 
+        [pathForTool(), "md5-digest", pathForResource("test.cer")], 
+        [pathForTool(), "sha1-digest", pathForResource("plaintext-0.dat")], 
+        [pathForTool(), "hmac-sha1", "-k", "48656c6c6f20437275656c20576f726c6421", pathForResource("test.cer")], 
+        [pathForTool(), "aes-encrypt", "-e", "-k", kAES128KeyHexStr, pathForResource("plaintext-336.dat")], 
+        [pathForTool(), "aes-pad-encrypt", "-k", kAES256KeyHexStr, "-i", kAESIVHexStr, pathForResource("plaintext-332.dat")], 
+        [pathForTool(), "rsa-sha1-verify", "Imported Public Key", pathForResource("test.cer.sig"), pathForResource("test.cer")], 
+    ]
+    requests = [batchRequestFromCommand(command) for command in commands]
+    requests.append((["md5-digest", pathForResource("does-not-exist.dat")], []))
+    requests.append((["md5-digest"], []))
+    requests.append((["no-such-subcommand"], []))
+    requests.append((["batch"], []))
+    requests.append((["sha1-digest", "@0"], ["Hello Cruel World!"]))
+
+    client = BatchClient()
+    try:
+        responses = list(client.runRequests(requests))
+    finally:
+        client.close()
+
+    assert len(responses) == len(requests)
+    for (command, (status, output)) in zip(commands, responses):
+        assert status == kBatchStatusSuccess, (command, output)
+        mismatch = compareStreams([output], [subprocess.check_output(command)])
+        if mismatch is not None:
+            raise AssertionError("%s: %s" % (command[1], mismatchMessage(mismatch, "batchOutput", "commandOutput")))
+    extraResponses = responses[len(commands):]
+    assert extraResponses[0][0] == kBatchStatusError
+    assert extraResponses[1][0] == kBatchStatusUsage
+    assert extraResponses[2][0] == kBatchStatusUsage
+    assert extraResponses[3][0] == kBatchStatusUsage
+    assert extraResponses[4] == (kBatchStatusSuccess, "dffc7074156e05694e07ece86bf239b36efe88e7\n")
+
+    # In parallel mode the requests run concurrently, but the responses must be the same, 
+    # and in the same order.  We repeat the requests so that there are more of them than 
+    # can run at once, and use a small payload so that some finish well before others.
+
+    parallelRequests = []
+    for index in range(kBatchParallelRequestCount):
+        parallelRequests.append(requests[index % len(requests)])
+        parallelRequests.append((["sha1-digest", "@0"], [str(index)]))
+    client = BatchClient()
+    try:
+        expectedResponses = list(client.runRequests(parallelRequests))
+    finally:
+        client.close()
+    for jobs in (1, kBatchParallelJobs):
+        client = BatchClient(globalOptions=["-j", str(jobs)], batchOptions=["-p"])
+        try:
+            parallelResponses = list(client.runRequests(parallelRequests))
+        finally:
+            client.close()
+        assert len(parallelResponses) == len(expectedResponses)
+        for (index, (parallelResponse, expectedResponse)) in enumerate(zip(parallelResponses, expectedResponses)):
+            assert parallelResponse == expectedResponse, "-j %d batch -p: request %d (%s): expected %r, got %r" % (jobs, index, parallelRequests[index][0][0], expectedResponse, parallelResponse)
+
+def checkMappedInput():
+    # Checks that mapping the input files ("-m") makes no difference to the output, 
+    # including for an empty file.
+    commands = [
+        [pathForTool(), "sha1-digest", pathForResource("plaintext-0.dat")], 
+        [pathForTool(), "md5-digest", pathForResource("test.cer")], 
+        [pathForTool(), "base64-encode", "-l", pathForResource("test.cer")], 
+        [pathForTool(), "base64-decode", pathForResource("test.pem")], 
+        [pathForTool(), "aes-decrypt", "-k", kAES128KeyHexStr, "-i", kAESIVHexStr, pathForResource("cyphertext-aes-128-cbc-336.dat")], 
+        [pathForTool(), "aes-pad-encrypt", "-k", kAES256KeyHexStr, "-i", kAESIVHexStr, pathForResource("plaintext-332.dat")], 
+        [pathForTool(), "rsa-sha1-verify", "Imported Public Key", pathForResource("test.cer.sig"), pathForResource("test.cer")], 
+    ]
+    for command in commands:
+        checkCommandOutputAgainOtherCommand(command[:1] + ["-m"] + command[1:], command)
+
+def checkBinaryOutput():
+    # Checks that "-b" writes the raw bytes of each result that the tool would otherwise 
+    # print as a line of hex, comparing against OpenSSL's "-binary" output (or the raw 
+    # output of commands that are binary anyway).  A list of files gives the results 
+    # back to back.
+    hmacKey = binascii.unhexlify(kStreamHMACKeyHexStr)
+    pairs = [
+        (["sha1-digest", pathForResource("test.cer")], ["openssl", "dgst", "-sha1", "-binary", pathForResource("test.cer")]), 
+        (["md5-digest", pathForResource("plaintext-0.dat")], ["openssl", "dgst", "-md5", "-binary", pathForResource("plaintext-0.dat")]), 
+        (["sha1-digest", pathForResource("test.cer"), pathForResource("plaintext-0.dat")], ["sh", "-c", "openssl dgst -sha1 -binary %s; openssl dgst -sha1 -binary %s" % (pipes.quote(pathForResource("test.cer")), pipes.quote(pathForResource("plaintext-0.dat")))]), 
+        (["hmac-sha1", "-k", kStreamHMACKeyHexStr, pathForResource("test.cer")], ["openssl", "dgst", "-sha1", "-binary", "-mac", "HMAC", "-macopt", opensslHMACKeyOption(hmacKey), pathForResource("test.cer")]), 
+        (["rsa-sha1-sign", "Imported Private Key", pathForResource("test.cer")], ["openssl", "dgst", "-sha1", "-sign", pathForResource("private.pem"), pathForResource("test.cer")]), 
+        (["rsa-small-encrypt", "-p", "none", "Imported Public Key", pathForResource("plaintext-256.dat")], ["openssl", "pkeyutl", "-encrypt", "-pubin", "-inkey", pathForResource("public.pem"), "-pkeyopt", "rsa_padding_mode:none", "-in", pathForResource("plaintext-256.dat")]), 
+    ]
+    for (arguments, opensslCommand) in pairs:
+        checkCommandOutputAgainOtherCommand([pathForTool(), "-b"] + arguments, opensslCommand)
+    
+    # A long derived key is the sort of large result "-b" is for.
+    
+    checkCommandOutputAgainOtherCommand(
+        [pathForTool(), "-b", "pbkdf2-sha1-key-derivation", "-p", "Hello Cruel World!", "-s", "0102030405060708", "-r", "2", "-z", "100000"], 
+        lambda: hashlib.pbkdf2_hmac("sha1", "Hello Cruel World!", binascii.unhexlify("0102030405060708"), 2, 100000)
+    )
+    
+    # Text results, like those from rsa-sha1-verify, are unaffected.
+    
+    command = ["rsa-sha1-verify", "Imported Public Key", pathForResource("test.cer.sig"), pathForResource("test.cer")]
+    checkCommandOutputAgainOtherCommand([pathForTool(), "-b"] + command, [pathForTool()] + command)
+
+def checkHexArguments():
+    # Hex arguments may use either case, but anything that isn't a pair of hex digits 
+    # per byte is a usage error.  In the past the tool parsed each pair with sscanf's 
+    # "%x", which quietly accepted things like " a" and "-1".
+    checkCommandOutputAgainOtherCommand(
+        [pathForTool(), "hmac-sha1", "-k", kStreamHMACKeyHexStr.upper(), pathForResource("test.cer")], 
+        [pathForTool(), "hmac-sha1", "-k", kStreamHMACKeyHexStr.lower(), pathForResource("test.cer")]
+    )
+    for badHexStr in ["0", "0g", "g0", " a", "-1", "+1", "0x", "\xc3\xa9\xc3\xa9"]:
+        process = subprocess.Popen([pathForTool(), "hmac-sha1", "-k", "00" + badHexStr, pathForResource("test.cer")], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (output, errors) = process.communicate()
+        assert (process.returncode == 1) and (output == "") and errors.startswith("usage:"), "%r: not rejected" % badHexStr
+
+kBackendCheckCaseCount = 32
+
+def checkToolAgainstReferenceBackend():
+    # Runs a set of random cases through the tool, via ToolBackend, and compares the 
+    # results against the in-process reference backend.  RSA PKCS#1 encryption is 
+    # randomised, so we check that by round trip instead.
+    rng = random.Random(0)
+    tool = ToolBackend()
+    reference = ReferenceBackend()
+    try:
+        for _ in range(kBackendCheckCaseCount):
+            data = randomBytes(rng, rng.randint(0, 1024))
+            blocks = data[:len(data) - (len(data) % 16)]
+            key = randomBytes(rng, rng.choice([16, 24, 32]))
+            iv = randomBytes(rng, 16)
+
+            checkBackendsAgree(tool, reference, "digest", "md5", data)
+            checkBackendsAgree(tool, reference, "digest", "sha1", data)
+            checkBackendsAgree(tool, reference, "hmac", "sha1", key, data)
+            checkBackendsAgree(tool, reference, "base64Encode", data, rng.choice([False, True]))
+            for mode in ("ecb", "cbc"):
+                checkBackendsAgree(tool, reference, "aes", "encrypt", mode, key, iv, blocks)
+                checkBackendsAgree(tool, reference, "aes", "decrypt", mode, key, iv, blocks)
+            cypherText = checkBackendsAgree(tool, reference, "aes", "encrypt", "cbc", key, iv, data, True)
+            checkBackendsAgree(tool, reference, "aes", "decrypt", "cbc", key, iv, cypherText, True)
+
+        data = randomBytes(rng, 100)
+        signature = checkBackendsAgree(tool, reference, "rsaSign", "Imported Private Key", data)
+        assert checkBackendsAgree(tool, reference, "rsaVerify", "Imported Public Key", signature, data)
+        assert not checkBackendsAgree(tool, reference, "rsaVerify", "Imported Public Key", signature, data + "x")
+        assert reference.rsaDecrypt("Imported Private Key", tool.rsaEncrypt("Imported Public Key", data)) == data
+        assert tool.rsaDecrypt("Imported Private Key", reference.rsaEncrypt("Imported Public Key", data)) == data
+    finally:
+        tool.close()
+        reference.close()
+
+# ---------------------------------------------------------------------------
+
+# The checks, in the order we report them.  Each check is independent of all the 
+# others (any scratch files come from tempfile), so the scheduler below is free to 
+# run them in any order and in parallel.
+
+gChecks = [
+    checkBase64Encode,
+    checkBase64Decode,
+
+    checkMD5Digest,
+    checkSHA1Digest,
+    checkHMACSHA1,
+    checkStreamDigests,
+    checkMultiFileDigests,
+
+    checkPBKDF2KeyDerivation,
+    checkPBKDF2Calibration,
+
+    checkAES128ECBEncryption,
+    checkAES128ECBDecryption,
+    checkAES128CBCEncryption,
+    checkAES128CBCDecryption,
+
+    checkAES256ECBEncryption,
+    checkAES256ECBDecryption,
+    checkAES256CBCEncryption,
+    checkAES256CBCDecryption,
+
+    # I'm not exercising the Pad + ECB case because ECB is a bad idea and 
+    # I don't want to encourage it.
+
+    checkAES128PadCBCEncryption,
+    checkAES128PadCBCDecryption,
+    checkAES128PadBigCBCEncryption,
+    checkAES128PadBigCBCDecryption,
+    checkAES128PadBigParallelDecryption,
+    checkAES128PadBigEncryptThenMAC,
+    checkAES256PadCBCEncryption,
+    checkAES256PadCBCDecryption,
+
+    # CTR mode is only offered by the big cryptor.
+
+    checkAES128CTRBigEncryption,
+    checkAES128CTRBigDecryption,
+    checkAES256CTRBigEncryption,
+    checkAES128CTRBigParallelCryption,
+
+    checkRSAVerifySHA1Digest,
+    checkRSASignSHA1Digest,
+    checkRSASmallEncrypt,
+    checkRSASmallDecrypt,
+    checkRSAListSignVerify,
+
+    checkBatchMode,
+    checkMappedInput,
+    checkBinaryOutput,
+    checkHexArguments,
+    checkToolAgainstReferenceBackend,
+]
+
+def setupWorker(path):
+    # Runs in each worker process so that it sees the same tool as the parent.
+    setupPathForTool(path)
+
+def makePool(jobs, useProcesses):
+    # Returns a pool of jobs workers, or None if there's only one job, in which case the 
+    # caller should do the work itself.
+    if jobs == 1:
+        return None
+    elif useProcesses:
+        return multiprocessing.Pool(jobs, setupWorker, (pathForTool(),))
+    else:
+        return multiprocessing.pool.ThreadPool(jobs)
+
+def runCheck(checkName):
+    # Runs a single check, returning a (name, status, duration, detail) tuple rather than 
+    # raising, so that one failing check doesn't stop the others.  We pass the check's name, 
+    # rather than the function itself, so that this works across a process pool.
+    check = globals()[checkName]
+    start = time.time()
+    try:
+        check()
+    except AssertionError:
+        status = "FAIL"
+        detail = traceback.format_exc()
+    except Exception:
+        status = "ERROR"
+        detail = traceback.format_exc()
+    else:
+        status = "ok"
+        detail = None
+    return (checkName, status, time.time() - start, detail)
+
+def runChecks(checkNames, jobs, useProcesses):
+    # Runs the specified checks on a pool of jobs workers, printing each result (in 
+    # registration order) as it becomes available.  Returns the list of results.
+    #
+    # Threads are the default because the checks spend almost all of their time waiting 
+    # on child processes, which releases the GIL.
+    pool = makePool(jobs, useProcesses)
+    if pool is None:
+        resultIter = (runCheck(checkName) for checkName in checkNames)
+    else:
+        resultIter = pool.imap(runCheck, checkNames)
+
+    results = []
+    for result in resultIter:
+        (checkName, status, duration, detail) = result
+        print "%s ... %s (%.2fs)" % (checkName, status, duration)
+        sys.stdout.flush()
+        results.append(result)
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+    return results
+
+def printSummary(results, duration):
+    # Prints the details of each failure followed by a one line summary.  Returns True 
+    # if every check passed.
+    failures = [result for result in results if result[1] != "ok"]
+    for (checkName, status, _, detail) in failures:
+        print
+        print "%s: %s" % (status, checkName)
+        print detail.rstrip()
+    print
+    print "%d checks, %d passed, %d failed (%.2fs)" % (len(results), len(results) - len(failures), len(failures), duration)
+    if len(failures) == 0:
+        print "Success"
+    return len(failures) == 0
+
+# ---------------------------------------------------------------------------
+
+# Benchmarks.  With --benchmark the script times each tool subcommand, and its OpenSSL 
+# equivalent, over a range of input sizes instead of running the checks.  The benchmarks 
+# run one at a time, regardless of -j, so that they don't compete for the CPU.
+
+kAES128KeyHexStr = "0C1032520302EC8537A4A82C4EF7579D"
+kAES256KeyHexStr = "0C1032520302EC8537A4A82C4EF7579D2b88e4309655eb40707decdb143e328a"
+kAESIVHexStr     = "AB5BBEB426015DA7EEDCEE8BEE3DFFB7"
+
+gBenchmarkSizes = [0, 1024, 64 * 1024, 1024 * 1024, 16 * 1024 * 1024]
+
+class BenchmarkInputs(object):
+    # Creates, on demand, the input files used by the benchmarks.  Each file is derived 
+    # from the synthetic data for its size, so the inputs are the same from run to run.
+
+    def __init__(self):
+        self.directory = tempfile.mkdtemp(prefix="ATestAgainstOpenSSL-")
+        self.paths = {}
+
+    def cleanUp(self):
+        for path in self.paths.values():
+            os.remove(path)
+        os.rmdir(self.directory)
+
+    def path(self, kind, size):
+        key = (kind, size)
+        if key not in self.paths:
+            path = os.path.join(self.directory, "%s-%d.dat" % (kind, size))
+            if kind == "plaintext":
+                with open(path, "wb") as f:
+                    for chunk in SyntheticData(size, size).chunks():
+                        f.write(chunk)
+            elif kind == "blocks":
+                # Unpadded AES needs a multiple of the block size.  Any such data is also 
+                # valid ciphertext.
+                with open(path, "wb") as f:
+                    for chunk in SyntheticData(size - size % 16, size).chunks():
+                        f.write(chunk)
+            elif kind in ("aes-128-cbc", "aes-256-cbc"):
+                subprocess.check_call(["openssl", "enc", "-e", "-" + kind, "-K", kAES128KeyHexStr if kind == "aes-128-cbc" else kAES256KeyHexStr, "-iv", kAESIVHexStr, "-in", self.path("plaintext", size), "-out", path])
+            elif kind == "base64":
+                subprocess.check_call(["openssl", "enc", "-e", "-base64", "-in", self.path("plaintext", size), "-out", path])
+            elif kind == "signature":
+                subprocess.check_call(["openssl", "dgst", "-sha1", "-sign", pathForResource("private.pem"), "-out", path, self.path("plaintext", size)])
+            else:
+                assert False
+            self.paths[key] = path
+        return self.paths[key]
+
+def isBigCryptorBenchmark(subcommand):
+    # The big cryptor subcommands stream from an input file to an output file.
+    return subcommand.startswith("aes-pad-big-") or subcommand.startswith("aes-ctr-big-")
+
+def aesBenchmarks(subcommand, opensslArgs, inputKind, toolOptions=[]):
+    # Returns the benchmarks for an AES subcommand, one per key size.
+    #
+    # inputKind and the OpenSSL arguments may contain "%d", which is replaced by the key size.  
+    # toolOptions are passed to the tool, and appended to the variant, so that the same 
+    # subcommand can be benchmarked with and without them.
+    result = []
+    for (keySize, keyHexStr) in [(128, kAES128KeyHexStr), (256, kAES256KeyHexStr)]:
+        kind = inputKind.replace("%d", str(keySize))
+        # We bind the loop variables as default arguments so that each function gets its own copy.
+        def toolCommand(inputs, size, keyHexStr=keyHexStr, kind=kind):
+            command = [pathForTool(), subcommand] + toolOptions + ["-k", keyHexStr, "-i", kAESIVHexStr, inputs.path(kind, size)]
+            if isBigCryptorBenchmark(subcommand):
+                command.append("/dev/null")
+            return command
+        def opensslCommand(inputs, size, keySize=keySize, keyHexStr=keyHexStr, kind=kind):
+            return ["openssl", "enc"] + [arg.replace("%d", str(keySize)) for arg in opensslArgs] + ["-K", keyHexStr, "-iv", kAESIVHexStr, "-in", inputs.path(kind, size)]
+        result.append((subcommand, " ".join(["AES-%d" % keySize] + toolOptions), toolCommand, opensslCommand))
+    return result
+
+# Each benchmark is a (subcommand, variant, toolCommand, opensslCommand) tuple, where the 
+# command functions take a BenchmarkInputs object and an input size and return the command 
+# to run.  opensslCommand is None if OpenSSL has no equivalent.
+#
+# There's only one RSA key pair in the keychain ("Imported Public Key" and "Imported Private Key", 
+# a copy of "TestData/public.pem" and "TestData/private.pem"), so that's the only RSA key size 
+# we benchmark.  The RSA small cryptor benchmarks use fixed-size inputs.
+
+gBenchmarks = [
+    ("base64-encode", "", 
+        lambda inputs, size: [pathForTool(), "base64-encode", "-l", inputs.path("plaintext", size)], 
+        lambda inputs, size: ["openssl", "enc", "-e", "-base64", "-in", inputs.path("plaintext", size)]),
+    ("base64-decode", "", 
+        lambda inputs, size: [pathForTool(), "base64-decode", inputs.path("base64", size)], 
+        lambda inputs, size: ["openssl", "enc", "-d", "-base64", "-in", inputs.path("base64", size)]),
+    ("md5-digest", "", 
+        lambda inputs, size: [pathForTool(), "md5-digest", inputs.path("plaintext", size)], 
+        lambda inputs, size: ["openssl", "dgst", "-md5", inputs.path("plaintext", size)]),
+    ("sha1-digest", "", 
+        lambda inputs, size: [pathForTool(), "sha1-digest", inputs.path("plaintext", size)], 
+        lambda inputs, size: ["openssl", "dgst", "-sha1", inputs.path("plaintext", size)]),
+    ("hmac-sha1", "", 
+        lambda inputs, size: [pathForTool(), "hmac-sha1", "-k", "48656c6c6f20437275656c20576f726c6421", inputs.path("plaintext", size)], 
+        lambda inputs, size: ["openssl", "dgst", "-sha1", "-hmac", "Hello Cruel World!", inputs.path("plaintext", size)]),
+] + aesBenchmarks("aes-encrypt", ["-e", "-aes-%d-cbc", "-nopad"], "blocks") \
+  + aesBenchmarks("aes-decrypt", ["-d", "-aes-%d-cbc", "-nopad"], "blocks") \
+  + aesBenchmarks("aes-pad-encrypt", ["-e", "-aes-%d-cbc"], "plaintext") \
+  + aesBenchmarks("aes-pad-decrypt", ["-d", "-aes-%d-cbc"], "aes-%d-cbc") \
+  + aesBenchmarks("aes-pad-big-encrypt", ["-e", "-aes-%d-cbc"], "plaintext") \
+  + aesBenchmarks("aes-pad-big-decrypt", ["-d", "-aes-%d-cbc"], "aes-%d-cbc") \
+  + aesBenchmarks("aes-ctr-big-encrypt", ["-e", "-aes-%d-ctr"], "plaintext") \
+  + aesBenchmarks("aes-ctr-big-encrypt", ["-e", "-aes-%d-ctr"], "plaintext", ["-p"]) \
+  + aesBenchmarks("aes-ctr-big-decrypt", ["-d", "-aes-%d-ctr"], "plaintext") \
+  + aesBenchmarks("aes-ctr-big-decrypt", ["-d", "-aes-%d-ctr"], "plaintext", ["-p"]) \
+  + [
+    ("rsa-sha1-sign", "RSA-2048", 
+        lambda inputs, size: [pathForTool(), "rsa-sha1-sign", "Imported Private Key", inputs.path("plaintext", size)], 
+        lambda inputs, size: ["openssl", "dgst", "-sha1", "-sign", pathForResource("private.pem"), inputs.path("plaintext", size)]),
+    ("rsa-sha1-verify", "RSA-2048", 
+        lambda inputs, size: [pathForTool(), "rsa-sha1-verify", "Imported Public Key", inputs.path("signature", size), inputs.path("plaintext", size)], 
+        lambda inputs, size: ["openssl", "dgst", "-sha1", "-verify", pathForResource("public.pem"), "-signature", inputs.path("signature", size), inputs.path("plaintext", size)]),
+    ("rsa-small-encrypt", "RSA-2048", 
+        lambda inputs, size: [pathForTool(), "rsa-small-encrypt", "Imported Public Key", pathForResource("plaintext-32.dat")], 
+        lambda inputs, size: ["openssl", "rsautl", "-encrypt", "-pkcs", "-pubin", "-inkey", pathForResource("public.pem"), "-in", pathForResource("plaintext-32.dat")]),
+    ("rsa-small-decrypt", "RSA-2048", 
+        lambda inputs, size: [pathForTool(), "rsa-small-decrypt", "-p", "none", "Imported Private Key", pathForResource("cyphertext-rsa-nopad-256.dat")], 
+        lambda inputs, size: ["openssl", "rsautl", "-decrypt", "-raw", "-inkey", pathForResource("private.pem"), "-in", pathForResource("cyphertext-rsa-nopad-256.dat")]),
+]
+
+def isFixedSizeBenchmark(subcommand):
+    return subcommand.startswith("rsa-small-")
 
-setupPathForTool();
+def timeCommand(command, warmup, repetitions):
+    # Runs command warmup times, ignoring the results, and then repetitions times, returning 
+    # the list of wall clock times (in seconds).  The output goes to /dev/null.
+    samples = []
+    with open(os.devnull, "wb") as devNull:
+        for iteration in range(warmup + repetitions):
+            start = time.time()
+            subprocess.check_call(command, stdout=devNull)
+            duration = time.time() - start
+            if iteration >= warmup:
+                samples.append(duration)
+    return samples
 
-checkBase64Encode()
-checkBase64Decode()
+def percentile(samples, fraction):
+    # Returns the nearest-rank percentile of samples.
+    ordered = sorted(samples)
+    return ordered[max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))]
 
-checkMD5Digest()
-checkSHA1Digest()
-checkHMACSHA1()
+def summariseSamples(samples, size):
+    median = percentile(samples, 0.5)
+    return {
+        "samples": samples, 
+        "median": median, 
+        "p95": percentile(samples, 0.95), 
+        "mbPerSec": (size / median / 1e6) if median > 0 else None, 
+        "opsPerSec": (1.0 / median) if median > 0 else None, 
+    }
 
-checkPBKDF2KeyDerivation()
+def formatRate(rate):
+    return "-" if rate is None else "%.1f" % rate
+
+def linearFit(points):
+    # Returns the least squares (intercept, slope) of the line through the (x, y) points, 
+    # or None if there aren't at least two distinct x values.
+    count = float(len(points))
+    meanX = sum(x for (x, _) in points) / count
+    meanY = sum(y for (_, y) in points) / count
+    sxx = sum((x - meanX) ** 2 for (x, _) in points)
+    if sxx == 0:
+        return None
+    slope = sum((x - meanX) * (y - meanY) for (x, y) in points) / sxx
+    return (meanY - slope * meanX, slope)
+
+def applyBaseline(summary, size, baseline):
+    # Adds the net (baseline subtracted) time and throughput to a summary.  The baseline is 
+    # the median time to run the same subcommand on an empty input, that is, the cost of 
+    # process start-up, argument parsing, file handling and so on.
+    summary["baseline"] = baseline
+    summary["netMedian"] = max(summary["median"] - baseline, 0.0)
+    summary["netMBPerSec"] = (size / summary["netMedian"] / 1e6) if (size != 0) and (summary["netMedian"] > 0) else None
+
+def fitSamples(rows, implementation):
+    # Fits time = overhead + size * secondsPerByte across every sample of every size, 
+    # which separates the fixed per-invocation cost from the real per-byte cost.
+    points = [(row["size"], sample) for row in rows for sample in row[implementation]["samples"]]
+    fit = linearFit(points)
+    if fit is None:
+        return None
+    (overhead, secondsPerByte) = fit
+    return {
+        "overhead": overhead, 
+        "secondsPerByte": secondsPerByte, 
+        "mbPerSec": (1.0 / secondsPerByte / 1e6) if secondsPerByte > 0 else None
+    }
+
+def runBenchmarks(benchmarks, sizes, warmup, repetitions):
+    # Runs each benchmark at each size, printing a table as we go.  Returns a tuple of the 
+    # results, as a list of dictionaries, one per benchmark/size pair, and the fits, as a 
+    # list of dictionaries, one per benchmark.
+    #
+    # Every run includes process start-up and the like, which dominates small inputs.  So 
+    # we always run each benchmark on an empty input first and report net numbers with that 
+    # baseline subtracted, and we fit a line across the sizes to get the per-byte cost.
+
+    sizes = sorted(set(sizes) | set([0]))
+    results = []
+    fits = []
+    inputs = BenchmarkInputs()
+    try:
+        print "%-20s %-9s %10s | %9s %9s %9s %9s %9s | %9s %9s %9s %9s %9s" % (
+            "subcommand", "variant", "size", 
+            "tool ms", "p95 ms", "MB/s", "ops/s", "net MB/s", 
+            "ssl ms", "p95 ms", "MB/s", "ops/s", "net MB/s"
+        )
+        for (subcommand, variant, toolCommand, opensslCommand) in benchmarks:
+            implementations = [("tool", toolCommand)]
+            if opensslCommand is not None:
+                implementations.append(("openssl", opensslCommand))
+            rows = []
+            for size in ([0] if isFixedSizeBenchmark(subcommand) else sizes):
+                result = {
+                    "subcommand": subcommand, 
+                    "variant": variant, 
+                    "size": size, 
+                    "tool": None, 
+                    "openssl": None
+                }
+                for (implementation, command) in implementations:
+                    summary = summariseSamples(timeCommand(command(inputs, size), warmup, repetitions), size)
+                    baseline = summary["median"] if size == 0 else rows[0][implementation]["median"]
+                    applyBaseline(summary, size, baseline)
+                    result[implementation] = summary
+                rows.append(result)
+
+                columns = []
+                for implementation in ("tool", "openssl"):
+                    summary = result[implementation]
+                    if summary is None:
+                        columns.extend(["-"] * 5)
+                    else:
+                        columns.extend([
+                            "%.2f" % (summary["median"] * 1000.0), 
+                            "%.2f" % (summary["p95"] * 1000.0), 
+                            formatRate(summary["mbPerSec"]), 
+                            formatRate(summary["opsPerSec"]), 
+                            formatRate(summary["netMBPerSec"])
+                        ])
+                print "%-20s %-9s %10d | %9s %9s %9s %9s %9s | %9s %9s %9s %9s %9s" % tuple([subcommand, variant, size] + columns)
+                sys.stdout.flush()
+            results.extend(rows)
+
+            fit = { "subcommand": subcommand, "variant": variant }
+            descriptions = []
+            for (implementation, _) in implementations:
+                fit[implementation] = fitSamples(rows, implementation)
+                if fit[implementation] is not None:
+                    descriptions.append("%s %.2f ms + %s MB/s" % (
+                        implementation, 
+                        fit[implementation]["overhead"] * 1000.0, 
+                        formatRate(fit[implementation]["mbPerSec"])
+                    ))
+            if len(descriptions) != 0:
+                print "%-20s %-9s %10s   %s" % ("", "", "fit:", " | ".join(descriptions))
+            fits.append(fit)
+    finally:
+        inputs.cleanUp()
+    return (results, fits)
+
+# The input size for the batch benchmarks.  This is deliberately small, because the 
+# point of batch mode is to amortise the per-invocation cost.
+
+kBatchBenchmarkSize = 1024
+
+def runBatchBenchmarks(benchmarks, requestCount, warmup):
+    # Runs requestCount requests for each benchmark, first as separate tool processes and 
+    # then pipelined through a single batch process, printing the mean time per request 
+    # for each.  Returns the results as a list of dictionaries, one per benchmark.  The 
+    # big cryptor subcommands are skipped because they can't take their input from a 
+    # batch payload.
+    results = []
+    inputs = BenchmarkInputs()
+    try:
+        print
+        print "%-20s %-9s %10s %8s | %12s %12s %9s" % ("subcommand", "variant", "size", "requests", "one-shot ms", "batch ms", "speedup")
+        for (subcommand, variant, toolCommand, _) in benchmarks:
+            if isBigCryptorBenchmark(subcommand):
+                continue
+            size = 0 if isFixedSizeBenchmark(subcommand) else kBatchBenchmarkSize
+            command = toolCommand(inputs, size)
+            oneShotTime = sum(timeCommand(command, warmup, requestCount)) / requestCount
+
+            request = batchRequestFromCommand(command)
+            client = BatchClient()
+            try:
+                list(client.runRequests([request] * warmup))
+                start = time.time()
+                for (status, output) in client.runRequests([request] * requestCount):
+                    assert status == kBatchStatusSuccess, output
+                batchTime = (time.time() - start) / requestCount
+            finally:
+                client.close()
+
+            results.append({
+                "subcommand": subcommand, 
+                "variant": variant, 
+                "size": size, 
+                "requests": requestCount, 
+                "oneShotSeconds": oneShotTime, 
+                "batchSeconds": batchTime
+            })
+            print "%-20s %-9s %10d %8d | %12.3f %12.3f %8.1fx" % (
+                subcommand, variant, size, requestCount, 
+                oneShotTime * 1000.0, batchTime * 1000.0, 
+                (oneShotTime / batchTime) if batchTime > 0 else 0.0
+            )
+            sys.stdout.flush()
+    finally:
+        inputs.cleanUp()
+    return results
+
+# The scaling benchmarks run a batch of requests in parallel mode ("-j N batch -p") at 
+# each of a range of concurrent operation counts, to show how throughput scales with 
+# cores.  The input is big enough that each request is dominated by the cryptography 
+# rather than the batch protocol.  Override the counts with --scaling-jobs.
+
+kScalingBenchmarkSubcommands = ["sha1-digest", "aes-pad-encrypt", "rsa-sha1-verify"]
+kScalingBenchmarkSize = 1024 * 1024
+
+def defaultScalingJobCounts():
+    # 1, 2, 4 and so on, up to and including the number of cores.
+    cpuCount = multiprocessing.cpu_count()
+    counts = [1]
+    while counts[-1] * 2 < cpuCount:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cpuCount:
+        counts.append(cpuCount)
+    return counts
+
+def runScalingBenchmarks(benchmarks, jobCounts, requestCount, warmup):
+    # Runs requestCount requests for the first variant of each subcommand in 
+    # kScalingBenchmarkSubcommands through a parallel batch at each job count, printing 
+    # the throughput, the speedup relative to the first job count, and the efficiency 
+    # (speedup per job, relative to the first job count).  Returns the results as a list 
+    # of dictionaries, one per subcommand/job count pair.
+    results = []
+    inputs = BenchmarkInputs()
+    try:
+        print
+        print "%-20s %-9s %10s %8s %5s | %10s %9s %10s" % ("subcommand", "variant", "size", "requests", "jobs", "requests/s", "speedup", "efficiency")
+        seen = set()
+        for (subcommand, variant, toolCommand, _) in benchmarks:
+            if (subcommand not in kScalingBenchmarkSubcommands) or (subcommand in seen):
+                continue
+            seen.add(subcommand)
+            size = 0 if isFixedSizeBenchmark(subcommand) else kScalingBenchmarkSize
+            request = batchRequestFromCommand(toolCommand(inputs, size))
+            baseRate = None
+            for jobs in jobCounts:
+                client = BatchClient(globalOptions=["-j", str(jobs)], batchOptions=["-p"])
+                try:
+                    list(client.runRequests([request] * warmup))
+                    start = time.time()
+                    for (status, output) in client.runRequests([request] * requestCount):
+                        assert status == kBatchStatusSuccess, output
+                    elapsed = time.time() - start
+                finally:
+                    client.close()
+                rate = (requestCount / elapsed) if elapsed > 0 else float("inf")
+                if baseRate is None:
+                    baseRate = rate
+                speedup = rate / baseRate
+                efficiency = speedup * jobCounts[0] / jobs
+                results.append({
+                    "subcommand": subcommand, 
+                    "variant": variant, 
+                    "size": size, 
+                    "requests": requestCount, 
+                    "jobs": jobs, 
+                    "requestsPerSec": rate, 
+                    "speedup": speedup, 
+                    "efficiency": efficiency
+                })
+                print "%-20s %-9s %10d %8d %5d | %10.1f %8.2fx %9.0f%%" % (
+                    subcommand, variant, size, requestCount, jobs, 
+                    rate, speedup, efficiency * 100.0
+                )
+                sys.stdout.flush()
+    finally:
+        inputs.cleanUp()
+    return results
+
+# ru_maxrss is in kilobytes on Linux but in bytes on OS X.
+
+kMaxRSSUnit = 1 if sys.platform == "darwin" else 1024
+
+def peakRSSOfCommand(command):
+    # Runs command, with its output going to /dev/null, and returns the peak resident set 
+    # size of that child process, in bytes.  We reap the child with os.wait4, which returns 
+    # its resource usage, rather than using resource.getrusage(RUSAGE_CHILDREN), because 
+    # the latter gives the maximum across every child we've ever run.
+    with open(os.devnull, "wb") as devNull:
+        process = subprocess.Popen(command, stdout=devNull)
+        (_, status, usage) = os.wait4(process.pid, 0)
+    process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    return usage.ru_maxrss * kMaxRSSUnit
+
+def runMemoryBenchmarks(benchmarks, size):
+    # Runs each one-shot benchmark on a size byte input, both reading its input into memory 
+    # and mapping it ("-m"), printing the peak RSS of each.  Returns the results as a list 
+    # of dictionaries, one per benchmark.  The big cryptor subcommands are skipped because 
+    # they stream their input.
+    results = []
+    inputs = BenchmarkInputs()
+    try:
+        print
+        print "%-20s %-9s %10s | %10s %10s %10s" % ("subcommand", "variant", "size", "read MB", "mapped MB", "saved MB")
+        for (subcommand, variant, toolCommand, _) in benchmarks:
+            if isBigCryptorBenchmark(subcommand) or isFixedSizeBenchmark(subcommand):
+                continue
+            command = toolCommand(inputs, size)
+            readRSS = peakRSSOfCommand(command)
+            mappedRSS = peakRSSOfCommand(command[:1] + ["-m"] + command[1:])
+            results.append({
+                "subcommand": subcommand, 
+                "variant": variant, 
+                "size": size, 
+                "readPeakRSS": readRSS, 
+                "mappedPeakRSS": mappedRSS
+            })
+            print "%-20s %-9s %10d | %10.1f %10.1f %10.1f" % (
+                subcommand, variant, size, 
+                readRSS / 1e6, mappedRSS / 1e6, (readRSS - mappedRSS) / 1e6
+            )
+            sys.stdout.flush()
+    finally:
+        inputs.cleanUp()
+    return results
+
+# The chunk sizes for the chunk size benchmarks, which also run adaptive mode capped 
+# at kChunkBenchmarkAdaptiveCap.  Override with --chunk-sizes.
+
+gChunkBenchmarkSizes = [4 * 1024, 16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024]
+kChunkBenchmarkAdaptiveCap = 16 * 1024 * 1024
+
+def runChunkSizeBenchmarks(benchmarks, chunkSizes, size, warmup, repetitions):
+    # Runs each big cryptor benchmark on a size byte input once for each chunk size, and 
+    # once with an adaptive chunk size, printing the throughput of each.  Returns the 
+    # results as a list of dictionaries, one per benchmark/chunk size pair.
+    results = []
+    inputs = BenchmarkInputs()
+    try:
+        print
+        print "%-20s %-9s %10s %10s | %9s %9s %9s" % ("subcommand", "variant", "size", "chunk", "tool ms", "p95 ms", "MB/s")
+        for (subcommand, variant, toolCommand, _) in benchmarks:
+            if not subcommand.startswith("aes-pad-big-"):
+                continue
+            command = toolCommand(inputs, size)
+            settings = [(str(chunkSize), ["-c", str(chunkSize)]) for chunkSize in chunkSizes]
+            settings.append(("adaptive", ["-a", str(kChunkBenchmarkAdaptiveCap)]))
+            for (chunkLabel, options) in settings:
+                summary = summariseSamples(timeCommand(command[:2] + options + command[2:], warmup, repetitions), size)
+                summary.update({
+                    "subcommand": subcommand, 
+                    "variant": variant, 
+                    "size": size, 
+                    "chunkSize": chunkLabel
+                })
+                results.append(summary)
+                print "%-20s %-9s %10d %10s | %9.2f %9.2f %9s" % (
+                    subcommand, variant, size, chunkLabel, 
+                    summary["median"] * 1000.0, summary["p95"] * 1000.0, formatRate(summary["mbPerSec"])
+                )
+                sys.stdout.flush()
+    finally:
+        inputs.cleanUp()
+    return results
+
+# The round counts for the PBKDF2 benchmarks.  Override with --pbkdf2-rounds.
+
+gPBKDF2BenchmarkRounds = [1000, 10000, 100000, 1000000]
+
+kPBKDF2BenchmarkSaltHexStr = "0102030405060708"
+
+def opensslSupportsKDF():
+    # "openssl kdf" is new in OpenSSL 3.0; the OpenSSL on OS X doesn't have it.
+    with open(os.devnull, "wb") as devNull:
+        return subprocess.call(["openssl", "kdf", "-keylen", "1", "-kdfopt", "digest:SHA1", "-kdfopt", "pass:x", "-kdfopt", "hexsalt:00", "-kdfopt", "iter:1", "PBKDF2"], stdout=devNull, stderr=devNull) == 0
+
+def runPBKDF2Benchmarks(roundCounts, warmup, repetitions):
+    # Times PBKDF2 at each round count, for a one block key and a multi-block key, the 
+    # latter both serially and with its blocks derived in parallel ("-P").  The OpenSSL 
+    # equivalent is "openssl kdf", if it's available.  Returns the results as a list of 
+    # dictionaries, one per round count/key length/mode.
+    results = []
+    hasKDF = opensslSupportsKDF()
+    print
+    print "%-10s %6s %-8s | %9s %9s %12s | %9s %12s" % ("rounds", "keylen", "mode", "tool ms", "p95 ms", "rounds/s", "ssl ms", "rounds/s")
+    for rounds in roundCounts:
+        for (length, mode, options) in [(16, "serial", []), (64, "serial", []), (64, "parallel", ["-P"])]:
+            command = [pathForTool(), "pbkdf2-sha1-key-derivation", "-p", "Hello Cruel World!", "-s", kPBKDF2BenchmarkSaltHexStr, "-r", str(rounds), "-z", str(length)] + options
+            summary = summariseSamples(timeCommand(command, warmup, repetitions), 0)
+            blockRounds = rounds * ((length + 19) // 20)
+            result = {
+                "rounds": rounds, 
+                "derivedKeyLength": length, 
+                "mode": mode, 
+                "tool": summary, 
+                "toolRoundsPerSec": (blockRounds / summary["median"]) if summary["median"] > 0 else None, 
+                "openssl": None, 
+                "opensslRoundsPerSec": None
+            }
+            if hasKDF and (mode == "serial"):
+                opensslCommand = ["openssl", "kdf", "-keylen", str(length), "-kdfopt", "digest:SHA1", "-kdfopt", "pass:Hello Cruel World!", "-kdfopt", "hexsalt:" + kPBKDF2BenchmarkSaltHexStr, "-kdfopt", "iter:%d" % rounds, "PBKDF2"]
+                result["openssl"] = summariseSamples(timeCommand(opensslCommand, warmup, repetitions), 0)
+                if result["openssl"]["median"] > 0:
+                    result["opensslRoundsPerSec"] = blockRounds / result["openssl"]["median"]
+            results.append(result)
+            print "%-10d %6d %-8s | %9.2f %9.2f %12s | %9s %12s" % (
+                rounds, length, mode, 
+                summary["median"] * 1000.0, summary["p95"] * 1000.0, formatRate(result["toolRoundsPerSec"]), 
+                "-" if result["openssl"] is None else "%.2f" % (result["openssl"]["median"] * 1000.0), 
+                formatRate(result["opensslRoundsPerSec"])
+            )
+            sys.stdout.flush()
+    return results
+
+def writeBenchmarkJSON(path, results, fits, batchResults, scalingResults, chunkResults, memoryResults, pbkdf2Results, warmup, repetitions):
+    # Writes the results in a machine-readable form, so that runs from different builds 
+    # can be compared.
+    with open(path, "w") as f:
+        json.dump({
+            "tool": pathForTool(), 
+            "platform": platform.platform(), 
+            "openssl": subprocess.check_output(["openssl", "version"]).strip(), 
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), 
+            "warmup": warmup, 
+            "repetitions": repetitions, 
+            "results": results, 
+            "fits": fits, 
+            "batch": batchResults, 
+            "scaling": scalingResults, 
+            "cpuCount": multiprocessing.cpu_count(), 
+            "chunkSizes": chunkResults, 
+            "memory": memoryResults, 
+            "pbkdf2": pbkdf2Results
+        }, f, indent=2, sort_keys=True)
+
+# ---------------------------------------------------------------------------
+
+# Calibration.  In calibration mode we run "pbkdf2-sha1-calibrate" repeatedly at each of 
+# a range of target derivation times and check that the round counts are stable (every run 
+# is within kCalibrationTolerance of the median for its target time) and monotonic (the 
+# median grows with the target time).  We also time a real derivation using the median 
+# round count to see how close it comes to the target.  To get that time clear of process 
+# start-up, we derive a key of kCalibrationCheckBlocks SHA-1 blocks, serially, which takes 
+# that many times as long as the one block key that we calibrate for, and subtract the 
+# time for the same key with one round.  The calibration times a single thread, so the 
+# rounds per second we report are per core.  The runs are serial, because running them 
+# in parallel would disturb the timing.
+
+gCalibrationTimes = [25, 50, 100, 200]
+kCalibrationTolerance = 0.25
+kCalibrationCheckBlocks = 10
+
+def calibrationWriteJSON(path, results, runCount, tolerance):
+    with open(path, "w") as f:
+        json.dump({
+            "tool": pathForTool(), 
+            "platform": platform.platform(), 
+            "cpuCount": multiprocessing.cpu_count(), 
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), 
+            "runs": runCount, 
+            "tolerance": tolerance, 
+            "results": results
+        }, f, indent=2, sort_keys=True)
+
+def runCalibration(runCount, times, tolerance, jsonPath):
+    # Returns True if the calibration is stable and monotonic.
+    success = True
+    results = []
+    command = [pathForTool(), "pbkdf2-sha1-calibrate", "-p", "8", "-s", "8", "-z", "16"]
+    derivationCommand = [pathForTool(), "pbkdf2-sha1-key-derivation", "-p", "password", "-s", "0102030405060708", "-z", str(kCalibrationCheckBlocks * 20)]
+    baseline = percentile(timeCommand(derivationCommand + ["-r", "1"], 1, runCount), 0.5)
+    print "%8s | %10s %10s %10s %8s | %12s | %11s %12s" % ("target", "median", "min", "max", "spread", "rounds/s", "derive ms", "rounds/s")
+    for milliseconds in times:
+        rounds = [int(subprocess.check_output(command + ["-t", str(milliseconds)])) for _ in range(runCount)]
+        median = percentile(rounds, 0.5)
+        spread = float(max(rounds) - min(rounds)) / median
+        stable = all(abs(count - median) <= tolerance * median for count in rounds)
+        monotonic = (len(results) == 0) or (median > results[-1]["median"])
+        derivationTime = max(percentile(timeCommand(derivationCommand + ["-r", str(median)], 1, runCount), 0.5) - baseline, 1e-6) / kCalibrationCheckBlocks
+        results.append({
+            "targetMilliseconds": milliseconds, 
+            "rounds": rounds, 
+            "median": median, 
+            "stable": stable, 
+            "monotonic": monotonic, 
+            "roundsPerSecPerCore": median / (milliseconds / 1000.0), 
+            "measuredMilliseconds": derivationTime * 1000.0, 
+            "measuredRoundsPerSecPerCore": median / derivationTime
+        })
+        print "%6dms | %10d %10d %10d %7.1f%% | %12.0f | %11.2f %12.0f%s%s" % (
+            milliseconds, median, min(rounds), max(rounds), spread * 100.0, 
+            results[-1]["roundsPerSecPerCore"], 
+            results[-1]["measuredMilliseconds"], results[-1]["measuredRoundsPerSecPerCore"], 
+            "" if stable else "  UNSTABLE", 
+            "" if monotonic else "  NOT MONOTONIC"
+        )
+        sys.stdout.flush()
+        success = success and stable and monotonic
+    if jsonPath is not None:
+        calibrationWriteJSON(jsonPath, results, runCount, tolerance)
+    print "Success" if success else "Failure"
+    return success
+
+# ---------------------------------------------------------------------------
+
+# Fuzzing.  In fuzz mode we generate random cases (lengths, keys, IVs and data) for each 
+# subcommand that has a direct OpenSSL equivalent, and check that the tool and OpenSSL 
+# agree on every one.  To get through tens of thousands of cases a minute we never start 
+# a process per case.  Each work unit sends all of its cases to a single batch mode tool 
+# process, and runs OpenSSL once per group of cases that share a key.  That works because:
+#
+# o "openssl dgst" accepts any number of files, and prints a result for each
+#
+# o ECB encryption of a concatenation is the concatenation of the encryptions
+#
+# o CBC is the same, as long as each case's IV is the last cyphertext block of the case 
+#   before it; opensslFuzzAES works out those IVs, and we pass them to the tool
+#
+# o OpenSSL only pads the end of its input, so for the padded subcommands we have OpenSSL 
+#   do raw CBC, and add or check the PKCS#7 padding ourselves
+#
+# When a case fails we minimise it, by trying smaller and simpler versions of it one at a 
+# time, and report the smallest version that still fails.  A run is reproducible from its 
+# seed.
+
+gFuzzKinds = [
+    ("md5-digest",  None), 
+    ("sha1-digest", None), 
+    ("hmac-sha1",   None), 
+] + [
+    (subcommand, mode) for subcommand in ("aes-encrypt", "aes-decrypt", "aes-pad-encrypt", "aes-pad-decrypt") for mode in ("ecb", "cbc")
+]
+
+kFuzzGroupSize = 64
+kFuzzGroupsPerUnit = 16
+kFuzzUnitCaseCount = kFuzzGroupSize * kFuzzGroupsPerUnit
+
+def isFuzzDigestKind(subcommand):
+    return subcommand in ("md5-digest", "sha1-digest", "hmac-sha1")
+
+def pkcs7Pad(data):
+    padLength = 16 - (len(data) % 16)
+    return data + chr(padLength) * padLength
+
+def pkcs7Unpad(data):
+    # Returns None if the padding is invalid, which is when OpenSSL would fail.
+    if len(data) == 0:
+        return None
+    padLength = ord(data[-1])
+    if (padLength < 1) or (padLength > 16) or (data[-padLength:] != data[-1] * padLength):
+        return None
+    return data[:-padLength]
+
+def opensslFuzzDigests(subcommand, key, inputs):
+    # Runs every input through a single "openssl dgst", returning a list of digests.
+    directory = tempfile.mkdtemp()
+    try:
+        for (index, data) in enumerate(inputs):
+            with open(os.path.join(directory, str(index)), "wb") as f:
+                f.write(data)
+        if subcommand == "md5-digest":
+            arguments = ["-md5"]
+        elif subcommand == "sha1-digest":
+            arguments = ["-sha1"]
+        else:
+            arguments = ["-sha1", "-mac", "HMAC", "-macopt", opensslHMACKeyOption(key)]
+        output = subprocess.check_output(["openssl", "dgst", "-r"] + arguments + [str(index) for index in range(len(inputs))], cwd=directory)
+    finally:
+        shutil.rmtree(directory)
+    return [binascii.unhexlify(line.split()[0]) for line in output.splitlines()]
+
+def opensslFuzzAES(subcommand, mode, key, iv, inputs):
+    # Runs every input through a single "openssl enc", returning a list of (iv, result) 
+    # tuples, one per input.  iv is the IV to use for that case (or None for ECB) and 
+    # result is what the tool should output, or None if the tool should fail.
+    op = "decrypt" if subcommand.endswith("decrypt") else "encrypt"
+    padding = "-pad-" in subcommand
+    rawInputs = []
+    for data in inputs:
+        if padding and (op == "encrypt"):
+            rawInputs.append(pkcs7Pad(data))
+        elif ((len(data) % 16) != 0) or (padding and (len(data) == 0)):
+            rawInputs.append(None)
+        else:
+            rawInputs.append(data)
+    rawOutput = OpenSSLBackend().aes(op, mode, key, iv, "".join(raw for raw in rawInputs if raw is not None))
+    results = []
+    offset = 0
+    for raw in rawInputs:
+        caseIV = iv
+        if raw is None:
+            result = None
+        else:
+            result = rawOutput[offset:offset + len(raw)]
+            offset += len(raw)
+            if (mode == "cbc") and (len(raw) != 0):
+                iv = (result if op == "encrypt" else raw)[-16:]
+            if padding and (op == "decrypt"):
+                result = pkcs7Unpad(result)
+        results.append((caseIV, result))
+    return results
+
+def fuzzExpected(case):
+    # Runs a single case through OpenSSL, returning what the tool should output, or None 
+    # if it should fail.
+    (subcommand, mode, key, iv, data) = case
+    if isFuzzDigestKind(subcommand):
+        return opensslFuzzDigests(subcommand, key, [data])[0]
+    return opensslFuzzAES(subcommand, mode, key, iv, [data])[0][1]
+
+def fuzzToolRequest(case):
+    (subcommand, mode, key, iv, data) = case
+    arguments = [subcommand]
+    if key is not None:
+        arguments.extend(["-k", binascii.hexlify(key)])
+    if mode == "ecb":
+        arguments.append("-e")
+    elif mode == "cbc":
+        arguments.extend(["-i", binascii.hexlify(iv)])
+    return (arguments + ["@0"], [data])
+
+def describeFuzzResult(status, output):
+    if status == kBatchStatusSuccess:
+        return "%d bytes %s" % (len(output), binascii.hexlify(output[:64]) + ("..." if len(output) > 64 else ""))
+    elif status == kBatchStatusError:
+        return "error %s" % output
+    else:
+        return "usage error"
+
+def fuzzMismatch(case, expected, status, output):
+    # Returns None if the tool's response matches what OpenSSL expects, or a description 
+    # of the difference otherwise.
+    if (status == kBatchStatusSuccess) and isFuzzDigestKind(case[0]):
+        try:
+            output = binascii.unhexlify(output.rstrip("\n"))
+        except TypeError:
+            pass
+    if expected is None:
+        if status == kBatchStatusError:
+            return None
+        return "expected an error, got %s" % describeFuzzResult(status, output)
+    if status != kBatchStatusSuccess:
+        return "expected %s, got %s" % (describeFuzzResult(kBatchStatusSuccess, expected), describeFuzzResult(status, output))
+    if output == expected:
+        return None
+    # Show where the outputs first differ, rather than their prefixes, which can be the 
+    # same.  The description is printed indented under the case, so indent its lines to 
+    # match.
+    return "expected %d bytes, got %d bytes, %s" % (
+        len(expected), 
+        len(output), 
+        mismatchMessage(compareStreams([expected], [output]), "expected", "output").replace("\n", "\n    ")
+    )
+
+def fuzzGroupCases(rng, subcommand, mode):
+    # Generates a group of cases that share a key, and runs them through OpenSSL, returning 
+    # a list of (case, expected) tuples.
+    if subcommand == "hmac-sha1":
+        key = randomBytes(rng, rng.randint(0, 160))     # SHA-1's block is 64 bytes
+    elif isFuzzDigestKind(subcommand):
+        key = None
+    else:
+        key = randomBytes(rng, rng.choice([16, 24, 32]))
+    iv = randomBytes(rng, 16) if mode == "cbc" else None
+    aligned = subcommand in ("aes-encrypt", "aes-decrypt")
+    inputs = [randomBytes(rng, fuzzLength(rng, aligned)) for _ in range(kFuzzGroupSize)]
+    if isFuzzDigestKind(subcommand):
+        return [((subcommand, mode, key, iv, data), result) for (data, result) in zip(inputs, opensslFuzzDigests(subcommand, key, inputs))]
+    if subcommand == "aes-pad-decrypt":
+        # Random cyphertext almost never has valid padding, so start from the encryption 
+        # of the inputs and then damage some of them.
+        inputs = [result for (_, result) in opensslFuzzAES("aes-pad-encrypt", mode, key, iv, inputs)]
+        for index in range(len(inputs)):
+            if rng.random() < 0.1:
+                offset = rng.randrange(len(inputs[index]))
+                inputs[index] = inputs[index][:offset] + chr(ord(inputs[index][offset]) ^ (1 << rng.randrange(8))) + inputs[index][offset + 1:]
+            elif rng.random() < 0.05:
+                inputs[index] = inputs[index][:-rng.randint(1, 16)]
+    return [((subcommand, mode, key, caseIV, data), result) for (data, (caseIV, result)) in zip(inputs, opensslFuzzAES(subcommand, mode, key, iv, inputs))]
+
+def fuzzLength(rng, aligned):
+    # Picks an input length, biased towards short inputs and block boundaries.  If aligned 
+    # is set, most (but not all) lengths are a multiple of the AES block size.
+    choice = rng.random()
+    if choice < 0.5:
+        length = rng.randint(0, 48)
+    elif choice < 0.9:
+        length = max(16 * rng.randint(0, 64) + rng.choice([-1, 0, 0, 1]), 0)
+    else:
+        length = rng.randint(0, 4096)
+    if aligned and (rng.random() < 0.95):
+        length -= length % 16
+    return length
+
+def fuzzShrinkCandidates(case):
+    # Yields smaller or simpler versions of case, the most aggressive first.
+    (subcommand, mode, key, iv, data) = case
+    granularity = 16 if subcommand in ("aes-encrypt", "aes-decrypt", "aes-pad-decrypt") else 1
+    def chunks(length):
+        chunk = length // 2
+        while chunk >= granularity:
+            chunk -= chunk % granularity
+            for start in range(0, length, chunk):
+                yield (start, chunk)
+            chunk //= 2
+    for (start, chunk) in chunks(len(data)):
+        yield (subcommand, mode, key, iv, data[:start] + data[start + chunk:])
+    if (mode == "cbc") and subcommand.endswith("decrypt") and (len(data) > 16):
+        # Decrypting the rest of the input with the first block as the IV gives the same 
+        # result, minus the first block.
+        yield (subcommand, mode, key, data[:16], data[16:])
+    if subcommand == "hmac-sha1":
+        for (start, chunk) in chunks(len(key)):
+            yield (subcommand, mode, key[:start] + key[start + chunk:], iv, data)
+    for (start, chunk) in chunks(len(data)):
+        zeros = "\x00" * len(data[start:start + chunk])
+        if data[start:start + chunk] != zeros:
+            yield (subcommand, mode, key, iv, data[:start] + zeros + data[start + chunk:])
+    if (key is not None) and (key != "\x00" * len(key)):
+        yield (subcommand, mode, "\x00" * len(key), iv, data)
+    if (iv is not None) and (iv != "\x00" * 16):
+        yield (subcommand, mode, key, "\x00" * 16, data)
+
+def minimiseFuzzCase(client, case):
+    # Repeatedly replaces case with the first of its shrink candidates that still fails, 
+    # until none do.  Returns the minimised case and a description of how it fails.
+    progress = True
+    while progress:
+        progress = False
+        for candidate in fuzzShrinkCandidates(case):
+            (status, output) = client.run(*fuzzToolRequest(candidate))
+            if fuzzMismatch(candidate, fuzzExpected(candidate), status, output) is not None:
+                case = candidate
+                progress = True
+                break
+    (status, output) = client.run(*fuzzToolRequest(case))
+    return (case, fuzzMismatch(case, fuzzExpected(case), status, output))
+
+def describeFuzzCase(case):
+    (arguments, payloads) = fuzzToolRequest(case)
+    return "%s file\n    where file contains (%d bytes) %s" % (
+        " ".join(pipes.quote(argument) for argument in arguments[:-1]), 
+        len(payloads[0]), 
+        binascii.hexlify(payloads[0])
+    )
+
+def runFuzzUnit(unit):
+    # Generates and runs one work unit's cases, returning a (caseCount, failures) tuple.  
+    # Each failure is a (case, description) tuple; we only minimise the first failure of 
+    # each kind in a unit.  If something goes wrong in the harness, or the tool dies, case 
+    # is None and the description is the traceback.
+    (seed, unitIndex) = unit
+    rng = random.Random(seed * 1000003 + unitIndex)
+    failures = []
+    cases = []
+    try:
+        for _ in range(kFuzzGroupsPerUnit):
+            (subcommand, mode) = rng.choice(gFuzzKinds)
+            cases.extend(fuzzGroupCases(rng, subcommand, mode))
+        client = BatchClient()
+        try:
+            responses = list(client.runRequests(fuzzToolRequest(case) for (case, _) in cases))
+            failedKinds = set()
+            for ((case, expected), (status, output)) in zip(cases, responses):
+                if (case[:2] not in failedKinds) and (fuzzMismatch(case, expected, status, output) is not None):
+                    failedKinds.add(case[:2])
+                    failures.append(minimiseFuzzCase(client, case))
+        finally:
+            client.close()
+    except Exception:
+        failures.append((None, "unit %d: %s" % (unitIndex, traceback.format_exc())))
+    return (len(cases), failures)
+
+def runFuzz(caseCount, seed, jobs, useProcesses):
+    # Runs at least caseCount cases on a pool of jobs workers, printing each failure as 
+    # it's found.  Returns True if there were no failures.
+    units = [(seed, unitIndex) for unitIndex in range((caseCount + kFuzzUnitCaseCount - 1) // kFuzzUnitCaseCount)]
+    pool = makePool(jobs, useProcesses)
+    if pool is None:
+        resultIter = (runFuzzUnit(unit) for unit in units)
+    else:
+        resultIter = pool.imap_unordered(runFuzzUnit, units)
+
+    start = time.time()
+    totalCases = 0
+    failureCount = 0
+    for (unitCaseCount, failures) in resultIter:
+        totalCases += unitCaseCount
+        for (case, description) in failures:
+            failureCount += 1
+            if case is None:
+                print "ERROR %s" % description
+            else:
+                print "FAIL %s\n    %s" % (describeFuzzCase(case), description)
+            sys.stdout.flush()
+    duration = time.time() - start
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+    print "%d cases, %d failures, %.0f cases/minute (--fuzz-seed %d)" % (totalCases, failureCount, totalCases * 60.0 / duration, seed)
+    return failureCount == 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Tests the command line tool against equivalent OpenSSL commands.")
+    parser.add_argument("tool", nargs="?", help="path to the tool (defaults to the pre-built binary in \"build\")")
+    parser.add_argument("--reference", action="store_true", help="test the pure Python reference implementation of the tool rather than the tool itself")
+    parser.add_argument("-j", "--jobs", type=int, default=multiprocessing.cpu_count(), help="number of checks to run in parallel (default: %(default)s)")
+    parser.add_argument("--processes", action="store_true", help="run checks in a process pool rather than a thread pool")
+    parser.add_argument("--big-sizes", metavar="SIZES", help="comma-separated input sizes for the big cryptor checks, like \"1M,1G,16G\"")
+    parser.add_argument("--benchmark", action="store_true", help="time each subcommand, and its OpenSSL equivalent, rather than running the checks")
+    parser.add_argument("--benchmark-sizes", metavar="SIZES", help="comma-separated input sizes for the benchmarks (default: 0,1K,64K,1M,16M)")
+    parser.add_argument("--benchmark-filter", metavar="SUBSTR", help="only run benchmarks whose subcommand contains SUBSTR")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed runs before each benchmark (default: %(default)s)")
+    parser.add_argument("--repetitions", type=int, default=5, help="timed runs per benchmark (default: %(default)s)")
+    parser.add_argument("--batch-requests", type=int, default=100, metavar="COUNT", help="requests per batch benchmark, or 0 to skip the batch benchmarks (default: %(default)s)")
+    parser.add_argument("--scaling-jobs", metavar="COUNTS", help="comma-separated concurrent operation counts for the parallel batch scaling benchmarks, or \"none\" to skip them (default: 1, 2, 4 and so on up to the number of cores)")
+    parser.add_argument("--chunk-sizes", metavar="SIZES", help="comma-separated chunk sizes for the big cryptor chunk size benchmarks, or \"none\" to skip them (default: 4K,16K,64K,256K,1M,4M)")
+    parser.add_argument("--pbkdf2-rounds", metavar="ROUNDS", help="comma-separated round counts for the PBKDF2 benchmarks, or \"none\" to skip them (default: 1000,10000,100000,1000000)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the benchmarks that compare peak memory use with and without mapped input files")
+    parser.add_argument("--json", metavar="PATH", help="write the benchmark results to PATH as JSON")
+    parser.add_argument("--calibrate", type=int, metavar="RUNS", help="check that PBKDF2 calibration is stable and monotonic over RUNS runs per target time rather than running the checks")
+    parser.add_argument("--calibrate-times", metavar="MS", help="comma-separated target derivation times, in milliseconds, for --calibrate (default: 25,50,100,200)")
+    parser.add_argument("--calibrate-tolerance", type=float, default=kCalibrationTolerance, metavar="FRACTION", help="how far, as a fraction of the median, a --calibrate run can stray before it's deemed unstable (default: %(default)s)")
+    parser.add_argument("--fuzz", type=int, metavar="CASES", help="compare the tool against OpenSSL on CASES random cases rather than running the checks")
+    parser.add_argument("--fuzz-seed", type=int, metavar="SEED", help="seed for the fuzz cases (default: random)")
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("-j must be at least 1")
+    if (args.warmup < 0) or (args.repetitions < 1) or (args.batch_requests < 0):
+        parser.error("invalid --warmup, --repetitions or --batch-requests value")
+
+    if args.reference:
+        if args.tool is not None:
+            parser.error("--reference and a tool path are mutually exclusive")
+        setupPathForTool(pathForReferenceTool())
+    else:
+        setupPathForTool(args.tool)
 
-checkAES128ECBEncryption()
-checkAES128ECBDecryption()
-checkAES128CBCEncryption()
-checkAES128CBCDecryption()
+    global gBigSizes
+    if args.big_sizes is not None:
+        try:
+            gBigSizes = [parseSize(sizeStr) for sizeStr in args.big_sizes.split(",")]
+        except ValueError:
+            parser.error("invalid --big-sizes value")
 
-checkAES256ECBEncryption()
-checkAES256ECBDecryption()
-checkAES256CBCEncryption()
-checkAES256CBCDecryption()
+    if args.calibrate is not None:
+        if args.calibrate < 1:
+            parser.error("--calibrate must be at least 1")
+        times = gCalibrationTimes
+        if args.calibrate_times is not None:
+            try:
+                times = [int(timeStr) for timeStr in args.calibrate_times.split(",")]
+            except ValueError:
+                parser.error("invalid --calibrate-times value")
+            if (min(times) < 1) or (times != sorted(set(times))):
+                parser.error("--calibrate-times must be positive and in increasing order")
+        success = runCalibration(args.calibrate, times, args.calibrate_tolerance, args.json)
+        sys.exit(0 if success else 1)
 
-# I'm not exercising the Pad + ECB case because ECB is a bad idea and 
-# I don't want to encourage it.
+    if args.fuzz is not None:
+        seed = args.fuzz_seed
+        if seed is None:
+            seed = random.SystemRandom().randint(0, 0xFFFFFFFF)
+        success = runFuzz(args.fuzz, seed, args.jobs, args.processes)
+        sys.exit(0 if success else 1)
 
-checkAES128PadCBCEncryption()
-checkAES128PadCBCDecryption()
-checkAES128PadBigCBCEncryption()
-checkAES128PadBigCBCDecryption()
-checkAES256PadCBCEncryption()
-checkAES256PadCBCDecryption()
+    if args.benchmark:
+        sizes = gBenchmarkSizes
+        if args.benchmark_sizes is not None:
+            try:
+                sizes = [parseSize(sizeStr) for sizeStr in args.benchmark_sizes.split(",")]
+            except ValueError:
+                parser.error("invalid --benchmark-sizes value")
+        chunkSizes = gChunkBenchmarkSizes
+        if args.chunk_sizes == "none":
+            chunkSizes = None
+        elif args.chunk_sizes is not None:
+            try:
+                chunkSizes = [parseSize(sizeStr) for sizeStr in args.chunk_sizes.split(",")]
+            except ValueError:
+                parser.error("invalid --chunk-sizes value")
+            if 0 in chunkSizes:
+                parser.error("invalid --chunk-sizes value")
+        scalingJobCounts = defaultScalingJobCounts()
+        if args.scaling_jobs == "none":
+            scalingJobCounts = None
+        elif args.scaling_jobs is not None:
+            try:
+                scalingJobCounts = [int(countStr) for countStr in args.scaling_jobs.split(",")]
+            except ValueError:
+                parser.error("invalid --scaling-jobs value")
+            if min(scalingJobCounts) < 1:
+                parser.error("invalid --scaling-jobs value")
+        pbkdf2Rounds = gPBKDF2BenchmarkRounds
+        if args.pbkdf2_rounds == "none":
+            pbkdf2Rounds = None
+        elif args.pbkdf2_rounds is not None:
+            try:
+                pbkdf2Rounds = [int(roundsStr) for roundsStr in args.pbkdf2_rounds.split(",")]
+            except ValueError:
+                parser.error("invalid --pbkdf2-rounds value")
+            if min(pbkdf2Rounds) < 1:
+                parser.error("invalid --pbkdf2-rounds value")
+        benchmarks = [benchmark for benchmark in gBenchmarks if (args.benchmark_filter is None) or (args.benchmark_filter in benchmark[0])]
+        (results, fits) = runBenchmarks(benchmarks, sizes, args.warmup, args.repetitions)
+        batchResults = []
+        if args.batch_requests != 0:
+            batchResults = runBatchBenchmarks(benchmarks, args.batch_requests, args.warmup)
+        scalingResults = []
+        if (scalingJobCounts is not None) and (args.batch_requests != 0):
+            scalingResults = runScalingBenchmarks(benchmarks, scalingJobCounts, args.batch_requests, args.warmup)
+        chunkResults = []
+        if (chunkSizes is not None) and (max(sizes) != 0):
+            chunkResults = runChunkSizeBenchmarks(benchmarks, chunkSizes, max(sizes), args.warmup, args.repetitions)
+        memoryResults = []
+        if (not args.no_memory) and (max(sizes) != 0):
+            memoryResults = runMemoryBenchmarks(benchmarks, max(sizes))
+        pbkdf2Results = []
+        if (pbkdf2Rounds is not None) and ((args.benchmark_filter is None) or (args.benchmark_filter in "pbkdf2-sha1-key-derivation")):
+            pbkdf2Results = runPBKDF2Benchmarks(pbkdf2Rounds, args.warmup, args.repetitions)
+        if args.json is not None:
+            writeBenchmarkJSON(args.json, results, fits, batchResults, scalingResults, chunkResults, memoryResults, pbkdf2Results, args.warmup, args.repetitions)
+        sys.exit(0)
 
-checkRSAVerifySHA1Digest()
-checkRSASignSHA1Digest()
-checkRSASmallEncrypt()
-checkRSASmallDecrypt()
+    start = time.time()
+    results = runChecks([check.__name__ for check in gChecks], args.jobs, args.processes)
+    success = printSummary(results, time.time() - start)
+    sys.exit(0 if success else 1)
 
-print "Success"
+if __name__ == "__main__":
+    main()
@@ -49,6 +49,8 @@
 
 #import "QCCBase64Encode.h"
 #import "QCCBase64Decode.h"
+#import "QCCBase64BigEncode.h"
+#import "QCCBase64BigDecode.h"
 
 #import "ToolCommon.h"
 
@@ -113,10 +115,85 @@
     STAssertEqualObjects(expectedOutputData, op.outputData, @"");
 }
 
+- (void)testBase64BigEncode
+{
+    NSData *                inputData;
+    NSInputStream *         inputStream;
+    NSOutputStream *        outputStream;
+    QCCBase64BigEncode *    op;
+    NSData *                expectedOutputData;
+    
+    inputData = [NSData dataWithContentsOfURL:[[NSBundle bundleForClass:[self class]] URLForResource:@"test" withExtension:@"cer"]];
+    assert(inputData != nil);
+    
+    inputStream = [NSInputStream inputStreamWithData:inputData];
+    assert(inputStream != nil);
+    
+    outputStream = [NSOutputStream outputStreamToMemory];
+    assert(outputStream != nil);
+    
+    expectedOutputData = [NSData dataWithContentsOfURL:[[NSBundle bundleForClass:[self class]] URLForResource:@"test" withExtension:@"pem"]];
+    assert(expectedOutputData != nil);
+    
+    op = [[QCCBase64BigEncode alloc] initWithInputStream:inputStream outputStream:outputStream];
+    op.addLineBreaks = YES;
+    [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
+    STAssertNil(op.error, @"");
+    STAssertEqualObjects(expectedOutputData, [outputStream propertyForKey:NSStreamDataWrittenToMemoryStreamKey], @"");
+}
+
+- (void)testBase64BigDecode
+{
+    NSData *                inputData;
+    NSInputStream *         inputStream;
+    NSOutputStream *        outputStream;
+    QCCBase64BigDecode *    op;
+    NSData *                expectedOutputData;
+    
+    inputData = [NSData dataWithContentsOfURL:[[NSBundle bundleForClass:[self class]] URLForResource:@"test" withExtension:@"pem"]];
+    assert(inputData != nil);
+    
+    inputStream = [NSInputStream inputStreamWithData:inputData];
+    assert(inputStream != nil);
+    
+    outputStream = [NSOutputStream outputStreamToMemory];
+    assert(outputStream != nil);
+    
+    expectedOutputData = [NSData dataWithContentsOfURL:[[NSBundle bundleForClass:[self class]] URLForResource:@"test" withExtension:@"cer"]];
+    assert(expectedOutputData != nil);
+    
+    op = [[QCCBase64BigDecode alloc] initWithInputStream:inputStream outputStream:outputStream];
+    [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
+    STAssertNil(op.error, @"");
+    STAssertEqualObjects(expectedOutputData, [outputStream propertyForKey:NSStreamDataWrittenToMemoryStreamKey], @"");
+}
+
+- (void)testBase64BigDecodeError
+{
+    NSInputStream *         inputStream;
+    NSOutputStream *        outputStream;
+    QCCBase64BigDecode *    op;
+    
+    // "QR==" has non-zero bits after its one byte, so b64_pton rejects it, and so must we.
+    
+    inputStream = [NSInputStream inputStreamWithData:[@"QR==" dataUsingEncoding:NSUTF8StringEncoding]];
+    assert(inputStream != nil);
+    
+    outputStream = [NSOutputStream outputStreamToMemory];
+    assert(outputStream != nil);
+    
+    op = [[QCCBase64BigDecode alloc] initWithInputStream:inputStream outputStream:outputStream];
+    [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
+    STAssertEqualObjects([op.error domain], NSCocoaErrorDomain, @"");
+    STAssertEquals([op.error code], (NSInteger) NSFileReadCorruptFileError, @"");
+}
+
 - (void)testBase64Throws
 {
     STAssertThrows((void) [[QCCBase64Encode alloc] initWithInputData:nil], @"");
     STAssertThrows((void) [[QCCBase64Decode alloc] initWithInputString:nil], @"");
+    STAssertThrows((void) [[QCCBase64BigEncode alloc] initWithInputStream:nil outputStream:[NSOutputStream outputStreamToMemory]], @"");
+    STAssertThrows((void) [[QCCBase64BigDecode alloc] initWithInputStream:[NSInputStream inputStreamWithData:[NSData data]] outputStream:nil], @"");
 }
 
 @end
@@ -0,0 +1,1706 @@
+#! /usr/bin/python
+#
+#     File: CryptoCompatibilityReference.py
+# Abstract: A pure Python implementation of the command line tool.
+#  Version: 1.0
+# 
+# Disclaimer: IMPORTANT:  This Apple software is supplied to you by Apple
+# Inc. ("Apple") in consideration of your agreement to the following
+# terms, and your use, installation, modification or redistribution of
+# this Apple software constitutes acceptance of these terms.  If you do
+# not agree with these terms, please do not use, install, modify or
+# redistribute this Apple software.
+# 
+# In consideration of your agreement to abide by the following terms, and
+# subject to these terms, Apple grants you a personal, non-exclusive
+# license, under Apple's copyrights in this original Apple software (the
+# "Apple Software"), to use, reproduce, modify and redistribute the Apple
+# Software, with or without modifications, in source and/or binary forms;
+# provided that if you redistribute the Apple Software in its entirety and
+# without modifications, you must retain this notice and the following
+# text and disclaimers in all such redistributions of the Apple Software.
+# Neither the name, trademarks, service marks or logos of Apple Inc. may
+# be used to endorse or promote products derived from the Apple Software
+# without specific prior written permission from Apple.  Except as
+# expressly stated in this notice, no other rights or licenses, express or
+# implied, are granted by Apple herein, including but not limited to any
+# patent rights that may be infringed by your derivative works or by other
+# works in which the Apple Software may be incorporated.
+# 
+# The Apple Software is provided by Apple on an "AS IS" basis.  APPLE
+# MAKES NO WARRANTIES, EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION
+# THE IMPLIED WARRANTIES OF NON-INFRINGEMENT, MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE, REGARDING THE APPLE SOFTWARE OR ITS USE AND
+# OPERATION ALONE OR IN COMBINATION WITH YOUR PRODUCTS.
+# 
+# IN NO EVENT SHALL APPLE BE LIABLE FOR ANY SPECIAL, INDIRECT, INCIDENTAL
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) ARISING IN ANY WAY OUT OF THE USE, REPRODUCTION,
+# MODIFICATION AND/OR DISTRIBUTION OF THE APPLE SOFTWARE, HOWEVER CAUSED
+# AND WHETHER UNDER THEORY OF CONTRACT, TORT (INCLUDING NEGLIGENCE),
+# STRICT LIABILITY OR OTHERWISE, EVEN IF APPLE HAS BEEN ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# 
+# Copyright (C) 2013 Apple Inc. All Rights Reserved.
+# 
+#
+
+# This script has the same command line interface as the tool built by the 
+# "CryptoCompatibility" target (see "Tool/main.m"), and produces the same output 
+# and errors, but it's built on hashlib, hmac and the AES and RSA code below rather 
+# than on CommonCrypto and the Security framework.  That lets you run the OpenSSL 
+# test script where the tool can't be built, like so:
+#
+# $ UnitTest/ATestAgainstOpenSSL.py --reference
+#
+# There's no keychain, so the RSA commands map the key names used by the test script 
+# to the corresponding files in "TestData".
+#
+# NumPy is optional.  If it's installed, the AES code uses it to speed up ECB and CBC 
+# decryption.
+
+import sys
+import os
+import getopt
+import hashlib
+import hmac
+import binascii
+import struct
+import time
+import errno
+import cStringIO
+import collections
+import threading
+import Queue
+import multiprocessing
+import multiprocessing.pool
+
+try:
+    import numpy
+except ImportError:
+    numpy = None        # optional; see "Vectorised AES" below
+
+# Error domains and codes, as reported by the tool.
+
+kNSCocoaErrorDomain = "NSCocoaErrorDomain"
+kNSPOSIXErrorDomain = "NSPOSIXErrorDomain"
+kNSOSStatusErrorDomain = "NSOSStatusErrorDomain"
+
+kNSFileReadUnknownError = 256
+kNSFileReadNoPermissionError = 257
+kNSFileReadCorruptFileError = 259
+kNSFileReadNoSuchFileError = 260
+kNSFileReadInapplicableStringEncodingError = 261
+
+kCCParamError = -4300
+kCCAlignmentError = -4303
+kCCDecodeError = -4304
+
+kErrSecParam = -50
+kErrSecItemNotFound = -25300
+kErrSecDecode = -26275
+
+class ToolError(Exception):
+    # An error that the tool reports as "domain / code".
+    def __init__(self, domain, code):
+        Exception.__init__(self, "%s / %d" % (domain, code))
+        self.domain = domain
+        self.code = code
+
+class UsageError(Exception):
+    pass
+
+# ---------------------------------------------------------------------------
+
+# The equivalent of ToolCommon.  Commands read their input files and write their output 
+# via gToolCommon so that the batch command can supply input from memory and capture 
+# output.
+
+class ToolCommon(object):
+    # As in the tool, inputDataByPath and outputData are per thread, so that "batch -p" 
+    # can run several commands at once.
+
+    def __init__(self):
+        self.perThread = threading.local()
+        self.binaryOutput = False
+        self.maxConcurrentOperationCount = multiprocessing.cpu_count()
+
+    @property
+    def inputDataByPath(self):
+        return getattr(self.perThread, "inputDataByPath", None)
+
+    @inputDataByPath.setter
+    def inputDataByPath(self, value):
+        self.perThread.inputDataByPath = value
+
+    @property
+    def outputData(self):
+        return getattr(self.perThread, "outputData", None)
+
+    @outputData.setter
+    def outputData(self, value):
+        self.perThread.outputData = value
+
+    def dataWithContentsOfFile(self, path):
+        if (self.inputDataByPath is not None) and (path in self.inputDataByPath):
+            return self.inputDataByPath[path]
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except IOError, e:
+            raise ToolError(kNSCocoaErrorDomain, {
+                errno.ENOENT: kNSFileReadNoSuchFileError, 
+                errno.EACCES: kNSFileReadNoPermissionError
+            }.get(e.errno, kNSFileReadUnknownError))
+
+    def inputStreamWithContentsOfFile(self, path):
+        # Returns a file-like object.  Errors are reported as the stream errors the tool 
+        # gets back from NSInputStream.
+        if (self.inputDataByPath is not None) and (path in self.inputDataByPath):
+            return cStringIO.StringIO(self.inputDataByPath[path])
+        try:
+            return open(path, "rb")
+        except IOError, e:
+            raise ToolError(kNSPOSIXErrorDomain, e.errno)
+
+    def writeOutputData(self, data):
+        if self.outputData is not None:
+            self.outputData.append(data)
+        else:
+            sys.stdout.write(data)
+
+    def writeOutputLine(self, line):
+        self.writeOutputData(line + "\n")
+
+    def writeOutputDataAsHexLine(self, data):
+        if self.binaryOutput:
+            self.writeOutputData(data)
+        else:
+            self.writeOutputLine(binascii.hexlify(data))
+
+gToolCommon = ToolCommon()
+
+def dataWithHexString(hexStr):
+    # Like +[QHex dataWithHexString:], returns None if the string has an odd length or 
+    # contains anything other than hex digits.
+    try:
+        return binascii.unhexlify(hexStr)
+    except TypeError:
+        return None
+
+def integerValue(argument):
+    # Like -[NSString integerValue], which parses any leading integer and returns 0 
+    # if there isn't one.
+    argument = argument.lstrip()
+    sign = 1
+    if argument[:1] in ("+", "-"):
+        sign = -1 if argument[0] == "-" else 1
+        argument = argument[1:]
+    digits = ""
+    while (len(argument) != 0) and argument[0].isdigit():
+        digits += argument[0]
+        argument = argument[1:]
+    return sign * int(digits) if len(digits) != 0 else 0
+
+# ---------------------------------------------------------------------------
+
+# Base64, with the same rules as b64_ntop and b64_pton.
+
+kBase64Alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+kBase64Whitespace = " \t\n\v\f\r"
+
+def base64Encode(data, addLineBreaks):
+    result = binascii.b2a_base64(data)[:-1]
+    if addLineBreaks:
+        result = "".join(result[i:i+64] + "\n" for i in range(0, len(result), 64))
+    return result
+
+def base64Decode(string):
+    # Returns None if the string isn't valid Base64.  Like b64_pton, this ignores 
+    # whitespace, requires correct padding, and rejects non-zero bits after the 
+    # last full byte.
+    string = string.translate(None, kBase64Whitespace)
+    body = string.rstrip("=")
+    padding = string[len(body):]
+    if body.strip(kBase64Alphabet) != "":
+        return None
+    if (len(body) % 4) != {"": 0, "=": 3, "==": 2}.get(padding, -1):
+        return None
+    result = binascii.a2b_base64(string)
+    if binascii.b2a_base64(result)[:-1] != string:
+        return None
+    return result
+
+# ---------------------------------------------------------------------------
+
+# AES, using the usual 32-bit table-driven implementation.  The tables are computed 
+# at start-up from the field arithmetic rather than being written out.
+
+def generateAESTables():
+    expTable = [0] * 256
+    logTable = [0] * 256
+    x = 1
+    for i in range(255):
+        expTable[i] = x
+        logTable[x] = i
+        x ^= (x << 1) ^ (0x11b if (x & 0x80) else 0)     # multiply by 3
+    def gmul(a, b):
+        if (a == 0) or (b == 0):
+            return 0
+        return expTable[(logTable[a] + logTable[b]) % 255]
+
+    sBox = [0x63] * 256
+    for a in range(1, 256):
+        inverse = expTable[(255 - logTable[a]) % 255]
+        s = inverse
+        for shift in range(1, 5):
+            s ^= ((inverse << shift) | (inverse >> (8 - shift))) & 0xff
+        sBox[a] = s ^ 0x63
+    invSBox = [0] * 256
+    for a in range(256):
+        invSBox[sBox[a]] = a
+
+    def rotations(table):
+        result = [table]
+        for _ in range(3):
+            table = [((t >> 8) | (t << 24)) & 0xffffffff for t in table]
+            result.append(table)
+        return result
+
+    te = rotations([(gmul(s, 2) << 24) | (s << 16) | (s << 8) | gmul(s, 3) for s in sBox])
+    td = rotations([(gmul(s, 14) << 24) | (gmul(s, 9) << 16) | (gmul(s, 13) << 8) | gmul(s, 11) for s in invSBox])
+    return (sBox, invSBox, te, td)
+
+(kAESSBox, kAESInvSBox, (kAESTe0, kAESTe1, kAESTe2, kAESTe3), (kAESTd0, kAESTd1, kAESTd2, kAESTd3)) = generateAESTables()
+
+# The last round has no MixColumns, so it uses the S-boxes shifted into each byte position.
+
+kAESSBoxShifted = [[s << shift for s in kAESSBox] for shift in (24, 16, 8, 0)]
+kAESInvSBoxShifted = [[s << shift for s in kAESInvSBox] for shift in (24, 16, 8, 0)]
+
+# Vectorised AES.  If NumPy is available, AESKey can also process an array of independent 
+# blocks in one go, doing each table lookup for every block at once.  AESCryptor uses that 
+# for ECB and for CBC decryption, where each block depends only on the input, but not for 
+# CBC encryption, where each block depends on the previous block's output.  AESCTRCryptor 
+# uses it to generate its key stream, which depends only on the counter.
+
+if numpy is not None:
+    (kAESTeArrays, kAESTdArrays, kAESSBoxShiftedArrays, kAESInvSBoxShiftedArrays) = [
+        [numpy.array(table, dtype=numpy.uint32) for table in tables] 
+        for tables in ((kAESTe0, kAESTe1, kAESTe2, kAESTe3), (kAESTd0, kAESTd1, kAESTd2, kAESTd3), kAESSBoxShifted, kAESInvSBoxShifted)
+    ]
+
+# Below this many blocks the per-call overhead of NumPy outweighs the savings.
+
+kAESVectorMinimumBlocks = 64
+
+class AESKey(object):
+    # An expanded AES key, with methods to encrypt and decrypt a block held as four 
+    # big endian 32-bit words.
+
+    def __init__(self, keyData):
+        assert len(keyData) in (16, 24, 32)
+        keyWords = len(keyData) // 4
+        self.rounds = keyWords + 6
+        words = list(struct.unpack(">%dI" % keyWords, keyData))
+        rcon = 1
+        for i in range(keyWords, 4 * (self.rounds + 1)):
+            t = words[i - 1]
+            if (i % keyWords) == 0:
+                t = (kAESSBox[(t >> 16) & 0xff] << 24) | (kAESSBox[(t >> 8) & 0xff] << 16) | (kAESSBox[t & 0xff] << 8) | kAESSBox[t >> 24]
+                t ^= rcon << 24
+                rcon = (rcon << 1) ^ (0x11b if (rcon & 0x80) else 0)
+            elif (keyWords > 6) and ((i % keyWords) == 4):
+                t = (kAESSBox[t >> 24] << 24) | (kAESSBox[(t >> 16) & 0xff] << 16) | (kAESSBox[(t >> 8) & 0xff] << 8) | kAESSBox[t & 0xff]
+            words.append(words[i - keyWords] ^ t)
+        self.encryptKeys = words
+
+        # The decryption keys are for the equivalent inverse cipher: the round keys in 
+        # reverse order, with InvMixColumns applied to all but the first and last.
+        decryptKeys = []
+        for r in range(self.rounds, -1, -1):
+            roundKeys = words[4 * r:4 * r + 4]
+            if (r != 0) and (r != self.rounds):
+                roundKeys = [
+                    kAESTd0[kAESSBox[w >> 24]] ^ kAESTd1[kAESSBox[(w >> 16) & 0xff]] ^ kAESTd2[kAESSBox[(w >> 8) & 0xff]] ^ kAESTd3[kAESSBox[w & 0xff]] 
+                    for w in roundKeys
+                ]
+            decryptKeys.extend(roundKeys)
+        self.decryptKeys = decryptKeys
+
+        if numpy is not None:
+            self.encryptKeyArray = numpy.array(self.encryptKeys, dtype=numpy.uint32).reshape(-1, 4)
+            self.decryptKeyArray = numpy.array(self.decryptKeys, dtype=numpy.uint32).reshape(-1, 4)
+
+    def encryptWords(self, s0, s1, s2, s3):
+        te0, te1, te2, te3 = kAESTe0, kAESTe1, kAESTe2, kAESTe3
+        rk = self.encryptKeys
+        s0 ^= rk[0]
+        s1 ^= rk[1]
+        s2 ^= rk[2]
+        s3 ^= rk[3]
+        i = 4
+        for _ in range(self.rounds - 1):
+            t0 = te0[s0 >> 24] ^ te1[(s1 >> 16) & 0xff] ^ te2[(s2 >> 8) & 0xff] ^ te3[s3 & 0xff] ^ rk[i]
+            t1 = te0[s1 >> 24] ^ te1[(s2 >> 16) & 0xff] ^ te2[(s3 >> 8) & 0xff] ^ te3[s0 & 0xff] ^ rk[i + 1]
+            t2 = te0[s2 >> 24] ^ te1[(s3 >> 16) & 0xff] ^ te2[(s0 >> 8) & 0xff] ^ te3[s1 & 0xff] ^ rk[i + 2]
+            t3 = te0[s3 >> 24] ^ te1[(s0 >> 16) & 0xff] ^ te2[(s1 >> 8) & 0xff] ^ te3[s2 & 0xff] ^ rk[i + 3]
+            s0, s1, s2, s3 = t0, t1, t2, t3
+            i += 4
+        f0, f1, f2, f3 = kAESSBoxShifted
+        return (
+            (f0[s0 >> 24] | f1[(s1 >> 16) & 0xff] | f2[(s2 >> 8) & 0xff] | f3[s3 & 0xff]) ^ rk[i], 
+            (f0[s1 >> 24] | f1[(s2 >> 16) & 0xff] | f2[(s3 >> 8) & 0xff] | f3[s0 & 0xff]) ^ rk[i + 1], 
+            (f0[s2 >> 24] | f1[(s3 >> 16) & 0xff] | f2[(s0 >> 8) & 0xff] | f3[s1 & 0xff]) ^ rk[i + 2], 
+            (f0[s3 >> 24] | f1[(s0 >> 16) & 0xff] | f2[(s1 >> 8) & 0xff] | f3[s2 & 0xff]) ^ rk[i + 3]
+        )
+
+    def decryptWords(self, s0, s1, s2, s3):
+        td0, td1, td2, td3 = kAESTd0, kAESTd1, kAESTd2, kAESTd3
+        rk = self.decryptKeys
+        s0 ^= rk[0]
+        s1 ^= rk[1]
+        s2 ^= rk[2]
+        s3 ^= rk[3]
+        i = 4
+        for _ in range(self.rounds - 1):
+            t0 = td0[s0 >> 24] ^ td1[(s3 >> 16) & 0xff] ^ td2[(s2 >> 8) & 0xff] ^ td3[s1 & 0xff] ^ rk[i]
+            t1 = td0[s1 >> 24] ^ td1[(s0 >> 16) & 0xff] ^ td2[(s3 >> 8) & 0xff] ^ td3[s2 & 0xff] ^ rk[i + 1]
+            t2 = td0[s2 >> 24] ^ td1[(s1 >> 16) & 0xff] ^ td2[(s0 >> 8) & 0xff] ^ td3[s3 & 0xff] ^ rk[i + 2]
+            t3 = td0[s3 >> 24] ^ td1[(s2 >> 16) & 0xff] ^ td2[(s1 >> 8) & 0xff] ^ td3[s0 & 0xff] ^ rk[i + 3]
+            s0, s1, s2, s3 = t0, t1, t2, t3
+            i += 4
+        f0, f1, f2, f3 = kAESInvSBoxShifted
+        return (
+            (f0[s0 >> 24] | f1[(s3 >> 16) & 0xff] | f2[(s2 >> 8) & 0xff] | f3[s1 & 0xff]) ^ rk[i], 
+            (f0[s1 >> 24] | f1[(s0 >> 16) & 0xff] | f2[(s3 >> 8) & 0xff] | f3[s2 & 0xff]) ^ rk[i + 1], 
+            (f0[s2 >> 24] | f1[(s1 >> 16) & 0xff] | f2[(s0 >> 8) & 0xff] | f3[s3 & 0xff]) ^ rk[i + 2], 
+            (f0[s3 >> 24] | f1[(s2 >> 16) & 0xff] | f2[(s1 >> 8) & 0xff] | f3[s0 & 0xff]) ^ rk[i + 3]
+        )
+
+    def encryptBlocks(self, s):
+        # Like encryptWords, but for an n x 4 NumPy array of uint32 words, one row per block.
+        te0, te1, te2, te3 = kAESTeArrays
+        rk = self.encryptKeyArray
+        s = s ^ rk[0]
+        s0, s1, s2, s3 = s[:, 0], s[:, 1], s[:, 2], s[:, 3]
+        for r in range(1, self.rounds):
+            t0 = te0[s0 >> 24] ^ te1[(s1 >> 16) & 0xff] ^ te2[(s2 >> 8) & 0xff] ^ te3[s3 & 0xff] ^ rk[r, 0]
+            t1 = te0[s1 >> 24] ^ te1[(s2 >> 16) & 0xff] ^ te2[(s3 >> 8) & 0xff] ^ te3[s0 & 0xff] ^ rk[r, 1]
+            t2 = te0[s2 >> 24] ^ te1[(s3 >> 16) & 0xff] ^ te2[(s0 >> 8) & 0xff] ^ te3[s1 & 0xff] ^ rk[r, 2]
+            t3 = te0[s3 >> 24] ^ te1[(s0 >> 16) & 0xff] ^ te2[(s1 >> 8) & 0xff] ^ te3[s2 & 0xff] ^ rk[r, 3]
+            s0, s1, s2, s3 = t0, t1, t2, t3
+        f0, f1, f2, f3 = kAESSBoxShiftedArrays
+        r = self.rounds
+        return numpy.column_stack((
+            (f0[s0 >> 24] | f1[(s1 >> 16) & 0xff] | f2[(s2 >> 8) & 0xff] | f3[s3 & 0xff]) ^ rk[r, 0], 
+            (f0[s1 >> 24] | f1[(s2 >> 16) & 0xff] | f2[(s3 >> 8) & 0xff] | f3[s0 & 0xff]) ^ rk[r, 1], 
+            (f0[s2 >> 24] | f1[(s3 >> 16) & 0xff] | f2[(s0 >> 8) & 0xff] | f3[s1 & 0xff]) ^ rk[r, 2], 
+            (f0[s3 >> 24] | f1[(s0 >> 16) & 0xff] | f2[(s1 >> 8) & 0xff] | f3[s2 & 0xff]) ^ rk[r, 3]
+        ))
+
+    def decryptBlocks(self, s):
+        # Like decryptWords, but for an n x 4 NumPy array of uint32 words, one row per block.
+        td0, td1, td2, td3 = kAESTdArrays
+        rk = self.decryptKeyArray
+        s = s ^ rk[0]
+        s0, s1, s2, s3 = s[:, 0], s[:, 1], s[:, 2], s[:, 3]
+        for r in range(1, self.rounds):
+            t0 = td0[s0 >> 24] ^ td1[(s3 >> 16) & 0xff] ^ td2[(s2 >> 8) & 0xff] ^ td3[s1 & 0xff] ^ rk[r, 0]
+            t1 = td0[s1 >> 24] ^ td1[(s0 >> 16) & 0xff] ^ td2[(s3 >> 8) & 0xff] ^ td3[s2 & 0xff] ^ rk[r, 1]
+            t2 = td0[s2 >> 24] ^ td1[(s1 >> 16) & 0xff] ^ td2[(s0 >> 8) & 0xff] ^ td3[s3 & 0xff] ^ rk[r, 2]
+            t3 = td0[s3 >> 24] ^ td1[(s2 >> 16) & 0xff] ^ td2[(s1 >> 8) & 0xff] ^ td3[s0 & 0xff] ^ rk[r, 3]
+            s0, s1, s2, s3 = t0, t1, t2, t3
+        f0, f1, f2, f3 = kAESInvSBoxShiftedArrays
+        r = self.rounds
+        return numpy.column_stack((
+            (f0[s0 >> 24] | f1[(s3 >> 16) & 0xff] | f2[(s2 >> 8) & 0xff] | f3[s1 & 0xff]) ^ rk[r, 0], 
+            (f0[s1 >> 24] | f1[(s0 >> 16) & 0xff] | f2[(s3 >> 8) & 0xff] | f3[s2 & 0xff]) ^ rk[r, 1], 
+            (f0[s2 >> 24] | f1[(s1 >> 16) & 0xff] | f2[(s0 >> 8) & 0xff] | f3[s3 & 0xff]) ^ rk[r, 2], 
+            (f0[s3 >> 24] | f1[(s2 >> 16) & 0xff] | f2[(s1 >> 8) & 0xff] | f3[s0 & 0xff]) ^ rk[r, 3]
+        ))
+
+class CommonCryptoError(Exception):
+    def __init__(self, code):
+        Exception.__init__(self, code)
+        self.code = code
+
+class AESCryptor(object):
+    # The equivalent of a CommonCrypto AES cryptor: ECB if ivData is None, CBC otherwise, 
+    # optionally with PKCS#7 padding.  Feed the data through -update and then call -final.
+
+    def __init__(self, encrypt, keyData, ivData, padding):
+        if (len(keyData) not in (16, 24, 32)) or ((ivData is not None) and (len(ivData) != 16)):
+            raise CommonCryptoError(kCCParamError)
+        self.encrypt = encrypt
+        self.key = AESKey(keyData)
+        self.chain = None if ivData is None else struct.unpack(">4I", ivData)
+        self.padding = padding
+        self.pending = ""
+
+    def processBlocks(self, data):
+        # Encrypts or decrypts data, which must be a whole number of blocks.
+        if len(data) == 0:
+            return ""
+        if (numpy is not None) and ((len(data) // 16) >= kAESVectorMinimumBlocks) and not (self.encrypt and (self.chain is not None)):
+            return self.processBlocksVectorised(data)
+        words = struct.unpack(">%dI" % (len(data) // 4), data)
+        result = []
+        append = result.extend
+        chain = self.chain
+        if self.encrypt:
+            encryptWords = self.key.encryptWords
+            for i in xrange(0, len(words), 4):
+                if chain is None:
+                    append(encryptWords(words[i], words[i + 1], words[i + 2], words[i + 3]))
+                else:
+                    chain = encryptWords(words[i] ^ chain[0], words[i + 1] ^ chain[1], words[i + 2] ^ chain[2], words[i + 3] ^ chain[3])
+                    append(chain)
+        else:
+            decryptWords = self.key.decryptWords
+            for i in xrange(0, len(words), 4):
+                (p0, p1, p2, p3) = decryptWords(words[i], words[i + 1], words[i + 2], words[i + 3])
+                if chain is None:
+                    append((p0, p1, p2, p3))
+                else:
+                    append((p0 ^ chain[0], p1 ^ chain[1], p2 ^ chain[2], p3 ^ chain[3]))
+                    chain = words[i:i + 4]
+        self.chain = chain
+        return struct.pack(">%dI" % len(result), *result)
+
+    def processBlocksVectorised(self, data):
+        # Like processBlocks, but using NumPy.  Not for CBC encryption.
+        words = numpy.frombuffer(data, dtype=">u4").astype(numpy.uint32).reshape(-1, 4)
+        if self.encrypt:
+            result = self.key.encryptBlocks(words)
+        else:
+            result = self.key.decryptBlocks(words)
+            if self.chain is not None:
+                result[0] ^= numpy.array(self.chain, dtype=numpy.uint32)
+                result[1:] ^= words[:-1]
+                self.chain = tuple(int(w) for w in words[-1])
+        return result.astype(">u4").tostring()
+
+    def update(self, data):
+        data = self.pending + data
+        blockBytes = len(data) - (len(data) % 16)
+        if (not self.encrypt) and self.padding and (blockBytes == len(data)) and (blockBytes != 0):
+            # Hold back the last block, because it's the one with the padding.
+            blockBytes -= 16
+        self.pending = data[blockBytes:]
+        return self.processBlocks(data[:blockBytes])
+
+    def final(self):
+        pending = self.pending
+        self.pending = ""
+        if self.encrypt and self.padding:
+            padLength = 16 - len(pending)
+            return self.processBlocks(pending + chr(padLength) * padLength)
+        elif self.padding:
+            if len(pending) == 0:
+                raise CommonCryptoError(kCCDecodeError)
+            if len(pending) != 16:
+                raise CommonCryptoError(kCCAlignmentError)
+            block = self.processBlocks(pending)
+            padLength = ord(block[-1])
+            if (padLength < 1) or (padLength > 16) or (block[-padLength:] != block[-1] * padLength):
+                raise CommonCryptoError(kCCDecodeError)
+            return block[:-padLength]
+        else:
+            if len(pending) != 0:
+                raise CommonCryptoError(kCCAlignmentError)
+            return ""
+
+class AESCTRCryptor(object):
+    # The equivalent of a CommonCrypto AES cryptor in CTR mode with a big endian counter.  
+    # The counter block is a 128-bit integer, incremented for each block and wrapping 
+    # around at 2^128, whose encryption is the key stream.  Encryption and decryption are 
+    # the same thing, namely XORing the data with the key stream, so there's no padding 
+    # and -final never returns anything.
+
+    def __init__(self, keyData, counterData):
+        if (len(keyData) not in (16, 24, 32)) or (len(counterData) != 16):
+            raise CommonCryptoError(kCCParamError)
+        self.key = AESKey(keyData)
+        self.counter = bytesToInt(counterData)
+        self.keyStream = ""
+
+    def keyStreamBlocks(self, count):
+        # Returns the next count blocks of key stream.
+        counter = self.counter
+        self.counter = (counter + count) % (1 << 128)
+        if (numpy is not None) and (count >= kAESVectorMinimumBlocks):
+            return self.keyStreamBlocksVectorised(counter, count)
+        result = []
+        append = result.extend
+        encryptWords = self.key.encryptWords
+        for i in xrange(count):
+            c = (counter + i) % (1 << 128)
+            append(encryptWords(c >> 96, (c >> 64) & 0xffffffff, (c >> 32) & 0xffffffff, c & 0xffffffff))
+        return struct.pack(">%dI" % len(result), *result)
+
+    def keyStreamBlocksVectorised(self, counter, count):
+        # Like keyStreamBlocks, but using NumPy.  The low word of each counter block is 
+        # computed in 64 bits, so its top half is the carry into the high 96 bits, which 
+        # takes only a handful of distinct values.
+        low = numpy.uint64(counter & 0xffffffff) + numpy.arange(count, dtype=numpy.uint64)
+        carries = low >> numpy.uint64(32)
+        words = numpy.empty((count, 4), dtype=numpy.uint32)
+        words[:, 3] = low & numpy.uint64(0xffffffff)
+        for carry in numpy.unique(carries):
+            high = ((counter >> 32) + int(carry)) % (1 << 96)
+            words[carries == carry, 0:3] = (high >> 64, (high >> 32) & 0xffffffff, high & 0xffffffff)
+        return self.key.encryptBlocks(words).astype(">u4").tostring()
+
+    def update(self, data):
+        if len(data) == 0:
+            return ""
+        if len(self.keyStream) < len(data):
+            self.keyStream += self.keyStreamBlocks((len(data) - len(self.keyStream) + 15) // 16)
+        keyStream = self.keyStream[:len(data)]
+        self.keyStream = self.keyStream[len(data):]
+        return intToBytes(bytesToInt(data) ^ bytesToInt(keyStream), len(data))
+
+    def final(self):
+        return ""
+
+# ---------------------------------------------------------------------------
+
+# RSA.  The tool looks up its keys in the keychain by name; we look them up in the 
+# following table, whose paths are relative to "TestData".
+
+kRSAKeyFilesByName = {
+    ("public",  "Imported Public Key"):  "public.pem", 
+    ("private", "Imported Private Key"): "private.pem", 
+}
+
+kRSASHA1DigestInfoPrefix = binascii.unhexlify("3021300906052b0e03021a05000414")
+
+def pathForKeyFile(fileName):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "TestData", fileName)
+
+def derElements(data):
+    # Parses the concatenated DER elements in data, returning a list of (tag, contents) tuples.
+    result = []
+    offset = 0
+    while offset < len(data):
+        tag = ord(data[offset])
+        length = ord(data[offset + 1])
+        offset += 2
+        if length & 0x80:
+            lengthBytes = length & 0x7f
+            length = int(binascii.hexlify(data[offset:offset + lengthBytes]), 16)
+            offset += lengthBytes
+        result.append((tag, data[offset:offset + length]))
+        offset += length
+    return result
+
+def bytesToInt(data):
+    return int(binascii.hexlify(data), 16) if len(data) != 0 else 0
+
+def intToBytes(value, length):
+    hexStr = "%x" % value
+    return binascii.unhexlify(hexStr.rjust(length * 2, "0"))
+
+class RSAKey(object):
+
+    def __init__(self, n, e, d=None, p=None, q=None):
+        self.n = n
+        self.e = e
+        self.d = d
+        self.p = p
+        self.q = q
+        self.blockSize = (n.bit_length() + 7) // 8
+
+    @classmethod
+    def fromPEMFile(cls, path):
+        # Reads a key from an OpenSSL style PEM file, skipping any attributes before 
+        # the key itself.  This supports PKCS#1 RSA private keys, PKCS#8 private keys, 
+        # and X.509 SubjectPublicKeyInfo public keys.
+        lines = open(path, "rb").read().splitlines()
+        begin = [i for (i, line) in enumerate(lines) if line.startswith("-----BEGIN ")][0]
+        end = [i for (i, line) in enumerate(lines) if line.startswith("-----END ")][0]
+        label = lines[begin][len("-----BEGIN "):].rstrip("-")
+        der = binascii.a2b_base64("".join(line for line in lines[begin + 1:end] if ":" not in line))
+        (_, contents) = derElements(der)[0]
+        if label == "PUBLIC KEY":
+            (_, bitString) = derElements(contents)[1]
+            (_, publicKey) = derElements(bitString[1:])[0]
+            (n, e) = [bytesToInt(value) for (_, value) in derElements(publicKey)]
+            return cls(n, e)
+        if label == "PRIVATE KEY":
+            (_, privateKey) = derElements(contents)[2]
+            (_, contents) = derElements(privateKey)[0]
+        values = [bytesToInt(value) for (_, value) in derElements(contents)]
+        return cls(values[1], values[2], values[3], values[4], values[5])
+
+    def public(self, value):
+        return pow(value, self.e, self.n)
+
+    def private(self, value):
+        if (self.p is None) or (self.q is None):
+            return pow(value, self.d, self.n)
+        # Use the CRT, which is about four times faster.
+        m1 = pow(value, self.d % (self.p - 1), self.p)
+        m2 = pow(value, self.d % (self.q - 1), self.q)
+        h = (pow(self.q, self.p - 2, self.p) * (m1 - m2)) % self.p
+        return m2 + h * self.q
+
+gRSAKeys = {}
+
+def rsaKeyNamed(keyClass, keyName):
+    if (keyClass, keyName) not in kRSAKeyFilesByName:
+        # This is what the tool reports if the key isn't in the keychain.
+        raise ToolError(kNSPOSIXErrorDomain, kErrSecItemNotFound)
+    if (keyClass, keyName) not in gRSAKeys:
+        gRSAKeys[(keyClass, keyName)] = RSAKey.fromPEMFile(pathForKeyFile(kRSAKeyFilesByName[(keyClass, keyName)]))
+    return gRSAKeys[(keyClass, keyName)]
+
+def rsaSHA1Signature(key, data):
+    digestInfo = kRSASHA1DigestInfoPrefix + hashlib.sha1(data).digest()
+    encoded = "\x00\x01" + "\xff" * (key.blockSize - len(digestInfo) - 3) + "\x00" + digestInfo
+    return intToBytes(key.private(bytesToInt(encoded)), key.blockSize)
+
+def rsaSHA1Verify(key, signatureData, data):
+    if len(signatureData) != key.blockSize:
+        return False
+    signature = bytesToInt(signatureData)
+    if signature >= key.n:
+        return False
+    digestInfo = kRSASHA1DigestInfoPrefix + hashlib.sha1(data).digest()
+    expected = "\x00\x01" + "\xff" * (key.blockSize - len(digestInfo) - 3) + "\x00" + digestInfo
+    return intToBytes(key.public(signature), key.blockSize) == expected
+
+def rsaSmallEncrypt(key, data, padding):
+    if padding == "none":
+        if len(data) != key.blockSize:
+            raise ToolError(kNSOSStatusErrorDomain, kErrSecParam)
+        encoded = data
+    else:
+        if (len(data) + 11) > key.blockSize:
+            raise ToolError(kNSOSStatusErrorDomain, kErrSecParam)
+        padBytes = ""
+        while len(padBytes) != (key.blockSize - len(data) - 3):
+            padBytes += os.urandom(key.blockSize - len(data) - 3 - len(padBytes)).replace("\x00", "")
+        encoded = "\x00\x02" + padBytes + "\x00" + data
+    value = bytesToInt(encoded)
+    if value >= key.n:
+        raise ToolError(kNSOSStatusErrorDomain, kErrSecParam)
+    return intToBytes(key.public(value), key.blockSize)
+
+def rsaSmallDecrypt(key, data, padding):
+    if len(data) != key.blockSize:
+        raise ToolError(kNSOSStatusErrorDomain, kErrSecParam)
+    value = bytesToInt(data)
+    if value >= key.n:
+        raise ToolError(kNSOSStatusErrorDomain, kErrSecParam)
+    decoded = intToBytes(key.private(value), key.blockSize)
+    if padding == "none":
+        return decoded
+    separator = decoded.find("\x00", 2)
+    if (decoded[:2] != "\x00\x02") or (separator < 10):
+        raise ToolError(kNSOSStatusErrorDomain, kErrSecDecode)
+    return decoded[separator + 1:]
+
+# ---------------------------------------------------------------------------
+
+# PBKDF2.
+
+kPBKDF2DefaultDerivationTime = 0.1
+kPBKDF2CalibrationRounds = 1000
+kPBKDF2CalibrationMinimumTime = 0.025
+kPBKDF2CalibrationTrials = 5
+
+def calibratePBKDF2(passwordLength, saltLength, derivedKeyLength, derivationTime):
+    # Like CCCalibratePBKDF, returns the number of rounds that takes about derivationTime 
+    # seconds for inputs of the specified sizes.  A short derivation is dominated by timer 
+    # and scheduling noise, so we double the rounds until a trial takes a reasonable time, 
+    # and then time a few trials and use the fastest, which is the least disturbed by 
+    # whatever else the machine is doing.
+    def timeRounds(rounds):
+        start = time.time()
+        hashlib.pbkdf2_hmac("sha1", "p" * passwordLength, "s" * saltLength, rounds, derivedKeyLength)
+        return time.time() - start
+    rounds = kPBKDF2CalibrationRounds
+    while timeRounds(rounds) < kPBKDF2CalibrationMinimumTime:
+        rounds *= 2
+    duration = max(min(timeRounds(rounds) for _ in range(kPBKDF2CalibrationTrials)), 1e-6)
+    return max(int(rounds * derivationTime / duration), 1)
+
+# ---------------------------------------------------------------------------
+
+# The commands.  Each class corresponds to a QToolCommand subclass in the tool and has 
+# the same name, usage, options and arguments.
+
+class ToolCommand(object):
+    commandName = None
+    usageArguments = ""
+    commandOptions = ""
+
+    @classmethod
+    def commandUsage(cls):
+        return "%s %s" % (cls.commandName, cls.usageArguments)
+
+    def setOption(self, option, argument):
+        # Returns False to trigger a usage error.
+        return False
+
+    def validateArguments(self):
+        return True
+
+    def validateOptionsAndArguments(self, optionsAndArguments):
+        try:
+            (options, self.arguments) = getopt.getopt(optionsAndArguments, self.commandOptions)
+        except getopt.GetoptError:
+            return False
+        for (option, argument) in options:
+            if not self.setOption(option[1:], argument):
+                return False
+        return self.validateArguments()
+
+    def run(self):
+        raise NotImplementedError()
+
+class Base64EncodeCommand(ToolCommand):
+    commandName = "base64-encode"
+    usageArguments = "[-l] file"
+    commandOptions = "l"
+
+    addLineBreaks = False
+
+    def setOption(self, option, argument):
+        self.addLineBreaks = True
+        return True
+
+    def validateArguments(self):
+        return len(self.arguments) == 1
+
+    def run(self):
+        data = gToolCommon.dataWithContentsOfFile(self.arguments[0])
+        gToolCommon.writeOutputData(base64Encode(data, self.addLineBreaks))
+
+class Base64DecodeCommand(ToolCommand):
+    commandName = "base64-decode"
+    usageArguments = "file"
+
+    def validateArguments(self):
+        return len(self.arguments) == 1
+
+    def run(self):
+        data = gToolCommon.dataWithContentsOfFile(self.arguments[0])
+        try:
+            data.decode("utf-8")
+        except UnicodeDecodeError:
+            raise ToolError(kNSCocoaErrorDomain, kNSFileReadInapplicableStringEncodingError)
+        result = base64Decode(data)
+        if result is None:
+            raise ToolError(kNSCocoaErrorDomain, kNSFileReadCorruptFileError)
+        gToolCommon.writeOutputData(result)
+
+# QCCBase64BigEncode reads a whole number of 48 byte lines at a time, so each chunk 
+# encodes independently.  QCCBase64BigDecode reads 64K at a time.
+
+kBase64BigEncodeChunkSize = 48 * 1024
+kBase64BigDecodeChunkSize = 64 * 1024
+
+class Base64BigCommand(ToolCommand):
+    usageArguments = "inputFile outputFile"
+
+    def validateArguments(self):
+        return len(self.arguments) == 2
+
+    def run(self):
+        try:
+            inputFile = open(self.arguments[0], "rb")
+            outputFile = open(self.arguments[1], "wb")
+        except IOError, e:
+            raise ToolError(kNSPOSIXErrorDomain, e.errno)
+        try:
+            self.processFiles(inputFile, outputFile)
+        except IOError, e:
+            raise ToolError(kNSPOSIXErrorDomain, e.errno)
+        finally:
+            inputFile.close()
+            outputFile.close()
+
+class Base64BigEncodeCommand(Base64BigCommand):
+    commandName = "base64-big-encode"
+    usageArguments = "[-l] inputFile outputFile"
+    commandOptions = "l"
+
+    addLineBreaks = False
+
+    def setOption(self, option, argument):
+        self.addLineBreaks = True
+        return True
+
+    def processFiles(self, inputFile, outputFile):
+        while True:
+            chunk = inputFile.read(kBase64BigEncodeChunkSize)
+            if len(chunk) == 0:
+                break
+            outputFile.write(base64Encode(chunk, self.addLineBreaks))
+
+class Base64BigDecodeCommand(Base64BigCommand):
+    commandName = "base64-big-decode"
+
+    def processFiles(self, inputFile, outputFile):
+        # Decodes whole quanta as they arrive, holding back any partial quantum and, once 
+        # we've seen a padding character, everything after it.  The final quantum goes 
+        # through base64Decode so that the padding rules match base64-decode.
+        pending = ""
+        padding = ""
+        while True:
+            chunk = inputFile.read(kBase64BigDecodeChunkSize)
+            if len(chunk) == 0:
+                break
+            chunk = chunk.translate(None, kBase64Whitespace)
+            if len(padding) == 0:
+                (body, separator, rest) = chunk.partition("=")
+                padding = separator + rest
+            else:
+                body = ""
+                padding += chunk
+            if (body.translate(None, kBase64Alphabet) != "") or (padding.strip("=") != "") or (len(padding) > 2):
+                raise ToolError(kNSCocoaErrorDomain, kNSFileReadCorruptFileError)
+            pending += body
+            usable = len(pending) - (len(pending) % 4)
+            outputFile.write(binascii.a2b_base64(pending[:usable]))
+            pending = pending[usable:]
+        result = base64Decode(pending + padding)
+        if result is None:
+            raise ToolError(kNSCocoaErrorDomain, kNSFileReadCorruptFileError)
+        outputFile.write(result)
+
+kStreamChunkSize = 64 * 1024
+
+def updateWithStream(context, path):
+    # Like the stream variants of the digest and HMAC operations, feeds the file through 
+    # context (a hashlib or hmac object) a chunk at a time.
+    inputFile = gToolCommon.inputStreamWithContentsOfFile(path)
+    try:
+        while True:
+            chunk = inputFile.read(kStreamChunkSize)
+            if len(chunk) == 0:
+                break
+            context.update(chunk)
+    except IOError, e:
+        raise ToolError(kNSPOSIXErrorDomain, e.errno)
+    finally:
+        inputFile.close()
+    return context
+
+def linesFromListFile(listPath):
+    # Returns the lines of the list file used by "-l" in the digest and RSA commands, 
+    # ignoring empty lines.
+    data = gToolCommon.dataWithContentsOfFile(listPath)
+    try:
+        data.decode("utf-8")
+    except UnicodeDecodeError:
+        raise ToolError(kNSCocoaErrorDomain, kNSFileReadInapplicableStringEncodingError)
+    return [line for line in data.replace("\r\n", "\n").replace("\r", "\n").split("\n") if len(line) != 0]
+
+class DigestCommand(ToolCommand):
+    usageArguments = "[-s] (-l listFile | file...)"
+    commandOptions = "sl:"
+    algorithm = None
+
+    stream = False
+    listPath = None
+
+    def setOption(self, option, argument):
+        if option == "l":
+            self.listPath = argument
+        else:
+            self.stream = True
+        return True
+
+    def validateArguments(self):
+        return (len(self.arguments) != 0) != (self.listPath is not None)
+
+    def run(self):
+        # As in the tool, a single file on the command line honours "-s", while multiple 
+        # files always use the stream variant.  The tool digests multiple files 
+        # concurrently; we do them one at a time, which gives the same output.
+        if self.listPath is None:
+            paths = self.arguments
+        else:
+            paths = linesFromListFile(self.listPath)
+        if (self.listPath is None) and (len(paths) == 1):
+            if self.stream:
+                context = updateWithStream(hashlib.new(self.algorithm), paths[0])
+            else:
+                context = hashlib.new(self.algorithm, gToolCommon.dataWithContentsOfFile(paths[0]))
+            gToolCommon.writeOutputDataAsHexLine(context.digest())
+        else:
+            for path in paths:
+                gToolCommon.writeOutputDataAsHexLine(updateWithStream(hashlib.new(self.algorithm), path).digest())
+
+class SHA1DigestCommand(DigestCommand):
+    commandName = "sha1-digest"
+    algorithm = "sha1"
+
+class MD5DigestCommand(DigestCommand):
+    commandName = "md5-digest"
+    algorithm = "md5"
+
+class SHA1HMACCommand(ToolCommand):
+    commandName = "hmac-sha1"
+    usageArguments = "[-s] -k keyHexStr file"
+    commandOptions = "k:s"
+
+    keyData = None
+    stream = False
+
+    def setOption(self, option, argument):
+        if option == "s":
+            self.stream = True
+            return True
+        self.keyData = dataWithHexString(argument)
+        return self.keyData is not None
+
+    def validateArguments(self):
+        return (len(self.arguments) == 1) and (self.keyData is not None)
+
+    def run(self):
+        if self.stream:
+            context = updateWithStream(hmac.new(self.keyData, digestmod=hashlib.sha1), self.arguments[0])
+        else:
+            context = hmac.new(self.keyData, gToolCommon.dataWithContentsOfFile(self.arguments[0]), hashlib.sha1)
+        gToolCommon.writeOutputDataAsHexLine(context.digest())
+
+class PBKDF2KeyDerivationCache(object):
+    # Like QCCPBKDF2SHA1KeyDerivationCache, a size-bounded cache of derived keys that 
+    # evicts the least recently used key when it's full.
+
+    def __init__(self, countLimit):
+        self.countLimit = countLimit
+        self.derivedKeysByKey = collections.OrderedDict()
+
+    def setCountLimit(self, countLimit):
+        self.countLimit = countLimit
+        while len(self.derivedKeysByKey) > self.countLimit:
+            self.derivedKeysByKey.popitem(last=False)
+
+    def derivedKey(self, passwordString, saltData, rounds, derivedKeyLength):
+        key = (passwordString, saltData, rounds, derivedKeyLength)
+        derivedKey = self.derivedKeysByKey.pop(key, None)
+        if derivedKey is not None:
+            self.derivedKeysByKey[key] = derivedKey
+        return derivedKey
+
+    def setDerivedKey(self, derivedKey, passwordString, saltData, rounds):
+        key = (passwordString, saltData, rounds, len(derivedKey))
+        self.derivedKeysByKey.pop(key, None)
+        self.derivedKeysByKey[key] = derivedKey
+        self.setCountLimit(self.countLimit)
+
+# The cache used by "-c", shared by every invocation of the command, as in the tool.
+
+gPBKDF2KeyDerivationCache = PBKDF2KeyDerivationCache(1)
+
+class PBKDF2KeyDerivationCommand(ToolCommand):
+    commandName = "pbkdf2-sha1-key-derivation"
+    usageArguments = "(-p passwordStr | -l passwordListFile) -s saltHexStr [-r rounds] [-z derivedKeyLength] [-P] [-c cacheCount]"
+    commandOptions = "p:l:s:r:z:Pc:"
+
+    passwordString = None
+    passwordListPath = None
+    saltData = None
+    rounds = 0
+    derivedKeyLength = 0
+    cacheCountLimit = 0
+
+    def setOption(self, option, argument):
+        if option == "p":
+            self.passwordString = argument
+            return True
+        elif option == "l":
+            self.passwordListPath = argument
+            return True
+        elif option == "s":
+            self.saltData = dataWithHexString(argument)
+            return self.saltData is not None
+        elif option == "r":
+            self.rounds = integerValue(argument)
+            return self.rounds >= 0
+        elif option == "P":
+            # The tool derives the blocks of the key concurrently; that makes no difference 
+            # to the result, so we ignore it.
+            return True
+        elif option == "c":
+            self.cacheCountLimit = integerValue(argument)
+            return self.cacheCountLimit > 0
+        else:
+            self.derivedKeyLength = integerValue(argument)
+            return self.derivedKeyLength >= 0
+
+    def validateArguments(self):
+        return (len(self.arguments) == 0) and ((self.passwordString is None) != (self.passwordListPath is None)) and (self.saltData is not None)
+
+    def passwordStrings(self):
+        # A password can be empty, so we keep empty lines, except for the one implied by 
+        # a trailing newline.  Like the tool, we strip a trailing CR from each line, so 
+        # that a list with CRLF line endings works.
+        if self.passwordListPath is None:
+            return [self.passwordString]
+        data = gToolCommon.dataWithContentsOfFile(self.passwordListPath)
+        try:
+            data.decode("utf-8")
+        except UnicodeDecodeError:
+            raise ToolError(kNSCocoaErrorDomain, kNSFileReadInapplicableStringEncodingError)
+        result = [line[:-1] if line.endswith("\r") else line for line in data.split("\n")]
+        if result[-1] == "":
+            del result[-1]
+        return result
+
+    def deriveKey(self, passwordString):
+        derivedKeyLength = self.derivedKeyLength if self.derivedKeyLength != 0 else 16
+        rounds = self.rounds
+        if rounds == 0:
+            rounds = calibratePBKDF2(len(passwordString), min(max(len(self.saltData), 1), 128), derivedKeyLength, kPBKDF2DefaultDerivationTime)
+        if rounds > 0xffffffff:
+            raise ToolError("kQCCPBKDF2KeyDerivationErrorDomain", kCCParamError)
+        derivedKey = None
+        if self.cacheCountLimit != 0:
+            derivedKey = gPBKDF2KeyDerivationCache.derivedKey(passwordString, self.saltData, rounds, derivedKeyLength)
+        if derivedKey is None:
+            derivedKey = hashlib.pbkdf2_hmac("sha1", passwordString, self.saltData, rounds, derivedKeyLength)
+            if self.cacheCountLimit != 0:
+                gPBKDF2KeyDerivationCache.setDerivedKey(derivedKey, passwordString, self.saltData, rounds)
+        return derivedKey
+
+    def run(self):
+        # The tool derives the keys for a list of passwords concurrently; we do them one 
+        # at a time, which gives the same output.
+        passwordStrings = self.passwordStrings()
+        if self.cacheCountLimit != 0:
+            gPBKDF2KeyDerivationCache.setCountLimit(self.cacheCountLimit)
+        for passwordString in passwordStrings:
+            gToolCommon.writeOutputDataAsHexLine(self.deriveKey(passwordString))
+
+class PBKDF2CalibrateCommand(ToolCommand):
+    commandName = "pbkdf2-sha1-calibrate"
+    usageArguments = "[-p passwordLength] [-s saltLength] [-z derivedKeyLength] [-t milliseconds]"
+    commandOptions = "p:s:z:t:"
+
+    passwordLength = 8
+    saltLength = 8
+    derivedKeyLength = 16
+    derivationTimeMilliseconds = 100
+
+    def setOption(self, option, argument):
+        value = integerValue(argument)
+        if option == "p":
+            self.passwordLength = value
+            return value >= 0
+        elif option == "s":
+            self.saltLength = value
+            return value >= 0
+        elif option == "z":
+            self.derivedKeyLength = value
+            return value > 0
+        else:
+            self.derivationTimeMilliseconds = value
+            return value > 0
+
+    def validateArguments(self):
+        return len(self.arguments) == 0
+
+    def run(self):
+        rounds = calibratePBKDF2(self.passwordLength, min(max(self.saltLength, 1), 128), self.derivedKeyLength, self.derivationTimeMilliseconds / 1000.0)
+        gToolCommon.writeOutputLine(str(rounds))
+
+class AESCryptorCommand(ToolCommand):
+    usageArguments = "-k keyHexStr (-e | [-i ivHexStr]) file"
+    commandOptions = "k:i:e"
+    argumentCount = 1
+    encrypt = None
+    padding = None
+    errorDomain = None
+
+    keyData = None
+    ivData = None
+    ecbMode = False
+
+    def setOption(self, option, argument):
+        if option == "k":
+            self.keyData = dataWithHexString(argument)
+            return self.keyData is not None
+        elif option == "i":
+            self.ivData = dataWithHexString(argument)
+            return self.ivData is not None
+        else:
+            self.ecbMode = True
+            return True
+
+    def validateArguments(self):
+        if len(self.arguments) != self.argumentCount:
+            return False
+        elif self.keyData is None:
+            return False
+        elif self.ecbMode and (self.ivData is not None):
+            return False            # IV is incompatible with ECB
+        return True
+
+    def cryptorIVData(self):
+        if self.ecbMode:
+            return None
+        elif self.ivData is not None:
+            return self.ivData
+        else:
+            return "\x00" * 16
+
+    def makeCryptor(self):
+        return self.makeCryptorWithIV(self.cryptorIVData(), self.padding)
+
+    def makeCryptorWithIV(self, ivData, padding):
+        try:
+            return AESCryptor(self.encrypt, self.keyData, ivData, padding)
+        except CommonCryptoError, e:
+            raise ToolError(self.errorDomain, e.code)
+
+    def run(self):
+        data = gToolCommon.dataWithContentsOfFile(self.arguments[0])
+        # Like QCCAESCryptor and QCCAESPadCryptor, check the input length up front.
+        if ((not self.padding) or (not self.encrypt)) and ((len(data) % 16) != 0):
+            raise ToolError(self.errorDomain, kCCParamError)
+        cryptor = self.makeCryptor()
+        try:
+            result = cryptor.update(data) + cryptor.final()
+        except CommonCryptoError, e:
+            raise ToolError(self.errorDomain, e.code)
+        gToolCommon.writeOutputData(result)
+
+class AESEncryptCommand(AESCryptorCommand):
+    commandName = "aes-encrypt"
+    encrypt = True
+    padding = False
+    errorDomain = "kQCCAESCryptorErrorDomain"
+
+class AESDecryptCommand(AESCryptorCommand):
+    commandName = "aes-decrypt"
+    encrypt = False
+    padding = False
+    errorDomain = "kQCCAESCryptorErrorDomain"
+
+class AESPadEncryptCommand(AESCryptorCommand):
+    commandName = "aes-pad-encrypt"
+    encrypt = True
+    padding = True
+    errorDomain = "kQCCAESPadCryptorErrorDomain"
+
+class AESPadDecryptCommand(AESCryptorCommand):
+    commandName = "aes-pad-decrypt"
+    encrypt = False
+    padding = True
+    errorDomain = "kQCCAESPadCryptorErrorDomain"
+
+kBigCryptorChunkSize = 64 * 1024
+
+# Like QCCAESPadBigCryptor, when adapting the chunk size we measure the throughput over 
+# this many chunks, and only grow the chunk size if that beats the best so far by this factor.
+
+kAdaptiveChunkCount = 8
+kAdaptiveImprovementFactor = 1.05
+
+class HMACFile(object):
+    # Wraps a file, running everything read from it or written to it through an HMAC 
+    # context.  This is how the big cryptor commands HMAC the cyphertext as it goes by, 
+    # like QCCAESPadBigCryptor does when you set hmacKeyData.
+
+    def __init__(self, file, context):
+        self.file = file
+        self.context = context
+
+    def read(self, size):
+        data = self.file.read(size)
+        self.context.update(data)
+        return data
+
+    def write(self, data):
+        self.context.update(data)
+        self.file.write(data)
+
+class AESBigCryptorCommand(AESCryptorCommand):
+    usageArguments = "[-c chunkSize] [-a maxChunkSize] [-h hmacKeyHexStr] -k keyHexStr (-e | [-i ivHexStr]) inputFile outputFile"
+    commandOptions = "k:i:ec:a:h:"
+    argumentCount = 2
+    padding = True
+    errorDomain = "kQCCAESPadBigCryptorErrorDomain"
+
+    chunkSize = kBigCryptorChunkSize
+    maxChunkSize = 0
+    hmacKeyData = None
+
+    def setOption(self, option, argument):
+        if option == "c":
+            self.chunkSize = integerValue(argument)
+            return self.chunkSize > 0
+        elif option == "a":
+            self.maxChunkSize = integerValue(argument)
+            return self.maxChunkSize > 0
+        elif option == "h":
+            self.hmacKeyData = dataWithHexString(argument)
+            return self.hmacKeyData is not None
+        return AESCryptorCommand.setOption(self, option, argument)
+
+    def run(self):
+        # Like QCCAESPadBigCryptor, this streams the data through a chunk at a time, 
+        # so it works for arbitrarily large files.  If there's an HMAC key, we HMAC the 
+        # cyphertext (the output on encrypt, the input on decrypt) in the same pass, and 
+        # print the HMAC once the output file is closed.
+        cryptor = self.makeCryptor()
+        try:
+            inputFile = open(self.arguments[0], "rb")
+            outputFile = open(self.arguments[1], "wb")
+        except IOError, e:
+            raise ToolError(kNSPOSIXErrorDomain, e.errno)
+        context = None
+        if self.hmacKeyData is not None:
+            context = hmac.new(self.hmacKeyData, digestmod=hashlib.sha1)
+        try:
+            if context is None:
+                self.processFiles(cryptor, inputFile, outputFile)
+            elif self.encrypt:
+                self.processFiles(cryptor, inputFile, HMACFile(outputFile, context))
+            else:
+                self.processFiles(cryptor, HMACFile(inputFile, context), outputFile)
+        except CommonCryptoError, e:
+            raise ToolError(self.errorDomain, e.code)
+        except IOError, e:
+            raise ToolError(kNSPOSIXErrorDomain, e.errno)
+        finally:
+            inputFile.close()
+            outputFile.close()
+        if context is not None:
+            gToolCommon.writeOutputDataAsHexLine(context.digest())
+
+    def processFiles(self, cryptor, inputFile, outputFile):
+        chunkSize = self.chunkSize
+        adapting = (self.maxChunkSize > chunkSize)
+        periodChunks = 0
+        periodBytes = 0
+        periodStart = time.time()
+        bestRate = 0.0
+        bestChunkSize = chunkSize
+        while True:
+            chunk = inputFile.read(chunkSize)
+            if len(chunk) != 0:
+                outputFile.write(cryptor.update(chunk))
+            else:
+                outputFile.write(cryptor.final())
+                break
+            if adapting:
+                periodChunks += 1
+                periodBytes += len(chunk)
+                if periodChunks == kAdaptiveChunkCount:
+                    now = time.time()
+                    rate = (periodBytes / (now - periodStart)) if now > periodStart else float("inf")
+                    if (rate > bestRate * kAdaptiveImprovementFactor) and (chunkSize < self.maxChunkSize):
+                        bestRate = rate
+                        bestChunkSize = chunkSize
+                        chunkSize = min(chunkSize * 2, self.maxChunkSize)
+                    else:
+                        if rate < bestRate:
+                            chunkSize = bestChunkSize
+                        adapting = False
+                    periodChunks = 0
+                    periodBytes = 0
+                    periodStart = now
+
+class AESPadBigEncryptCommand(AESBigCryptorCommand):
+    commandName = "aes-pad-big-encrypt"
+    encrypt = True
+
+kParallelSegmentSize = 1024 * 1024
+
+class AESPadBigDecryptCommand(AESBigCryptorCommand):
+    commandName = "aes-pad-big-decrypt"
+    usageArguments = "[-p] " + AESBigCryptorCommand.usageArguments
+    commandOptions = "k:i:ec:a:ph:"
+    encrypt = False
+
+    parallel = False
+
+    def setOption(self, option, argument):
+        if option == "p":
+            self.parallel = True
+            return True
+        return AESBigCryptorCommand.setOption(self, option, argument)
+
+    def processFiles(self, cryptor, inputFile, outputFile):
+        # In parallel mode QCCAESPadBigCryptor decrypts the input in segments, each with its 
+        # own cryptor whose IV is the last cyphertext block of the previous segment, and with 
+        # only the last segment padded.  We do the same, albeit one segment at a time.
+        if not self.parallel:
+            AESBigCryptorCommand.processFiles(self, cryptor, inputFile, outputFile)
+            return
+        chainData = self.cryptorIVData()
+        segment = inputFile.read(kParallelSegmentSize)
+        while True:
+            nextSegment = inputFile.read(kParallelSegmentSize)
+            isLast = (len(nextSegment) == 0)
+            segmentCryptor = self.makeCryptorWithIV(chainData, isLast)
+            outputFile.write(segmentCryptor.update(segment) + segmentCryptor.final())
+            if isLast:
+                break
+            if chainData is not None:
+                chainData = segment[-16:]
+            segment = nextSegment
+
+class AESCTRBigCryptorCommand(AESCryptorCommand):
+    usageArguments = "[-p] [-c chunkSize] -k keyHexStr [-i ivHexStr] inputFile outputFile"
+    commandOptions = "k:i:c:p"
+    argumentCount = 2
+    errorDomain = "kQCCAESCTRBigCryptorErrorDomain"
+
+    chunkSize = kBigCryptorChunkSize
+    parallel = False
+
+    def setOption(self, option, argument):
+        if option == "c":
+            self.chunkSize = integerValue(argument)
+            return self.chunkSize > 0
+        elif option == "p":
+            self.parallel = True
+            return True
+        return AESCryptorCommand.setOption(self, option, argument)
+
+    def makeCryptorWithCounter(self, counterData):
+        try:
+            return AESCTRCryptor(self.keyData, counterData)
+        except CommonCryptoError, e:
+            raise ToolError(self.errorDomain, e.code)
+
+    def run(self):
+        cryptor = self.makeCryptorWithCounter(self.cryptorIVData())
+        try:
+            inputFile = open(self.arguments[0], "rb")
+            outputFile = open(self.arguments[1], "wb")
+        except IOError, e:
+            raise ToolError(kNSPOSIXErrorDomain, e.errno)
+        try:
+            self.processFiles(cryptor, inputFile, outputFile)
+        except IOError, e:
+            raise ToolError(kNSPOSIXErrorDomain, e.errno)
+        finally:
+            inputFile.close()
+            outputFile.close()
+
+    def processFiles(self, cryptor, inputFile, outputFile):
+        # In parallel mode QCCAESCTRBigCryptor crypts the input in segments, each with its 
+        # own cryptor whose counter is the initial counter plus the number of blocks before 
+        # the segment.  We do the same, albeit one segment at a time.
+        if self.parallel:
+            counterData = self.cryptorIVData()
+            blocksSoFar = 0
+            while True:
+                segment = inputFile.read(kParallelSegmentSize)
+                if len(segment) == 0:
+                    break
+                segmentCounter = intToBytes((bytesToInt(counterData) + blocksSoFar) % (1 << 128), 16)
+                outputFile.write(self.makeCryptorWithCounter(segmentCounter).update(segment))
+                blocksSoFar += kParallelSegmentSize // 16
+        else:
+            while True:
+                chunk = inputFile.read(self.chunkSize)
+                if len(chunk) == 0:
+                    break
+                outputFile.write(cryptor.update(chunk))
+
+class AESCTRBigEncryptCommand(AESCTRBigCryptorCommand):
+    commandName = "aes-ctr-big-encrypt"
+    encrypt = True
+
+class AESCTRBigDecryptCommand(AESCTRBigCryptorCommand):
+    commandName = "aes-ctr-big-decrypt"
+    encrypt = False
+
+class RSASHA1VerifyCommand(ToolCommand):
+    commandName = "rsa-sha1-verify"
+    usageArguments = "(-l listFile publicKeyName | publicKeyName signatureFile dataFile)"
+    commandOptions = "l:"
+
+    listPath = None
+
+    def setOption(self, option, argument):
+        self.listPath = argument
+        return True
+
+    def validateArguments(self):
+        return len(self.arguments) == (3 if self.listPath is None else 1)
+
+    def run(self):
+        if self.listPath is None:
+            signatureData = gToolCommon.dataWithContentsOfFile(self.arguments[1])
+            data = gToolCommon.dataWithContentsOfFile(self.arguments[2])
+            key = rsaKeyNamed("public", self.arguments[0])
+            gToolCommon.writeOutputLine("verified" if rsaSHA1Verify(key, signatureData, data) else "not verified")
+        else:
+            # The tool verifies the pairs concurrently; we do them one at a time, which 
+            # gives the same output.
+            pairs = [line.split("\t") for line in linesFromListFile(self.listPath)]
+            if any(len(pair) != 2 for pair in pairs):
+                raise ToolError(kNSCocoaErrorDomain, kNSFileReadCorruptFileError)
+            key = rsaKeyNamed("public", self.arguments[0])
+            for (signaturePath, dataPath) in pairs:
+                signatureData = gToolCommon.dataWithContentsOfFile(signaturePath)
+                data = gToolCommon.dataWithContentsOfFile(dataPath)
+                gToolCommon.writeOutputLine("verified" if rsaSHA1Verify(key, signatureData, data) else "not verified")
+
+class RSASHA1SignCommand(ToolCommand):
+    commandName = "rsa-sha1-sign"
+    usageArguments = "(-l listFile privateKeyName | privateKeyName file...)"
+    commandOptions = "l:"
+
+    listPath = None
+
+    def setOption(self, option, argument):
+        self.listPath = argument
+        return True
+
+    def validateArguments(self):
+        if self.listPath is None:
+            return len(self.arguments) >= 2
+        return len(self.arguments) == 1
+
+    def run(self):
+        if (self.listPath is None) and (len(self.arguments) == 2):
+            data = gToolCommon.dataWithContentsOfFile(self.arguments[1])
+            key = rsaKeyNamed("private", self.arguments[0])
+            gToolCommon.writeOutputDataAsHexLine(rsaSHA1Signature(key, data))
+        else:
+            # As above, the tool signs the files concurrently but we do them one at a time.
+            if self.listPath is None:
+                paths = self.arguments[1:]
+            else:
+                paths = linesFromListFile(self.listPath)
+            key = rsaKeyNamed("private", self.arguments[0])
+            for path in paths:
+                gToolCommon.writeOutputDataAsHexLine(rsaSHA1Signature(key, gToolCommon.dataWithContentsOfFile(path)))
+
+class RSACryptorCommand(ToolCommand):
+    commandOptions = "p:"
+
+    padding = "pkcs1"
+
+    def setOption(self, option, argument):
+        if argument not in ("none", "pkcs1"):
+            return False
+        self.padding = argument
+        return True
+
+    def validateArguments(self):
+        return len(self.arguments) == 2
+
+class RSASmallEncryptCommand(RSACryptorCommand):
+    commandName = "rsa-small-encrypt"
+    usageArguments = "[-p none|pkcs1] publicKeyName file"
+
+    def run(self):
+        data = gToolCommon.dataWithContentsOfFile(self.arguments[1])
+        key = rsaKeyNamed("public", self.arguments[0])
+        gToolCommon.writeOutputDataAsHexLine(rsaSmallEncrypt(key, data, self.padding))
+
+class RSASmallDecryptCommand(RSACryptorCommand):
+    commandName = "rsa-small-decrypt"
+    usageArguments = "[-p none|pkcs1] privateKeyName file"
+
+    def run(self):
+        data = gToolCommon.dataWithContentsOfFile(self.arguments[1])
+        key = rsaKeyNamed("private", self.arguments[0])
+        gToolCommon.writeOutputDataAsHexLine(rsaSmallDecrypt(key, data, self.padding))
+
+# The batch command, with the same wire format as BatchCommand (see "Tool/BatchCommands.h").
+
+kBatchStatusSuccess = 0
+kBatchStatusError   = 1
+kBatchStatusUsage   = 2
+
+class BatchCommand(ToolCommand):
+    commandName = "batch"
+    usageArguments = "[-p] < requests"
+    commandOptions = "p"
+
+    parallel = False
+
+    def setOption(self, option, argument):
+        self.parallel = True
+        return True
+
+    def validateArguments(self):
+        return len(self.arguments) == 0
+
+    def readExactly(self, length):
+        data = sys.stdin.read(length)
+        if len(data) != length:
+            raise ToolError(kNSCocoaErrorDomain, kNSFileReadCorruptFileError)
+        return data
+
+    def readItems(self, countBytes=None):
+        # Reads a count followed by that many (length, bytes) items.
+        if countBytes is None:
+            countBytes = self.readExactly(4)
+        (count,) = struct.unpack(">I", countBytes)
+        result = []
+        for _ in range(count):
+            (length,) = struct.unpack(">I", self.readExactly(4))
+            result.append(self.readExactly(length))
+        return result
+
+    def runRequest(self, arguments, payloads):
+        command = None
+        if len(arguments) != 0:
+            for commandClass in kSubcommandClasses:
+                if (commandClass is not BatchCommand) and (arguments[0] == commandClass.commandName):
+                    command = commandClass()
+                    break
+        if (command is None) or not command.validateOptionsAndArguments(arguments[1:]):
+            if command is not None:
+                usages = [command.commandUsage()]
+            else:
+                usages = [commandClass.commandUsage() for commandClass in kSubcommandClasses if commandClass is not BatchCommand]
+            return (kBatchStatusUsage, "\n".join(usages))
+        gToolCommon.inputDataByPath = dict(("@%d" % i, payload) for (i, payload) in enumerate(payloads))
+        gToolCommon.outputData = []
+        try:
+            command.run()
+            return (kBatchStatusSuccess, "".join(gToolCommon.outputData))
+        except ToolError, e:
+            return (kBatchStatusError, "%s / %d" % (e.domain, e.code))
+        finally:
+            gToolCommon.inputDataByPath = None
+            gToolCommon.outputData = None
+
+    def readRequests(self):
+        while True:
+            # Peek at stdin so that we can tell the end of the batch apart from a truncated request.
+            firstByte = sys.stdin.read(1)
+            if len(firstByte) == 0:
+                break
+            arguments = self.readItems(firstByte + self.readExactly(3))
+            for argument in arguments:
+                try:
+                    argument.decode("utf-8")
+                except UnicodeDecodeError:
+                    raise ToolError(kNSCocoaErrorDomain, kNSFileReadCorruptFileError)
+            payloads = self.readItems()
+            yield (arguments, payloads)
+
+    def writeResponse(self, status, response):
+        sys.stdout.write(struct.pack(">II", status, len(response)))
+        sys.stdout.write(response)
+        sys.stdout.flush()
+
+    def run(self):
+        if not self.parallel:
+            for (arguments, payloads) in self.readRequests():
+                self.writeResponse(*self.runRequest(arguments, payloads))
+            return
+
+        # Run the requests on a thread pool, and have a separate thread write the 
+        # responses, in request order, as they become available, so that a client that 
+        # waits for each response before sending the next request doesn't deadlock.  
+        # As in the tool, if the batch is truncated we still write the responses to the 
+        # requests before it, and we don't read a request until there are fewer than 
+        # maxConcurrentOperationCount requests in flight, so memory use is bounded.
+        pool = multiprocessing.pool.ThreadPool(gToolCommon.maxConcurrentOperationCount)
+        pending = Queue.Queue()
+        inFlight = threading.Semaphore(gToolCommon.maxConcurrentOperationCount)
+        def write():
+            while True:
+                result = pending.get()
+                if result is None:
+                    break
+                self.writeResponse(*result.get())
+                inFlight.release()
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            requests = self.readRequests()
+            while True:
+                inFlight.acquire()
+                request = next(requests, None)
+                if request is None:
+                    break
+                pending.put(pool.apply_async(self.runRequest, request))
+        finally:
+            pending.put(None)
+            writer.join()
+            pool.close()
+            pool.join()
+
+# The subcommands, in the same order as +[MainCommand subcommandClasses].
+
+kSubcommandClasses = [
+    Base64EncodeCommand, 
+    Base64DecodeCommand, 
+    Base64BigEncodeCommand, 
+    Base64BigDecodeCommand, 
+    SHA1DigestCommand, 
+    MD5DigestCommand, 
+    SHA1HMACCommand, 
+    PBKDF2KeyDerivationCommand, 
+    PBKDF2CalibrateCommand, 
+    AESEncryptCommand, 
+    AESDecryptCommand, 
+    AESPadEncryptCommand, 
+    AESPadDecryptCommand, 
+    AESPadBigEncryptCommand, 
+    AESPadBigDecryptCommand, 
+    AESCTRBigEncryptCommand, 
+    AESCTRBigDecryptCommand, 
+    RSASHA1VerifyCommand, 
+    RSASHA1SignCommand, 
+    RSASmallEncryptCommand, 
+    RSASmallDecryptCommand, 
+    BatchCommand, 
+]
+
+def mainCommandUsage(commandName):
+    return "%s [-v] [-m] [-b] [-j count] subcommand\n\nSubcommands:\n\n%s" % (
+        commandName, 
+        "\n".join(commandClass.commandUsage() for commandClass in kSubcommandClasses)
+    )
+
+def main():
+    commandName = os.path.basename(sys.argv[0])
+    verbose = 0
+    command = None
+    try:
+        (options, arguments) = getopt.getopt(sys.argv[1:], "vdmbj:")
+    except getopt.GetoptError:
+        arguments = []
+    else:
+        # -d (run operations on the main thread) and -m (map input files) make no 
+        # difference here; we always read input files into a string.  -j only affects 
+        # "batch -p"; everything else runs one operation at a time.
+        verbose = len([option for (option, _) in options if option == "-v"])
+        gToolCommon.binaryOutput = ("-b", "") in options
+        for (option, argument) in options:
+            if option == "-j":
+                gToolCommon.maxConcurrentOperationCount = integerValue(argument)
+                if gToolCommon.maxConcurrentOperationCount <= 0:
+                    arguments = []
+        if len(arguments) != 0:
+            for commandClass in kSubcommandClasses:
+                if arguments[0] == commandClass.commandName:
+                    command = commandClass()
+                    break
+    if (command is None) or not command.validateOptionsAndArguments(arguments[1:]):
+        sys.stderr.write("usage: %s\n\n" % mainCommandUsage(commandName))
+        return 1
+    try:
+        command.run()
+    except ToolError, e:
+        sys.stdout.flush()
+        sys.stderr.write("%s: error: %s / %d\n" % (commandName, e.domain, e.code))
+        return 1
+    if verbose != 0:
+        sys.stderr.write("Success!\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -50,6 +50,7 @@
 #import "QCCAESCryptor.h"
 #import "QCCAESPadCryptor.h"
 #import "QCCAESPadBigCryptor.h"
+#import "QCCAESCTRBigCryptor.h"
 
 #import "ToolCommon.h"
 
@@ -555,6 +556,173 @@
     STAssertEqualObjects(expectedOutputData, [outputStream propertyForKey:NSStreamDataWrittenToMemoryStreamKey], @"");
 }
 
+- (void)testAES128PadBigCBCEncryptThenMAC
+{
+    NSData *                inputData;
+    NSInputStream *         inputStream;
+    NSOutputStream *        outputStream;
+    NSData *                keyData;
+    NSData *                ivData;
+    NSData *                hmacKeyData;
+    QCCAESPadBigCryptor *   op;
+    NSData *                cyphertextData;
+    NSData *                plaintextData;
+    NSData *                expectedHMAC;
+    
+    plaintextData = [NSData dataWithContentsOfURL:[[NSBundle bundleForClass:[self class]] URLForResource:@"plaintext-332" withExtension:@"dat"]];
+    assert(plaintextData != nil);
+
+    cyphertextData = [NSData dataWithContentsOfURL:[[NSBundle bundleForClass:[self class]] URLForResource:@"cyphertext-aes-128-cbc-332" withExtension:@"dat"]];
+    assert(cyphertextData != nil);
+    
+    keyData = [QHex dataWithHexString:@"0C1032520302EC8537A4A82C4EF7579D"];
+    assert(keyData != nil);
+
+    ivData = [QHex dataWithHexString:@"AB5BBEB426015DA7EEDCEE8BEE3DFFB7"];
+    assert(ivData != nil);
+    
+    hmacKeyData = [@"Hello Cruel World!" dataUsingEncoding:NSUTF8StringEncoding];
+    assert(hmacKeyData != nil);
+    
+    // The HMAC of the cyphertext, as calculated by "openssl dgst -sha1 -hmac".
+    
+    expectedHMAC = [QHex dataWithHexString:@"d458826df6b3e70dd826c8a2388c88f349c45778"];
+    assert(expectedHMAC != nil);
+    
+    // On encrypt the HMAC covers the output.
+    
+    inputData = plaintextData;
+    
+    inputStream = [NSInputStream inputStreamWithData:inputData];
+    assert(inputStream != nil);
+    
+    outputStream = [NSOutputStream outputStreamToMemory];
+    assert(outputStream != nil);
+    
+    op = [[QCCAESPadBigCryptor alloc] initToEncryptInputStream:inputStream toOutputStream:outputStream keyData:keyData];
+    op.ivData = ivData;
+    op.hmacKeyData = hmacKeyData;
+    [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
+    STAssertNil(op.error, @"");
+    STAssertEqualObjects(cyphertextData, [outputStream propertyForKey:NSStreamDataWrittenToMemoryStreamKey], @"");
+    STAssertEqualObjects(expectedHMAC, op.outputHMAC, @"");
+    
+    // On decrypt it covers the input, both serially and in parallel.
+    
+    inputData = cyphertextData;
+    
+    for (NSNumber * parallel in @[ @NO, @YES ]) {
+        inputStream = [NSInputStream inputStreamWithData:inputData];
+        assert(inputStream != nil);
+        
+        outputStream = [NSOutputStream outputStreamToMemory];
+        assert(outputStream != nil);
+        
+        op = [[QCCAESPadBigCryptor alloc] initToDecryptInputStream:inputStream toOutputStream:outputStream keyData:keyData];
+        op.ivData = ivData;
+        op.hmacKeyData = hmacKeyData;
+        op.parallel = [parallel boolValue];
+        [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
+        STAssertNil(op.error, @"");
+        STAssertEqualObjects(plaintextData, [outputStream propertyForKey:NSStreamDataWrittenToMemoryStreamKey], @"");
+        STAssertEqualObjects(expectedHMAC, op.outputHMAC, @"");
+    }
+    
+    // Without an HMAC key there's no HMAC.
+    
+    inputStream = [NSInputStream inputStreamWithData:plaintextData];
+    assert(inputStream != nil);
+    
+    outputStream = [NSOutputStream outputStreamToMemory];
+    assert(outputStream != nil);
+    
+    op = [[QCCAESPadBigCryptor alloc] initToEncryptInputStream:inputStream toOutputStream:outputStream keyData:keyData];
+    op.ivData = ivData;
+    [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
+    STAssertNil(op.error, @"");
+    STAssertNil(op.outputHMAC, @"");
+}
+
+// AES-128 CTR Big
+//
+// The test vectors are from NIST SP 800-38A, section F.5.  The counter wraps in the 
+// second block, which tests that the cryptor carries between bytes.
+
+- (void)testAES128CTRBigEncryption
+{
+    NSData *                inputData;
+    NSInputStream *         inputStream;
+    NSOutputStream *        outputStream;
+    NSData *                keyData;
+    NSData *                ivData;
+    QCCAESCTRBigCryptor *   op;
+    NSData *                expectedOutputData;
+    
+    inputData = [QHex dataWithHexString:@"6bc1bee22e409f96e93d7e117393172aae2d8a571e03ac9c9eb76fac45af8e5130c81c46a35ce411e5fbc1191a0a52eff69f2445df4f9b17ad2b417be66c3710"];
+    assert(inputData != nil);
+
+    inputStream = [NSInputStream inputStreamWithData:inputData];
+    assert(inputStream != nil);
+    
+    outputStream = [NSOutputStream outputStreamToMemory];
+    assert(outputStream != nil);
+    
+    expectedOutputData = [QHex dataWithHexString:@"874d6191b620e3261bef6864990db6ce9806f66b7970fdff8617187bb9fffdff5ae4df3edbd5d35e5b4f09020db03eab1e031dda2fbe03d1792170a0f3009cee"];
+    assert(expectedOutputData != nil);
+    
+    keyData = [QHex dataWithHexString:@"2b7e151628aed2a6abf7158809cf4f3c"];
+    assert(keyData != nil);
+
+    ivData = [QHex dataWithHexString:@"f0f1f2f3f4f5f6f7f8f9fafbfcfdfeff"];
+    assert(ivData != nil);
+    
+    // A chunk size that isn't a multiple of the block size checks that the key stream 
+    // carries over from one chunk to the next.
+    
+    op = [[QCCAESCTRBigCryptor alloc] initToEncryptInputStream:inputStream toOutputStream:outputStream keyData:keyData];
+    op.ivData = ivData;
+    op.chunkSize = 7;
+    [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
+    STAssertNil(op.error, @"");
+    STAssertEqualObjects(expectedOutputData, [outputStream propertyForKey:NSStreamDataWrittenToMemoryStreamKey], @"");
+}
+
+- (void)testAES128CTRBigParallelDecryption
+{
+    NSData *                inputData;
+    NSInputStream *         inputStream;
+    NSOutputStream *        outputStream;
+    NSData *                keyData;
+    NSData *                ivData;
+    QCCAESCTRBigCryptor *   op;
+    NSData *                expectedOutputData;
+    
+    inputData = [QHex dataWithHexString:@"874d6191b620e3261bef6864990db6ce9806f66b7970fdff8617187bb9fffdff5ae4df3edbd5d35e5b4f09020db03eab1e031dda2fbe03d1792170a0f3009cee"];
+    assert(inputData != nil);
+    
+    inputStream = [NSInputStream inputStreamWithData:inputData];
+    assert(inputStream != nil);
+    
+    outputStream = [NSOutputStream outputStreamToMemory];
+    assert(outputStream != nil);
+    
+    expectedOutputData = [QHex dataWithHexString:@"6bc1bee22e409f96e93d7e117393172aae2d8a571e03ac9c9eb76fac45af8e5130c81c46a35ce411e5fbc1191a0a52eff69f2445df4f9b17ad2b417be66c3710"];
+    assert(expectedOutputData != nil);
+    
+    keyData = [QHex dataWithHexString:@"2b7e151628aed2a6abf7158809cf4f3c"];
+    assert(keyData != nil);
+
+    ivData = [QHex dataWithHexString:@"f0f1f2f3f4f5f6f7f8f9fafbfcfdfeff"];
+    assert(ivData != nil);
+    
+    op = [[QCCAESCTRBigCryptor alloc] initToDecryptInputStream:inputStream toOutputStream:outputStream keyData:keyData];
+    op.ivData = ivData;
+    op.parallel = YES;
+    [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
+    STAssertNil(op.error, @"");
+    STAssertEqualObjects(expectedOutputData, [outputStream propertyForKey:NSStreamDataWrittenToMemoryStreamKey], @"");
+}
+
 // AES-256 Pad CBC
 
 - (void)testAES256PadCBCEncryption
@@ -867,6 +1035,55 @@
     STAssertEquals([[outputStream propertyForKey:NSStreamDataWrittenToMemoryStreamKey] length], (NSUInteger) 0, @"");
 }
 
+- (void)testAES128CTRBigCryptorErrors
+{
+    NSData *                inputData;
+    NSInputStream *         inputStream;
+    NSOutputStream *        outputStream;
+    NSData *                keyData;
+    QCCAESCTRBigCryptor *   op;
+    
+    // key not one of the standard AES key lengths
+
+    inputData = [NSData dataWithContentsOfURL:[[NSBundle bundleForClass:[self class]] URLForResource:@"plaintext-332" withExtension:@"dat"]];
+    assert(inputData != nil);
+    
+    inputStream = [NSInputStream inputStreamWithData:inputData];
+    assert(inputStream != nil);
+    
+    outputStream = [NSOutputStream outputStreamToMemory];
+    assert(outputStream != nil);
+    
+    keyData = [QHex dataWithHexString:@"0C1032520302EC8537A4A82C4EF757"];
+    assert(keyData != nil);
+
+    op = [[QCCAESCTRBigCryptor alloc] initToEncryptInputStream:inputStream toOutputStream:outputStream keyData:keyData];
+    [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
+    STAssertNotNil(op.error, @"");
+    STAssertEqualObjects([op.error domain], kQCCAESCTRBigCryptorErrorDomain, @"");
+    STAssertEquals([op.error code], (NSInteger) kCCParamError, @"");
+    STAssertEquals([[outputStream propertyForKey:NSStreamDataWrittenToMemoryStreamKey] length], (NSUInteger) 0, @"");
+
+    // no IV; unlike CBC, there's no ECB fallback
+
+    inputStream = [NSInputStream inputStreamWithData:inputData];
+    assert(inputStream != nil);
+    
+    outputStream = [NSOutputStream outputStreamToMemory];
+    assert(outputStream != nil);
+    
+    keyData = [QHex dataWithHexString:@"0C1032520302EC8537A4A82C4EF7579D"];
+    assert(keyData != nil);
+
+    op = [[QCCAESCTRBigCryptor alloc] initToEncryptInputStream:inputStream toOutputStream:outputStream keyData:keyData];
+    op.ivData = nil;
+    [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
+    STAssertNotNil(op.error, @"");
+    STAssertEqualObjects([op.error domain], kQCCAESCTRBigCryptorErrorDomain, @"");
+    STAssertEquals([op.error code], (NSInteger) kCCParamError, @"");
+    STAssertEquals([[outputStream propertyForKey:NSStreamDataWrittenToMemoryStreamKey] length], (NSUInteger) 0, @"");
+}
+
 - (void)testCryptoThrows
 {
     STAssertThrows((void) [[QCCAESCryptor alloc] initToDecryptInputData:nil keyData:[NSData data]], @"");
@@ -882,6 +1099,10 @@
     STAssertThrows((void) [[QCCAESPadBigCryptor alloc] initToDecryptInputStream:nil toOutputStream:[NSOutputStream outputStreamToMemory] keyData:[NSData data]], @"");
     STAssertThrows((void) [[QCCAESPadBigCryptor alloc] initToDecryptInputStream:[NSInputStream inputStreamWithData:[NSData data]] toOutputStream:nil keyData:[NSData data]], @"");
     STAssertThrows((void) [[QCCAESPadBigCryptor alloc] initToDecryptInputStream:[NSInputStream inputStreamWithData:[NSData data]] toOutputStream:[NSOutputStream outputStreamToMemory] keyData:nil], @"");
+
+    STAssertThrows((void) [[QCCAESCTRBigCryptor alloc] initToEncryptInputStream:nil toOutputStream:[NSOutputStream outputStreamToMemory] keyData:[NSData data]], @"");
+    STAssertThrows((void) [[QCCAESCTRBigCryptor alloc] initToEncryptInputStream:[NSInputStream inputStreamWithData:[NSData data]] toOutputStream:nil keyData:[NSData data]], @"");
+    STAssertThrows((void) [[QCCAESCTRBigCryptor alloc] initToEncryptInputStream:[NSInputStream inputStreamWithData:[NSData data]] toOutputStream:[NSOutputStream outputStreamToMemory] keyData:nil], @"");
 }
 
 @end
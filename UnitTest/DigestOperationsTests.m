@@ -173,12 +173,67 @@
     STAssertEqualObjects(expectedOutputData, op.outputHMAC, @"");
 }
 
+- (void)testStreamDigests
+{
+    NSData *                    inputData;
+    NSData *                    keyData;
+    QCCMD5Digest *              md5Op;
+    QCCSHA1Digest *             sha1Op;
+    QCCHMACSHA1Authentication * hmacOp;
+    
+    // The stream variants should produce the same results as the data variants, 
+    // so we reuse the expected values from the tests above.
+    
+    inputData = [NSData dataWithContentsOfURL:[[NSBundle bundleForClass:[self class]] URLForResource:@"test" withExtension:@"cer"]];
+    assert(inputData != nil);
+    
+    keyData = [QHex dataWithHexString:@"48656c6c6f20437275656c20576f726c6421"];
+    assert(keyData != nil);
+    
+    md5Op = [[QCCMD5Digest alloc] initWithInputStream:[NSInputStream inputStreamWithData:inputData]];
+    [[ToolCommon sharedInstance] synchronouslyRunOperation:md5Op];
+    STAssertNil(md5Op.error, @"");
+    STAssertEqualObjects([QHex dataWithHexString:@"cdd202dcf9deea872f7c64f6081e526c"], md5Op.outputDigest, @"");
+    
+    sha1Op = [[QCCSHA1Digest alloc] initWithInputStream:[NSInputStream inputStreamWithData:inputData]];
+    [[ToolCommon sharedInstance] synchronouslyRunOperation:sha1Op];
+    STAssertNil(sha1Op.error, @"");
+    STAssertEqualObjects([QHex dataWithHexString:@"c1ddfe7dd14c9b8dee83b46b87a408970fd2a83f"], sha1Op.outputDigest, @"");
+    
+    hmacOp = [[QCCHMACSHA1Authentication alloc] initWithInputStream:[NSInputStream inputStreamWithData:inputData] keyData:keyData];
+    [[ToolCommon sharedInstance] synchronouslyRunOperation:hmacOp];
+    STAssertNil(hmacOp.error, @"");
+    STAssertEqualObjects([QHex dataWithHexString:@"550a1da058c1b5df6ea167870ae6dbc92f0e0281"], hmacOp.outputHMAC, @"");
+    
+    // an empty stream is fine too
+    
+    sha1Op = [[QCCSHA1Digest alloc] initWithInputStream:[NSInputStream inputStreamWithData:[NSData data]]];
+    [[ToolCommon sharedInstance] synchronouslyRunOperation:sha1Op];
+    STAssertNil(sha1Op.error, @"");
+    STAssertEqualObjects([QHex dataWithHexString:@"da39a3ee5e6b4b0d3255bfef95601890afd80709"], sha1Op.outputDigest, @"");
+}
+
+- (void)testStreamDigestError
+{
+    QCCSHA1Digest *     op;
+    
+    // a stream that can't be opened should result in an error, not a digest
+    
+    op = [[QCCSHA1Digest alloc] initWithInputStream:[NSInputStream inputStreamWithFileAtPath:@"/this/file/does/not/exist"]];
+    [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
+    STAssertNotNil(op.error, @"");
+    STAssertNil(op.outputDigest, @"");
+}
+
 - (void)testDigestThrows
 {
     STAssertThrows((void) [[QCCMD5Digest alloc] initWithInputData:nil], @"");
     STAssertThrows((void) [[QCCSHA1Digest alloc] initWithInputData:nil], @"");
     STAssertThrows((void) [[QCCHMACSHA1Authentication alloc] initWithInputData:nil keyData:[NSData data]], @"");
     STAssertThrows((void) [[QCCHMACSHA1Authentication alloc] initWithInputData:[NSData data] keyData:nil], @"");
+    STAssertThrows((void) [[QCCMD5Digest alloc] initWithInputStream:nil], @"");
+    STAssertThrows((void) [[QCCSHA1Digest alloc] initWithInputStream:nil], @"");
+    STAssertThrows((void) [[QCCHMACSHA1Authentication alloc] initWithInputStream:nil keyData:[NSData data]], @"");
 }
 
 @end
@@ -153,6 +153,118 @@
     STAssertEqualObjects(op.derivedKeyData, expectedKeyData, @"");
 }
 
+- (void)testPBKDF2Parallel
+{
+    QCCPBKDF2SHA1KeyDerivation *    op;
+    NSString *                      passwordString;
+    NSData *                        saltData;
+    NSData *                        expectedKeyData;
+
+    passwordString = @"Hello Cruel World!";
+    assert(passwordString != nil);
+
+    saltData = [@"Some salt sir?" dataUsingEncoding:NSUTF8StringEncoding];
+    assert(saltData != nil);
+
+    // This result was generated with Python 3 using:
+    //
+    // hashlib.pbkdf2_hmac("sha1", b"Hello Cruel World!", b"Some salt sir?", 1000, 50)
+    //
+    // It's three blocks, the last one partial.
+
+    expectedKeyData = [QHex dataWithHexString:@"e56c27f5eed251db50a33e050ce01fb76e7b6b889f05850e6d903db8baaad61a7f1d19761e7d9df86687915835b31145ccc7"];
+    assert(expectedKeyData != nil);
+
+    op = [[QCCPBKDF2SHA1KeyDerivation alloc] initWithPasswordString:passwordString saltData:saltData];
+    op.rounds = 1000;
+    op.derivedKeyLength = 50;
+    op.parallel = YES;
+    [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
+    STAssertNil(op.error, @"");
+    STAssertEqualObjects(op.derivedKeyData, expectedKeyData, @"");
+
+    // a single block key takes the non-parallel path, but should still work
+
+    op = [[QCCPBKDF2SHA1KeyDerivation alloc] initWithPasswordString:passwordString saltData:saltData];
+    op.rounds = 1000;
+    op.derivedKeyLength = 10;
+    op.parallel = YES;
+    [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
+    STAssertNil(op.error, @"");
+    STAssertEqualObjects(op.derivedKeyData, [expectedKeyData subdataWithRange:NSMakeRange(0, 10)], @"");
+}
+
+- (void)testPBKDF2Cache
+{
+    QCCPBKDF2SHA1KeyDerivationCache *   cache;
+    QCCPBKDF2SHA1KeyDerivation *        op;
+    NSString *                          passwordString;
+    NSData *                            saltData;
+    NSData *                            expectedKeyData;
+    NSData *                            bogusKeyData;
+
+    passwordString = @"Hello Cruel World!";
+    assert(passwordString != nil);
+
+    saltData = [@"Some salt sir?" dataUsingEncoding:NSUTF8StringEncoding];
+    assert(saltData != nil);
+
+    // See -testPBKDF2 for the source of this value.
+
+    expectedKeyData = [QHex dataWithHexString:@"e56c27f5eed251db50a3"];
+    assert(expectedKeyData != nil);
+
+    cache = [[QCCPBKDF2SHA1KeyDerivationCache alloc] initWithCountLimit:2];
+    assert(cache != nil);
+
+    // a miss derives the key and adds it to the cache
+
+    op = [[QCCPBKDF2SHA1KeyDerivation alloc] initWithPasswordString:passwordString saltData:saltData];
+    op.rounds = 1000;
+    op.derivedKeyLength = 10;
+    op.cache = cache;
+    [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
+    STAssertNil(op.error, @"");
+    STAssertEqualObjects(op.derivedKeyData, expectedKeyData, @"");
+    STAssertEquals(cache.count, (NSUInteger) 1, @"");
+    STAssertEqualObjects([cache derivedKeyDataForPasswordString:passwordString saltData:saltData rounds:1000 derivedKeyLength:10], expectedKeyData, @"");
+
+    // the key length and rounds are part of the cache key
+
+    STAssertNil([cache derivedKeyDataForPasswordString:passwordString saltData:saltData rounds:1000 derivedKeyLength:11], @"");
+    STAssertNil([cache derivedKeyDataForPasswordString:passwordString saltData:saltData rounds:1001 derivedKeyLength:10], @"");
+
+    // a hit comes from the cache; we prove this by planting a bogus key
+
+    bogusKeyData = [QHex dataWithHexString:@"00112233445566778899"];
+    assert(bogusKeyData != nil);
+    [cache setDerivedKeyData:bogusKeyData forPasswordString:passwordString saltData:saltData rounds:1000];
+
+    op = [[QCCPBKDF2SHA1KeyDerivation alloc] initWithPasswordString:passwordString saltData:saltData];
+    op.rounds = 1000;
+    op.derivedKeyLength = 10;
+    op.cache = cache;
+    [[ToolCommon sharedInstance] synchronouslyRunOperation:op];
+    STAssertNil(op.error, @"");
+    STAssertEqualObjects(op.derivedKeyData, bogusKeyData, @"");
+    STAssertEquals(op.actualRounds, (NSUInteger) 1000, @"");
+
+    // adding more keys than the limit evicts the least recently used one
+
+    [cache setDerivedKeyData:expectedKeyData forPasswordString:@"a" saltData:saltData rounds:1000];
+    (void) [cache derivedKeyDataForPasswordString:passwordString saltData:saltData rounds:1000 derivedKeyLength:10];
+    [cache setDerivedKeyData:expectedKeyData forPasswordString:@"b" saltData:saltData rounds:1000];
+    STAssertEquals(cache.count, (NSUInteger) 2, @"");
+    STAssertNil([cache derivedKeyDataForPasswordString:@"a" saltData:saltData rounds:1000 derivedKeyLength:10], @"");
+    STAssertNotNil([cache derivedKeyDataForPasswordString:passwordString saltData:saltData rounds:1000 derivedKeyLength:10], @"");
+
+    cache.countLimit = 1;
+    STAssertEquals(cache.count, (NSUInteger) 1, @"");
+
+    [cache removeAllDerivedKeys];
+    STAssertEquals(cache.count, (NSUInteger) 0, @"");
+}
+
 - (void)testPBKDF2Calibration
 {
     NSString *                      passwordString;
@@ -195,6 +307,20 @@
     STAssertEqualObjects(op.derivedKeyData, derivedKey, @"");
 }
 
+- (void)testPBKDF2CalibratedRounds
+{
+    NSUInteger      shortRounds;
+    NSUInteger      longRounds;
+
+    // The exact values depend on the machine, so we just check that they're sensible
+    // and that asking for more time gets you more rounds.
+
+    shortRounds = [QCCPBKDF2SHA1KeyDerivation calibratedRoundsForPasswordLength:18 saltLength:14 derivedKeyLength:16 derivationTime:0.05];
+    longRounds  = [QCCPBKDF2SHA1KeyDerivation calibratedRoundsForPasswordLength:18 saltLength:14 derivedKeyLength:16 derivationTime:0.2];
+    STAssertTrue(shortRounds != 0, @"");
+    STAssertTrue(longRounds > shortRounds, @"");
+}
+
 - (void)testPBKDF2Error
 {
     NSString *                      passwordString;